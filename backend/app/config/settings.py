@@ -33,6 +33,38 @@ class Settings(BaseSettings):
     stock_list_fetch_cron: str = "00 20 * * 1"  # Every Monday at 20:00
     stock_history_fetch_cron: str = "04 20 * * *"  # Every day at 20:32
 
+    # Daily data ingestion pipeline (fetch -> convert -> write -> indicators)
+    ingest_fetch_workers: int = 4
+    ingest_convert_workers: int = 2
+    ingest_write_workers: int = 2
+    ingest_indicator_workers: int = 3
+    ingest_queue_size: int = 50  # bounded queue between stages
+    ingest_write_batch_size: int = 20  # ready stocks coalesced into one write round
+    # Upstream rate limits and circuit breaker
+    baostock_qps: float = 20.0
+    tushare_qps: float = 3.0  # TuShare limits calls per minute per endpoint
+    upstream_failure_threshold: int = 5  # consecutive failures before the circuit opens
+    upstream_reset_seconds: float = 30.0  # open period before a half-open probe
+    upstream_cache_dir: str = "./cache/upstream"  # on-disk cache of stock list / calendar responses
+    upstream_cache_ttl_hours: float = 24.0  # 0 disables the cache
+    daily_fetch_mode: str = "latest_day"  # latest_day (TuShare by trade date) or per_code (BaoStock)
+
+    # Failed request replay (exponential backoff: base * 2^retry_count, capped)
+    retry_interval_minutes: int = 5
+    retry_concurrency: int = 4
+    retry_base_delay_seconds: float = 60.0
+    retry_max_delay_seconds: float = 3600.0
+    retry_max_attempts: int = 8
+    # Mid-history gap scan against the trading calendar
+    gap_scan_concurrency: int = 8
+    # Daily bar layout: "document" (one document per bar) or "monthly" (an extra copy as packed monthly
+    # buckets that get_stock_history reads for fully migrated stocks; run migrate_monthly_bars.py)
+    daily_bar_layout: str = "document"
+    # Minute bars (one bucket document per stock, day and frequency)
+    minute_frequencies: str = "5,15,30,60"
+    minute_fetch_start_date: str = "2025-01-01"  # first import; minute history is ~48x the daily volume
+    minute_fetch_concurrency: int = 4
+
     # Trading
     stamp_duty_rate: float = 0.0005
     trading_fee_rate: float = 0.0003
@@ -40,6 +72,19 @@ class Settings(BaseSettings):
     # Technical Analysis
     cci_default_period: int = 14
     cci_default_constant: float = 0.015
+    # Moving averages persisted with the technical indicators (empty disables)
+    price_ma_periods: str = "5,10,20,60"
+    volume_ma_periods: str = "5,10,20"
+
+    # Strategy execution
+    strategy_executor_workers: int = 0  # 0 means os.cpu_count()
+    strategy_prefetch_size: int = 64  # bars prefetched ahead of computation
+    strategy_fetch_concurrency: int = 8  # capped at half of the MongoDB connection pool
+    strategy_load_batch_size: int = 100  # stocks loaded concurrently per batch
+    strategy_job_lease_seconds: int = 60  # running jobs whose lease expires are resumed elsewhere
+    strategy_job_heartbeat_seconds: int = 10
+    strategy_job_flush_size: int = 200  # per-stock results buffered before a bulk write
+    collection_flush_size: int = 1000  # screening hits buffered before a bulk upsert into stock_collections
 
     # Logging
     log_level: str = "DEBUG"
@@ -8,6 +8,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.services.data_service import DataService
 from app.services.mongodb_service import MongoDBService
+from app.services.strategy_job_service import StrategyJobService
 from app.routers import stocks, technical_analysis, trading_strategies, config, stock_collections, trading_records
 from app.config.settings import Settings
 
@@ -65,9 +66,12 @@ async def lifespan(app: FastAPI):
     # Initialize default scheduler timing configurations
     await _initialize_scheduler_configs(mongo_service)
 
+    # Resume strategy execution jobs interrupted by a restart or crash
+    await StrategyJobService(mongo_service).resume_jobs()
+
     # Start data service if scheduler is enabled
     if settings.scheduler_enabled:
-        data_service = DataService()
+        data_service = DataService.shared()
         await data_service.startup_job()
     else:
         logger.info("Scheduler is disabled - manual data fetch required")
@@ -76,6 +80,7 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info(f"Shutting down {settings.app_name} Application")
+    await StrategyJobService.shutdown()
 
 
 async def _initialize_scheduler_configs(mongo_service: MongoDBService):
@@ -6,7 +6,9 @@ import re
 from bson import ObjectId
 from datetime import datetime, timedelta
 
-from app.services.data_service import DataService
+from app.services.data_service import BAOSTOCK_GUARD, TUSHARE_GUARD, DataService
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.services.minute_bars import MINUTE_FREQUENCIES, parse_frequencies
 from app.services.mongodb_service import MongoDBService
 from app.services.technical_analysis_service import TechnicalAnalysisService
 
@@ -146,7 +148,6 @@ async def get_stock_daily_data(
         if code.isdigit():
             code = get_market_and_code(code)
 
-        collection_name = mongo_service.get_collection_name(code)
         query = {'code': code}
         if start_date or end_date:
             query['date'] = {}
@@ -166,8 +167,8 @@ async def get_stock_daily_data(
             projection = {field.strip(): 1 for field in field_list}
             projection['_id'] = 0  # Exclude _id by default
 
-        data = await mongo_service.find(
-            collection_name,
+        data = await mongo_service.find_daily_bars(
+            code,
             query,
             projection=projection,
             sort=[('date', -1)],
@@ -186,6 +187,32 @@ async def get_stock_daily_data(
         logger.error(f"Error getting daily data for {code}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/{code}/minute")
+async def get_stock_minute_data(
+    code: str,
+    frequency: int = Query(5, description="分钟频率：5、15、30、60"),
+    start_date: Optional[str] = Query(None, description="开始日期 (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="结束日期 (YYYY-MM-DD)"),
+    rollup: bool = Query(False, description="是否只返回按日汇总的数据")
+):
+    """获取分钟K线（前复权），rollup 时返回由分钟K线汇总的日级数据"""
+    if frequency not in MINUTE_FREQUENCIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported frequency: {frequency}")
+    try:
+        mongo_service = MongoDBService()
+        if code.isdigit():
+            code = get_market_and_code(code)
+        data = await mongo_service.get_minute_bars(
+            code, frequency,
+            datetime.strptime(start_date, "%Y-%m-%d") if start_date else None,
+            datetime.strptime(end_date, "%Y-%m-%d") if end_date else None,
+            rollup=rollup
+        )
+        return {"code": code, "frequency": frequency, "data": data, "total": len(data)}
+    except Exception as e:
+        logger.error(f"Error getting minute data for {code}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.get("/{code}/integrated-data")
 async def get_stock_integrated_data(
     code: str,
@@ -207,7 +234,6 @@ async def get_stock_integrated_data(
         stock_name = stock_info.get('code_name', '') if stock_info else ''
 
         # 获取股票日线数据
-        collection_name = mongo_service.get_collection_name(code)
         query = {'code': code}
         if start_date or end_date:
             query['date'] = {}
@@ -226,8 +252,8 @@ async def get_stock_integrated_data(
             projection['_id'] = 0  # Exclude _id by default
 
         # 获取日线数据
-        daily_data = await mongo_service.find(
-            collection_name,
+        daily_data = await mongo_service.find_daily_bars(
+            code,
             query,
             projection=projection,
             sort=[('date', -1)],
@@ -358,11 +384,16 @@ async def get_stock_detailed_info(code: str):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/trigger-fetch")
-async def trigger_data_fetch():
+async def trigger_data_fetch(
+    mode: Optional[str] = Query(None, description="latest_day 或 per_code，默认使用配置"),
+    trade_date: Optional[str] = Query(None, description="latest_day 模式的交易日 YYYYMMDD，默认今天")
+):
     """Manually trigger data fetch"""
+    if mode is not None and mode not in ("latest_day", "per_code"):
+        raise HTTPException(status_code=400, detail=f"Unknown fetch mode: {mode}")
     try:
-        data_service = DataService()
-        result = await data_service.trigger_immediate_fetch()
+        data_service = DataService.shared()
+        result = await data_service.trigger_immediate_fetch(mode, trade_date)
         # 转换可能的ObjectId
         result = convert_object_id(result)
         return {"status": "success", "data": result}
@@ -370,13 +401,59 @@ async def trigger_data_fetch():
         logger.error(f"Error triggering data fetch: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/retry-failed")
+async def retry_failed_requests():
+    """重放到期的失败日线请求"""
+    try:
+        data_service = DataService.shared()
+        result = await data_service.retry_failed_requests()
+        return {"status": "success", "data": result}
+    except Exception as e:
+        logger.error(f"Error retrying failed requests: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/trigger-minute-fetch")
+async def trigger_minute_fetch(
+    frequencies: Optional[str] = Query(None, description="分钟频率，逗号分隔，默认使用配置"),
+    codes: Optional[str] = Query(None, description="股票代码，逗号分隔，默认全部")
+):
+    """在后台导入分钟K线；结果见 /fetch-progress 的 jobs"""
+    try:
+        frequency_list = parse_frequencies(frequencies) if frequencies else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        data_service = DataService.shared()
+        stock_codes = [code.strip() for code in codes.split(",") if code.strip()] if codes else None
+        result = await data_service.trigger_minute_fetch(stock_codes, frequency_list)
+        return {"status": "success", "data": result}
+    except Exception as e:
+        logger.error(f"Error fetching minute bars: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/scan-gaps")
+async def scan_daily_gaps(
+    backfill: bool = Query(True, description="是否补抓扫描到的缺口"),
+    codes: Optional[str] = Query(None, description="股票代码，逗号分隔，默认全部")
+):
+    """在后台扫描日线中间缺失的交易日，并按最少的日期区间补抓；结果见 /fetch-progress 的 jobs"""
+    try:
+        data_service = DataService.shared()
+        stock_codes = [code.strip() for code in codes.split(",") if code.strip()] if codes else None
+        result = await data_service.trigger_gap_scan(stock_codes, backfill=backfill)
+        return {"status": "success", "data": result}
+    except Exception as e:
+        logger.error(f"Error scanning daily gaps: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.post("/stop-fetch")
 async def stop_data_fetch():
     """Stop ongoing data fetch"""
     try:
-        data_service = DataService()
-        # 设置标志以停止数据获取
-        data_service.is_fetching = False
+        # 流水线停止抓取新的股票，已抓取的数据继续写入
+        pipeline = IngestionPipeline.current()
+        if pipeline:
+            pipeline.cancel()
         logger.info("Data fetch stop command received")
         return {"status": "success", "message": "Data fetch stop command sent"}
     except Exception as e:
@@ -387,18 +464,24 @@ async def stop_data_fetch():
 async def get_fetch_progress():
     """Get data fetch progress"""
     try:
-        data_service = DataService()
-        # 返回数据获取进度信息
-        return {
-            "status": "success",
-            "data": {
-                "progress": 0,  # 进度百分比
-                "is_running": data_service.is_fetching,
-                "status": "running" if data_service.is_fetching else "idle",
-                "current_stock": "",  # 当前正在处理的股票
-                "failed_stocks": []  # 失败的股票列表
+        # 返回数据获取进度信息，包括流水线各阶段的吞吐和队列深度，以及上游限流/熔断状态
+        upstream = {"baostock": BAOSTOCK_GUARD.status(), "tushare": TUSHARE_GUARD.status()}
+        jobs = DataService.shared().job_results
+        pipeline = IngestionPipeline.current()
+        if pipeline is None:
+            return {
+                "status": "success",
+                "data": {
+                    "progress": 0,  # 进度百分比
+                    "is_running": False,
+                    "status": "idle",
+                    "current_stock": "",  # 当前正在处理的股票
+                    "failed_stocks": [],  # 失败的股票列表
+                    "upstream": upstream,
+                    "jobs": jobs  # 后台任务（抓取、缺口补抓、分钟线）最近一次的结果
+                }
             }
-        }
+        return {"status": "success", "data": {**pipeline.progress(), "upstream": upstream, "jobs": jobs}}
     except Exception as e:
         logger.error(f"Error getting fetch progress: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -11,8 +11,10 @@ from bson import ObjectId
 from pymongo.errors import DuplicateKeyError
 
 from app.services.mongodb_service import MongoDBService
-from app.services.technical_analysis_service import TechnicalAnalysisService
 from app.services.data_service import DataService
+from app.services.snapshot_service import SnapshotService
+from app.services.strategy_screener import StrategyScreener
+from app.services.strategy_job_service import StrategyJobService, FINISHED_STATUSES, CANCELLED, ERROR
 from app.strategies.right_side_trading_strategy import RightSideTradingStrategy
 from app.strategies.strong_k_breakout_strategy import StrongKBreakoutStrategy
 from app.strategies.bottom_reversal_strategy import BottomReversalStrategy
@@ -26,13 +28,6 @@ from app.models.trading_strategy import (
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# 添加一个全局变量来控制策略执行
-strategy_execution_in_progress = False
-strategy_execution_cancelled = False
-strategy_execution_task = None
-
-# 添加一个字典来存储执行任务的结果
-strategy_execution_results = {}
 
 @router.get("/strategies", response_model=List[TradingStrategyBase])
 async def get_trading_strategies():
@@ -335,122 +330,16 @@ async def evaluate_strategies():
     """Evaluate all active trading strategies"""
     try:
         mongo_service = MongoDBService()
-        technical_service = TechnicalAnalysisService()
         
         # Get all active strategies
         strategies = await mongo_service.find('trading_strategies', {'is_active': True})
         # 获取所有股票和股票名称信息
         stocks = await mongo_service.find('stock_info', {}, {'code': 1, 'code_name': 1})
         
-        # 创建股票代码到名称的映射
-        stock_name_map = {stock['code']: stock.get('code_name', stock['code']) for stock in stocks}
-        
-        results = []
-        for strategy in strategies:
-            strategy_params = strategy.get('parameters', {})
-            # 获取执行范围参数，默认为30天
-            days_range = strategy_params.get('days_range', 30)
-            
-            # 分批处理股票，每批20个并发执行
-            batch_size = 20
-            for i in range(0, len(stocks), batch_size):
-                batch = stocks[i:i+batch_size]
-                
-                # 为每只股票创建评估任务
-                tasks = []
-                for stock in batch:
-                    stock_code = stock['code']
-                    
-                    # 根据策略类型调用不同的评估方法
-                    if strategy.get('type') == 'right_side':
-                        # 右侧交易策略
-                        task = technical_service.evaluate_right_side_trading_strategy(
-                            stock_code, strategy_params
-                        )
-                    elif strategy.get('type') == 'strong_k':
-                        # 强K策略使用手动执行方式进行评估
-                        continue  # 暂时不支持在评估接口中执行强K策略
-                    else:
-                        # 通用策略评估
-                        task = technical_service.evaluate_trading_strategy(stock_code, strategy)
-                    
-                    tasks.append((stock_code, task))
-                
-                # 并发执行当前批次的任务
-                batch_results = await asyncio.gather(*[task for _, task in tasks], return_exceptions=True)
-                
-                # 处理当前批次的结果
-                for (stock_code, _), result in zip(tasks, batch_results):
-                    try:
-                        if isinstance(result, Exception):
-                            logger.error(f"Error evaluating strategy for {stock_code}: {str(result)}")
-                            continue
-                            
-                        meets_conditions = result
-                        
-                        if meets_conditions:
-                            # 从映射表中获取股票名称
-                            stock_name = stock_name_map.get(stock_code, stock_code)
-                            
-                            # 检查是否是右侧交易策略的详细结果
-                            if isinstance(meets_conditions, dict) and meets_conditions.get('matched'):
-                                # 右侧交易策略返回详细匹配信息
-                                matching_dates = meets_conditions.get('matching_dates', [])
-                                
-                                # 为每个匹配的日期创建一个记录
-                                for match_info in matching_dates:
-                                    # 添加到股票集合
-                                    collection_item = {
-                                        'code': stock_code,
-                                        'name': stock_name,  # 添加股票名称
-                                        'strategy_id': str(strategy['_id']),
-                                        'strategy_name': strategy['name'],
-                                        'operation': strategy['operation'],
-                                        'price': match_info.get('price'),
-                                        'share_amount': 0,
-                                        'meet_date': match_info.get('date'),
-                                        'added_date': datetime.utcnow()
-                                    }
-                                    
-                                    await mongo_service.insert_one('stock_collections', collection_item)
-                                
-                                results.append({
-                                    'stock_code': stock_code,
-                                    'stock_name': stock_name,  # 添加股票名称
-                                    'strategy_name': strategy['name'],
-                                    'operation': strategy['operation'],
-                                    'matching_dates': matching_dates
-                                })
-                            else:
-                                # 通用策略使用当前日期作为匹配日期
-                                meet_date = datetime.utcnow()
-                                
-                                # 通用策略不需要特定价格，设为0
-                                price = 0
-                                
-                                # Add to stock collections
-                                collection_item = {
-                                    'code': stock_code,
-                                    'name': stock_name,  # 添加股票名称
-                                    'strategy_id': str(strategy['_id']),
-                                    'strategy_name': strategy['name'],
-                                    'operation': strategy['operation'],
-                                    'price': price,  # 通用策略不需要特定价格
-                                    'share_amount': 0,
-                                    'meet_date': meet_date,
-                                    'added_date': datetime.utcnow()
-                                }
-                                
-                                await mongo_service.insert_one('stock_collections', collection_item)
-                                results.append({
-                                    'stock_code': stock_code,
-                                    'stock_name': stock_name,  # 添加股票名称
-                                    'strategy_name': strategy['name'],
-                                    'operation': strategy['operation']
-                                })
-                    except Exception as e:
-                        logger.error(f"Error processing result for {stock_code}: {str(e)}")
-                        continue
+        # 每只股票只读取一次数据，在同一份数据上评估所有激活策略，命中结果一次性写入
+        screener = StrategyScreener(mongo_service)
+        screening = await screener.run(strategies, stocks)
+        results = screening['results']
         
         return {
             "status": "success",
@@ -467,7 +356,6 @@ async def evaluate_right_side_strategies():
     """专门评估右侧交易策略"""
     try:
         mongo_service = MongoDBService()
-        technical_service = TechnicalAnalysisService()
         
         # 获取所有激活的右侧交易策略
         strategies = await mongo_service.find(
@@ -485,55 +373,9 @@ async def evaluate_right_side_strategies():
         # 获取所有股票和股票名称信息
         stocks = await mongo_service.find('stock_info', {}, {'code': 1, 'code_name': 1})
         
-        # 创建股票代码到名称的映射
-        stock_name_map = {stock['code']: stock.get('code_name', stock['code']) for stock in stocks}
-        
-        results = []
-        for strategy in strategies:
-            strategy_params = strategy.get('parameters', {})
-            # 获取执行范围参数，默认为30天
-            days_range = strategy_params.get('days_range', 30)
-            
-            for stock in stocks:
-                stock_code = stock['code']
-                
-                # 评估右侧交易策略
-                evaluation_result = await technical_service.evaluate_right_side_trading_strategy(
-                    stock_code, strategy_params
-                )
-                
-                # 如果满足条件，添加到股票集合
-                if evaluation_result and isinstance(evaluation_result, dict) and evaluation_result.get('matched'):
-                    matching_dates = evaluation_result.get('matching_dates', [])
-                    
-                    # 获取股票名称
-                    stock_info = await mongo_service.find_one('stock_info', {'code': stock_code})
-                    stock_name = stock_info.get('code_name', stock_code) if stock_info else stock_code
-                    
-                    # 为每个匹配的日期创建一个记录
-                    for match_info in matching_dates:
-                        # 添加到股票集合
-                        collection_item = {
-                            'code': stock_code,
-                            'name': stock_name,  # 添加股票名称
-                            'strategy_id': str(strategy['_id']),
-                            'strategy_name': strategy['name'],
-                            'operation': strategy['operation'],
-                            'price': match_info.get('price'),
-                            'share_amount': 0,
-                            'meet_date': match_info.get('date'),
-                            'added_date': datetime.utcnow()
-                        }
-                        
-                        await mongo_service.insert_one('stock_collections', collection_item)
-                    
-                    results.append({
-                        'stock_code': stock_code,
-                        'stock_name': stock_name,  # 添加股票名称
-                        'strategy_name': strategy['name'],
-                        'operation': strategy['operation'],
-                        'matching_dates': matching_dates
-                    })
+        # 单次扫描评估全部右侧策略，命中记录按 (code, strategy_id, meet_date) 批量 upsert
+        screening = await StrategyScreener(mongo_service).run(strategies, stocks)
+        results = screening['results']
         
         return {
             "message": f"右侧交易策略评估完成，{len(results)} 只股票满足条件",
@@ -544,35 +386,61 @@ async def evaluate_right_side_strategies():
         logger.error(f"Error evaluating right side strategies: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/evaluate/history/{strategy_id}")
+async def evaluate_strategy_history(
+    strategy_id: str,
+    start_date: str = Query(..., description="开始日期 YYYY-MM-DD"),
+    end_date: str = Query(None, description="结束日期 YYYY-MM-DD，默认今天")
+):
+    """在历史区间内逐日评估通用条件策略，返回每天命中的股票（不写入股票集合）"""
+    try:
+        mongo_service = MongoDBService()
+        strategy = await mongo_service.find_one('trading_strategies', {'_id': ObjectId(strategy_id)})
+        if not strategy:
+            raise HTTPException(status_code=404, detail="Strategy not found")
+        if not strategy.get('conditions'):
+            raise HTTPException(status_code=400, detail="Strategy has no conditions")
+
+        stocks = await mongo_service.find('stock_info', {}, {'code': 1})
+        matches = await StrategyScreener(mongo_service).screen_history(
+            strategy, [stock['code'] for stock in stocks],
+            start_date, end_date or datetime.now().strftime('%Y-%m-%d')
+        )
+        return {
+            "status": "success",
+            "strategy_name": strategy.get('name'),
+            "matches": matches,
+            "total_days": len(matches)
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error evaluating strategy history: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.post("/execute/manual")
 async def manual_execute_strategy(params: Dict[str, Any]):
-    """手动执行策略"""
-    global strategy_execution_in_progress, strategy_execution_cancelled, strategy_execution_task
-    
+    """手动执行策略（创建持久化的执行任务，立即返回任务ID）"""
     try:
-        # 设置执行状态
-        strategy_execution_in_progress = True
-        strategy_execution_cancelled = False
-        
-        strategy_type = params.get("strategy_type")  # "right_side" 或 "strong_k"
+        strategy_type = params.get("strategy_type")  # "right_side"、"strong_k" 或 "bottom_reversal"
+        # 可选：在同一份数据上执行多个策略 [{"strategy_type": ..., "parameters": {...}, "name": ...}]
+        strategies = params.get("strategies")
         stock_codes = params.get("stock_codes", [])  # 用户选择的股票代码列表
         days_range = params.get("days_range", 30)  # 执行范围（天数）
         strategy_params = params.get("parameters", {})  # 策略参数
+        # 决策追踪：true 或 {"symbols": [...], "start_date": ..., "end_date": ..., "capacity": ...}
+        trace = params.get("trace")
         
         # 如果没有提供days_range参数，但参数中有，则使用参数中的值
         if "days_range" in strategy_params:
             days_range = strategy_params["days_range"]
         
-        # 立即返回响应，不等待执行完成
-        execution_id = str(datetime.now().timestamp())
-        logger.info(f"启动策略执行任务，执行ID: {execution_id}，策略类型: {strategy_type}")
-        
-        # 在后台运行策略执行任务
-        strategy_execution_task = asyncio.create_task(
-            _execute_strategy_background(
-                execution_id, strategy_type, stock_codes, days_range, strategy_params
-            )
-        )
+        job_service = StrategyJobService()
+        execution_id = await job_service.create_job(strategy_type, stock_codes, days_range, strategy_params,
+                                                    trace, strategies)
+        logger.info(f"启动策略执行任务，执行ID: {execution_id}，策略类型: {strategy_type or strategies}")
         
         return {
             "status": "started",
@@ -580,373 +448,114 @@ async def manual_execute_strategy(params: Dict[str, Any]):
             "execution_id": execution_id
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        # 重置执行状态
-        strategy_execution_in_progress = False
-        strategy_execution_cancelled = False
         logger.error(f"启动策略执行任务时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-async def _execute_strategy_background(execution_id: str, strategy_type: str, stock_codes: List[str], 
-                                     days_range: int, strategy_params: Dict[str, Any]):
-    """在后台执行策略的异步函数"""
-    global strategy_execution_in_progress, strategy_execution_cancelled, strategy_execution_results
-    
-    try:
-        mongo_service = MongoDBService()
-        technical_service = TechnicalAnalysisService()
-        
-        if not stock_codes:
-            # 如果没有指定股票，获取所有股票
-            stocks = await mongo_service.find('stock_info', {}, {'code': 1, 'code_name': 1})
-            stock_codes = [stock['code'] for stock in stocks]
-        else:
-            # 如果指定了股票，获取这些股票的详细信息
-            stocks = await mongo_service.find('stock_info', {'code': {'$in': stock_codes}}, {'code': 1, 'code_name': 1})
-        
-        results = []
-        
-        if strategy_type == "right_side":
-            # 执行右侧交易策略
-            logger.info(f"开始执行右侧交易策略，执行ID: {execution_id}，股票数量: {len(stock_codes)}, 执行范围: {days_range}天")
-            for stock_code in stock_codes:
-                # 检查是否需要取消执行
-                if strategy_execution_cancelled:
-                    logger.info(f"策略执行已被取消，执行ID: {execution_id}")
-                    break
-                    
-                try:
-                    logger.info(f"处理股票 {stock_code}，执行ID: {execution_id}")
-                    # 获取股票历史数据
-                    collection_name = mongo_service.get_collection_name(stock_code)
-                    historical_data = await mongo_service.find(
-                        collection_name, 
-                        {'code': stock_code},
-                        sort=[('date', -1)],
-                        limit=days_range  # 使用用户指定的天数范围
-                    )
-                    
-                    if historical_data:
-                        logger.info(f"获取到股票 {stock_code} 的 {len(historical_data)} 条历史数据，执行ID: {execution_id}")
-                        # 创建策略实例并执行
-                        strategy = RightSideTradingStrategy(
-                            initial_capital=strategy_params.get("initial_capital", 100000),
-                            max_position_pct=strategy_params.get("max_position_pct", 0.02),
-                            max_positions=strategy_params.get("max_positions", 5)
-                        )
-                        
-                        # 转换数据格式
-                        import pandas as pd
-                        df = pd.DataFrame(historical_data)
-                        df['date'] = pd.to_datetime(df['date'])
-                        df = df.sort_values('date')
-                        
-                        # 执行策略
-                        signals = strategy.generate_signals(df, stock_code)
-                        logger.info(f"股票 {stock_code} 生成 {len(signals)} 个信号，执行ID: {execution_id}")
-                        
-                        # 转换信号为字典格式
-                        signals_dict = []
-                        for signal in signals:
-                            signal_dict = {
-                                "symbol": signal.symbol,
-                                "action": signal.action,
-                                "price": signal.price,
-                                "confidence": signal.confidence,
-                                "timestamp": signal.timestamp.isoformat() if hasattr(signal.timestamp, 'isoformat') else str(signal.timestamp),
-                                "reason": signal.reason
-                            }
-                            signals_dict.append(signal_dict)
-                        
-                        if signals_dict:
-                            logger.info(f"股票 {stock_code} 生成 {len(signals_dict)} 个有效信号，执行ID: {execution_id}")
-                            results.append({
-                                "stock_code": stock_code,
-                                "signals": signals_dict,
-                                "status": "success"
-                            })
-                        else:
-                            logger.info(f"股票 {stock_code} 未生成有效信号，执行ID: {execution_id}")
-                            results.append({
-                                "stock_code": stock_code,
-                                "signals": [],
-                                "status": "no_signals"
-                            })
-                    else:
-                        logger.warning(f"股票 {stock_code} 无历史数据，执行ID: {execution_id}")
-                        results.append({
-                            "stock_code": stock_code,
-                            "signals": [],
-                            "status": "no_data"
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"执行右侧交易策略时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}", exc_info=True)
-                    results.append({
-                        "stock_code": stock_code,
-                        "signals": [],
-                        "status": "error",
-                        "error": str(e)
-                    })
-                    
-        elif strategy_type == "strong_k":
-            # 执行强K策略
-            logger.info(f"开始执行强K策略，执行ID: {execution_id}，股票数量: {len(stock_codes)}, 执行范围: {days_range}天")
-            for stock_code in stock_codes:
-                # 检查是否需要取消执行
-                if strategy_execution_cancelled:
-                    logger.info(f"策略执行已被取消，执行ID: {execution_id}")
-                    break
-                    
-                try:
-                    logger.info(f"处理股票 {stock_code}，执行ID: {execution_id}")
-                    # 获取股票历史数据
-                    collection_name = mongo_service.get_collection_name(stock_code)
-                    historical_data = await mongo_service.find(
-                        collection_name, 
-                        {'code': stock_code},
-                        sort=[('date', -1)],
-                        limit=days_range  # 使用用户指定的天数范围
-                    )
-                    
-                    if historical_data:
-                        try:
-                            logger.info(f"获取到股票 {stock_code} 的 {len(historical_data)} 条历史数据，执行ID: {execution_id}")
-                            # 创建策略实例并执行
-                            strategy = StrongKBreakoutStrategy(
-                                initial_capital=strategy_params.get("initial_capital", 100000),
-                                max_position_pct=strategy_params.get("max_position_pct", 0.03),
-                                max_positions=strategy_params.get("max_positions", 3)
-                            )
-                            
-                            # 转换数据格式
-                            import pandas as pd
-                            df = pd.DataFrame(historical_data)
-                            df['date'] = pd.to_datetime(df['date'])
-                            df = df.sort_values('date')
-                            
-                            logger.info(f"数据形状: {df.shape}，执行ID: {execution_id}")
-                            
-                            # 执行策略
-                            signals = strategy.generate_signals(df, stock_code)
-                            logger.info(f"股票 {stock_code} 生成 {len(signals)} 个信号，执行ID: {execution_id}")
-                            
-                            # 转换信号为字典格式
-                            signals_dict = []
-                            try:
-                                for signal in signals:
-                                    signal_dict = {
-                                        "symbol": signal.symbol,
-                                        "action": signal.action,
-                                        "price": signal.price,
-                                        "stop_loss": getattr(signal, 'stop_loss', None),
-                                        "target_price": getattr(signal, 'target_price', None),
-                                        "timestamp": signal.timestamp.isoformat() if hasattr(signal.timestamp, 'isoformat') else str(signal.timestamp),
-                                        "confidence": signal.confidence,
-                                        "stage": getattr(signal, 'stage', None),
-                                        "reason": signal.reason
-                                    }
-                                    signals_dict.append(signal_dict)
-                            except Exception as e:
-                                logger.error(f"转换信号为字典时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}")
-                                raise e
-                            
-                            if signals_dict:
-                                logger.info(f"股票 {stock_code} 生成 {len(signals_dict)} 个有效信号，执行ID: {execution_id}")
-                                results.append({
-                                    "stock_code": stock_code,
-                                    "signals": signals_dict,
-                                    "status": "success"
-                                })
-                            else:
-                                logger.info(f"股票 {stock_code} 未生成有效信号，执行ID: {execution_id}")
-                                results.append({
-                                    "stock_code": stock_code,
-                                    "signals": [],
-                                    "status": "no_signals"
-                                })
-                        except Exception as e:
-                            logger.error(f"生成信号时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}", exc_info=True)
-                            raise e
-                    else:
-                        logger.warning(f"股票 {stock_code} 无历史数据，执行ID: {execution_id}")
-                        results.append({
-                            "stock_code": stock_code,
-                            "signals": [],
-                            "status": "no_data"
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"执行强K策略时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}", exc_info=True)
-                    results.append({
-                        "stock_code": stock_code,
-                        "signals": [],
-                        "status": "error",
-                        "error": str(e)
-                    })
-        
-        elif strategy_type == "bottom_reversal":
-            # 执行底部反转策略
-            logger.info(f"开始执行底部反转策略，执行ID: {execution_id}，股票数量: {len(stock_codes)}, 执行范围: {days_range}天")
-            for stock_code in stock_codes:
-                # 检查是否需要取消执行
-                if strategy_execution_cancelled:
-                    logger.info(f"策略执行已被取消，执行ID: {execution_id}")
-                    break
-                    
-                try:
-                    logger.info(f"处理股票 {stock_code}，执行ID: {execution_id}")
-                    # 获取股票历史数据
-                    collection_name = mongo_service.get_collection_name(stock_code)
-                    historical_data = await mongo_service.find(
-                        collection_name, 
-                        {'code': stock_code},
-                        sort=[('date', -1)],
-                        limit=days_range  # 使用用户指定的天数范围
-                    )
-                    
-                    if historical_data:
-                        try:
-                            logger.info(f"获取到股票 {stock_code} 的 {len(historical_data)} 条历史数据，执行ID: {execution_id}")
-                            # 创建策略实例并执行
-                            strategy = BottomReversalStrategy(
-                                initial_capital=strategy_params.get("initial_capital", 100000),
-                                max_position_pct=strategy_params.get("max_position_pct", 0.03),
-                                max_positions=strategy_params.get("max_positions", 5)
-                            )
-                            
-                            # 转换数据格式
-                            import pandas as pd
-                            df = pd.DataFrame(historical_data)
-                            df['date'] = pd.to_datetime(df['date'])
-                            df = df.sort_values('date')
-                            
-                            logger.info(f"数据形状: {df.shape}，执行ID: {execution_id}")
-                            
-                            # 执行策略
-                            signals = strategy.generate_signals(df, stock_code)
-                            logger.info(f"股票 {stock_code} 生成 {len(signals)} 个信号，执行ID: {execution_id}")
-                            
-                            # 转换信号为字典格式
-                            signals_dict = []
-                            try:
-                                for signal in signals:
-                                    signal_dict = {
-                                        "symbol": signal.symbol,
-                                        "action": signal.action,
-                                        "price": signal.price,
-                                        "stop_loss": getattr(signal, 'stop_loss', None),
-                                        "target_price": getattr(signal, 'target_price', None),
-                                        "timestamp": signal.timestamp.isoformat() if hasattr(signal.timestamp, 'isoformat') else str(signal.timestamp),
-                                        "confidence": signal.confidence,
-                                        "reason": signal.reason
-                                    }
-                                    signals_dict.append(signal_dict)
-                            except Exception as e:
-                                logger.error(f"转换信号为字典时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}")
-                                raise e
-                            
-                            if signals_dict:
-                                logger.info(f"股票 {stock_code} 生成 {len(signals_dict)} 个有效信号，执行ID: {execution_id}")
-                                results.append({
-                                    "stock_code": stock_code,
-                                    "signals": signals_dict,
-                                    "status": "success"
-                                })
-                            else:
-                                logger.info(f"股票 {stock_code} 未生成有效信号，执行ID: {execution_id}")
-                                results.append({
-                                    "stock_code": stock_code,
-                                    "signals": [],
-                                    "status": "no_signals"
-                                })
-                        except Exception as e:
-                            logger.error(f"生成信号时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}", exc_info=True)
-                            raise e
-                    else:
-                        logger.warning(f"股票 {stock_code} 无历史数据，执行ID: {execution_id}")
-                        results.append({
-                            "stock_code": stock_code,
-                            "signals": [],
-                            "status": "no_data"
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"执行底部反转策略时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}", exc_info=True)
-                    results.append({
-                        "stock_code": stock_code,
-                        "signals": [],
-                        "status": "error",
-                        "error": str(e)
-                    })
-        # 重置执行状态
-        strategy_execution_in_progress = False
-        strategy_execution_cancelled = False
-        
-        message = f"手动执行{strategy_type}策略完成"
-        if strategy_execution_cancelled:
-            message = f"手动执行{strategy_type}策略已取消"
-            
-        logger.info(f"策略执行完成: {message}, 执行ID: {execution_id}, 总股票数: {len(stock_codes)}, 结果数: {len(results)}")
-        
-        # 存储执行结果
-        strategy_execution_results[execution_id] = {
-            "status": "success",
-            "message": message,
-            "total_stocks": len(stock_codes),
-            "results": results,
-            "cancelled": strategy_execution_cancelled,
-            "completed_at": datetime.utcnow()
-        }
-        
-    except Exception as e:
-        # 重置执行状态
-        strategy_execution_in_progress = False
-        strategy_execution_cancelled = False
-        logger.error(f"后台策略执行任务发生错误: {str(e)}, 执行ID: {execution_id}")
-        
-        # 存储错误结果
-        strategy_execution_results[execution_id] = {
-            "status": "error",
-            "message": f"策略执行过程中发生错误: {str(e)}",
-            "total_stocks": 0,
-            "results": [],
-            "cancelled": strategy_execution_cancelled,
-            "completed_at": datetime.utcnow()
-        }
-
 @router.get("/execute/status/{execution_id}")
 async def get_execution_status(execution_id: str):
     """获取策略执行状态"""
-    global strategy_execution_results
+    job_service = StrategyJobService()
+    job = await job_service.get_job(execution_id)
     
-    # 检查执行是否完成
-    if execution_id in strategy_execution_results:
-        result = strategy_execution_results[execution_id]
-        # 清理已完成的结果（可选）
-        # del strategy_execution_results[execution_id]
-        return {
-            "status": "completed",
-            "result": result
-        }
-    elif strategy_execution_in_progress:
-        return {
-            "status": "running",
-            "message": "策略执行中"
-        }
-    else:
+    if not job:
         return {
             "status": "not_found",
             "message": "未找到执行任务"
         }
+    
+    progress = {"total": job.get("total", 0), "processed": job.get("processed", 0)}
+    
+    if job["status"] in FINISHED_STATUSES:
+        results = await job_service.get_results(execution_id)
+        return {
+            "status": "completed",
+            "result": {
+                "status": "error" if job["status"] == ERROR else "success",
+                "message": job.get("message"),
+                "total_stocks": job.get("total", 0),
+                "results": results,
+                "cancelled": job["status"] == CANCELLED,
+                "completed_at": job.get("completed_at")
+            }
+        }
+    
+    return {
+        "status": "running",
+        "message": "策略执行中",
+        "job_status": job["status"],
+        "progress": progress
+    }
+
+@router.get("/execute/jobs")
+async def list_execution_jobs(limit: int = Query(20, ge=1, le=200)):
+    """列出最近的策略执行任务"""
+    job_service = StrategyJobService()
+    return {"jobs": await job_service.list_jobs(limit)}
+
+@router.get("/execute/{execution_id}/results")
+async def get_execution_results(
+    execution_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, le=5000),
+    status: str = Query(None, description="按结果状态过滤：success, no_signals, no_data, error")
+):
+    """分页读取任务结果，任务运行中可读取已完成的部分"""
+    job_service = StrategyJobService()
+    job = await job_service.get_job(execution_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Execution job not found")
+    
+    results = await job_service.get_results(execution_id, offset, limit, status)
+    return {
+        "execution_id": execution_id,
+        "job_status": job["status"],
+        "total_stocks": job.get("total", 0),
+        "processed": job.get("processed", 0),
+        "offset": offset,
+        "results": results
+    }
+
+@router.get("/execute/{execution_id}/trace")
+async def get_execution_trace(
+    execution_id: str,
+    stock_code: str = Query(None, description="只返回指定股票的追踪记录")
+):
+    """读取执行任务的决策追踪记录（创建任务时需通过 trace 参数开启）"""
+    job_service = StrategyJobService()
+    job = await job_service.get_job(execution_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Execution job not found")
+    
+    traces = await job_service.get_traces(execution_id, stock_code)
+    return {
+        "execution_id": execution_id,
+        "job_status": job["status"],
+        "trace_options": job.get("trace"),
+        "stocks": traces
+    }
+
+@router.post("/execute/{execution_id}/resume")
+async def resume_execution(execution_id: str):
+    """在当前进程中接管租约已过期的任务，从检查点继续执行"""
+    job_service = StrategyJobService()
+    if await job_service.start_job(execution_id):
+        return {"status": "success", "message": "策略执行任务已恢复", "execution_id": execution_id}
+    return {"status": "success", "message": "任务已完成或正由其它进程执行", "execution_id": execution_id}
 
 @router.post("/execute/stop")
-async def stop_strategy_execution():
+async def stop_strategy_execution(execution_id: str = Query(None, description="任务ID，不传时停止所有任务")):
     """停止策略执行"""
-    global strategy_execution_in_progress, strategy_execution_cancelled
+    job_service = StrategyJobService()
+    
+    if execution_id:
+        stopped = 1 if await job_service.cancel_job(execution_id) else 0
+    else:
+        stopped = await job_service.cancel_all()
     
-    if strategy_execution_in_progress:
-        strategy_execution_cancelled = True
+    if stopped:
         return {"status": "success", "message": "策略执行停止命令已发送"}
     else:
         return {"status": "success", "message": "当前没有正在执行的策略"}
@@ -957,24 +566,36 @@ async def filter_stocks(
     max_price: float = Query(None, description="最高价格"),
     min_volume: int = Query(None, description="最小成交量"),
     market: str = Query(None, description="市场类型：sh, sz, bj"),
-    industry: str = Query(None, description="行业")
+    industry: str = Query(None, description="行业"),
+    min_pct_chg: float = Query(None, description="最小涨跌幅(%)"),
+    max_pct_chg: float = Query(None, description="最大涨跌幅(%)"),
+    min_volume_ratio: float = Query(None, description="最小量比（成交量/20日均量）"),
+    min_cci: float = Query(None, description="最小CCI"),
+    max_cci: float = Query(None, description="最大CCI"),
+    max_pct_from_high_52w: float = Query(None, description="距52周最高价的最大跌幅(%)，如 -5 表示5%以内"),
+    limit: int = Query(0, ge=0, description="最多返回数量，0 表示不限制")
 ):
-    """筛选股票"""
+    """筛选股票（基于 latest_snapshot 全市场最新快照，在进程内的快照副本上筛选）"""
     try:
         mongo_service = MongoDBService()
         
         # 构建筛选条件
         filter_conditions = {}
-        
-        if min_price is not None or max_price is not None:
-            filter_conditions['current_price'] = {}
-            if min_price is not None:
-                filter_conditions['current_price']['$gte'] = min_price
-            if max_price is not None:
-                filter_conditions['current_price']['$lte'] = max_price
-                
-        if min_volume is not None:
-            filter_conditions['volume'] = {'$gte': min_volume}
+        ranges = {
+            'close': (min_price, max_price),
+            'volume': (min_volume, None),
+            'pctChg': (min_pct_chg, max_pct_chg),
+            'volume_ratio': (min_volume_ratio, None),
+            'cci': (min_cci, max_cci),
+            'pct_from_high_52w': (max_pct_from_high_52w, None),
+        }
+        for field, (lower, upper) in ranges.items():
+            if lower is not None or upper is not None:
+                filter_conditions[field] = {}
+                if lower is not None:
+                    filter_conditions[field]['$gte'] = lower
+                if upper is not None:
+                    filter_conditions[field]['$lte'] = upper
             
         if market:
             filter_conditions['market'] = market
@@ -983,12 +604,7 @@ async def filter_stocks(
             filter_conditions['industry'] = {'$regex': industry, '$options': 'i'}
         
         # 获取筛选后的股票
-        stocks = await mongo_service.find('stock_info', filter_conditions)
-        
-        # 转换ObjectId
-        for stock in stocks:
-            if '_id' in stock and isinstance(stock['_id'], ObjectId):
-                stock['_id'] = str(stock['_id'])
+        stocks = await SnapshotService(mongo_service).filter(filter_conditions, limit=limit)
         
         return {
             "status": "success",
@@ -998,4 +614,15 @@ async def filter_stocks(
         
     except Exception as e:
         logger.error(f"Error filtering stocks: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/stocks/snapshot/refresh")
+async def refresh_latest_snapshot():
+    """重建全市场最新快照（日常由日线数据更新流程逐只维护）"""
+    try:
+        count = await SnapshotService().refresh_all()
+        return {"status": "success", "message": f"Latest snapshot refreshed for {count} stocks", "count": count}
+    except Exception as e:
+        logger.error(f"Error refreshing latest snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
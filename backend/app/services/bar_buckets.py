@@ -0,0 +1,221 @@
+"""按月分桶的日线存储
+
+stock_daily_<code> 中每根K线一个文档，读取十年数据需要约 2500 个文档。
+stock_monthly_<code> 中每只股票每月一个文档：数值字段按列打包为 float64 的 BSON Binary，
+日期只保存当月的日（uint8），读取一年数据只需 12 个文档。
+
+分桶是逐根K线集合之外的一份副本，用于加快 get_stock_history 等按股票读取历史的路径；
+快照、选股和全市场加载仍读取逐根K线的集合，因此启用后总存储会增加而不是减少。
+
+设置 daily_bar_layout = "monthly" 后，日线写入时同时更新月度分桶。分桶完整的股票
+（迁移完成，或首次抓取时写入了全部历史）在 monthly_bar_status 中有记录，只有这些股票
+从分桶读取，其余股票（包括只写入了部分月份的股票）仍读取逐根K线的集合。
+"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+
+from app.services.ingestion_pipeline import FLOAT_FIELDS, INT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_FIELDS = FLOAT_FIELDS + INT_FIELDS
+STATUS_COLLECTION = "monthly_bar_status"
+# 分桶完整的确认结果在本进程内缓存的秒数，其他进程 unmark 后最迟在该时间后生效
+COMPLETE_CACHE_SECONDS = 60.0
+
+
+def pack(values, dtype=np.float64) -> Binary:
+    return Binary(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+
+def unpack(data: bytes, dtype=np.float64) -> np.ndarray:
+    return np.frombuffer(data, dtype=dtype)
+
+
+def month_start(date: datetime) -> datetime:
+    return datetime(date.year, date.month, 1)
+
+
+def month_document(stock_code: str, month: datetime, bars: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """一个月的K线（按日期升序）打包为分桶文档"""
+    return {
+        "code": stock_code,
+        "month": month,
+        "count": len(bars),
+        "days": pack([bar["date"].day for bar in bars], np.uint8),
+        "adjustflag": [bar.get("adjustflag", "") for bar in bars],
+        # 缺少的值保存为 NaN，展开时不生成该字段，不会变成 0
+        "columns": {name: pack([np.nan if bar.get(name) is None else bar[name] for bar in bars])
+                    for name in NUMERIC_FIELDS},
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def bucket_bars(bucket: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """分桶文档展开为按日期升序的K线文档"""
+    month = bucket["month"]
+    days = unpack(bucket["days"], np.uint8)
+    columns = {name: unpack(data) for name, data in bucket.get("columns", {}).items()}
+    flags = bucket.get("adjustflag") or [""] * len(days)
+    bars = []
+    for i, day in enumerate(days):
+        bar = {"code": bucket["code"], "date": datetime(month.year, month.month, int(day))}
+        for name, column in columns.items():
+            value = column[i]
+            if np.isnan(value):
+                continue
+            bar[name] = int(value) if name in INT_FIELDS else float(value)
+        bar["adjustflag"] = flags[i]
+        bars.append(bar)
+    return bars
+
+
+class MonthlyBarStore:
+    """stock_monthly_<code> 的读写"""
+
+    # 本进程已创建索引的分桶集合
+    _indexed = set()
+    # 本进程已确认分桶完整的股票 -> 确认时间（只缓存肯定结果，其他进程完成的迁移随时生效，
+    # 其他进程的 unmark 在 COMPLETE_CACHE_SECONDS 内生效）
+    _complete: Dict[str, float] = {}
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def collection_name(stock_code: str) -> str:
+        return f"stock_monthly_{stock_code.lower()}"
+
+    async def _ensure_index(self, collection_name: str):
+        if collection_name not in MonthlyBarStore._indexed:
+            await self.db[collection_name].create_index([("month", ASCENDING)], unique=True)
+            MonthlyBarStore._indexed.add(collection_name)
+
+    async def is_complete(self, stock_code: str) -> bool:
+        """该股票的分桶是否包含全部历史"""
+        checked_at = MonthlyBarStore._complete.get(stock_code)
+        if checked_at is not None and time.monotonic() - checked_at < COMPLETE_CACHE_SECONDS:
+            return True
+        if await self.db[STATUS_COLLECTION].find_one({"code": stock_code}, {"_id": 1}) is None:
+            MonthlyBarStore._complete.pop(stock_code, None)
+            return False
+        MonthlyBarStore._complete[stock_code] = time.monotonic()
+        return True
+
+    async def mark_complete(self, stock_code: str, first_date: datetime):
+        """记录分桶已包含从 first_date 开始的全部历史"""
+        await self.db[STATUS_COLLECTION].update_one(
+            {"code": stock_code},
+            {"$set": {"code": stock_code, "first_date": first_date, "completed_at": datetime.utcnow()}},
+            upsert=True
+        )
+        MonthlyBarStore._complete[stock_code] = time.monotonic()
+
+    async def unmark(self, stock_code: str):
+        """分桶可能缺少K线（写入失败、重建中），读取回退到逐根K线的集合直到重新迁移"""
+        MonthlyBarStore._complete.pop(stock_code, None)
+        await self.db[STATUS_COLLECTION].delete_one({"code": stock_code})
+
+    async def write(self, stock_code: str, documents: List[Dict[str, Any]], replace: bool = False) -> int:
+        """把日线文档合并进所在月份的分桶，返回更新的分桶数
+
+        同一月份已有的K线按日期合并（新数据覆盖旧数据）；replace 为 True 时不读取旧分桶，
+        直接以 documents 重建涉及的月份（迁移时使用）。
+        """
+        if not documents:
+            return 0
+        collection_name = self.collection_name(stock_code)
+        await self._ensure_index(collection_name)
+
+        months: Dict[datetime, Dict[datetime, Dict[str, Any]]] = {}
+        for doc in documents:
+            months.setdefault(month_start(doc["date"]), {})[doc["date"]] = doc
+        if not replace:
+            existing = await self.db[collection_name].find({"month": {"$in": list(months)}}).to_list(length=None)
+            for bucket in existing:
+                merged = {bar["date"]: bar for bar in bucket_bars(bucket)}
+                merged.update(months[bucket["month"]])
+                months[bucket["month"]] = merged
+
+        operations = [
+            ReplaceOne({"month": month},
+                       month_document(stock_code, month, [bars[date] for date in sorted(bars)]),
+                       upsert=True)
+            for month, bars in months.items()
+        ]
+        await self.db[collection_name].bulk_write(operations, ordered=False)
+        return len(operations)
+
+    async def read(self, stock_code: str, start_date: Optional[datetime] = None,
+                   end_date: Optional[datetime] = None, descending: bool = False,
+                   max_bars: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """读取 [start_date, end_date] 的K线，按日期排序
+
+        max_bars > 0 时读够条数即停止读取更早（或更晚）的分桶。该股票的分桶不完整时
+        返回 None，由调用方回退到逐根K线的集合。
+        """
+        if not await self.is_complete(stock_code):
+            return None
+        collection = self.db[self.collection_name(stock_code)]
+        query: Dict[str, Any] = {}
+        if start_date or end_date:
+            query["month"] = {}
+            if start_date:
+                query["month"]["$gte"] = month_start(start_date)
+            if end_date:
+                query["month"]["$lte"] = end_date
+        cursor = collection.find(query, {"_id": 0}).sort("month", DESCENDING if descending else ASCENDING)
+
+        bars: List[Dict[str, Any]] = []
+        async for bucket in cursor:
+            month_bars = [
+                bar for bar in bucket_bars(bucket)
+                if (start_date is None or bar["date"] >= start_date) and (end_date is None or bar["date"] <= end_date)
+            ]
+            bars.extend(reversed(month_bars) if descending else month_bars)
+            if max_bars and len(bars) >= max_bars:
+                break
+        return bars
+
+    async def dates(self, stock_code: str) -> Optional[List[datetime]]:
+        """已保存的全部日期（升序），只读取分桶的月份和日，分桶不完整时返回 None"""
+        if not await self.is_complete(stock_code):
+            return None
+        buckets = await self.db[self.collection_name(stock_code)].find(
+            {}, {"_id": 0, "month": 1, "days": 1}
+        ).sort("month", ASCENDING).to_list(length=None)
+        return [
+            datetime(bucket["month"].year, bucket["month"].month, int(day))
+            for bucket in buckets for day in unpack(bucket["days"], np.uint8)
+        ]
+
+    async def migrate(self, stock_code: str, source_collection: str, batch_months: int = 120) -> int:
+        """把逐根K线集合中的全部数据重建为月度分桶，完成后标记为完整，返回写入的分桶数"""
+        await self.unmark(stock_code)
+        written = 0
+        first_date: Optional[datetime] = None
+        batch: List[Dict[str, Any]] = []
+        current_months = set()
+        cursor = self.db[source_collection].find({"code": stock_code}, {"_id": 0, "created_at": 0}).sort("date", ASCENDING)
+        async for doc in cursor:
+            if not isinstance(doc.get("date"), datetime):
+                continue
+            if first_date is None:
+                first_date = doc["date"]
+            month = month_start(doc["date"])
+            if month not in current_months and len(current_months) >= batch_months:
+                written += await self.write(stock_code, batch, replace=True)
+                batch, current_months = [], set()
+            current_months.add(month)
+            batch.append(doc)
+        written += await self.write(stock_code, batch, replace=True)
+        if first_date is not None:
+            await self.mark_complete(stock_code, first_date)
+        return written
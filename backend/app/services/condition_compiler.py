@@ -0,0 +1,264 @@
+"""通用策略条件编译
+
+策略的 conditions 是 {indicator, operator, value, days_ago} 字典列表。这里把条件列表
+编译为一组 NumPy 谓词，在指标面板（时间 × 股票 × 指标）上一次算出全部股票的布尔
+掩码，而不是逐只股票逐个条件解释执行：
+
+- 最新截面：每只股票取最近 depth 条技术指标按位置对齐，只看最后一行即为当前选股结果；
+- 历史区间：按日期对齐，每一行都是当天的选股结果。
+
+value 可以是数值，也可以是另一个指标名（如 macd_line 上穿 macd_signal）。
+除比较运算符外还支持 cross_above / cross_below（上穿/下穿），days_ago 表示整体向前
+偏移的交易日数。缺失值（NaN）视为条件不满足。
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+COMPARISON_OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+CROSS_OPERATORS = ('cross_above', 'cross_below')
+
+# 前端指标名称与技术指标文档字段的对应关系（其余名称按小写字段名处理）
+INDICATOR_ALIASES = {
+    'macd': 'macd_line',
+    'kdj': 'kdj_k',
+    'boll': 'bb_middle',
+}
+
+
+def indicator_field(name: str) -> str:
+    key = str(name).strip().lower()
+    return INDICATOR_ALIASES.get(key, key)
+
+
+class IndicatorPanel:
+    """指标面板
+
+    Args:
+        codes: 股票代码，长度 N
+        fields: 指标字段名，长度 F
+        values: 形状 (T, N, F) 的 float64 数组，时间从早到晚，缺失为 NaN
+        dates: 形状 (T, N) 的 datetime64 数组，每个单元对应的日期，缺失为 NaT
+        calendar: 按日期对齐时每行的日期，长度 T；按位置对齐时为 None
+    """
+
+    def __init__(self, codes: Sequence[str], fields: Sequence[str], values: np.ndarray, dates: np.ndarray,
+                 calendar: Optional[np.ndarray] = None):
+        self.codes = list(codes)
+        self.fields = list(fields)
+        self.values = values
+        self.dates = dates
+        self.calendar = calendar
+        self._field_index = {name: i for i, name in enumerate(self.fields)}
+
+    @property
+    def depth(self) -> int:
+        return self.values.shape[0]
+
+    def column(self, name: str, lag: int = 0) -> np.ndarray:
+        """字段在每个时间点向前 lag 行的取值，形状 (T, N)；前 lag 行填 NaN"""
+        index = self._field_index.get(name)
+        if index is None:
+            return np.full(self.values.shape[:2], np.nan)
+        data = self.values[:, :, index]
+        if lag == 0:
+            return data
+        shifted = np.full_like(data, np.nan)
+        if lag < len(data):
+            shifted[lag:] = data[:-lag]
+        return shifted
+
+    @classmethod
+    def from_latest(cls, docs_by_code: Dict[str, List[Dict[str, Any]]], fields: Iterable[str],
+                    depth: int) -> 'IndicatorPanel':
+        """每只股票最近 depth 条指标（文档按日期倒序）按位置对齐，最后一行为各自的最新数据"""
+        codes = list(docs_by_code)
+        fields = list(fields)
+        values = np.full((depth, len(codes), len(fields)), np.nan)
+        dates = np.full((depth, len(codes)), np.datetime64('NaT'), dtype='datetime64[ns]')
+        for n, code in enumerate(codes):
+            for k, doc in enumerate(docs_by_code[code][:depth]):
+                row = depth - 1 - k
+                dates[row, n] = _to_datetime64(doc.get('date'))
+                for f, name in enumerate(fields):
+                    values[row, n, f] = _to_float(doc.get(name))
+        return cls(codes, fields, values, dates)
+
+    @classmethod
+    def from_history(cls, docs_by_code: Dict[str, List[Dict[str, Any]]],
+                     fields: Iterable[str]) -> 'IndicatorPanel':
+        """按日期对齐的历史面板，行是所有股票日期的并集（升序）"""
+        codes = list(docs_by_code)
+        fields = list(fields)
+        per_code = []
+        for code in codes:
+            docs = docs_by_code[code]
+            code_dates = np.array([_to_datetime64(doc.get('date')) for doc in docs], dtype='datetime64[ns]')
+            per_code.append((docs, code_dates))
+
+        all_dates = [d for _, code_dates in per_code for d in code_dates if not np.isnat(d)]
+        calendar = np.unique(np.array(all_dates, dtype='datetime64[ns]'))
+        values = np.full((len(calendar), len(codes), len(fields)), np.nan)
+        dates = np.tile(calendar[:, None], (1, len(codes)))
+        present = np.zeros((len(calendar), len(codes)), dtype=bool)
+
+        for n, (docs, code_dates) in enumerate(per_code):
+            valid = ~np.isnat(code_dates)
+            rows = np.searchsorted(calendar, code_dates[valid])
+            present[rows, n] = True
+            for f, name in enumerate(fields):
+                column = np.array([_to_float(doc.get(name)) for doc, ok in zip(docs, valid) if ok])
+                values[rows, n, f] = column
+        dates[~present] = np.datetime64('NaT')
+        return cls(codes, fields, values, dates, calendar)
+
+
+def _to_float(value) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_datetime64(value) -> np.datetime64:
+    if value is None:
+        return np.datetime64('NaT')
+    return pd.Timestamp(value).to_datetime64()
+
+
+Predicate = Callable[[IndicatorPanel], np.ndarray]
+
+
+@dataclass
+class CompiledCondition:
+    """单个编译后的条件"""
+    field: str
+    operator: str
+    value: Any
+    days_ago: int
+    predicate: Predicate
+
+
+@dataclass
+class CompiledConditions:
+    """编译后的条件集合，全部条件同时满足（AND）才算命中"""
+    conditions: List[CompiledCondition]
+    fields: List[str] = field(default_factory=list)
+    depth: int = 1  # 最新截面评估需要的最少行数
+
+    def evaluate(self, panel: IndicatorPanel) -> np.ndarray:
+        """返回形状 (T, N) 的布尔掩码"""
+        mask = np.ones(panel.values.shape[:2], dtype=bool)
+        if not self.conditions:
+            return mask & False
+        for condition in self.conditions:
+            mask &= condition.predicate(panel)
+        return mask
+
+    def evaluate_latest(self, panel: IndicatorPanel) -> np.ndarray:
+        """最新截面：返回长度 N 的布尔掩码"""
+        if panel.depth == 0:
+            return np.zeros(len(panel.codes), dtype=bool)
+        return self.evaluate(panel)[-1]
+
+    def describe(self, panel: IndicatorPanel, row: int, stock_index: int) -> List[Dict[str, Any]]:
+        """命中股票在 row 行各条件对应的日期和指标值"""
+        details = []
+        for condition in self.conditions:
+            source = row - condition.days_ago
+            if source < 0:
+                details.append({'date': None, 'value': None})
+                continue
+            date = panel.dates[source, stock_index]
+            value = panel.column(condition.field)[source, stock_index]
+            details.append({
+                'date': None if np.isnat(date) else pd.Timestamp(date).to_pydatetime(),
+                'value': None if np.isnan(value) else float(value)
+            })
+        return details
+
+
+def _operand(value: Any, lag: int) -> Tuple[Callable[[IndicatorPanel], Any], Optional[str]]:
+    """数值常量或指标字段"""
+    if isinstance(value, str):
+        try:
+            constant = float(value)
+        except ValueError:
+            name = indicator_field(value)
+            return (lambda panel: panel.column(name, lag)), name
+        return (lambda panel: constant), None
+    constant = np.nan if value is None else float(value)
+    return (lambda panel: constant), None
+
+
+def compile_condition(condition: Dict[str, Any]) -> Tuple[CompiledCondition, List[str], int]:
+    """编译单个条件，返回 (条件, 用到的字段, 需要的行数)"""
+    name = indicator_field(condition.get('indicator', ''))
+    operator = condition.get('operator')
+    days_ago = int(condition.get('days_ago', 0) or 0)
+    value = condition.get('value')
+
+    left = lambda panel, lag: panel.column(name, lag)
+    right_now, right_field = _operand(value, days_ago)
+    fields = [name] + ([right_field] if right_field else [])
+
+    if operator in COMPARISON_OPERATORS:
+        compare = COMPARISON_OPERATORS[operator]
+
+        def predicate(panel: IndicatorPanel) -> np.ndarray:
+            lhs = left(panel, days_ago)
+            rhs = right_now(panel)
+            with np.errstate(invalid='ignore'):
+                result = compare(lhs, rhs)
+            # NaN 与任何值比较都视为不满足（!= 也一样）
+            return result & ~np.isnan(lhs) & ~np.isnan(rhs)
+
+        depth = days_ago + 1
+
+    elif operator in CROSS_OPERATORS:
+        right_before, _ = _operand(value, days_ago + 1)
+        above = operator == 'cross_above'
+
+        def predicate(panel: IndicatorPanel) -> np.ndarray:
+            current, previous = left(panel, days_ago), left(panel, days_ago + 1)
+            rhs_current, rhs_previous = right_now(panel), right_before(panel)
+            with np.errstate(invalid='ignore'):
+                if above:
+                    result = (previous <= rhs_previous) & (current > rhs_current)
+                else:
+                    result = (previous >= rhs_previous) & (current < rhs_current)
+            return result
+
+        depth = days_ago + 2
+
+    else:
+        raise ValueError(f"Unsupported condition operator: {operator}")
+
+    compiled = CompiledCondition(field=name, operator=operator, value=value,
+                                 days_ago=days_ago, predicate=predicate)
+    return compiled, fields, depth
+
+
+def compile_conditions(conditions: Optional[List[Dict[str, Any]]]) -> CompiledConditions:
+    """编译策略的条件列表；空列表编译为永不满足"""
+    compiled = []
+    fields: List[str] = []
+    depth = 1
+    for condition in conditions or []:
+        item, item_fields, item_depth = compile_condition(condition)
+        compiled.append(item)
+        fields.extend(f for f in item_fields if f not in fields)
+        depth = max(depth, item_depth)
+    return CompiledConditions(conditions=compiled, fields=fields, depth=depth)
@@ -1,28 +1,84 @@
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import aiohttp
 import apscheduler.schedulers.asyncio
-import baostock as bs
-import tushare as ts
 import pandas as pd
+from app.config.settings import settings
+from app.services.gap_scanner import GapScanner
+from app.services.ingestion_pipeline import IngestionPipeline, daily_bar_documents, daily_bar_operations
+from app.services.market_daily import split_by_code, tushare_daily_frame
+from app.services.market_data_provider import BaoStockProvider, MarketDataProvider, TushareProvider
+from app.services.minute_bars import MinuteBarService
 from app.services.mongodb_service import MongoDBService
+from app.services.retry_service import FailedRequestRetrier
+from app.services.snapshot_service import SnapshotService
+from app.services.stock_list import (baostock_stock_documents, changed_documents, company_documents,
+                                     tushare_stock_documents)
 from app.services.technical_analysis_service import TechnicalAnalysisService
+from app.services.trading_calendar import TradingCalendar
+from app.utils.price_adjust import RAW_FLAG, adjust_frame, ex_rights_detected, latest_back_factor
+from app.utils.rate_limit import UpstreamGuard
+from app.utils.response_cache import ResponseCache
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from pandas import to_datetime
 from pymongo import UpdateOne
 
 logger = logging.getLogger(__name__)
 
+# BaoStock 客户端共用一个连接，查询放在单独的线程里串行执行，避免阻塞事件循环
+BAOSTOCK_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="baostock")
+
+# 各数据源共用的限流与熔断
+BAOSTOCK_GUARD = UpstreamGuard("baostock", settings.baostock_qps,
+                               failure_threshold=settings.upstream_failure_threshold,
+                               reset_timeout=settings.upstream_reset_seconds)
+TUSHARE_GUARD = UpstreamGuard("tushare", settings.tushare_qps,
+                              failure_threshold=settings.upstream_failure_threshold,
+                              reset_timeout=settings.upstream_reset_seconds)
+
+# Bulk data jobs (stock list, daily fetch, gap backfill, minute import) run one at a time per process,
+# whichever DataService instance starts them
+DATA_JOB_LOCK = asyncio.Lock()
 
 class DataService:
-    def __init__(self):
+    # Process-wide instance shared by the scheduler and the routers
+    _shared: Optional["DataService"] = None
+
+    def __init__(self, provider: Optional[MarketDataProvider] = None,
+                 tushare_provider: Optional[MarketDataProvider] = None):
+        # Per-code daily bars come from provider; TuShare calls use tushare_provider when given,
+        # otherwise a TushareProvider built from the configured token
+        self.provider = provider or BaoStockProvider()
+        self.tushare_provider = tushare_provider
         self.mongo_service = MongoDBService()
         self.technical_service = TechnicalAnalysisService()
+        self.snapshot_service = SnapshotService(self.mongo_service)
         self.scheduler = apscheduler.schedulers.asyncio.AsyncIOScheduler()
         self.startup_job_run = False
-        self.is_fetching = False
+        # Last summary of each background job started through _run_in_background
+        self.job_results: Dict[str, Any] = {}
+        self._background_tasks = set()
+        self.retrier = FailedRequestRetrier(self)
+        self.gap_scanner = GapScanner(self)
+        self.minute_service = MinuteBarService(self)
+        self.response_cache = ResponseCache(settings.upstream_cache_dir, settings.upstream_cache_ttl_hours * 3600)
+        self.trading_calendar = TradingCalendar(self.query_trade_dates, self.mongo_service)
+
+    @classmethod
+    def shared(cls) -> "DataService":
+        """The process-wide DataService, created on first use"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @property
+    def is_fetching(self) -> bool:
+        """Whether a bulk data job is running anywhere in this process"""
+        return DATA_JOB_LOCK.locked()
 
     async def startup_job(self):
         """Run initial data fetch on startup"""
@@ -40,12 +96,14 @@ class DataService:
     async def _login_baostock(self) -> bool:
         """Login to BaoStock system"""
         try:
-            lg = bs.login()
-            if lg.error_code == "0":
+            error_code, error_msg = await BAOSTOCK_GUARD.call(
+                self.provider.login, executor=BAOSTOCK_EXECUTOR, is_failure=lambda result: result[0] != "0"
+            )
+            if error_code == "0":
                 logger.info("BaoStock login successful")
                 return True
             else:
-                logger.error(f"BaoStock login failed: {lg.error_msg}")
+                logger.error(f"BaoStock login failed: {error_msg}")
                 return False
         except Exception as e:
             logger.error(f"Error logging into BaoStock: {str(e)}")
@@ -61,16 +119,22 @@ class DataService:
         stock_history_cron = await self.mongo_service.get_config_value(
             "scheduler", "timing", "stock_history_fetch_cron", "04 20 * * *"
         )
+
+        gap_scan_cron = await self.mongo_service.get_config_value(
+            "scheduler", "timing", "gap_scan_cron", "30 03 * * 6"
+        )
         
         # Parse cron expressions
         try:
             stock_list_trigger = self._parse_cron_expression(stock_list_cron)
             stock_history_trigger = self._parse_cron_expression(stock_history_cron)
+            gap_scan_trigger = self._parse_cron_expression(gap_scan_cron)
         except Exception as e:
             logger.error(f"Error parsing cron expressions: {str(e)}")
             # Use default triggers
             stock_list_trigger = CronTrigger(hour=20, minute=30)
             stock_history_trigger = CronTrigger(hour=20, minute=32)
+            gap_scan_trigger = CronTrigger(day_of_week=6, hour=3, minute=30)
         
         # Schedule stock list update
         self.scheduler.add_job(
@@ -79,15 +143,34 @@ class DataService:
             id="fetch_stock_list",
         )
 
-        # Schedule daily data update
+        # Schedule daily data update (skipped on non-trading days)
         self.scheduler.add_job(
-            self.fetch_all_stock_daily_data,
+            self.scheduled_daily_fetch,
             trigger=stock_history_trigger,
             id="fetch_daily_data",
         )
 
+        # Replay failed daily requests with backoff
+        self.scheduler.add_job(
+            self.retry_failed_requests,
+            trigger=IntervalTrigger(minutes=settings.retry_interval_minutes),
+            id="retry_failed_requests",
+            max_instances=1,
+            coalesce=True,
+        )
+
+        # Find and backfill mid-history holes left by partially failed runs
+        self.scheduler.add_job(
+            self.scan_gaps,
+            trigger=gap_scan_trigger,
+            id="scan_daily_gaps",
+            max_instances=1,
+            coalesce=True,
+        )
+
         self.scheduler.start()
-        logger.info(f"Data scheduler started with stock list cron: {stock_list_cron}, history cron: {stock_history_cron}")
+        logger.info(f"Data scheduler started with stock list cron: {stock_list_cron}, history cron: {stock_history_cron}, "
+                    f"gap scan cron: {gap_scan_cron}")
 
     def _parse_cron_expression(self, cron_expr: str) -> CronTrigger:
         """Parse cron expression string into CronTrigger"""
@@ -104,39 +187,32 @@ class DataService:
             day_of_week=day_of_week if day_of_week != '*' else None
         )
 
-    def _convert_ts_code(self, ts_code: str) -> str:
-        """Convert TuShare ts_code format (123456.SH) to standard format (sh.123456)"""
-        if "." in ts_code:
-            parts = ts_code.split(".")
-            code = parts[0]
-            market = parts[1].lower()
-            return f"{market}.{code}"
-        return ts_code
+    async def _get_tushare_provider(self) -> Optional[MarketDataProvider]:
+        """TuShare provider, or None when no token is configured"""
+        if self.tushare_provider is not None:
+            return self.tushare_provider
+        # Get TuShare token from configuration
+        token = await self.mongo_service.get_config_value(
+            "system", "general", "tushare_token"
+        )
+        if not token:
+            logger.warning("TuShare token not found in configuration")
+            return None
+        return TushareProvider(token)
 
     async def fetch_stock_list_from_tushare(self) -> Optional[tuple]:
         """Fetch stock list from TuShare"""
         try:
-            # Get TuShare token from configuration
-            token = await self.mongo_service.get_config_value(
-                "system", "general", "tushare_token"
-            )
-            if not token:
-                logger.warning("TuShare token not found in configuration")
+            pro = await self._get_tushare_provider()
+            if pro is None:
                 return None
 
-            # Set TuShare token
-            ts.set_token(token)
-            pro = ts.pro_api()
-
             # Fetch stock basic info
-            df = pro.stock_basic(
-                exchange="",
-                list_status="L"
-            )
+            df = await self._cached_tushare_call(pro, "stock_basic", exchange="", list_status="L")
             
             # Also fetch company detailed info for ALL stocks at once
             try:
-                company_df = pro.stock_company(**{
+                company_df = await self._cached_tushare_call(pro, "stock_company", **{
                     "ts_code": "",
                     "exchange": "",
                     "status": "",
@@ -154,32 +230,66 @@ class DataService:
             logger.error(f"Error fetching stock list from TuShare: {str(e)}")
             return None
 
-    def fetch_latest_stock_list(self, date: str = None) -> bool | tuple[list[Any], Any]:
+    async def _cached_tushare_call(self, pro: MarketDataProvider, api_name: str, **params) -> pd.DataFrame:
+        """Call a TuShare API, reusing today's cached response when available"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        df = self.response_cache.get_frame(api_name, params, today)
+        if df is not None:
+            logger.info(f"Using cached TuShare {api_name} response ({len(df)} rows)")
+            return df
+        df = await TUSHARE_GUARD.call(pro.call, api_name, wait=False, **params)
+        if df is not None and not df.empty:
+            self.response_cache.set_frame(api_name, params, today, df)
+        return df
+
+    async def query_trade_dates(self, start_date: str, end_date: str) -> tuple:
+        """Query the exchange calendar from the provider, returns (error_code, error_msg, fields, rows)"""
+        return await BAOSTOCK_GUARD.call(
+            self.provider.query_trade_dates, start_date, end_date,
+            executor=BAOSTOCK_EXECUTOR, is_failure=lambda result: result[0] != "0"
+        )
+
+    async def fetch_latest_stock_list(self, date: str = None) -> Optional[tuple]:
+        """Fetch the stock list of the last trading day not after date, returns (rows, fields)"""
         if not date:
             date = datetime.now().strftime("%Y-%m-%d")
+        try:
+            # Jump straight to the last trading day instead of probing day by day
+            date = await self.trading_calendar.last_trading_day(date) or date
+        except Exception as e:
+            logger.warning(f"Trading calendar unavailable, probing dates backwards: {str(e)}")
+
         # Fetch stock data from BaoStock
         stock_list = []
+        fields = None
         times = 0
         while not stock_list and times < 30:
-            rs = bs.query_all_stock(date)
-            if rs.error_code != "0":
-                logger.error(f"Error fetching stock list: {rs.error_msg}")
-                self._record_failed_request(
-                    "query_all_stock", {"date": date}, rs.error_msg
+            cached = self.response_cache.get("query_all_stock", None, date)
+            if cached is not None:
+                fields, stock_list = cached["fields"], cached["rows"]
+                break
+
+            error_code, error_msg, fields, stock_list = await BAOSTOCK_GUARD.call(
+                self.provider.query_all_stock, date,
+                executor=BAOSTOCK_EXECUTOR, is_failure=lambda result: result[0] != "0"
+            )
+            if error_code != "0":
+                logger.error(f"Error fetching stock list: {error_msg}")
+                await self._record_failed_request(
+                    "query_all_stock", {"date": date}, error_msg
                 )
-                return False
-
-            while (rs.error_code == "0") & rs.next():
-                stock_list.append(rs.get_row_data())
+                return None
 
-            if not stock_list:
+            if stock_list:
+                self.response_cache.set("query_all_stock", None, date, {"fields": fields, "rows": stock_list})
+            else:
                 logger.warning(
                     "No stock data received, probably due to date is not trading date. Trying the previous one"
                 )
                 date = (to_datetime(date) - timedelta(days=1)).strftime("%Y-%m-%d")
                 times += 1
 
-        return stock_list, rs
+        return stock_list, fields
 
     async def fetch_stock_list(self, date: str = None) -> bool:
         """Fetch all stock list and save to database"""
@@ -187,201 +297,150 @@ class DataService:
             logger.info("Stock list fetch already in progress")
             return False
 
-        self.is_fetching = True
+        await DATA_JOB_LOCK.acquire()
         try:
             # First try to fetch from TuShare
             tushare_result = await self.fetch_stock_list_from_tushare()
 
-            company_operations = []
+            company_docs = []
             if tushare_result:
                 # Process TuShare data
                 df, company_df = tushare_result
                 logger.info(f"Using TuShare data with {len(df)} stocks")
-
-                # Transform data to match existing format
-                operations = []
-                for _, row in df.iterrows():
-                    # Convert ts_code to standard format
-                    code = self._convert_ts_code(row["ts_code"])
-                    
-                    # Filter out Beijing Stock Exchange (bj) stocks
-                    # because BaoStock does not provide data for Beijing Stock Exchange
-                    if code.startswith("bj."):
-                        continue
-
-                    stock_doc = {
-                        "code": code,
-                        "ts_code": row.get("ts_code", ""),
-                        "symbol": row.get("symbol", ""),
-                        "code_name": row["name"],
-                        "name": row["name"],
-                        "area": row.get("area", ""),
-                        "industry": row.get("industry", ""),
-                        "fullname": row.get("fullname", ""),
-                        "enname": row.get("enname", ""),
-                        "cnspell": row.get("cnspell", ""),
-                        "market": row.get("market", ""),
-                        "exchange": row.get("exchange", ""),
-                        "curr_type": row.get("curr_type", ""),
-                        "list_status": row.get("list_status", ""),
-                        "list_date": row.get("list_date", ""),
-                        "delist_date": row.get("delist_date", ""),
-                        "is_hs": row.get("is_hs", ""),
-                        "act_name": row.get("act_name", ""),
-                        "act_ent_type": row.get("act_ent_type", ""),
-                        "updateTime": datetime.utcnow(),
-                    }
-
-                    operations.append(
-                        UpdateOne(
-                            {"code": stock_doc["code"]},
-                            {"$set": stock_doc},
-                            upsert=True,
-                        )
-                    )
-                    
-                    # Prepare company info document if available
-                    if company_df is not None:
-                        # Find company info for this stock
-                        company_rows = company_df[company_df['ts_code'] == row['ts_code']]
-                        if not company_rows.empty:
-                            company_row = company_rows.iloc[0]
-                            company_doc = company_row.to_dict()
-                            # Add converted code
-                            company_doc['code'] = code
-                            company_doc['updated_at'] = datetime.utcnow()
-                            
-                            company_operations.append(
-                                UpdateOne(
-                                    {"ts_code": company_doc["ts_code"]},
-                                    {"$set": company_doc},
-                                    upsert=True,
-                                )
-                            )
-
+                stock_docs = tushare_stock_documents(df)
+                company_docs = company_documents(df, company_df)
             else:
                 # Fallback to BaoStock if TuShare fails
                 logger.info("Falling back to BaoStock for stock list")
-                stock_list, rs = self.fetch_latest_stock_list()
+                latest = await self.fetch_latest_stock_list(date)
+                if not latest:
+                    logger.error("Failed to fetch stock list from BaoStock")
+                    return False
+                stock_list, fields = latest
                 # Convert to DataFrame for better handling
-                df = pd.DataFrame(stock_list, columns=rs.fields)
+                df = pd.DataFrame(stock_list, columns=fields)
                 logger.info(
                     f"Received {len(df)} stocks from BaoStock, DataFrame structure: {df.shape}, columns: {df.columns.tolist()}"
                 )
+                stock_docs = baostock_stock_documents(df)
 
-                # Transform data
-                operations = []
-                for _, row in df.iterrows():
-                    stock_doc = {
-                        "code": row["code"],
-                        "code_name": row["code_name"],
-                        "tradeStatus": row.get("tradeStatus", ""),
-                        "updateTime": datetime.utcnow(),
-                    }
-
-                    operations.append(
-                        UpdateOne(
-                            {"code": stock_doc["code"]},
-                            {"$set": stock_doc},
-                            upsert=True,
-                        )
-                    )
+            if not stock_docs:
+                logger.warning("No operations to perform")
+                return False
 
-            # Bulk write to database
-            if operations:
+            # Only rewrite stocks that are new or changed
+            existing = await self.mongo_service.find(
+                "stock_info", {}, {name: 1 for name in stock_docs[0]}
+            )
+            changed = changed_documents(stock_docs, existing, "code")
+            logger.info(f"{len(changed)} of {len(stock_docs)} stocks are new or changed")
+
+            if changed:
+                operations = [
+                    UpdateOne({"code": doc["code"]}, {"$set": doc}, upsert=True)
+                    for doc in changed
+                ]
                 success = await self.mongo_service.bulk_write("stock_info", operations)
-                if success:
-                    logger.info(
-                        f"Successfully updated {len(operations)} stocks in database"
-                    )
-                    # Remove any successful requests from failed_requests table
-                    await self.mongo_service.delete_one(
-                        "failed_requests",
-                        {"api_name": "query_all_stock", "parameters.date": date},
-                    )
-                    
-                    # Also save company info if available
-                    if company_operations:
-                        company_success = await self.mongo_service.bulk_write("stock_basic_info", company_operations)
-                        if company_success:
-                            logger.info(f"Successfully updated {len(company_operations)} company records in database")
-                        else:
-                            logger.error("Failed to update company info in database")
-                    
-                    return True
-                else:
+                if not success:
                     logger.error("Failed to update stocks in database")
                     return False
-            else:
-                logger.warning("No operations to perform")
-                return False
+                logger.info(f"Successfully updated {len(operations)} stocks in database")
+
+            # Remove any successful requests from failed_requests table
+            await self.mongo_service.delete_one(
+                "failed_requests",
+                {"api_name": "query_all_stock", "parameters.date": date},
+            )
+
+            # Also save company info if available
+            if company_docs:
+                existing = await self.mongo_service.find(
+                    "stock_basic_info", {}, {name: 1 for name in company_docs[0]}
+                )
+                changed = changed_documents(company_docs, existing, "ts_code")
+                if changed:
+                    company_operations = [
+                        UpdateOne({"ts_code": doc["ts_code"]}, {"$set": doc}, upsert=True)
+                        for doc in changed
+                    ]
+                    company_success = await self.mongo_service.bulk_write("stock_basic_info", company_operations)
+                    if company_success:
+                        logger.info(f"Successfully updated {len(company_operations)} company records in database")
+                    else:
+                        logger.error("Failed to update company info in database")
+
+            return True
 
         except Exception as e:
             logger.error(f"Error in fetch_stock_list: {str(e)}")
             await self._record_failed_request("query_all_stock", {"date": date}, str(e))
             return False
         finally:
-            self.is_fetching = False
-
-    async def fetch_all_stock_daily_data(self):
-        """Fetch daily data for all stocks"""
-        # Login to BaoStock
-        login_success = await self._login_baostock()
-        if not login_success:
-            logger.error("Failed to login to BaoStock, cannot fetch stock data")
-            return
+            DATA_JOB_LOCK.release()
 
+    async def scheduled_daily_fetch(self):
+        """Scheduled daily fetch: a no-op on weekends and exchange holidays"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        try:
+            if not await self.trading_calendar.is_trading_day(today):
+                logger.info(f"{today} is not a trading day, skipping daily data fetch")
+                return
+        except Exception as e:
+            logger.warning(f"Trading calendar unavailable, running daily fetch anyway: {str(e)}")
+        await self.fetch_all_stock_daily_data()
+
+    async def _fetch_range(self, last_date: Optional[str]) -> tuple:
+        """Exact (start_date, end_date) still missing for a stock whose data ends on last_date
+
+        start_date is None when the stock is already up to date. Falls back to re-fetching
+        from last_date through today when the trading calendar is unavailable.
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        if not last_date:
+            return settings.data_fetch_start_date, today
+        try:
+            end_date = await self.trading_calendar.last_trading_day(today)
+            start_date = await self.trading_calendar.next_trading_day(last_date[:10])
+        except Exception as e:
+            logger.warning(f"Trading calendar unavailable: {str(e)}")
+            return last_date, today
+        if not start_date or not end_date or start_date > end_date:
+            return None, end_date
+        return start_date, end_date
+
+    async def fetch_all_stock_daily_data(self, mode: Optional[str] = None, trade_date: Optional[str] = None):
+        """Fetch daily data for all stocks
+
+        mode "latest_day" pulls the whole market's bar for one trade date from TuShare and only
+        falls back to per-code BaoStock queries for stocks that are more than one day behind;
+        mode "per_code" (or no TuShare token) queries every stock from BaoStock.
+        """
         if self.is_fetching:
             logger.info("Daily data fetch already in progress")
             return
 
-        self.is_fetching = True
+        mode = mode or settings.daily_fetch_mode
+        await DATA_JOB_LOCK.acquire()
         try:
-            # Get all stock codes, excluding Beijing Stock Exchange (bj) stocks
-            # because BaoStock does not provide data for Beijing Stock Exchange
-            stocks = await self.mongo_service.find(
-                "stock_info", 
-                {"code": {"$not": {"$regex": "^bj\\."}}}, 
-                {"code": 1}
-            )
+            stocks = await self.mongo_service.find("stock_info", {}, {"code": 1, "code_name": 1})
             if not stocks:
                 logger.warning("No stocks found in database")
                 return
 
-            # Process stocks in batches for better performance
-            # More concurrent requests for data fetching (30), fewer for processing (3)
-            fetch_semaphore = asyncio.Semaphore(30)  # Increased threads for data fetching
-            process_semaphore = asyncio.Semaphore(3)  # Reduced threads for processing
-            
-            async def fetch_with_semaphores(stock_code):
-                # First semaphore for fetching data from BaoStock
-                async with fetch_semaphore:
-                    result = await self.fetch_stock_daily_data_without_processing(stock_code)
-                    
-                # Second semaphore for processing data (saving to DB and calculating indicators)
-                if result and result[0]:  # if fetch was successful
-                    async with process_semaphore:
-                        stock_code, df = result[1]  # Fixed unpacking - result is (bool, (stock_code, df))
-                        await self.process_stock_data(stock_code, df)
-                
-                return result[0] if result else False
-            
-            # Process stocks in larger batches
-            batch_size = 100  # Increased batch size
-            successful_fetches = 0
-            total_stocks = len(stocks)
-            
-            for i in range(0, total_stocks, batch_size):
-                batch = stocks[i:i + batch_size]
-                logger.info(f"Processing batch {i//batch_size + 1}/{(total_stocks-1)//batch_size + 1} with {len(batch)} stocks")
-                
-                tasks = [fetch_with_semaphores(stock["code"]) for stock in batch]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                batch_successes = sum(1 for result in results if result is True and result is not Exception)
-                successful_fetches += batch_successes
-                
-                logger.info(f"Completed batch {i//batch_size + 1}, successful: {batch_successes}/{len(batch)}")
+            summary = None
+            if mode == "latest_day":
+                summary = await self._fetch_latest_day(stocks, trade_date)
+            if summary is None:
+                # Exclude Beijing Stock Exchange (bj) stocks
+                # because BaoStock does not provide data for Beijing Stock Exchange
+                summary = await self._run_ingestion([
+                    stock["code"] for stock in stocks if not stock["code"].startswith("bj.")
+                ])
+            if not summary:
+                return
+
+            successful_fetches = summary["completed"]
+            total_stocks = summary["total"]
 
             logger.info(
                 f"Daily data fetch completed. Successful: {successful_fetches}/{total_stocks}"
@@ -401,33 +460,162 @@ class DataService:
         except Exception as e:
             logger.error(f"Error in fetch_all_stock_daily_data: {str(e)}")
         finally:
-            self.is_fetching = False
+            DATA_JOB_LOCK.release()
+
+    async def _run_ingestion(self, stock_codes: list, frames: Optional[Dict[str, pd.DataFrame]] = None) -> Optional[Dict[str, Any]]:
+        """Run the staged pipeline: fetch -> convert -> bulk write -> indicators"""
+        if stock_codes:
+            # Login to BaoStock
+            login_success = await self._login_baostock()
+            if not login_success:
+                logger.error("Failed to login to BaoStock, cannot fetch stock data")
+                if not frames:
+                    return None
+                stock_codes = []
+
+        pipeline = IngestionPipeline(self)
+        return await pipeline.run(stock_codes, frames=frames)
+
+    async def fetch_market_daily_from_tushare(self, trade_date: str) -> Optional[tuple]:
+        """Fetch the whole market's daily bars for one trade date (YYYYMMDD) from TuShare
+
+        Returns (is_open, previous_trade_date, daily_df, daily_basic_df), or None when no token
+        is configured or the request fails.
+        """
+        try:
+            pro = await self._get_tushare_provider()
+            if pro is None:
+                return None
+
+            calendar = await TUSHARE_GUARD.call(
+                pro.call, "trade_cal", wait=False, exchange="SSE", start_date=trade_date, end_date=trade_date
+            )
+            if calendar is None or calendar.empty:
+                logger.warning(f"TuShare trade calendar has no entry for {trade_date}")
+                return None
+            day = calendar.iloc[0]
+            if str(day["is_open"]) != "1":
+                return False, None, None, None
+
+            daily = await TUSHARE_GUARD.call(pro.call, "daily", wait=False, trade_date=trade_date)
+            try:
+                basic = await TUSHARE_GUARD.call(
+                    pro.call, "daily_basic", wait=False,
+                    trade_date=trade_date, fields="ts_code,turnover_rate,pe_ttm,pb,ps_ttm"
+                )
+            except Exception as e:
+                logger.warning(f"Error fetching daily basic from TuShare: {str(e)}")
+                basic = None
+
+            logger.info(f"Fetched {0 if daily is None else len(daily)} daily bars for {trade_date} from TuShare")
+            return True, str(day["pretrade_date"]), daily, basic
+        except Exception as e:
+            logger.error(f"Error fetching market daily data from TuShare: {str(e)}")
+            return None
+
+    async def _fetch_latest_day(self, stocks: list, trade_date: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Ingest one trade date for the whole market with a single upstream request
+
+        Stocks whose stored data ends on the previous trade date take the bar from the market-wide
+        result; stocks further behind (or without data) go through per-code BaoStock queries.
+        Returns None when TuShare is unavailable so that the caller falls back to per-code mode.
+        """
+        trade_date = trade_date or datetime.now().strftime("%Y%m%d")
+        result = await self.fetch_market_daily_from_tushare(trade_date)
+        if result is None:
+            logger.info("Latest-day fetch unavailable, falling back to per-code fetch")
+            return None
+
+        is_open, previous_date, daily, basic = result
+        if not is_open:
+            logger.info(f"{trade_date} is not a trading day, nothing to fetch")
+            return {}
+        if daily is None or daily.empty:
+            # Data for the day is not published yet
+            logger.warning(f"TuShare returned no daily bars for {trade_date}, falling back to per-code fetch")
+            return None
+
+        st_codes = [stock["code"] for stock in stocks if "ST" in (stock.get("code_name") or "")]
+        frames = split_by_code(tushare_daily_frame(daily, basic, st_codes))
+
+        current = datetime.strptime(trade_date, "%Y%m%d")
+        previous = datetime.strptime(previous_date, "%Y%m%d")
+        snapshots = await self.mongo_service.find("latest_snapshot", {}, {"code": 1, "date": 1})
+        last_dates = {doc["code"]: doc.get("date") for doc in snapshots}
+
+        prefetched, lagging = {}, []
+        up_to_date = suspended = 0
+        for stock in stocks:
+            code = stock["code"]
+            last_date = last_dates.get(code)
+            if isinstance(last_date, datetime) and last_date >= current:
+                up_to_date += 1
+            elif last_date == previous:
+                if code in frames:
+                    prefetched[code] = frames[code]
+                else:
+                    # No bar for the day: suspended
+                    suspended += 1
+            elif not code.startswith("bj."):
+                lagging.append(code)
+
+        logger.info(
+            f"Latest-day fetch for {trade_date}: {len(prefetched)} from market-wide bars, "
+            f"{len(lagging)} lagging stocks via per-code fetch, {up_to_date} already up to date, "
+            f"{suspended} without a bar"
+        )
+        if not prefetched and not lagging:
+            return {}
+        return await self._run_ingestion(lagging, frames=prefetched)
+
+    async def query_daily_k(self, stock_code: str, start_date: str, end_date: str) -> tuple:
+        """Query daily bars from the provider in the BaoStock thread, returns (error_code, error_msg, fields, rows)"""
+        return await BAOSTOCK_GUARD.call(
+            self.provider.query_daily_k, stock_code, start_date, end_date,
+            executor=BAOSTOCK_EXECUTOR, is_failure=lambda result: result[0] != "0"
+        )
+
+    async def query_minute_k(self, stock_code: str, start_date: str, end_date: str, frequency: int) -> tuple:
+        """Query minute bars from the provider in the BaoStock thread"""
+        return await BAOSTOCK_GUARD.call(
+            self.provider.query_minute_k, stock_code, start_date, end_date, frequency,
+            executor=BAOSTOCK_EXECUTOR, is_failure=lambda result: result[0] != "0"
+        )
+
+    async def fetch_minute_bars(self, stock_codes: Optional[list] = None,
+                                frequencies: Optional[list] = None) -> Dict[str, Any]:
+        """Import 5/15/30/60-minute bars into per-day buckets, skipped while another data job is running"""
+        if self.is_fetching:
+            return {"status": "skipped", "message": "Data fetch in progress"}
+
+        await DATA_JOB_LOCK.acquire()
+        try:
+            return await self.minute_service.run(stock_codes, frequencies)
+        finally:
+            DATA_JOB_LOCK.release()
 
     async def fetch_stock_daily_data_without_processing(self, stock_code: str) -> tuple:
         """Fetch daily K-line data for a specific stock without processing"""
+        start_date = end_date = None
         try:
             # Get the last date from existing data
             last_date = await self._get_last_date_for_stock(stock_code)
-            start_date = last_date or "1990-12-19"
-
-            end_date = datetime.now().strftime("%Y-%m-%d")
+            start_date, end_date = await self._fetch_range(last_date)
+            if start_date is None:
+                logger.debug(f"{stock_code} is up to date ({last_date})")
+                return (False, None)
 
             logger.info(
                 f"Fetching daily data for {stock_code} from {start_date} to {end_date}"
             )
 
-            # Fetch data from BaoStock
-            rs = bs.query_history_k_data_plus(
-                stock_code,
-                "date,code,open,high,low,close,preclose,volume,amount,adjustflag,turn,tradestatus,pctChg,peTTM,pbMRQ,psTTM,pcfNcfTTM,isST",
-                start_date=start_date,
-                end_date=end_date,
-                frequency="d",
-                adjustflag="2",  # Backward adjustment
+            # Fetch data from BaoStock without blocking the event loop
+            error_code, error_msg, fields, data_list = await self.query_daily_k(
+                stock_code, start_date, end_date
             )
 
-            if rs.error_code != "0":
-                logger.error(f"Error fetching data for {stock_code}: {rs.error_msg}")
+            if error_code != "0":
+                logger.error(f"Error fetching data for {stock_code}: {error_msg}")
                 await self._record_failed_request(
                     "query_history_k_data_plus",
                     {
@@ -435,20 +623,16 @@ class DataService:
                         "start_date": start_date,
                         "end_date": end_date,
                     },
-                    rs.error_msg,
+                    error_msg,
                 )
                 return None
 
-            data_list = []
-            while (rs.error_code == "0") & rs.next():
-                data_list.append(rs.get_row_data())
-
             if not data_list:
                 logger.info(f"No new data for {stock_code}")
                 return (False, None)
 
             # Convert to DataFrame
-            df = pd.DataFrame(data_list, columns=rs.fields)
+            df = pd.DataFrame(data_list, columns=fields)
             logger.debug(
                 f"DataFrame structure for {stock_code}: {df.shape}, columns: {df.columns.tolist()}"
             )
@@ -469,62 +653,7 @@ class DataService:
         try:
             # Process and save data
             collection_name = self.mongo_service.get_collection_name(stock_code)
-            operations = []
-
-            for _, row in df.iterrows():
-                # Convert date string to datetime
-                try:
-                    if "date" in df.columns:
-                        trade_date = datetime.strptime(row["date"], "%Y-%m-%d")
-                    else:
-                        # Try to find date column automatically
-                        date_col = None
-                        for col in df.columns:
-                            if "date" in col.lower():
-                                date_col = col
-                                break
-                        if date_col:
-                            trade_date = datetime.strptime(row[date_col], "%Y-%m-%d")
-                        else:
-                            logger.warning(
-                                f"No date column found for {stock_code}, using current date"
-                            )
-                            trade_date = datetime.utcnow()
-                except Exception as e:
-                    logger.warning(
-                        f"Error parsing date for {stock_code}: {str(e)}, using current date"
-                    )
-                    trade_date = datetime.utcnow()
-
-                doc = {
-                    "code": stock_code,
-                    "date": trade_date,
-                    "open": float(row["open"]) if row["open"] else 0,
-                    "high": float(row["high"]) if row["high"] else 0,
-                    "low": float(row["low"]) if row["low"] else 0,
-                    "close": float(row["close"]) if row["close"] else 0,
-                    "preclose": float(row["preclose"]) if row["preclose"] else 0,
-                    "volume": float(row["volume"]) if row["volume"] else 0,
-                    "amount": float(row["amount"]) if row["amount"] else 0,
-                    "adjustflag": row.get("adjustflag", ""),
-                    "turn": float(row["turn"]) if row["turn"] else 0,
-                    "tradestatus": int(row["tradestatus"]) if row["tradestatus"] else 0,
-                    "pctChg": float(row["pctChg"]) if row["pctChg"] else 0,
-                    "peTTM": float(row["peTTM"]) if row["peTTM"] else 0,
-                    "pbMRQ": float(row["pbMRQ"]) if row["pbMRQ"] else 0,
-                    "psTTM": float(row["psTTM"]) if row["psTTM"] else 0,
-                    "pcfNcfTTM": float(row["pcfNcfTTM"]) if row["pcfNcfTTM"] else 0,
-                    "isST": int(row["isST"]) if row["isST"] else 0,
-                    "updated_at": datetime.utcnow(),
-                }
-
-                operations.append(
-                    UpdateOne(
-                        {"code": stock_code, "date": trade_date},
-                        {"$set": doc},
-                        upsert=True,
-                    )
-                )
+            operations = daily_bar_operations(stock_code, df)
 
             if operations:
                 success = await self.mongo_service.bulk_write(
@@ -534,6 +663,7 @@ class DataService:
                     logger.info(
                         f"Successfully updated {len(operations)} daily records for {stock_code}"
                     )
+                    await self.write_monthly_buckets(stock_code, df)
                     # Remove from failed requests if successful
                     await self.mongo_service.delete_one(
                         "failed_requests",
@@ -543,10 +673,16 @@ class DataService:
                         },
                     )
 
-                    # Calculate technical indicators
+                    # Calculate technical indicators on forward-adjusted prices
+                    factors, rebase = await self.sync_adjust_factors(stock_code, df)
                     await self.technical_service.calculate_technical_indicators(
-                        stock_code, df
+                        stock_code, adjust_frame(df, factors)
                     )
+                    if rebase:
+                        await self.technical_service.rebase_price_indicators(stock_code)
+
+                    # Refresh the cross-sectional latest snapshot
+                    await self.snapshot_service.refresh_stock(stock_code)
 
                     return True
                 else:
@@ -559,6 +695,37 @@ class DataService:
             logger.error(f"Error processing data for {stock_code}: {str(e)}")
             return False
 
+    async def write_monthly_buckets(self, stock_code: str, df: pd.DataFrame) -> int:
+        """Mirror freshly written daily bars into the monthly buckets when that layout is enabled
+
+        A stock's buckets are marked complete once they hold its whole history (after migration,
+        or when df starts at the first stored bar); a failed write clears the mark so reads fall
+        back to the per-bar collection until the stock is migrated again.
+        """
+        if settings.daily_bar_layout != "monthly":
+            return 0
+        store = self.mongo_service.monthly_bars
+        try:
+            documents = await asyncio.get_running_loop().run_in_executor(None, daily_bar_documents, stock_code, df)
+            if not documents:
+                return 0
+            written = await store.write(stock_code, documents)
+            if not await store.is_complete(stock_code):
+                first = await self.mongo_service.find_one(
+                    self.mongo_service.get_collection_name(stock_code), {"code": stock_code}, sort=[("date", 1)]
+                )
+                if first is not None and isinstance(first.get("date"), datetime) \
+                        and first["date"] >= min(doc["date"] for doc in documents):
+                    await store.mark_complete(stock_code, first["date"])
+            return written
+        except Exception as e:
+            logger.error(f"Error updating monthly buckets for {stock_code}: {str(e)}")
+            try:
+                await store.unmark(stock_code)
+            except Exception:
+                pass
+            return 0
+
     async def fetch_stock_daily_data(self, stock_code: str) -> bool:
         """Fetch daily K-line data for a specific stock"""
         # First fetch the data
@@ -575,7 +742,11 @@ class DataService:
         return await self.process_stock_data(stock_code, df)
 
     async def _get_last_date_for_stock(self, stock_code: str) -> Optional[str]:
-        """Get the last date for a stock from its daily data collection"""
+        """Get the last date for a stock from its daily data collection
+
+        Stocks still holding pre-adjusted (adjustflag "2") bars keep them and continue with
+        unadjusted bars from their last date; the history is never re-fetched implicitly.
+        """
         try:
             collection_name = f"stock_daily_{stock_code}"
             last_record = await self.mongo_service.find_one(
@@ -592,6 +763,98 @@ class DataService:
             logger.error(f"Error getting last date for {stock_code}: {str(e)}")
             return None
 
+    async def refresh_adjust_factors(self, stock_code: str) -> Optional[list]:
+        """Replace the stored adjust factors of a stock with the full upstream series
+
+        Only the factor documents change on a corporate action; stored bars stay unadjusted.
+        Returns the factors (ascending by date), or None when the upstream query fails.
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        try:
+            error_code, error_msg, fields, rows = await BAOSTOCK_GUARD.call(
+                self.provider.query_adjust_factor, stock_code, "1990-01-01", today,
+                executor=BAOSTOCK_EXECUTOR, is_failure=lambda result: result[0] != "0"
+            )
+        except Exception as e:
+            logger.error(f"Error fetching adjust factors for {stock_code}: {str(e)}")
+            return None
+        if error_code != "0":
+            logger.error(f"Error fetching adjust factors for {stock_code}: {error_msg}")
+            return None
+
+        now = datetime.utcnow()
+        factors = []
+        for row in rows:
+            record = dict(zip(fields, row))
+            if not record.get("dividOperateDate") or not record.get("backAdjustFactor"):
+                continue
+            factors.append({
+                "code": stock_code,
+                "date": datetime.strptime(record["dividOperateDate"], "%Y-%m-%d"),
+                "back_factor": float(record["backAdjustFactor"]),
+                "fore_factor": float(record["foreAdjustFactor"]) if record.get("foreAdjustFactor") else None,
+                "adjust_factor": float(record["adjustFactor"]) if record.get("adjustFactor") else None,
+                "updated_at": now,
+            })
+        factors.sort(key=lambda doc: doc["date"])
+
+        if factors:
+            operations = [
+                UpdateOne({"code": stock_code, "date": doc["date"]}, {"$set": doc}, upsert=True)
+                for doc in factors
+            ]
+            await self.mongo_service.bulk_write("adjust_factors", operations, ordered=False)
+        await self.mongo_service.delete_many(
+            "adjust_factors", {"code": stock_code, "date": {"$nin": [doc["date"] for doc in factors]}}
+        )
+        logger.info(f"Adjust factors for {stock_code} refreshed: {len(factors)} ex-rights dates")
+        return factors
+
+    async def sync_adjust_factors(self, stock_code: str, df: pd.DataFrame) -> Tuple[list, bool]:
+        """Adjust factors to apply to newly written bars, and whether the price basis changed
+
+        The factor series is re-read from upstream when df is the stock's whole history, when it
+        follows pre-adjusted legacy bars (first unadjusted fetch of that stock) or when its prices
+        show an ex-rights date (preclose differs from the previous close); otherwise the stored
+        factors are still current. The basis changes when the latest back factor differs from the
+        stored one while earlier bars are already unadjusted; price-level indicators saved earlier
+        must then be rebased. Legacy bars were adjusted at fetch time and are never rebased.
+        """
+        first_date = pd.to_datetime(df["date"]).min().to_pydatetime() if not df.empty else None
+        previous = None
+        if first_date is not None:
+            previous = await self.mongo_service.find_one(
+                self.mongo_service.get_collection_name(stock_code),
+                {"code": stock_code, "date": {"$lt": first_date}}, sort=[("date", -1)]
+            )
+        stored = (await self.mongo_service.get_adjust_factors([stock_code]))[stock_code]
+        unadjusted = previous is not None and previous.get("adjustflag") == RAW_FLAG
+        if not unadjusted or ex_rights_detected(df, previous.get("close")):
+            factors = await self.refresh_adjust_factors(stock_code)
+            if factors is not None:
+                return factors, unadjusted and latest_back_factor(factors) != latest_back_factor(stored)
+        return stored, False
+
+    async def retry_failed_requests(self) -> Dict[str, Any]:
+        """Replay due failed daily requests, skipped while a full fetch is running"""
+        if self.is_fetching:
+            return {"status": "skipped", "message": "Data fetch in progress"}
+        return await self.retrier.run()
+
+    async def scan_gaps(self, stock_codes: Optional[list] = None, backfill: bool = True) -> Dict[str, Any]:
+        """Scan daily collections for mid-history holes and backfill them, skipped while a fetch is running"""
+        if self.is_fetching:
+            return {"status": "skipped", "message": "Data fetch in progress"}
+
+        await DATA_JOB_LOCK.acquire()
+        try:
+            return await self.gap_scanner.run(stock_codes, backfill=backfill)
+        except Exception as e:
+            logger.error(f"Error scanning daily gaps: {str(e)}")
+            return {"status": "error", "message": str(e)}
+        finally:
+            DATA_JOB_LOCK.release()
+
     async def _record_failed_request(
         self, api_name: str, parameters: Dict[str, Any], error_msg: str
     ):
@@ -611,22 +874,51 @@ class DataService:
         except Exception as e:
             logger.error(f"Error recording failed request: {str(e)}")
 
-    async def trigger_immediate_fetch(self):
-        """Manually trigger immediate data fetch"""
-        if self.is_fetching:
-            return {"status": "error", "message": "Data fetch already in progress"}
+    def _run_in_background(self, name: str, coroutine) -> asyncio.Task:
+        """Run a job as a background task; its summary is kept in job_results[name]"""
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        self.job_results[name] = {"status": "running", "started_at": datetime.utcnow()}
 
-        # Run in background to avoid blocking
-        task = asyncio.create_task(self.fetch_all_stock_daily_data())
-        
         # Add a callback to handle task exceptions
         def handle_task_result(task):
+            self._background_tasks.discard(task)
             try:
                 exception = task.exception()
                 if exception:
-                    logger.error(f"Error in data fetch task: {str(exception)}")
+                    logger.error(f"Error in {name} task: {str(exception)}")
+                    self.job_results[name] = {"status": "error", "message": str(exception)}
+                else:
+                    result = task.result()
+                    self.job_results[name] = result if isinstance(result, dict) else {"status": "completed"}
             except asyncio.CancelledError:
-                logger.info("Data fetch task was cancelled")
-        
+                logger.info(f"{name} task was cancelled")
+                self.job_results[name] = {"status": "cancelled"}
+
         task.add_done_callback(handle_task_result)
+        return task
+
+    async def trigger_immediate_fetch(self, mode: Optional[str] = None, trade_date: Optional[str] = None):
+        """Manually trigger immediate data fetch"""
+        if self.is_fetching:
+            return {"status": "error", "message": "Data fetch already in progress"}
+
+        # Run in background to avoid blocking
+        self._run_in_background("daily_fetch", self.fetch_all_stock_daily_data(mode, trade_date))
         return {"status": "success", "message": "Data fetch started"}
+
+    async def trigger_gap_scan(self, stock_codes: Optional[list] = None, backfill: bool = True):
+        """Start a gap scan (and backfill) in the background"""
+        if self.is_fetching:
+            return {"status": "error", "message": "Data fetch already in progress"}
+
+        self._run_in_background("gap_scan", self.scan_gaps(stock_codes, backfill=backfill))
+        return {"status": "success", "message": "Gap scan started"}
+
+    async def trigger_minute_fetch(self, stock_codes: Optional[list] = None, frequencies: Optional[list] = None):
+        """Start a minute-bar import in the background"""
+        if self.is_fetching:
+            return {"status": "error", "message": "Data fetch already in progress"}
+
+        self._run_in_background("minute_fetch", self.fetch_minute_bars(stock_codes, frequencies))
+        return {"status": "success", "message": "Minute bar fetch started"}
@@ -0,0 +1,181 @@
+import asyncio
+import bisect
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from pymongo import UpdateOne
+
+from app.config.settings import settings
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.services.retry_service import DAILY_API
+
+logger = logging.getLogger(__name__)
+
+GAPS_COLLECTION = "daily_gaps"
+# 结果中列出缺口明细的股票数量上限
+MAX_REPORTED_STOCKS = 200
+
+
+def missing_ranges(stored: Sequence[datetime], trading_days: Sequence[datetime],
+                   skipped: Sequence[Tuple[datetime, datetime]] = ()) -> List[Tuple[str, str]]:
+    """已保存的首尾日期之间缺失的交易日，连续缺失的交易日合并为一个 (start, end) 区间
+
+    Args:
+        stored: 已保存的K线日期（升序）
+        trading_days: 覆盖 stored 首尾的交易日（升序）
+        skipped: 已确认上游没有数据的区间，其中的日期不算缺口
+    """
+    if len(stored) < 2:
+        return []
+    present = set(stored)
+    lo = bisect.bisect_left(trading_days, stored[0])
+    hi = bisect.bisect_right(trading_days, stored[-1])
+
+    ranges = []
+    run: Optional[List[datetime]] = None
+    for day in trading_days[lo:hi]:
+        if day in present or any(start <= day <= end for start, end in skipped):
+            if run is not None:
+                ranges.append(run)
+                run = None
+        elif run is None:
+            run = [day, day]
+        else:
+            run[1] = day
+    if run is not None:
+        ranges.append(run)
+    return [(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")) for start, end in ranges]
+
+
+class GapScanner:
+    """日线中间缺口扫描与定向补抓
+
+    抓取从最后一个已保存日期续传，中途失败留下的空洞不会再被补上。扫描时每只股票用一次
+    聚合读出已保存的日期，与交易日历比对，得到首尾之间缺失的最少区间；补抓时每个区间
+    查询一次上游，结果整体交给导入流水线批量写入并计算指标。上游确认没有数据的区间
+    （如长期停牌）记录在 daily_gaps 中，之后的扫描不再报告。
+    """
+
+    def __init__(self, data_service, concurrency: Optional[int] = None):
+        self.data_service = data_service
+        self.mongo_service = data_service.mongo_service
+        self.concurrency = max(1, concurrency or settings.gap_scan_concurrency)
+        self._days: List[datetime] = []
+        self._days_lock = asyncio.Lock()
+
+    async def _trading_days(self, start: datetime) -> List[datetime]:
+        """从 start 到今天的交易日，已加载的范围覆盖 start 时直接复用"""
+        async with self._days_lock:
+            if not self._days or start < self._days[0]:
+                days = await self.data_service.trading_calendar.trading_days(
+                    start.strftime("%Y-%m-%d"), datetime.now().strftime("%Y-%m-%d")
+                )
+                self._days = [datetime.strptime(day, "%Y-%m-%d") for day in days]
+            return self._days
+
+    async def _skipped_ranges(self) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        docs = await self.mongo_service.find(GAPS_COLLECTION, {}, {"_id": 0, "code": 1, "start_date": 1, "end_date": 1})
+        skipped: Dict[str, List[Tuple[datetime, datetime]]] = {}
+        for doc in docs:
+            skipped.setdefault(doc["code"], []).append((
+                datetime.strptime(doc["start_date"], "%Y-%m-%d"),
+                datetime.strptime(doc["end_date"], "%Y-%m-%d")
+            ))
+        return skipped
+
+    async def scan(self, stock_codes: Optional[List[str]] = None) -> Dict[str, List[Tuple[str, str]]]:
+        """扫描股票（默认全部沪深股票），返回 {股票代码: [(start, end), ...]}，没有缺口的股票不返回"""
+        if stock_codes is None:
+            stocks = await self.mongo_service.find("stock_info", {}, {"code": 1})
+            stock_codes = [stock["code"] for stock in stocks if not stock["code"].startswith("bj.")]
+        skipped = await self._skipped_ranges()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def scan_stock(stock_code: str) -> List[Tuple[str, str]]:
+            async with semaphore:
+                stored = await self.mongo_service.get_daily_dates(stock_code)
+                if len(stored) < 2:
+                    return []
+                days = await self._trading_days(stored[0])
+                return missing_ranges(stored, days, skipped.get(stock_code, ()))
+
+        results = await asyncio.gather(*(scan_stock(code) for code in stock_codes))
+        plan = {code: ranges for code, ranges in zip(stock_codes, results) if ranges}
+        logger.info(f"Gap scan: {sum(len(ranges) for ranges in plan.values())} ranges "
+                    f"in {len(plan)} of {len(stock_codes)} stocks")
+        return plan
+
+    async def _fetch_ranges(self, stock_code: str, ranges: List[Tuple[str, str]]) -> Optional[pd.DataFrame]:
+        """查询一只股票的全部缺口区间；没有数据的区间记为已确认，失败的区间交给失败请求重放"""
+        frames, empty = [], []
+        for start, end in ranges:
+            try:
+                error_code, error_msg, fields, rows = await self.data_service.query_daily_k(stock_code, start, end)
+            except Exception as e:
+                error_code, error_msg, fields, rows = "-1", str(e), [], []
+            if error_code != "0":
+                await self.data_service._record_failed_request(
+                    DAILY_API, {"code": stock_code, "start_date": start, "end_date": end}, error_msg
+                )
+            elif rows:
+                frames.append(pd.DataFrame(rows, columns=fields))
+            else:
+                empty.append((start, end))
+
+        if empty:
+            now = datetime.utcnow()
+            await self.mongo_service.bulk_write(GAPS_COLLECTION, [
+                UpdateOne(
+                    {"code": stock_code, "start_date": start},
+                    {"$set": {"code": stock_code, "start_date": start, "end_date": end, "checked_at": now}},
+                    upsert=True
+                )
+                for start, end in empty
+            ], ordered=False)
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True).drop_duplicates("date", keep="last")
+
+    async def backfill(self, plan: Dict[str, List[Tuple[str, str]]]) -> Dict[str, Any]:
+        """按扫描结果补抓，补到的数据一次交给导入流水线写入"""
+        if not plan:
+            return {"stocks": 0, "ranges": 0, "filled": 0}
+        if not await self.data_service._login_baostock():
+            raise RuntimeError("Failed to login to BaoStock")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(stock_code: str, ranges: List[Tuple[str, str]]) -> Optional[pd.DataFrame]:
+            async with semaphore:
+                return await self._fetch_ranges(stock_code, ranges)
+
+        codes = list(plan)
+        results = await asyncio.gather(*(fetch(code, plan[code]) for code in codes))
+        frames = {code: df for code, df in zip(codes, results) if df is not None}
+
+        summary: Dict[str, Any] = {
+            "stocks": len(plan),
+            "ranges": sum(len(ranges) for ranges in plan.values()),
+            "filled": len(frames),
+        }
+        if frames:
+            # 调用方持有 DATA_JOB_LOCK，补抓与每日抓取不会同时运行，进度接口此时显示补抓
+            pipeline = await IngestionPipeline(self.data_service, kind="gap_backfill").run([], frames=frames)
+            summary["rows"] = pipeline["stages"]["write"]["rows"]
+            summary["failed"] = pipeline["failed"]
+        return summary
+
+    async def run(self, stock_codes: Optional[List[str]] = None, backfill: bool = True) -> Dict[str, Any]:
+        """扫描并（可选）补抓，返回统计结果和部分股票的缺口明细"""
+        plan = await self.scan(stock_codes)
+        summary: Dict[str, Any] = {
+            "status": "completed",
+            "stocks_with_gaps": len(plan),
+            "ranges": sum(len(ranges) for ranges in plan.values()),
+            "gaps": {code: plan[code] for code in list(plan)[:MAX_REPORTED_STOCKS]},
+        }
+        if backfill:
+            summary["backfill"] = await self.backfill(plan)
+        return summary
@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from pymongo import UpdateOne
+
+from app.config.settings import settings
+from app.utils.price_adjust import adjust_frame
+
+logger = logging.getLogger(__name__)
+
+# 日线文档中的浮点字段和整数字段，空字符串或无法解析的值记为 0
+FLOAT_FIELDS = ("open", "high", "low", "close", "preclose", "volume", "amount", "turn",
+                "pctChg", "peTTM", "pbMRQ", "psTTM", "pcfNcfTTM")
+INT_FIELDS = ("tradestatus", "isST")
+
+# 阶段之间传递的结束标记
+_DONE = object()
+# 进度中保留的失败股票数量上限
+MAX_FAILED_STOCKS = 200
+
+
+def daily_bar_documents(stock_code: str, df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """BaoStock 返回的字符串 DataFrame 按列转换为日线文档"""
+    if df is None or df.empty:
+        return []
+
+    dates = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    valid = dates.notna().to_numpy()
+    if not valid.all():
+        logger.warning(f"Dropped {int((~valid).sum())} daily rows with invalid dates for {stock_code}")
+    df = df.loc[valid]
+    if df.empty:
+        return []
+
+    columns: Dict[str, List[Any]] = {"date": [d.to_pydatetime() for d in dates[valid]]}
+    for name in FLOAT_FIELDS:
+        values = pd.to_numeric(df[name], errors="coerce").fillna(0) if name in df.columns else pd.Series(0.0, index=df.index)
+        columns[name] = values.astype("float64").tolist()
+    for name in INT_FIELDS:
+        values = pd.to_numeric(df[name], errors="coerce").fillna(0) if name in df.columns else pd.Series(0, index=df.index)
+        columns[name] = values.astype("int64").tolist()
+    columns["adjustflag"] = df["adjustflag"].fillna("").tolist() if "adjustflag" in df.columns else [""] * len(df)
+
+    now = datetime.utcnow()
+    names = list(columns)
+    return [
+        {"code": stock_code, **dict(zip(names, row)), "updated_at": now}
+        for row in zip(*(columns[name] for name in names))
+    ]
+
+
+def daily_bar_operations(stock_code: str, df: pd.DataFrame) -> List[UpdateOne]:
+    """日线文档的 upsert 操作（按 code + date）"""
+    return [
+        UpdateOne({"code": stock_code, "date": doc["date"]}, {"$set": doc}, upsert=True)
+        for doc in daily_bar_documents(stock_code, df)
+    ]
+
+
+class StageMetrics:
+    """单个阶段的计数"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.processed = 0
+        self.rows = 0
+        self.failed = 0
+        self.active = 0
+        self.busy_seconds = 0.0
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rows": self.rows,
+            "throughput": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            # 平均每个工作协程的忙碌比例，接近 1 说明该阶段是瓶颈
+            "utilization": round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed > 0 else 0.0
+        }
+
+
+class IngestionPipeline:
+    """日线数据批量入库流水线
+
+    抓取 → 列转换 → 批量写入 → 指标计算 四个阶段由有界队列串联，每个阶段有独立的
+    并发数；下游处理不过来时队列写满，上游自然等待（背压），单只慢股票只占用一个
+    工作协程，不会拖住整批。写入阶段一次从队列取出多只已就绪的股票合并提交。
+    各阶段的吞吐、队列深度等指标在运行中可随时读取。
+    """
+
+    # 最近一次（或正在运行的）流水线，供进度接口读取
+    _current: Optional['IngestionPipeline'] = None
+
+    def __init__(self, data_service, fetch_workers: Optional[int] = None,
+                 convert_workers: Optional[int] = None, write_workers: Optional[int] = None,
+                 indicator_workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 write_batch_size: Optional[int] = None, kind: str = "daily"):
+        self.data_service = data_service
+        # 任务类型（daily / gap_backfill），进度接口据此区分当前运行的是哪个任务
+        self.kind = kind
+        self.mongo_service = data_service.mongo_service
+        self.queue_size = queue_size or settings.ingest_queue_size
+        self.write_batch_size = write_batch_size or settings.ingest_write_batch_size
+        self.metrics = {
+            "fetch": StageMetrics("fetch", fetch_workers or settings.ingest_fetch_workers),
+            "convert": StageMetrics("convert", convert_workers or settings.ingest_convert_workers),
+            "write": StageMetrics("write", write_workers or settings.ingest_write_workers),
+            "indicator": StageMetrics("indicator", indicator_workers or settings.ingest_indicator_workers),
+        }
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.total = 0
+        self.completed = 0
+        self.no_data = 0
+        self.failed = 0
+        self.failed_stocks: List[str] = []
+        self.current_stock = ""
+        self.status = "idle"
+        self.cancelled = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @classmethod
+    def current(cls) -> Optional['IngestionPipeline']:
+        return cls._current
+
+    def cancel(self):
+        """停止抓取新的股票，已抓取的数据继续写入"""
+        self.cancelled = True
+
+    def _fail(self, stock_code: str):
+        self.failed += 1
+        if len(self.failed_stocks) < MAX_FAILED_STOCKS:
+            self.failed_stocks.append(stock_code)
+
+    async def _run_stage(self, name: str, worker: Callable[[], Awaitable[None]],
+                         outbox: Optional[asyncio.Queue], next_workers: int):
+        """启动阶段的全部工作协程，结束后向下游每个工作协程发送结束标记"""
+        await asyncio.gather(*(worker() for _ in range(self.metrics[name].workers)))
+        if outbox is not None:
+            for _ in range(next_workers):
+                await outbox.put(_DONE)
+
+    async def _timed(self, name: str, coroutine):
+        metrics = self.metrics[name]
+        metrics.active += 1
+        started = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            metrics.busy_seconds += time.perf_counter() - started
+            metrics.active -= 1
+
+    async def run(self, stock_codes: List[str],
+                  frames: Optional[Dict[str, pd.DataFrame]] = None) -> Dict[str, Any]:
+        """处理全部股票，返回运行结果与各阶段指标
+
+        frames 为已经取得的 {股票代码: 日线 DataFrame}（如全市场按交易日拉取的结果），
+        不经过抓取阶段直接进入转换队列，与 stock_codes 中逐只抓取的股票一起写入。
+        """
+        IngestionPipeline._current = self
+        frames = frames or {}
+        self.total = len(stock_codes) + len(frames)
+        self.status = "running"
+        self.started_at = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        convert_queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue = asyncio.Queue(maxsize=self.queue_size)
+        indicator_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.queues = {"convert": convert_queue, "write": write_queue, "indicator": indicator_queue}
+        codes = iter(stock_codes)
+
+        async def fetcher():
+            metrics = self.metrics["fetch"]
+            for stock_code in codes:
+                if self.cancelled:
+                    return
+                self.current_stock = stock_code
+                result = await self._timed("fetch", self.data_service.fetch_stock_daily_data_without_processing(stock_code))
+                metrics.processed += 1
+                if not result:
+                    metrics.failed += 1
+                    self._fail(stock_code)
+                    continue
+                success, data = result
+                if not success:
+                    # 没有新数据
+                    self.no_data += 1
+                    continue
+                metrics.rows += len(data[1])
+                await convert_queue.put(data)
+
+        async def feeder():
+            metrics = self.metrics["fetch"]
+            for stock_code, df in frames.items():
+                if self.cancelled:
+                    return
+                metrics.processed += 1
+                metrics.rows += len(df)
+                await convert_queue.put((stock_code, df))
+
+        async def fetch_stage():
+            await asyncio.gather(feeder(), self._run_stage("fetch", fetcher, None, 0))
+            for _ in range(self.metrics["convert"].workers):
+                await convert_queue.put(_DONE)
+
+        async def converter():
+            metrics = self.metrics["convert"]
+            while True:
+                item = await convert_queue.get()
+                if item is _DONE:
+                    return
+                stock_code, df = item
+                try:
+                    operations = await self._timed(
+                        "convert", loop.run_in_executor(None, daily_bar_operations, stock_code, df))
+                except Exception as e:
+                    logger.error(f"Error converting daily data for {stock_code}: {str(e)}")
+                    metrics.failed += 1
+                    self._fail(stock_code)
+                    continue
+                metrics.processed += 1
+                metrics.rows += len(operations)
+                await write_queue.put((stock_code, df, operations))
+
+        async def writer():
+            while True:
+                item = await write_queue.get()
+                if item is _DONE:
+                    return
+                # 合并队列中已经就绪的股票，一起提交
+                batch = [item]
+                finished = False
+                while len(batch) < self.write_batch_size:
+                    try:
+                        item = write_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                    if item is _DONE:
+                        finished = True
+                        break
+                    batch.append(item)
+                written = await self._timed("write", self._write_batch(batch))
+                for stock_code, df in written:
+                    await indicator_queue.put((stock_code, df))
+                if finished:
+                    return
+
+        async def indicator_worker():
+            metrics = self.metrics["indicator"]
+            while True:
+                item = await indicator_queue.get()
+                if item is _DONE:
+                    return
+                stock_code, df = item
+                try:
+                    await self._timed("indicator", self._update_indicators(stock_code, df))
+                    metrics.processed += 1
+                    metrics.rows += len(df)
+                    self.completed += 1
+                except Exception as e:
+                    logger.error(f"Error calculating indicators for {stock_code}: {str(e)}")
+                    metrics.failed += 1
+                    self._fail(stock_code)
+
+        try:
+            await asyncio.gather(
+                fetch_stage(),
+                self._run_stage("convert", converter, write_queue, self.metrics["write"].workers),
+                self._run_stage("write", writer, indicator_queue, self.metrics["indicator"].workers),
+                self._run_stage("indicator", indicator_worker, None, 0),
+            )
+            self.status = "cancelled" if self.cancelled else "completed"
+        except Exception:
+            self.status = "error"
+            raise
+        finally:
+            self.finished_at = time.perf_counter()
+
+        summary = self.progress()
+        logger.info(f"Ingestion pipeline {self.status}: {self.completed}/{self.total} stocks updated, "
+                    f"{self.no_data} without new data, {self.failed} failed, "
+                    f"stages: {summary['stages']}")
+        return summary
+
+    async def _write_batch(self, batch: List[Tuple[str, pd.DataFrame, List[UpdateOne]]]) -> List[Tuple[str, pd.DataFrame]]:
+        """写入一批股票的日线数据，返回写入成功的 (股票代码, 原始数据)
+
+        每只股票有自己的日线集合，而驱动只支持单集合的 bulk_write，因此同一批内各集合的
+        批量写入并发提交；成功股票的失败请求记录合并为一次删除。
+        """
+        metrics = self.metrics["write"]
+        results = await asyncio.gather(*(
+            self.mongo_service.bulk_write(self.mongo_service.get_collection_name(stock_code), operations,
+                                          ordered=False)
+            if operations else asyncio.sleep(0, result=True)
+            for stock_code, _, operations in batch
+        ))
+
+        written = []
+        for (stock_code, df, operations), ok in zip(batch, results):
+            if ok:
+                metrics.processed += 1
+                metrics.rows += len(operations)
+                if operations:
+                    written.append((stock_code, df))
+                else:
+                    self.completed += 1
+            else:
+                logger.error(f"Failed to update daily records for {stock_code}")
+                metrics.failed += 1
+                self._fail(stock_code)
+
+        if written:
+            await asyncio.gather(*(self.data_service.write_monthly_buckets(stock_code, df)
+                                   for stock_code, df in written))
+            await self.mongo_service.delete_many("failed_requests", {
+                "api_name": "query_history_k_data_plus",
+                "parameters.code": {"$in": [stock_code for stock_code, _ in written]}
+            })
+        return written
+
+    async def _update_indicators(self, stock_code: str, df: pd.DataFrame):
+        # 指标按前复权价格计算；发生除权除息时先刷新复权因子
+        factors, rebase = await self.data_service.sync_adjust_factors(stock_code, df)
+        await self.data_service.technical_service.calculate_technical_indicators(
+            stock_code, adjust_frame(df, factors)
+        )
+        if rebase:
+            # 价格基准变化：已保存的 MACD、布林带、均线按新的前复权价格整体重算
+            await self.data_service.technical_service.rebase_price_indicators(stock_code)
+        await self.data_service.snapshot_service.refresh_stock(stock_code)
+
+    def progress(self) -> Dict[str, Any]:
+        """运行进度与各阶段指标"""
+        if self.started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        done = self.completed + self.no_data + self.failed
+        return {
+            "kind": self.kind,
+            "status": self.status,
+            "is_running": self.status == "running",
+            "total": self.total,
+            "completed": self.completed,
+            "no_data": self.no_data,
+            "failed": self.failed,
+            "progress": round(min(done, self.total) * 100 / self.total, 2) if self.total else 0,
+            "current_stock": self.current_stock,
+            "failed_stocks": list(self.failed_stocks),
+            "elapsed_seconds": round(elapsed, 1),
+            "stages": {name: metrics.to_dict(elapsed) for name, metrics in self.metrics.items()},
+            "queues": {name: {"depth": queue.qsize(), "capacity": queue.maxsize}
+                       for name, queue in self.queues.items()}
+        }
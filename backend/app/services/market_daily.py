@@ -0,0 +1,75 @@
+import logging
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# TuShare daily 字段 -> BaoStock 日线字段
+DAILY_COLUMNS = {
+    "open": "open",
+    "high": "high",
+    "low": "low",
+    "close": "close",
+    "pre_close": "preclose",
+    "pct_chg": "pctChg",
+}
+# TuShare daily_basic 字段 -> BaoStock 日线字段
+BASIC_COLUMNS = {
+    "turnover_rate": "turn",
+    "pe_ttm": "peTTM",
+    "pb": "pbMRQ",
+    "ps_ttm": "psTTM",
+}
+# TuShare 成交量单位为手、成交额单位为千元，BaoStock 为股和元
+VOLUME_UNIT = 100
+AMOUNT_UNIT = 1000
+
+
+def ts_code_to_code(ts_codes: pd.Series) -> pd.Series:
+    """600000.SH -> sh.600000（按列转换），不带市场后缀的代码保持不变"""
+    parts = ts_codes.astype(str).str.split(".", n=1, expand=True)
+    if parts.shape[1] < 2:
+        return ts_codes
+    return (parts[1].str.lower() + "." + parts[0]).where(parts[1].notna(), ts_codes)
+
+
+def tushare_daily_frame(daily: pd.DataFrame, basic: Optional[pd.DataFrame] = None,
+                        st_codes: Iterable[str] = ()) -> pd.DataFrame:
+    """TuShare 按交易日返回的全市场日线（及每日指标）转换为 BaoStock 字段格式
+
+    返回的每一行对应一只股票当天的K线，列与 BaoStock query_history_k_data_plus 一致，
+    可直接交给 daily_bar_documents 转换。TuShare 没有的字段（如 pcfNcfTTM）留空，
+    isST 按股票名称是否带 ST 判断，出现在当日行情中的股票均为正常交易。
+    """
+    if daily is None or daily.empty:
+        return pd.DataFrame()
+
+    frame = pd.DataFrame({
+        "date": pd.to_datetime(daily["trade_date"], format="%Y%m%d").dt.strftime("%Y-%m-%d"),
+        "code": ts_code_to_code(daily["ts_code"]),
+    })
+    for source, target in DAILY_COLUMNS.items():
+        frame[target] = pd.to_numeric(daily[source], errors="coerce").to_numpy()
+    frame["volume"] = pd.to_numeric(daily["vol"], errors="coerce").to_numpy() * VOLUME_UNIT
+    frame["amount"] = pd.to_numeric(daily["amount"], errors="coerce").to_numpy() * AMOUNT_UNIT
+
+    if basic is not None and not basic.empty:
+        basic = basic.drop_duplicates("ts_code").set_index("ts_code")
+        for source, target in BASIC_COLUMNS.items():
+            if source in basic.columns:
+                frame[target] = pd.to_numeric(basic[source], errors="coerce").reindex(daily["ts_code"]).to_numpy()
+
+    # TuShare daily 为不复权价格，与 BaoStock 日线一致，读取时按复权因子换算
+    frame["adjustflag"] = "3"
+    frame["tradestatus"] = 1
+    frame["isST"] = np.isin(frame["code"].to_numpy(), list(st_codes)).astype(int)
+    return frame.reset_index(drop=True)
+
+
+def split_by_code(frame: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """全市场日线按股票拆分"""
+    if frame.empty:
+        return {}
+    return {code: group.reset_index(drop=True) for code, group in frame.groupby("code", sort=False)}
@@ -0,0 +1,292 @@
+"""行情数据源
+
+DataService 通过 MarketDataProvider 访问上游：BaoStockProvider、TushareProvider 分别调用
+真实接口；RecordingProvider 把任意数据源的返回写入本地目录，ReplayProvider 从该目录
+按配置的延迟回放，使导入流程可以离线、可重复地测试和压测。
+
+日线一律为不复权价格（adjustflag "3"），复权因子由 query_adjust_factor 单独提供，
+读取时再换算为前复权价格（见 app.utils.price_adjust）。
+
+所有方法都是阻塞调用，由调用方放到线程池中执行。日线查询统一返回 BaoStock 格式的
+(error_code, error_msg, fields, rows)，rows 中的值为字符串。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import baostock as bs
+import pandas as pd
+import tushare as ts
+
+from app.services.market_daily import tushare_daily_frame
+from app.services.minute_bars import MINUTE_FIELDS
+
+ADJUST_FACTOR_FIELDS = "code,dividOperateDate,foreAdjustFactor,backAdjustFactor,adjustFactor"
+DAILY_FIELDS = "date,code,open,high,low,close,preclose,volume,amount,adjustflag,turn,tradestatus,pctChg,peTTM,pbMRQ,psTTM,pcfNcfTTM,isST"
+
+# (error_code, error_msg, fields, rows)
+DailyResult = Tuple[str, str, List[str], List[List[str]]]
+
+
+def _collect(rs) -> DailyResult:
+    """读取 BaoStock 结果集的全部行"""
+    if rs.error_code != "0":
+        return rs.error_code, rs.error_msg, rs.fields, []
+
+    data_list = []
+    while (rs.error_code == "0") & rs.next():
+        data_list.append(rs.get_row_data())
+    return rs.error_code, rs.error_msg, rs.fields, data_list
+
+
+class MarketDataProvider:
+    """数据源接口"""
+
+    name = "provider"
+
+    def login(self) -> Tuple[str, str]:
+        """登录上游，返回 (error_code, error_msg)，"0" 表示成功"""
+        return "0", ""
+
+    def query_daily_k(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        """查询单只股票 [start_date, end_date] 的日线（YYYY-MM-DD）"""
+        raise NotImplementedError
+
+    def query_minute_k(self, stock_code: str, start_date: str, end_date: str, frequency: int) -> DailyResult:
+        """查询单只股票的 frequency 分钟K线，字段见 MINUTE_FIELDS"""
+        raise NotImplementedError(f"{self.name} does not provide minute bars")
+
+    def query_adjust_factor(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        """查询 [start_date, end_date] 内的除权除息日及复权因子，字段见 ADJUST_FACTOR_FIELDS"""
+        raise NotImplementedError(f"{self.name} does not provide adjust factors")
+
+    def query_trade_dates(self, start_date: str, end_date: str) -> DailyResult:
+        """查询 [start_date, end_date] 的交易日历，字段含 calendar_date、is_trading_day"""
+        raise NotImplementedError(f"{self.name} does not provide trade dates")
+
+    def query_all_stock(self, date: str) -> DailyResult:
+        """查询某一交易日的全部证券列表"""
+        raise NotImplementedError(f"{self.name} does not provide the stock list")
+
+    def call(self, api_name: str, **params) -> pd.DataFrame:
+        """调用 TuShare 风格的接口（如 daily、trade_cal），返回 DataFrame"""
+        raise NotImplementedError(f"{self.name} does not provide {api_name}")
+
+
+class BaoStockProvider(MarketDataProvider):
+    """BaoStock：不复权日线和分钟线、复权因子、交易日历、证券列表"""
+
+    name = "baostock"
+
+    def login(self) -> Tuple[str, str]:
+        lg = bs.login()
+        return lg.error_code, lg.error_msg
+
+    def query_daily_k(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        rs = bs.query_history_k_data_plus(
+            stock_code,
+            DAILY_FIELDS,
+            start_date=start_date,
+            end_date=end_date,
+            frequency="d",
+            adjustflag="3",  # Unadjusted, adjusted on read with the factors below
+        )
+        return _collect(rs)
+
+    def query_minute_k(self, stock_code: str, start_date: str, end_date: str, frequency: int) -> DailyResult:
+        rs = bs.query_history_k_data_plus(
+            stock_code,
+            MINUTE_FIELDS,
+            start_date=start_date,
+            end_date=end_date,
+            frequency=str(frequency),
+            adjustflag="3",
+        )
+        return _collect(rs)
+
+    def query_adjust_factor(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        return _collect(bs.query_adjust_factor(code=stock_code, start_date=start_date, end_date=end_date))
+
+    def query_trade_dates(self, start_date: str, end_date: str) -> DailyResult:
+        return _collect(bs.query_trade_dates(start_date=start_date, end_date=end_date))
+
+    def query_all_stock(self, date: str) -> DailyResult:
+        return _collect(bs.query_all_stock(date))
+
+
+class TushareProvider(MarketDataProvider):
+    """TuShare Pro：通用接口调用，日线按 BaoStock 字段格式返回"""
+
+    name = "tushare"
+
+    def __init__(self, token: str):
+        ts.set_token(token)
+        self.pro = ts.pro_api()
+
+    def call(self, api_name: str, **params) -> pd.DataFrame:
+        return getattr(self.pro, api_name)(**params)
+
+    def query_daily_k(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        market, symbol = stock_code.split(".", 1)
+        daily = self.call("daily", ts_code=f"{symbol}.{market.upper()}",
+                          start_date=start_date.replace("-", ""), end_date=end_date.replace("-", ""))
+        fields = DAILY_FIELDS.split(",")
+        frame = tushare_daily_frame(daily)
+        if frame.empty:
+            return "0", "", fields, []
+        frame = frame.sort_values("date").reindex(columns=fields)
+        rows = frame.astype(object).where(frame.notna(), "").astype(str).values.tolist()
+        return "0", "", fields, rows
+
+
+def _call_key(api_name: str, params: Dict[str, Any]) -> str:
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+    return f"{api_name}-{digest}"
+
+
+def daily_recording_path(root: str, stock_code: str) -> str:
+    return os.path.join(root, "daily", f"{stock_code}.json")
+
+
+def write_daily_recording(root: str, stock_code: str, fields: List[str], rows: List[List[str]]):
+    """写入（覆盖）一只股票的日线录制文件"""
+    path = daily_recording_path(root, stock_code)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"fields": list(fields), "rows": rows}, f, ensure_ascii=False, separators=(",", ":"))
+
+
+class RecordingProvider(MarketDataProvider):
+    """包装真实数据源，把返回结果录制到 root 目录
+
+    日线按股票保存在 daily/<code>.json，同一股票多次查询的结果按日期合并；
+    接口调用按接口名和参数保存在 calls/<api>-<hash>.json。
+    """
+
+    def __init__(self, inner: MarketDataProvider, root: str):
+        self.inner = inner
+        self.root = root
+        self.name = f"recording:{inner.name}"
+        self._lock = threading.Lock()
+
+    def login(self) -> Tuple[str, str]:
+        return self.inner.login()
+
+    def query_daily_k(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        result = self.inner.query_daily_k(stock_code, start_date, end_date)
+        error_code, _, fields, rows = result
+        if error_code == "0" and rows:
+            position = list(fields).index("date")
+            with self._lock:
+                merged = {}
+                path = daily_recording_path(self.root, stock_code)
+                if os.path.exists(path):
+                    with open(path, encoding="utf-8") as f:
+                        recorded = json.load(f)
+                    merged = {row[position]: row for row in recorded["rows"]}
+                merged.update((row[position], row) for row in rows)
+                write_daily_recording(self.root, stock_code, fields, [merged[day] for day in sorted(merged)])
+        return result
+
+    def query_minute_k(self, stock_code: str, start_date: str, end_date: str, frequency: int) -> DailyResult:
+        params = {"code": stock_code, "start_date": start_date, "end_date": end_date, "frequency": frequency}
+        return self._record_rows("query_minute_k", params,
+                                 self.inner.query_minute_k(stock_code, start_date, end_date, frequency))
+
+    def query_adjust_factor(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        return self._record_rows("query_adjust_factor",
+                                 {"code": stock_code, "start_date": start_date, "end_date": end_date},
+                                 self.inner.query_adjust_factor(stock_code, start_date, end_date))
+
+    def _record_rows(self, api_name: str, params: Dict[str, Any], result: DailyResult) -> DailyResult:
+        error_code, _, fields, rows = result
+        if error_code == "0":
+            path = os.path.join(self.root, "calls", f"{_call_key(api_name, params)}.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._lock, open(path, "w", encoding="utf-8") as f:
+                json.dump({"fields": list(fields), "rows": rows}, f, ensure_ascii=False)
+        return result
+
+    def query_trade_dates(self, start_date: str, end_date: str) -> DailyResult:
+        return self._record_rows("query_trade_dates", {"start_date": start_date, "end_date": end_date},
+                                 self.inner.query_trade_dates(start_date, end_date))
+
+    def query_all_stock(self, date: str) -> DailyResult:
+        return self._record_rows("query_all_stock", {"date": date}, self.inner.query_all_stock(date))
+
+    def call(self, api_name: str, **params) -> pd.DataFrame:
+        df = self.inner.call(api_name, **params)
+        path = os.path.join(self.root, "calls", f"{_call_key(api_name, params)}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock, open(path, "w", encoding="utf-8") as f:
+            f.write(df.to_json(orient="split", force_ascii=False))
+        return df
+
+
+class ReplayProvider(MarketDataProvider):
+    """从录制目录回放，每次调用按 latency 秒模拟上游延迟
+
+    没有录制的股票返回空结果（等同于上游没有新数据），没有录制的接口调用抛出 LookupError。
+    """
+
+    name = "replay"
+
+    def __init__(self, root: str, latency: float = 0.0):
+        self.root = root
+        self.latency = latency
+
+    def _wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def query_daily_k(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        self._wait()
+        path = daily_recording_path(self.root, stock_code)
+        if not os.path.exists(path):
+            return "0", "", DAILY_FIELDS.split(","), []
+        with open(path, encoding="utf-8") as f:
+            recorded = json.load(f)
+        position = recorded["fields"].index("date")
+        rows = [row for row in recorded["rows"] if start_date <= row[position] <= end_date]
+        return "0", "", recorded["fields"], rows
+
+    def _replay_rows(self, api_name: str, params: Dict[str, Any]) -> DailyResult:
+        self._wait()
+        path = os.path.join(self.root, "calls", f"{_call_key(api_name, params)}.json")
+        if not os.path.exists(path):
+            raise LookupError(f"No recording for {api_name}({params})")
+        with open(path, encoding="utf-8") as f:
+            recorded = json.load(f)
+        return "0", "", recorded["fields"], recorded["rows"]
+
+    def query_minute_k(self, stock_code: str, start_date: str, end_date: str, frequency: int) -> DailyResult:
+        try:
+            return self._replay_rows("query_minute_k", {"code": stock_code, "start_date": start_date,
+                                                        "end_date": end_date, "frequency": frequency})
+        except LookupError:
+            return "0", "", MINUTE_FIELDS.split(","), []
+
+    def query_adjust_factor(self, stock_code: str, start_date: str, end_date: str) -> DailyResult:
+        try:
+            return self._replay_rows("query_adjust_factor",
+                                     {"code": stock_code, "start_date": start_date, "end_date": end_date})
+        except LookupError:
+            # 没有录制的股票视为没有除权除息
+            return "0", "", ADJUST_FACTOR_FIELDS.split(","), []
+
+    def query_trade_dates(self, start_date: str, end_date: str) -> DailyResult:
+        return self._replay_rows("query_trade_dates", {"start_date": start_date, "end_date": end_date})
+
+    def query_all_stock(self, date: str) -> DailyResult:
+        return self._replay_rows("query_all_stock", {"date": date})
+
+    def call(self, api_name: str, **params) -> pd.DataFrame:
+        self._wait()
+        path = os.path.join(self.root, "calls", f"{_call_key(api_name, params)}.json")
+        if not os.path.exists(path):
+            raise LookupError(f"No recording for {api_name}({params})")
+        return pd.read_json(path, orient="split", dtype=False, convert_dates=False)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+MINUTE_FIELDS = "date,time,code,open,high,low,close,volume,amount,adjustflag"
+# BaoStock 支持的分钟频率
+MINUTE_FREQUENCIES = (5, 15, 30, 60)
+# A股每个交易日的连续竞价时长（分钟），用于判断一个桶是否完整
+TRADING_MINUTES = 240
+# 每个桶中保存为数组的字段
+ARRAY_FIELDS = ("open", "high", "low", "close", "volume", "amount")
+
+
+def parse_frequencies(value) -> List[int]:
+    """"5,15" 或 [5, 15] -> [5, 15]，不支持的频率抛出 ValueError"""
+    items = value.split(",") if isinstance(value, str) else value
+    frequencies = sorted({int(item) for item in items if str(item).strip()})
+    unsupported = [frequency for frequency in frequencies if frequency not in MINUTE_FREQUENCIES]
+    if unsupported:
+        raise ValueError(f"Unsupported minute frequencies: {unsupported}, expected {list(MINUTE_FREQUENCIES)}")
+    return frequencies
+
+
+def _valid(values) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    return values[~np.isnan(values)]
+
+
+def daily_rollup(bucket: Dict[str, Any]) -> Dict[str, Any]:
+    """由一个桶的分钟K线汇总出当日的开高低收和成交量额，缺失值（NaN）不参与汇总"""
+    opens, highs, lows, closes = (_valid(bucket[name]) for name in ("open", "high", "low", "close"))
+    return {
+        "open": float(opens[0]) if len(opens) else None,
+        "high": float(highs.max()) if len(highs) else None,
+        "low": float(lows.min()) if len(lows) else None,
+        "close": float(closes[-1]) if len(closes) else None,
+        "volume": float(np.nansum(bucket["volume"])),
+        "amount": float(np.nansum(bucket["amount"])),
+    }
+
+
+def minute_bucket_documents(stock_code: str, frequency: int, df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """BaoStock 分钟K线 DataFrame -> 每个交易日一个桶文档
+
+    桶内各字段为按时间排列的数组，time 为 HHMM 整数（如 935 表示 09:35 结束的K线），
+    day 为当日汇总，日级查询只需读取该字段。
+    """
+    if df is None or df.empty:
+        return []
+    df = df.sort_values("time")
+    values = {name: pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float) for name in ARRAY_FIELDS}
+    # BaoStock 的 time 为 YYYYMMDDHHMMSSsss
+    times = pd.to_numeric(df["time"].astype(str).str.slice(8, 12), errors="coerce").to_numpy(dtype=float)
+    # 字段缺失或无法解析的K线不写入，不能记为 0 价格
+    complete = ~np.isnan(times)
+    for column in values.values():
+        complete &= ~np.isnan(column)
+    if not complete.all():
+        logger.warning(f"Dropped {int((~complete).sum())} incomplete {frequency}-minute bars for {stock_code}")
+        values = {name: column[complete] for name, column in values.items()}
+        times = times[complete]
+        df = df[complete]
+    times = times.astype(int)
+    dates = df["date"].to_numpy()
+    flags = df["adjustflag"].to_numpy() if "adjustflag" in df.columns else np.full(len(df), "3", dtype=object)
+
+    now = datetime.utcnow()
+    documents = []
+    for date in np.unique(dates):
+        rows = dates == date
+        bucket = {name: column[rows].tolist() for name, column in values.items()}
+        bucket.update({
+            "code": stock_code,
+            "date": datetime.strptime(str(date), "%Y-%m-%d"),
+            "frequency": frequency,
+            "adjustflag": str(flags[rows][0]),
+            "time": times[rows].tolist(),
+            "count": int(rows.sum()),
+            "updated_at": now,
+        })
+        bucket["day"] = daily_rollup(bucket)
+        documents.append(bucket)
+    return documents
+
+
+def minute_bucket_operations(stock_code: str, frequency: int, df: pd.DataFrame) -> List[UpdateOne]:
+    return [
+        UpdateOne({"frequency": doc["frequency"], "date": doc["date"]}, {"$set": doc}, upsert=True)
+        for doc in minute_bucket_documents(stock_code, frequency, df)
+    ]
+
+
+class MinuteBarService:
+    """分钟K线导入
+
+    按股票、频率从 BaoStock 查询 5/15/30/60 分钟K线（不复权），每只股票的分钟数据保存在
+    stock_minute_<code> 集合，每个交易日每个频率一个桶文档，文档数与日线同量级；
+    桶内同时保存当日汇总，日级统计不需要展开分钟数组。增量导入从该频率最后一个桶的
+    下一个交易日开始（最后一个桶不完整时从该日重新查询），首次导入从
+    minute_fetch_start_date 开始。
+    """
+
+    def __init__(self, data_service, concurrency: Optional[int] = None):
+        self.data_service = data_service
+        self.mongo_service = data_service.mongo_service
+        self.concurrency = max(1, concurrency or settings.minute_fetch_concurrency)
+        self.running = False
+
+    async def fetch_stock(self, stock_code: str, frequency: int) -> Optional[int]:
+        """导入一只股票一个频率的新分钟K线，返回写入的桶数，失败时返回 None"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        last = await self.mongo_service.find_one(
+            self.mongo_service.get_minute_collection_name(stock_code),
+            {"frequency": frequency}, sort=[("date", -1)]
+        )
+        if last is None:
+            start_date, end_date = settings.minute_fetch_start_date, today
+        else:
+            last_date = last["date"].strftime("%Y-%m-%d")
+            start_date, end_date = await self.data_service._fetch_range(last_date)
+            if (last.get("count") or 0) < TRADING_MINUTES // frequency:
+                # 最后一个桶不完整（盘中导入），从该日重新查询
+                start_date, end_date = last_date, end_date or today
+            elif start_date is None:
+                return 0
+
+        try:
+            error_code, error_msg, fields, rows = await self.data_service.query_minute_k(
+                stock_code, start_date, end_date, frequency
+            )
+        except Exception as e:
+            error_code, error_msg, fields, rows = "-1", str(e), [], []
+        if error_code != "0":
+            # 不写入 failed_requests：没有写入的区间在下一次导入时会从最后一个桶之后重新查询
+            logger.error(f"Error fetching {frequency}-minute bars for {stock_code}: {error_msg}")
+            return None
+
+        operations = minute_bucket_operations(stock_code, frequency, pd.DataFrame(rows, columns=fields))
+        if not operations:
+            return 0
+        await self.mongo_service.ensure_minute_indexes(stock_code)
+        if not await self.mongo_service.bulk_write(
+            self.mongo_service.get_minute_collection_name(stock_code), operations, ordered=False
+        ):
+            return None
+        return len(operations)
+
+    async def run(self, stock_codes: Optional[List[str]] = None,
+                  frequencies: Optional[List[int]] = None) -> Dict[str, Any]:
+        """导入一批股票（默认全部沪深股票）的分钟K线，返回统计结果"""
+        if self.running:
+            return {"status": "running"}
+        self.running = True
+        try:
+            frequencies = frequencies or parse_frequencies(settings.minute_frequencies)
+            if stock_codes is None:
+                stocks = await self.mongo_service.find("stock_info", {}, {"code": 1})
+                stock_codes = [stock["code"] for stock in stocks if not stock["code"].startswith("bj.")]
+            if not await self.data_service._login_baostock():
+                return {"status": "error", "message": "Failed to login to BaoStock"}
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def fetch(stock_code: str, frequency: int) -> Optional[int]:
+                async with semaphore:
+                    return await self.fetch_stock(stock_code, frequency)
+
+            tasks = [(code, frequency) for code in stock_codes for frequency in frequencies]
+            results = await asyncio.gather(*(fetch(code, frequency) for code, frequency in tasks))
+            summary = {
+                "status": "completed",
+                "stocks": len(stock_codes),
+                "frequencies": frequencies,
+                "buckets": sum(result for result in results if result),
+                "failed": sum(1 for result in results if result is None),
+            }
+            logger.info(f"Minute bar fetch finished: {summary}")
+            return summary
+        finally:
+            self.running = False
@@ -4,7 +4,12 @@ from typing import List, Dict, Any, Optional, Pattern
 import re
 
 import motor.motor_asyncio
+import numpy as np
 from bson import ObjectId
+
+from app.config.settings import settings
+from app.services.bar_buckets import MonthlyBarStore
+from app.utils.price_adjust import PRICE_FIELDS, RAW_FLAG, adjust_bars, date_multipliers
 from pymongo import UpdateOne, ASCENDING, DESCENDING
 from pymongo.errors import PyMongoError
 
@@ -12,12 +17,20 @@ logger = logging.getLogger(__name__)
 
 
 class MongoDBService:
+    # 本进程已创建索引的分钟K线集合
+    _minute_indexed = set()
+
     def __init__(self):
         self.client = motor.motor_asyncio.AsyncIOMotorClient(
             "mongodb://localhost:27017/grape_finance"
         )
         self.db = self.client.grape_finance
 
+    @property
+    def monthly_bars(self) -> MonthlyBarStore:
+        """月度分桶的日线存储（daily_bar_layout = "monthly" 时使用）"""
+        return MonthlyBarStore(self.db)
+
     async def initialize_indexes(self):
         try:
             # Stock info indexes
@@ -46,15 +59,82 @@ class MongoDBService:
             await self.db.failed_requests.create_index([("retry_count", ASCENDING)])
             await self.db.failed_requests.create_index([("last_attempt", DESCENDING)])
 
+            # Adjustment factors (one document per ex-rights date)
+            await self.db.adjust_factors.create_index([("code", ASCENDING), ("date", ASCENDING)], unique=True)
+
+            # Ranges confirmed to have no upstream bars (skipped by the gap scanner)
+            await self.db.daily_gaps.create_index([("code", ASCENDING), ("start_date", ASCENDING)], unique=True)
+
+            # Trading calendar (one document per calendar day)
+            await self.db.trading_calendar.create_index([("date", ASCENDING)], unique=True)
+
             # Trading records indexes
             await self.db.trading_records.create_index([("code", ASCENDING)])
             await self.db.trading_records.create_index([("date", DESCENDING)])
 
+            # Strategy execution job indexes
+            await self.db.strategy_jobs.create_index([("job_id", ASCENDING)], unique=True)
+            await self.db.strategy_jobs.create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+            await self.db.strategy_jobs.create_index([("created_at", DESCENDING)])
+            await self.db.strategy_job_results.create_index([
+                ("job_id", ASCENDING),
+                ("stock_code", ASCENDING)
+            ], unique=True)
+            await self.db.strategy_job_results.create_index([("job_id", ASCENDING), ("index", ASCENDING)])
+
+            # Latest snapshot indexes (range filters over the whole market)
+            await self.db.latest_snapshot.create_index([("code", ASCENDING)], unique=True)
+            await self.db.latest_snapshot.create_index([("market", ASCENDING)])
+            await self.db.latest_snapshot.create_index([("industry", ASCENDING)])
+            for field in ("close", "volume", "amount", "pctChg", "turn", "cci", "rsi",
+                          "volume_ma20", "volume_ratio", "pct_from_high_52w"):
+                await self.db.latest_snapshot.create_index([(field, DESCENDING)])
+
             logger.info("Database indexes initialized successfully")
 
         except Exception as e:
             logger.error(f"Error initializing database indexes: {str(e)}")
 
+        # 策略命中记录唯一索引单独创建：历史数据中可能存在重复记录，需要先去重，
+        # 失败时不影响其它索引
+        try:
+            removed = await self.dedupe_stock_collections()
+            if removed:
+                logger.info(f"Removed {removed} duplicate strategy hits from stock_collections")
+            await self.db.stock_collections.create_index(
+                [("code", ASCENDING), ("strategy_id", ASCENDING), ("meet_date", ASCENDING)],
+                unique=True,
+                name="code_strategy_meet_date_unique",
+                # 手动加入的收藏没有策略和匹配日期，不参与唯一约束
+                partialFilterExpression={"strategy_id": {"$exists": True}, "meet_date": {"$exists": True}}
+            )
+        except Exception as e:
+            logger.error(f"Error initializing stock_collections unique index: {str(e)}")
+
+    async def dedupe_stock_collections(self) -> int:
+        """删除 (code, strategy_id, meet_date) 重复的策略命中记录，每组保留最早的一条"""
+        pipeline = [
+            {"$match": {"strategy_id": {"$exists": True}, "meet_date": {"$exists": True}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {
+                "_id": {"code": "$code", "strategy_id": "$strategy_id", "meet_date": "$meet_date"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        duplicate_ids = []
+        async for group in self.db.stock_collections.aggregate(pipeline, allowDiskUse=True):
+            duplicate_ids.extend(group["ids"][1:])
+
+        removed = 0
+        for start in range(0, len(duplicate_ids), 1000):
+            result = await self.db.stock_collections.delete_many(
+                {"_id": {"$in": duplicate_ids[start:start + 1000]}}
+            )
+            removed += result.deleted_count
+        return removed
+
     async def initialize_configurations(self):
         default_configs = [
             {
@@ -91,6 +171,20 @@ class MongoDBService:
                 "key": "default_constant",
                 "value": "0.015",
                 "description": "Default CCI scaling constant"
+            },
+            {
+                "category": "technical",
+                "sub_category": "moving_average",
+                "key": "price_periods",
+                "value": "5,10,20,60",
+                "description": "Close price MA periods stored with technical indicators (ma5, ma10, ...), empty to disable"
+            },
+            {
+                "category": "technical",
+                "sub_category": "moving_average",
+                "key": "volume_periods",
+                "value": "5,10,20",
+                "description": "Volume MA periods stored with technical indicators (vol_ma5, ...), empty to disable"
             }
         ]
 
@@ -206,9 +300,9 @@ class MongoDBService:
             logger.error(f"Error updating documents in {collection}: {str(e)}")
             return 0
 
-    async def bulk_write(self, collection: str, operations: List[UpdateOne]) -> bool:
+    async def bulk_write(self, collection: str, operations: List[UpdateOne], ordered: bool = True) -> bool:
         try:
-            result = await self.db[collection].bulk_write(operations)
+            result = await self.db[collection].bulk_write(operations, ordered=ordered)
             return result.acknowledged
         except PyMongoError as e:
             logger.error(f"Error in bulk write operation for {collection}: {str(e)}")
@@ -223,6 +317,15 @@ class MongoDBService:
             logger.error(f"Error deleting document from {collection}: {str(e)}")
             return False
     
+    async def delete_many(self, collection: str, query: Dict[str, Any]) -> int:
+        try:
+            self.convert_string_to_objectid(query)
+            result = await self.db[collection].delete_many(query)
+            return result.deleted_count
+        except PyMongoError as e:
+            logger.error(f"Error deleting documents from {collection}: {str(e)}")
+            return 0
+
     async def count_documents(self, collection: str, query: Dict[str, Any] = None) -> int:
         """统计集合中的文档数量"""
         try:
@@ -354,25 +457,143 @@ class MongoDBService:
         if fields:
             projection = {field: 1 for field in fields}
             projection['_id'] = 0  # 总是排除_id
+            # 复权换算需要日期和复权标志
+            projection.update({'date': 1, 'adjustflag': 1})
 
         # 排序方向
         sort_direction = DESCENDING if sort == "desc" else ASCENDING
 
         try:
-            # 执行查询
-            cursor = collection.find(query, projection).sort('date', sort_direction).skip(skip).limit(limit)
-            results = await cursor.to_list(length=None)
+            results = None
+            if settings.daily_bar_layout == "monthly":
+                # 月度分桶：读够 skip + limit 条即停止，没有分桶的股票回退到逐根K线的集合
+                results = await self.monthly_bars.read(
+                    stock_code, query.get('date', {}).get('$gte'), query.get('date', {}).get('$lte'),
+                    descending=sort == "desc", max_bars=skip + limit if limit else 0
+                )
+                if results is not None:
+                    results = results[skip:skip + limit] if limit else results[skip:]
+                    if projection:
+                        results = [{name: bar[name] for name in projection if name in bar} for bar in results]
+            if results is None:
+                # 执行查询
+                cursor = collection.find(query, projection).sort('date', sort_direction).skip(skip).limit(limit)
+                results = await cursor.to_list(length=None)
 
             # 移除内部字段
             for doc in results:
                 doc.pop('_id', None)
                 doc.pop('created_at', None)
 
+            await self.adjust_bars(stock_code, results)
+            if fields:
+                for name in {'date', 'adjustflag'} - set(fields):
+                    for doc in results:
+                        doc.pop(name, None)
             return results
         except PyMongoError as e:
             logger.error(f"Error fetching stock history for {stock_code}: {str(e)}")
             return []
     
+    async def get_adjust_factors(self, stock_codes: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """读取多只股票的复权因子，按日期升序"""
+        factors: Dict[str, List[Dict[str, Any]]] = {code: [] for code in stock_codes}
+        if not stock_codes:
+            return factors
+        docs = await self.find(
+            'adjust_factors', {'code': {'$in': list(stock_codes)}},
+            projection={'_id': 0, 'code': 1, 'date': 1, 'back_factor': 1},
+            sort=[('date', ASCENDING)]
+        )
+        for doc in docs:
+            factors[doc['code']].append(doc)
+        return factors
+
+    async def adjust_bars(self, stock_code: str, bars: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """把读取的不复权K线换算为前复权价格（原地修改），没有不复权K线时不读取因子"""
+        if not any(bar.get('adjustflag') == '3' and any(name in bar for name in PRICE_FIELDS) for bar in bars):
+            return bars
+        factors = await self.get_adjust_factors([stock_code])
+        return adjust_bars(bars, factors[stock_code])
+
+    async def get_daily_dates(self, stock_code: str) -> List[datetime]:
+        """单只股票已保存的全部日线日期（升序），一次聚合只返回一个文档"""
+        if settings.daily_bar_layout == "monthly":
+            dates = await self.monthly_bars.dates(stock_code)
+            if dates is not None:
+                return dates
+        pipeline = [
+            {'$match': {'code': stock_code}},
+            {'$group': {'_id': None, 'dates': {'$push': '$date'}}}
+        ]
+        try:
+            cursor = self.db[self.get_collection_name(stock_code)].aggregate(pipeline)
+            results = await cursor.to_list(length=1)
+            return sorted(results[0]['dates']) if results else []
+        except PyMongoError as e:
+            logger.error(f"Error fetching daily dates for {stock_code}: {str(e)}")
+            return []
+
+    async def find_daily_bars(self, stock_code: str, query: Dict[str, Any] = None,
+                              projection: Dict[str, Any] = None, limit: int = 0,
+                              sort: List[tuple] = None) -> List[Dict[str, Any]]:
+        """与 find 相同地查询日线集合，价格换算为前复权；投影中未包含的日期、复权标志不返回"""
+        hidden = set()
+        if projection and any(value for key, value in projection.items() if key != '_id'):
+            hidden = {'date', 'adjustflag'} - {key for key, value in projection.items() if value}
+            projection = {**projection, 'date': 1, 'adjustflag': 1}
+        bars = await self.find(self.get_collection_name(stock_code), query, projection, limit, sort)
+        await self.adjust_bars(stock_code, bars)
+        for name in hidden:
+            for bar in bars:
+                bar.pop(name, None)
+        return bars
+
+    async def get_stock_history_with_technical(self, stock_code: str, limit: int = 100,
+                                               fields: Optional[List[str]] = None,
+                                               technical_fields: Optional[List[str]] = None) -> List[Dict]:
+        """一次聚合读取最近 limit 条K线及同日的技术指标（按日期倒序）
+
+        技术指标通过 $lookup 按日期关联（technical_ 集合的 date 有唯一索引），
+        放在每条K线的 technical 字段中，没有指标的日期为 None。
+
+        Args:
+            fields: 需要的K线字段，默认全部
+            technical_fields: 需要的技术指标字段，默认全部
+        """
+        keep = set(technical_fields) | {'date'} if technical_fields else None
+        projection = {'_id': 0, 'date': 1, 'adjustflag': 1, 'technical': 1, **{field: 1 for field in fields}} \
+            if fields else {'_id': 0, 'created_at': 0}
+        pipeline = [
+            {'$match': {'code': stock_code}},
+            {'$sort': {'date': DESCENDING}},
+            {'$limit': limit},
+            {'$lookup': {
+                'from': self.get_technical_collection_name(stock_code),
+                'localField': 'date',
+                'foreignField': 'date',
+                'as': 'technical'
+            }},
+            {'$project': projection}
+        ]
+        try:
+            cursor = self.db[self.get_collection_name(stock_code)].aggregate(pipeline)
+            results = await cursor.to_list(length=None)
+            for doc in results:
+                matches = doc.get('technical') or []
+                tech = matches[0] if matches else None
+                if tech is not None:
+                    tech = {k: v for k, v in tech.items() if k != '_id' and (keep is None or k in keep)}
+                doc['technical'] = tech
+            await self.adjust_bars(stock_code, results)
+            if fields and 'adjustflag' not in fields:
+                for doc in results:
+                    doc.pop('adjustflag', None)
+            return results
+        except PyMongoError as e:
+            logger.error(f"Error fetching stock history with technical data for {stock_code}: {str(e)}")
+            return []
+
     async def get_all_stocks(self) -> List[Dict[str, Any]]:
         """
         从stock_info集合获取所有股票列表
@@ -412,6 +633,62 @@ class MongoDBService:
         stock_code = stock_code.lower()
         return f"technical_{stock_code}"
     
+    def get_minute_collection_name(self, stock_code: str) -> str:
+        """分钟K线集合名称：stock_minute_<code>"""
+        return f"stock_minute_{stock_code.lower()}"
+
+    async def ensure_minute_indexes(self, stock_code: str):
+        """分钟K线集合按 (frequency, date) 唯一，每个进程每个集合只创建一次"""
+        collection_name = self.get_minute_collection_name(stock_code)
+        if collection_name in MongoDBService._minute_indexed:
+            return
+        await self.db[collection_name].create_index([("frequency", ASCENDING), ("date", ASCENDING)], unique=True)
+        MongoDBService._minute_indexed.add(collection_name)
+
+    async def get_minute_bars(self, stock_code: str, frequency: int, start_date: Optional[datetime] = None,
+                              end_date: Optional[datetime] = None, rollup: bool = False) -> List[Dict[str, Any]]:
+        """读取分钟K线桶（按日期升序），价格换算为前复权
+
+        rollup 为 True 时只读取每个桶的当日汇总，返回日级数据 {date, open, high, low, close, volume, amount}；
+        否则展开为逐根K线 {date, time, open, high, low, close, volume, amount}。
+        """
+        query: Dict[str, Any] = {'frequency': frequency}
+        if start_date or end_date:
+            query['date'] = {}
+            if start_date:
+                query['date']['$gte'] = start_date
+            if end_date:
+                query['date']['$lte'] = end_date
+        projection = {'_id': 0, 'date': 1, 'adjustflag': 1, 'day': 1} if rollup \
+            else {'_id': 0, 'code': 0, 'day': 0, 'updated_at': 0}
+        buckets = await self.find(self.get_minute_collection_name(stock_code), query, projection,
+                                  sort=[('date', ASCENDING)])
+
+        if rollup:
+            bars = [{'date': bucket['date'], 'adjustflag': bucket.get('adjustflag'), **bucket['day']}
+                    for bucket in buckets]
+            await self.adjust_bars(stock_code, bars)
+            for bar in bars:
+                bar.pop('adjustflag', None)
+            return bars
+
+        # 同一天的K线共用一个复权系数
+        multipliers = np.ones(len(buckets))
+        if any(bucket.get('adjustflag') == RAW_FLAG for bucket in buckets):
+            factors = await self.get_adjust_factors([stock_code])
+            multipliers = np.where([bucket.get('adjustflag') == RAW_FLAG for bucket in buckets],
+                                   date_multipliers([bucket['date'] for bucket in buckets], factors[stock_code]), 1.0)
+        bars = []
+        for bucket, multiplier in zip(buckets, multipliers):
+            for i, time in enumerate(bucket['time']):
+                bar = {'date': bucket['date'], 'time': time}
+                for name in ('open', 'high', 'low', 'close'):
+                    bar[name] = bucket[name][i] * float(multiplier)
+                bar['volume'] = bucket['volume'][i]
+                bar['amount'] = bucket['amount'][i]
+                bars.append(bar)
+        return bars
+
     async def ensure_technical_collection_exists(self, stock_code: str) -> bool:
         """
         确保技术分析集合存在，如果不存在则创建
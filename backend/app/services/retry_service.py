@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from bson import ObjectId
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+DAILY_API = "query_history_k_data_plus"
+EARLIEST_DATE = "1990-12-19"
+
+
+def backoff_delay(retry_count: int, base_seconds: float, max_seconds: float) -> float:
+    """第 retry_count 次重试前需要等待的秒数（指数退避，有上限）"""
+    return min(base_seconds * (2 ** retry_count), max_seconds)
+
+
+def is_due(request: Dict[str, Any], now: datetime, base_seconds: float, max_seconds: float) -> bool:
+    """失败请求是否已经过了退避时间"""
+    last_attempt = request.get("last_attempt")
+    if not isinstance(last_attempt, datetime):
+        return True
+    delay = backoff_delay(int(request.get("retry_count") or 0), base_seconds, max_seconds)
+    return last_attempt + timedelta(seconds=delay) <= now
+
+
+def coalesce_ranges(ranges: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """合并重叠或相邻的日期区间 (YYYY-MM-DD)"""
+    merged: List[List[str]] = []
+    for start, end in sorted(ranges):
+        if merged:
+            last_end = datetime.strptime(merged[-1][1], "%Y-%m-%d")
+            if datetime.strptime(start, "%Y-%m-%d") <= last_end + timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], end)
+                continue
+        merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def group_daily_requests(requests: List[Dict[str, Any]], today: str) -> Dict[str, Dict[str, Any]]:
+    """按股票代码分组失败的日线请求，合并各自的日期区间
+
+    返回 {股票代码: {"ids": [...], "retry_count": 最大重试次数, "ranges": [(start, end), ...]}}
+    """
+    groups: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"ids": [], "retry_count": 0, "ranges": []})
+    for request in requests:
+        parameters = request.get("parameters") or {}
+        code = parameters.get("code")
+        if not code:
+            continue
+        start = parameters.get("start_date") or EARLIEST_DATE
+        end = parameters.get("end_date") or today
+        group = groups[code]
+        group["ids"].append(request["_id"])
+        group["retry_count"] = max(group["retry_count"], int(request.get("retry_count") or 0))
+        group["ranges"].append((start, max(start, end)))
+    for group in groups.values():
+        group["ranges"] = coalesce_ranges(group["ranges"])
+    return dict(groups)
+
+
+class FailedRequestRetrier:
+    """失败请求重放
+
+    读取 failed_requests 中到期的日线请求（按 retry_count 指数退避），按股票分组并合并
+    重叠的日期区间，每只股票每个区间只查询一次，并发重放；成功后写入数据、计算指标并
+    删除该股票的全部失败记录，失败则增加重试次数，超过上限后不再自动重试。
+    """
+
+    def __init__(self, data_service, concurrency: Optional[int] = None,
+                 base_delay: Optional[float] = None, max_delay: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        self.data_service = data_service
+        self.mongo_service = data_service.mongo_service
+        self.concurrency = max(1, concurrency or settings.retry_concurrency)
+        self.base_delay = base_delay or settings.retry_base_delay_seconds
+        self.max_delay = max_delay or settings.retry_max_delay_seconds
+        self.max_retries = max_retries or settings.retry_max_attempts
+        self.running = False
+
+    async def due_requests(self) -> List[Dict[str, Any]]:
+        """未超过重试上限的日线失败请求中，有请求到期的股票的全部请求
+
+        同一股票未到期的请求也一起合并重放，避免成功后留下重复的记录。
+        """
+        requests = await self.mongo_service.find(
+            "failed_requests",
+            {"api_name": DAILY_API, "retry_count": {"$lt": self.max_retries}}
+        )
+        now = datetime.utcnow()
+        due_codes = {
+            (request.get("parameters") or {}).get("code")
+            for request in requests if is_due(request, now, self.base_delay, self.max_delay)
+        }
+        return [request for request in requests if (request.get("parameters") or {}).get("code") in due_codes]
+
+    async def run(self) -> Dict[str, Any]:
+        """重放一轮到期的失败请求，返回统计结果"""
+        if self.running:
+            return {"status": "running"}
+        self.running = True
+        try:
+            requests = await self.due_requests()
+            if not requests:
+                return {"status": "idle", "requests": 0, "stocks": 0, "recovered": 0, "failed": 0}
+
+            if not await self.data_service._login_baostock():
+                logger.error("Failed to login to BaoStock, skip retrying failed requests")
+                return {"status": "error", "requests": len(requests), "stocks": 0, "recovered": 0, "failed": 0}
+
+            groups = group_daily_requests(requests, datetime.now().strftime("%Y-%m-%d"))
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def replay(code: str, group: Dict[str, Any]) -> bool:
+                async with semaphore:
+                    return await self._replay_stock(code, group)
+
+            results = await asyncio.gather(*(replay(code, group) for code, group in groups.items()))
+            recovered = sum(1 for ok in results if ok)
+            summary = {
+                "status": "completed",
+                "requests": len(requests),
+                "stocks": len(groups),
+                "recovered": recovered,
+                "failed": len(groups) - recovered,
+            }
+            logger.info(f"Retried failed requests: {summary}")
+            return summary
+        finally:
+            self.running = False
+
+    async def _replay_stock(self, code: str, group: Dict[str, Any]) -> bool:
+        """重放一只股票合并后的全部区间，全部成功才删除失败记录"""
+        error = None
+        frames = []
+        for start, end in group["ranges"]:
+            try:
+                error_code, error_msg, fields, rows = await self.data_service.query_daily_k(code, start, end)
+            except Exception as e:
+                error_code, error_msg, fields, rows = "-1", str(e), [], []
+            if error_code != "0":
+                error = error_msg
+                break
+            if rows:
+                frames.append(pd.DataFrame(rows, columns=fields))
+
+        if error is None and frames:
+            df = pd.concat(frames, ignore_index=True).drop_duplicates("date", keep="last")
+            if not await self.data_service.process_stock_data(code, df):
+                error = "Failed to save replayed daily data"
+
+        ids = [ObjectId(request_id) for request_id in group["ids"]]
+        if error is None:
+            await self.mongo_service.delete_many("failed_requests", {"_id": {"$in": ids}})
+            return True
+
+        logger.warning(f"Retry {group['retry_count'] + 1} failed for {code}: {error}")
+        await self.mongo_service.update_many(
+            "failed_requests",
+            {"_id": {"$in": ids}},
+            {"$inc": {"retry_count": 1},
+             "$set": {"last_attempt": datetime.utcnow(), "error_message": error}}
+        )
+        return False
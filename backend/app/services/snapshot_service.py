@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from app.services.mongodb_service import MongoDBService
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_COLLECTION = "latest_snapshot"
+
+# 快照保留的最新K线字段
+BAR_FIELDS = ("date", "open", "high", "low", "close", "preclose", "volume", "amount",
+              "turn", "pctChg", "peTTM", "pbMRQ", "isST", "tradestatus", "adjustflag")
+# 快照保留的最新技术指标字段
+INDICATOR_FIELDS = ("cci", "rsi", "macd_line", "macd_signal", "macd_histogram",
+                    "kdj_k", "kdj_d", "kdj_j", "bb_upper", "bb_middle", "bb_lower")
+
+VOLUME_MA_PERIOD = 20
+# 52周高低点按自然日回看；读取的K线条数覆盖一年的交易日
+LOOKBACK_DAYS = 365
+LOOKBACK_BARS = 260
+# 内存副本的有效期（秒），其他进程写入的快照最迟在该时间后可见
+CACHE_SECONDS = 300.0
+
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    if operator == "$regex":
+        return isinstance(value, str) and re.search(operand, value) is not None
+    if operator == "$in":
+        return value in operand
+    if value is None:
+        return False
+    if operator == "$gte":
+        return value >= operand
+    if operator == "$lte":
+        return value <= operand
+    if operator == "$gt":
+        return value > operand
+    if operator == "$lt":
+        return value < operand
+    raise ValueError(f"Unsupported operator {operator}")
+
+
+def snapshot_matches(snapshot: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    """在内存中判断快照是否满足筛选条件（字段相等、$gte/$lte/$gt/$lt、$in、$regex）"""
+    for field, condition in query.items():
+        value = snapshot.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for operator, operand in condition.items():
+            if operator == "$options":
+                continue
+            if operator == "$regex" and "i" in condition.get("$options", ""):
+                operand = re.compile(operand, re.IGNORECASE)
+            if not _compare(value, operator, operand):
+                return False
+    return True
+
+
+def _supported(query: Dict[str, Any]) -> bool:
+    operators = {"$gte", "$lte", "$gt", "$lt", "$in", "$regex", "$options"}
+    return all(not field.startswith("$") and (not isinstance(condition, dict) or set(condition) <= operators)
+               for field, condition in query.items())
+
+
+def build_snapshot(stock_code: str, bars: List[Dict[str, Any]], tech: Optional[Dict[str, Any]] = None,
+                   info: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """由最近的K线（按日期倒序）、最新技术指标和股票信息生成快照文档"""
+    if not bars:
+        return None
+
+    latest = bars[0]
+    snapshot: Dict[str, Any] = {"code": stock_code, "market": stock_code.split(".")[0]}
+    if info:
+        snapshot["code_name"] = info.get("code_name") or info.get("name")
+        snapshot["industry"] = info.get("industry")
+    for name in BAR_FIELDS:
+        snapshot[name] = latest.get(name)
+    # 兼容原筛选接口使用的字段名
+    snapshot["current_price"] = latest.get("close")
+
+    volumes = np.array([bar.get("volume") or 0 for bar in bars[:VOLUME_MA_PERIOD]], dtype=float)
+    snapshot["volume_ma20"] = float(volumes.mean()) if len(volumes) >= VOLUME_MA_PERIOD else None
+    snapshot["volume_ratio"] = (float(latest.get("volume") or 0) / snapshot["volume_ma20"]
+                                if snapshot["volume_ma20"] else None)
+
+    latest_date = latest.get("date")
+    if isinstance(latest_date, datetime):
+        since = latest_date - timedelta(days=LOOKBACK_DAYS)
+        year = [bar for bar in bars if isinstance(bar.get("date"), datetime) and bar["date"] > since]
+    else:
+        year = bars[:LOOKBACK_BARS]
+    highs = np.array([bar.get("high") or np.nan for bar in year], dtype=float)
+    lows = np.array([bar.get("low") or np.nan for bar in year], dtype=float)
+    snapshot["high_52w"] = float(np.nanmax(highs)) if np.isfinite(highs).any() else None
+    snapshot["low_52w"] = float(np.nanmin(lows)) if np.isfinite(lows).any() else None
+    close = latest.get("close")
+    snapshot["pct_from_high_52w"] = ((close / snapshot["high_52w"] - 1) * 100
+                                     if close and snapshot["high_52w"] else None)
+    snapshot["pct_from_low_52w"] = ((close / snapshot["low_52w"] - 1) * 100
+                                    if close and snapshot["low_52w"] else None)
+
+    tech = tech or {}
+    for name in INDICATOR_FIELDS:
+        value = tech.get(name)
+        snapshot[name] = None if value is None or (isinstance(value, float) and np.isnan(value)) else value
+    snapshot["indicator_date"] = tech.get("date")
+    snapshot["updated_at"] = datetime.utcnow()
+    return snapshot
+
+
+class SnapshotService:
+    """全市场最新截面快照
+
+    latest_snapshot 中每只股票一条文档，保存最新K线、主要技术指标以及20日均量、
+    52周高低点等衍生指标，日线数据入库并计算指标后随之更新。全市场的筛选只需
+    对该集合做一次带索引的查询；进程内另有一份内存副本，单只股票的查询和筛选
+    直接读取副本，不访问数据库。
+    """
+
+    # 进程内的快照副本（code -> 快照文档）及其加载时间
+    _cache: Dict[str, Dict[str, Any]] = {}
+    _cache_loaded_at: Optional[float] = None
+
+    def __init__(self, mongo_service: MongoDBService = None):
+        self.mongo_service = mongo_service or MongoDBService()
+        self.db = self.mongo_service.db
+
+    async def load_stock(self, stock_code: str, info: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """读取单只股票最近一年的K线和最新技术指标，生成快照（不写入）"""
+        bars_task = self.mongo_service.find(
+            self.mongo_service.get_collection_name(stock_code),
+            {"code": stock_code},
+            projection={"_id": 0, **{name: 1 for name in BAR_FIELDS}},
+            sort=[("date", -1)],
+            limit=LOOKBACK_BARS
+        )
+        tech_task = self.mongo_service.find_one(
+            self.mongo_service.get_technical_collection_name(stock_code),
+            {"code": stock_code},
+            sort=[("date", -1)]
+        )
+        info_task = self.mongo_service.find_one("stock_info", {"code": stock_code}) if info is None \
+            else asyncio.sleep(0, result=info)
+        bars, tech, info = await asyncio.gather(bars_task, tech_task, info_task)
+        # 52周高低点等按前复权价格计算
+        await self.mongo_service.adjust_bars(stock_code, bars)
+        return build_snapshot(stock_code, bars, tech, info)
+
+    async def save(self, snapshots: List[Dict[str, Any]]) -> int:
+        """批量 upsert 快照并同步内存副本"""
+        snapshots = [snapshot for snapshot in snapshots if snapshot]
+        if not snapshots:
+            return 0
+        operations = [UpdateOne({"code": s["code"]}, {"$set": s}, upsert=True) for s in snapshots]
+        if not await self.mongo_service.bulk_write(SNAPSHOT_COLLECTION, operations, ordered=False):
+            return 0
+        for snapshot in snapshots:
+            SnapshotService._cache[snapshot["code"]] = snapshot
+        return len(snapshots)
+
+    async def refresh_stock(self, stock_code: str) -> bool:
+        """日线数据更新后刷新单只股票的快照"""
+        try:
+            return await self.save([await self.load_stock(stock_code)]) > 0
+        except Exception as e:
+            logger.error(f"Error refreshing snapshot for {stock_code}: {str(e)}")
+            return False
+
+    async def refresh_all(self, stock_codes: Optional[Iterable[str]] = None,
+                          concurrency: int = 20, batch_size: int = 500) -> int:
+        """重建全部（或指定股票的）快照，返回写入数量"""
+        query = {"code": {"$in": list(stock_codes)}} if stock_codes is not None else {}
+        infos = await self.mongo_service.find("stock_info", query,
+                                              {"code": 1, "code_name": 1, "name": 1, "industry": 1})
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load(info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self.load_stock(info["code"], info)
+                except Exception as e:
+                    logger.error(f"Error building snapshot for {info['code']}: {str(e)}")
+                    return None
+
+        written = 0
+        for start in range(0, len(infos), batch_size):
+            batch = infos[start:start + batch_size]
+            written += await self.save(list(await asyncio.gather(*(load(info) for info in batch))))
+        logger.info(f"Latest snapshot refreshed for {written}/{len(infos)} stocks")
+        return written
+
+    async def load_cache(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """内存副本，首次使用或超过 CACHE_SECONDS 后从数据库重新读取"""
+        loaded_at = SnapshotService._cache_loaded_at
+        if force or loaded_at is None or time.monotonic() - loaded_at >= CACHE_SECONDS:
+            documents = await self.mongo_service.find(SNAPSHOT_COLLECTION, {}, {"_id": 0})
+            SnapshotService._cache = {doc["code"]: doc for doc in documents}
+            SnapshotService._cache_loaded_at = time.monotonic()
+        return SnapshotService._cache
+
+    async def get(self, stock_code: str) -> Optional[Dict[str, Any]]:
+        return (await self.load_cache()).get(stock_code)
+
+    async def filter(self, query: Dict[str, Any], sort: List[tuple] = None,
+                     limit: int = 0) -> List[Dict[str, Any]]:
+        """筛选快照：条件只包含比较、$in 和 $regex 时在内存副本上执行，否则查询数据库"""
+        sort = sort or [("code", ASCENDING)]
+        if not _supported(query):
+            return await self.mongo_service.find(SNAPSHOT_COLLECTION, query, {"_id": 0}, sort=sort, limit=limit)
+        snapshots = [doc for doc in (await self.load_cache()).values() if snapshot_matches(doc, query)]
+        # 与数据库排序一致：缺失值排在最前（升序）
+        for field, direction in reversed(sort):
+            snapshots.sort(key=lambda doc: (0, 0) if doc.get(field) is None else (1, doc[field]),
+                           reverse=direction == DESCENDING)
+        return snapshots[:limit] if limit else snapshots
@@ -0,0 +1,80 @@
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from app.services.market_daily import ts_code_to_code
+
+# TuShare stock_basic 中写入 stock_info 的字段
+TUSHARE_STOCK_FIELDS = ("ts_code", "symbol", "area", "industry", "fullname", "enname", "cnspell",
+                        "market", "exchange", "curr_type", "list_status", "list_date", "delist_date",
+                        "is_hs", "act_name", "act_ent_type")
+# 比较是否变化时忽略的时间戳字段
+TIMESTAMP_FIELDS = ("updateTime", "updated_at")
+
+
+def _records(frame: pd.DataFrame, **extra) -> List[Dict[str, Any]]:
+    names = list(frame.columns)
+    return [{**dict(zip(names, row)), **extra} for row in zip(*(frame[name].tolist() for name in names))]
+
+
+def tushare_stock_documents(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """TuShare stock_basic 结果按列转换为 stock_info 文档（不含北交所股票）"""
+    if df is None or df.empty:
+        return []
+    frame = pd.DataFrame({"code": ts_code_to_code(df["ts_code"])}, index=df.index)
+    # BaoStock 不提供北交所数据，北交所股票不写入
+    keep = ~frame["code"].str.startswith("bj.")
+    for name in TUSHARE_STOCK_FIELDS:
+        frame[name] = df[name] if name in df.columns else ""
+    frame["code_name"] = df["name"]
+    frame["name"] = df["name"]
+    return _records(frame.loc[keep], updateTime=datetime.utcnow())
+
+
+def company_documents(df: pd.DataFrame, company_df: Optional[pd.DataFrame]) -> List[Dict[str, Any]]:
+    """按 ts_code 关联 stock_company 结果，生成 stock_basic_info 文档
+
+    每只股票取第一条公司信息，只保留 stock_info 中会写入的股票。
+    """
+    if company_df is None or company_df.empty or df is None or df.empty:
+        return []
+    stocks = pd.DataFrame({"ts_code": df["ts_code"], "code": ts_code_to_code(df["ts_code"])})
+    stocks = stocks[~stocks["code"].str.startswith("bj.")].drop_duplicates("ts_code")
+    companies = company_df.drop_duplicates("ts_code").drop(columns=["code"], errors="ignore")
+    merged = companies.merge(stocks, on="ts_code", how="inner")
+    return _records(merged, updated_at=datetime.utcnow())
+
+
+def baostock_stock_documents(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """BaoStock query_all_stock 结果转换为 stock_info 文档"""
+    if df is None or df.empty:
+        return []
+    frame = pd.DataFrame({
+        "code": df["code"],
+        "code_name": df["code_name"],
+        "tradeStatus": df["tradeStatus"] if "tradeStatus" in df.columns else "",
+    })
+    return _records(frame, updateTime=datetime.utcnow())
+
+
+def _same(old: Any, new: Any) -> bool:
+    if isinstance(old, float) and isinstance(new, float) and math.isnan(old) and math.isnan(new):
+        return True
+    return old == new
+
+
+def changed_documents(documents: Iterable[Dict[str, Any]], existing: Iterable[Dict[str, Any]],
+                      key: str) -> List[Dict[str, Any]]:
+    """与库中已有文档比较，返回新增或任一字段发生变化的文档（忽略时间戳字段）"""
+    current = {doc.get(key): doc for doc in existing}
+    changed = []
+    for doc in documents:
+        old = current.get(doc[key])
+        if old is None or any(
+            name not in old or not _same(old[name], value)
+            for name, value in doc.items() if name not in TIMESTAMP_FIELDS
+        ):
+            changed.append(doc)
+    return changed
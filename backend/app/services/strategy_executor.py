@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from app.config.settings import settings
+from app.services.mongodb_service import MongoDBService
+from app.services.universe_loader import UniverseLoader
+from app.strategies.right_side_trading_strategy import RightSideTradingStrategy
+from app.strategies.strong_k_breakout_strategy import StrongKBreakoutStrategy
+from app.strategies.bottom_reversal_strategy import BottomReversalStrategy
+from app.utils.strategy_trace import build_tracer
+
+logger = logging.getLogger(__name__)
+
+# 策略类型 -> (策略类, 默认参数)
+STRATEGY_TYPES = {
+    "right_side": (RightSideTradingStrategy, {"max_position_pct": 0.02, "max_positions": 5}),
+    "strong_k": (StrongKBreakoutStrategy, {"max_position_pct": 0.03, "max_positions": 3}),
+    "bottom_reversal": (BottomReversalStrategy, {"max_position_pct": 0.03, "max_positions": 5}),
+}
+
+
+def build_strategy(strategy_type: str, strategy_params: Dict[str, Any], tracer=None):
+    """按策略类型和用户参数创建策略实例"""
+    strategy_class, defaults = STRATEGY_TYPES[strategy_type]
+    return strategy_class(
+        initial_capital=strategy_params.get("initial_capital", 100000),
+        max_position_pct=strategy_params.get("max_position_pct", defaults["max_position_pct"]),
+        max_positions=strategy_params.get("max_positions", defaults["max_positions"]),
+        tracer=tracer
+    )
+
+
+def signal_to_dict(strategy_type: str, signal) -> Dict[str, Any]:
+    """信号转换为接口返回的字典格式"""
+    timestamp = signal.timestamp.isoformat() if hasattr(signal.timestamp, 'isoformat') else str(signal.timestamp)
+    if strategy_type == "right_side":
+        return {
+            "symbol": signal.symbol,
+            "action": signal.action,
+            "price": signal.price,
+            "confidence": signal.confidence,
+            "timestamp": timestamp,
+            "reason": signal.reason
+        }
+
+    signal_dict = {
+        "symbol": signal.symbol,
+        "action": signal.action,
+        "price": signal.price,
+        "stop_loss": getattr(signal, 'stop_loss', None),
+        "target_price": getattr(signal, 'target_price', None),
+        "timestamp": timestamp,
+        "confidence": signal.confidence,
+    }
+    if strategy_type == "strong_k":
+        signal_dict["stage"] = getattr(signal, 'stage', None)
+    signal_dict["reason"] = signal.reason
+    return signal_dict
+
+
+def normalize_strategies(strategy_type: Optional[str] = None, parameters: Optional[Dict[str, Any]] = None,
+                         strategies: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """整理一次执行要运行的策略列表 [{name, strategy_type, parameters}]
+
+    strategies 为空时使用单个 strategy_type / parameters；同类型策略可以用不同参数出现多次，
+    name 缺省为策略类型，重复时追加序号。
+    """
+    if not strategies:
+        strategies = [{"strategy_type": strategy_type, "parameters": parameters or {}}]
+
+    normalized = []
+    names = set()
+    for spec in strategies:
+        spec_type = spec.get("strategy_type")
+        if spec_type not in STRATEGY_TYPES:
+            raise ValueError(f"Unknown strategy type: {spec_type}")
+        name = spec.get("name") or spec_type
+        suffix = 2
+        while name in names:
+            name = f"{spec.get('name') or spec_type}#{suffix}"
+            suffix += 1
+        names.add(name)
+        normalized.append({"name": name, "strategy_type": spec_type, "parameters": spec.get("parameters") or {}})
+    return normalized
+
+
+def run_strategy_on_frame(strategy_type: str, stock_code: str, df: pd.DataFrame,
+                          strategy_params: Dict[str, Any], tracer=None) -> Dict[str, Any]:
+    """对单只股票已加载的K线执行一个策略"""
+    try:
+        strategy = build_strategy(strategy_type, strategy_params, tracer)
+        signals = strategy.generate_signals(df, stock_code)
+        signals_dict = [signal_to_dict(strategy_type, signal) for signal in signals]
+
+        if signals_dict:
+            return {"stock_code": stock_code, "signals": signals_dict, "status": "success"}
+        return {"stock_code": stock_code, "signals": [], "status": "no_signals"}
+
+    except Exception as e:
+        logger.error(f"执行{strategy_type}策略时发生错误，股票: {stock_code}, 错误: {str(e)}", exc_info=True)
+        return {"stock_code": stock_code, "signals": [], "status": "error", "error": str(e)}
+
+
+def run_strategies_on_frame(strategies: List[Dict[str, Any]], stock_code: str, df: Optional[pd.DataFrame],
+                            trace_options: Any = None) -> Dict[str, Any]:
+    """对单只股票的K线依次执行多个策略（模块级函数，可在子进程中运行）
+
+    只有一个策略时结果格式与单策略执行相同；多个策略时信号带 strategy 字段，
+    各策略的状态放在 strategies 中，任一策略有信号即为 success。
+    trace_options 不为空时按 app.utils.strategy_trace.build_tracer 的规则开启决策追踪，
+    追踪记录放在结果的 trace 字段中。
+    """
+    if df is None or df.empty:
+        return {"stock_code": stock_code, "signals": [], "status": "no_data"}
+
+    tracers = []
+    results = []
+    for spec in strategies:
+        tracer = build_tracer(trace_options)
+        tracers.append(tracer)
+        results.append(run_strategy_on_frame(spec["strategy_type"], stock_code, df, spec["parameters"], tracer))
+
+    if len(strategies) == 1:
+        result = results[0]
+    else:
+        signals = [dict(signal, strategy=spec["name"])
+                   for spec, item in zip(strategies, results) for signal in item["signals"]]
+        statuses = [item["status"] for item in results]
+        if signals:
+            status = "success"
+        elif all(item == "error" for item in statuses):
+            status = "error"
+        else:
+            status = "no_signals"
+        result = {
+            "stock_code": stock_code,
+            "signals": signals,
+            "status": status,
+            "strategies": {
+                spec["name"]: {key: item[key] for key in ("status", "error") if key in item}
+                for spec, item in zip(strategies, results)
+            }
+        }
+
+    trace = []
+    dropped = 0
+    for spec, tracer in zip(strategies, tracers):
+        records = tracer.export()
+        if len(strategies) > 1:
+            for record in records:
+                record["strategy"] = spec["name"]
+        trace.extend(records)
+        dropped += tracer.dropped
+    if trace:
+        result["trace"] = trace
+        if dropped:
+            result["trace_dropped"] = dropped
+    return result
+
+
+class StrategyExecutor:
+    """全市场策略执行器
+
+    读取和计算流水线化：UniverseLoader 按批并发读取股票池的K线并转换为 DataFrame，
+    放入有界队列；计算协程从队列取数据提交到进程池，每只股票的数据只读取一次，
+    由本次执行的所有策略共用。队列容量限制了预取的内存占用，取消标志在每批读取前检查。
+    """
+
+    def __init__(self, mongo_service: MongoDBService = None,
+                 max_workers: Optional[int] = None,
+                 prefetch_size: Optional[int] = None,
+                 fetch_concurrency: Optional[int] = None):
+        self.mongo_service = mongo_service or MongoDBService()
+        self.max_workers = max_workers or settings.strategy_executor_workers or os.cpu_count() or 1
+        self.prefetch_size = prefetch_size or settings.strategy_prefetch_size
+        self.fetch_concurrency = fetch_concurrency or settings.strategy_fetch_concurrency
+
+    async def run(self, execution_id: str, strategies: List[Dict[str, Any]], stock_codes: List[str],
+                  days_range: int,
+                  is_cancelled: Callable[[], bool] = lambda: False,
+                  progress: Optional[Dict[str, Any]] = None,
+                  on_result: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None,
+                  trace_options: Any = None
+                  ) -> List[Dict[str, Any]]:
+        """执行策略，返回与 stock_codes 顺序一致的结果（取消时只包含已完成部分）
+
+        Args:
+            strategies: normalize_strategies 整理后的策略列表，共用同一份K线
+            is_cancelled: 返回 True 时停止读取新的股票
+            progress: 执行进度字典，运行中原地更新 fetched / processed 计数
+            on_result: 每只股票完成后回调 (stock_codes 中的下标, 结果)，用于持久化检查点
+            trace_options: 决策追踪选项，默认关闭
+        """
+        strategies = normalize_strategies(strategies=strategies)
+        strategy_names = ", ".join(spec["name"] for spec in strategies)
+
+        if progress is None:
+            progress = {}
+        progress.update({"total": len(stock_codes), "fetched": 0, "processed": 0})
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(stock_codes)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.prefetch_size)
+        loader = UniverseLoader(self.mongo_service, lookback=days_range, concurrency=self.fetch_concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def fetcher():
+            async for batch in loader.iter_batches(stock_codes, is_cancelled):
+                for index, stock_code, frame in batch:
+                    if isinstance(frame, Exception):
+                        results[index] = {"stock_code": stock_code, "signals": [], "status": "error",
+                                          "error": str(frame)}
+                        if on_result:
+                            await on_result(index, results[index])
+                        continue
+                    progress["fetched"] += 1
+                    await queue.put((index, stock_code, frame))
+
+        async def worker(pool: ProcessPoolExecutor):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, stock_code, frame = item
+                try:
+                    results[index] = await loop.run_in_executor(
+                        pool, run_strategies_on_frame, strategies, stock_code, frame, trace_options
+                    )
+                except Exception as e:
+                    logger.error(f"执行{strategy_names}策略时发生错误，股票: {stock_code}, 错误: {str(e)}, 执行ID: {execution_id}")
+                    results[index] = {"stock_code": stock_code, "signals": [], "status": "error", "error": str(e)}
+                progress["processed"] += 1
+                if on_result:
+                    await on_result(index, results[index])
+
+        logger.info(f"开始执行{strategy_names}策略，执行ID: {execution_id}，股票数量: {len(stock_codes)}, "
+                    f"执行范围: {days_range}天, 进程数: {self.max_workers}, 读取并发: {loader.concurrency}")
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            workers = [asyncio.create_task(worker(pool)) for _ in range(self.max_workers)]
+            try:
+                await fetcher()
+            finally:
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+
+        return [result for result in results if result is not None]
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+from app.config.settings import settings
+from app.services.mongodb_service import MongoDBService
+from app.services.strategy_executor import StrategyExecutor, normalize_strategies
+from app.utils.strategy_trace import build_tracer
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "strategy_jobs"
+RESULTS_COLLECTION = "strategy_job_results"
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+ERROR = "error"
+FINISHED_STATUSES = (COMPLETED, CANCELLED, ERROR)
+
+# 当前进程的标识，用于任务租约
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class StrategyJobService:
+    """策略执行任务（持久化在 MongoDB）
+
+    任务文档保存在 strategy_jobs，每只股票的结果作为检查点写入 strategy_job_results
+    （job_id + stock_code 唯一）。运行中的任务由持有者进程定期续租并读取取消标志，
+    进程退出后租约过期，其它进程或重启后的进程可以接管任务，只执行尚无结果的股票。
+    多个任务可以同时运行，取消按任务进行，多个 uvicorn 进程通过数据库共享状态。
+    """
+
+    # 当前进程中运行的任务（job_id -> asyncio.Task）及其运行状态（用于本进程内立即取消）
+    _running: Dict[str, asyncio.Task] = {}
+    _states: Dict[str, Dict[str, bool]] = {}
+
+    def __init__(self, mongo_service: MongoDBService = None):
+        self.mongo_service = mongo_service or MongoDBService()
+        self.db = self.mongo_service.db
+        self.lease_seconds = settings.strategy_job_lease_seconds
+        self.heartbeat_seconds = settings.strategy_job_heartbeat_seconds
+        self.flush_size = settings.strategy_job_flush_size
+
+    async def create_job(self, strategy_type: Optional[str], stock_codes: List[str], days_range: int,
+                         parameters: Dict[str, Any], trace: Any = None,
+                         strategies: Optional[List[Dict[str, Any]]] = None) -> str:
+        """创建任务并在当前进程启动，返回任务ID
+
+        strategies 不为空时在同一份K线上执行多个策略（[{strategy_type, parameters, name}]），
+        否则执行单个 strategy_type。trace 为决策追踪选项（见 app.utils.strategy_trace.build_tracer），默认关闭
+        """
+        strategies = normalize_strategies(strategy_type, parameters, strategies)
+        if len(strategies) == 1:
+            strategy_type, parameters = strategies[0]["strategy_type"], strategies[0]["parameters"]
+        else:
+            strategy_type = ",".join(spec["name"] for spec in strategies)
+            parameters = {}
+        # 提前校验追踪选项，格式错误时直接拒绝
+        build_tracer(trace)
+
+        if not stock_codes:
+            # 未指定股票时执行全部股票，股票列表在创建时固定下来，保证恢复后范围一致
+            stocks = await self.mongo_service.find('stock_info', {}, {'code': 1})
+            stock_codes = [stock['code'] for stock in stocks]
+
+        now = datetime.utcnow()
+        job_id = uuid.uuid4().hex
+        await self.db[JOBS_COLLECTION].insert_one({
+            "job_id": job_id,
+            "strategy_type": strategy_type,
+            "stock_codes": stock_codes,
+            "days_range": days_range,
+            "parameters": parameters,
+            "strategies": strategies,
+            "trace": trace or None,
+            "status": PENDING,
+            "cancel_requested": False,
+            "total": len(stock_codes),
+            "processed": 0,
+            "owner": None,
+            "lease_until": None,
+            "message": None,
+            "created_at": now,
+            "updated_at": now
+        })
+        logger.info(f"创建策略执行任务，任务ID: {job_id}，策略类型: {strategy_type}，股票数量: {len(stock_codes)}")
+
+        await self.start_job(job_id)
+        return job_id
+
+    async def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """原子地获取任务租约：待执行任务，或租约已过期的运行中任务"""
+        now = datetime.utcnow()
+        return await self.db[JOBS_COLLECTION].find_one_and_update(
+            {
+                "job_id": job_id,
+                "$or": [
+                    {"status": PENDING},
+                    {"status": RUNNING, "lease_until": {"$lt": now}},
+                    {"status": RUNNING, "owner": WORKER_ID}
+                ]
+            },
+            {"$set": {
+                "status": RUNNING,
+                "owner": WORKER_ID,
+                "lease_until": now + timedelta(seconds=self.lease_seconds),
+                "started_at": now,
+                "updated_at": now
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def start_job(self, job_id: str) -> bool:
+        """在当前进程中启动（或接管）任务，任务已被其它进程持有时返回 False"""
+        if job_id in self._running and not self._running[job_id].done():
+            return True
+
+        job = await self._claim(job_id)
+        if not job:
+            return False
+
+        task = asyncio.create_task(self._run_job(job))
+        self._running[job_id] = task
+        task.add_done_callback(lambda _: self._running.pop(job_id, None))
+        return True
+
+    async def resume_jobs(self) -> List[str]:
+        """启动时接管未完成的任务（待执行或租约已过期）"""
+        now = datetime.utcnow()
+        cursor = self.db[JOBS_COLLECTION].find(
+            {"$or": [
+                {"status": PENDING},
+                {"status": RUNNING, "lease_until": {"$lt": now}}
+            ]},
+            {"job_id": 1}
+        )
+        resumed = []
+        async for job in cursor:
+            if await self.start_job(job["job_id"]):
+                resumed.append(job["job_id"])
+        if resumed:
+            logger.info(f"恢复未完成的策略执行任务: {resumed}")
+        return resumed
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        stock_codes = job["stock_codes"]
+
+        # 跳过已有检查点的股票
+        done_codes = set(await self.db[RESULTS_COLLECTION].distinct("stock_code", {"job_id": job_id}))
+        pending = [(index, code) for index, code in enumerate(stock_codes) if code not in done_codes]
+        if done_codes:
+            logger.info(f"任务 {job_id} 从检查点恢复，已完成 {len(done_codes)} 只，剩余 {len(pending)} 只")
+        await self.db[JOBS_COLLECTION].update_one(
+            {"job_id": job_id}, {"$set": {"processed": len(done_codes)}}
+        )
+
+        state = {"cancelled": bool(job.get("cancel_requested"))}
+        self._states[job_id] = state
+        buffer: List[UpdateOne] = []
+        flush_lock = asyncio.Lock()
+
+        async def flush():
+            # 写入失败时检查点放回缓冲区（upsert 可以重复执行），由下次落盘重试
+            async with flush_lock:
+                if not buffer:
+                    return
+                operations = buffer[:]
+                buffer.clear()
+                try:
+                    await self.db[RESULTS_COLLECTION].bulk_write(operations, ordered=False)
+                except Exception:
+                    buffer[:0] = operations
+                    raise
+                try:
+                    await self.db[JOBS_COLLECTION].update_one(
+                        {"job_id": job_id},
+                        {"$inc": {"processed": len(operations)}, "$set": {"updated_at": datetime.utcnow()}}
+                    )
+                except Exception as e:
+                    logger.warning(f"任务 {job_id} 更新进度失败: {str(e)}")
+
+        async def on_result(position: int, result: Dict[str, Any]):
+            index = pending[position][0]
+            buffer.append(UpdateOne(
+                {"job_id": job_id, "stock_code": result["stock_code"]},
+                {"$set": {**result, "job_id": job_id, "index": index, "created_at": datetime.utcnow()}},
+                upsert=True
+            ))
+            if len(buffer) >= self.flush_size:
+                try:
+                    await flush()
+                except Exception as e:
+                    logger.error(f"任务 {job_id} 写入检查点失败，稍后重试: {str(e)}")
+
+        async def heartbeat():
+            # 续租、落盘检查点并读取取消标志；出错时记录日志，下次心跳继续续租
+            while True:
+                await asyncio.sleep(self.heartbeat_seconds)
+                try:
+                    await flush()
+                except Exception as e:
+                    logger.error(f"任务 {job_id} 写入检查点失败，稍后重试: {str(e)}")
+                try:
+                    doc = await self.db[JOBS_COLLECTION].find_one_and_update(
+                        {"job_id": job_id, "owner": WORKER_ID},
+                        {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+                        projection={"cancel_requested": 1},
+                        return_document=ReturnDocument.AFTER
+                    )
+                except Exception as e:
+                    logger.error(f"任务 {job_id} 续租失败: {str(e)}")
+                    continue
+                if doc is None:
+                    # 租约被其它进程接管
+                    logger.warning(f"任务 {job_id} 的租约已丢失，停止执行")
+                    state["cancelled"] = True
+                    return
+                if doc.get("cancel_requested"):
+                    state["cancelled"] = True
+
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            executor = StrategyExecutor(self.mongo_service)
+            # 旧任务文档没有 strategies 字段
+            strategies = job.get("strategies") or normalize_strategies(
+                job["strategy_type"], job.get("parameters") or {})
+            await executor.run(
+                job_id, strategies, [code for _, code in pending], job["days_range"],
+                is_cancelled=lambda: state["cancelled"],
+                on_result=on_result,
+                trace_options=job.get("trace")
+            )
+            # 检查点写入失败时任务以错误结束，不会标记为已完成
+            await flush()
+
+            status = CANCELLED if state["cancelled"] else COMPLETED
+            message = f"手动执行{job['strategy_type']}策略" + ("已取消" if status == CANCELLED else "完成")
+            await self._finish(job_id, status, message)
+            logger.info(f"策略执行任务结束: {message}, 任务ID: {job_id}, 总股票数: {len(stock_codes)}")
+
+        except asyncio.CancelledError:
+            # 进程关闭：保留运行状态并释放租约，由其它进程或重启后的进程接管
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"任务 {job_id} 写入检查点失败，接管后重新执行这些股票: {str(e)}")
+            await self.db[JOBS_COLLECTION].update_one(
+                {"job_id": job_id, "owner": WORKER_ID},
+                {"$set": {"lease_until": datetime.utcnow(), "owner": None}}
+            )
+            raise
+        except Exception as e:
+            logger.error(f"策略执行任务发生错误: {str(e)}, 任务ID: {job_id}", exc_info=True)
+            try:
+                await flush()
+            except Exception as flush_error:
+                logger.error(f"任务 {job_id} 写入检查点失败: {str(flush_error)}")
+            await self._finish(job_id, ERROR, f"策略执行过程中发生错误: {str(e)}")
+        finally:
+            heartbeat_task.cancel()
+            self._states.pop(job_id, None)
+
+    async def _finish(self, job_id: str, status: str, message: str):
+        now = datetime.utcnow()
+        await self.db[JOBS_COLLECTION].update_one(
+            {"job_id": job_id, "owner": WORKER_ID},
+            {"$set": {"status": status, "message": message, "completed_at": now,
+                      "lease_until": None, "updated_at": now}}
+        )
+
+    async def cancel_job(self, job_id: str) -> bool:
+        """请求取消任务，持有任务的进程在下次心跳时停止；未开始的任务直接标记为已取消"""
+        now = datetime.utcnow()
+        result = await self.db[JOBS_COLLECTION].update_one(
+            {"job_id": job_id, "status": {"$in": [PENDING, RUNNING]}},
+            {"$set": {"cancel_requested": True, "updated_at": now}}
+        )
+        if job_id in self._states:
+            self._states[job_id]["cancelled"] = True
+        await self.db[JOBS_COLLECTION].update_one(
+            {"job_id": job_id, "status": PENDING},
+            {"$set": {"status": CANCELLED, "message": "任务已取消", "completed_at": now}}
+        )
+        return result.modified_count > 0
+
+    async def cancel_all(self) -> int:
+        """取消所有未完成的任务"""
+        count = 0
+        async for job in self.db[JOBS_COLLECTION].find(
+                {"status": {"$in": [PENDING, RUNNING]}}, {"job_id": 1}):
+            if await self.cancel_job(job["job_id"]):
+                count += 1
+        return count
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db[JOBS_COLLECTION].find_one({"job_id": job_id}, {"_id": 0, "stock_codes": 0})
+
+    async def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        cursor = self.db[JOBS_COLLECTION].find({}, {"_id": 0, "stock_codes": 0}) \
+            .sort("created_at", DESCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_results(self, job_id: str, offset: int = 0, limit: int = 0,
+                          status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按股票顺序读取任务结果，任务运行中也可读取已完成的部分"""
+        query: Dict[str, Any] = {"job_id": job_id}
+        if status:
+            query["status"] = status
+        cursor = self.db[RESULTS_COLLECTION].find(
+            query, {"_id": 0, "job_id": 0, "index": 0, "created_at": 0, "trace": 0}
+        ).sort("index", ASCENDING).skip(offset)
+        if limit > 0:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def get_traces(self, job_id: str, stock_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """读取任务的决策追踪记录（按股票分组）"""
+        query: Dict[str, Any] = {"job_id": job_id, "trace": {"$exists": True}}
+        if stock_code:
+            query["stock_code"] = stock_code
+        cursor = self.db[RESULTS_COLLECTION].find(
+            query, {"_id": 0, "stock_code": 1, "status": 1, "trace": 1, "trace_dropped": 1}
+        ).sort("index", ASCENDING)
+        return await cursor.to_list(length=None)
+
+    @classmethod
+    async def shutdown(cls):
+        """进程关闭时停止本进程中的任务，检查点保留在数据库中"""
+        tasks = [task for task in cls._running.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,487 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+
+from app.config.settings import settings
+from app.services.condition_compiler import CompiledConditions, IndicatorPanel, compile_conditions
+from app.services.mongodb_service import MongoDBService
+from app.services.snapshot_service import INDICATOR_FIELDS, SnapshotService
+from app.utils.moving_average import price_ma_field, rolling_mean, volume_ma_field
+
+logger = logging.getLogger(__name__)
+
+
+def right_side_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """右侧交易策略参数（补全默认值）"""
+    params = params or {}
+    return {
+        'breakout_threshold': params.get('breakout_threshold', 0),   # 突破阈值
+        'volume_threshold': params.get('volume_threshold', 1.5),     # 成交量放大倍数
+        'cci_threshold': params.get('cci_threshold', -100),          # CCI阈值
+        'ma_periods': params.get('ma_periods', [5, 10, 20]),         # 均线周期
+        'days_range': params.get('days_range', 30),                  # 执行范围（天数）
+        'enable_price_breakout': params.get('enable_price_breakout', True),
+        'enable_volume_check': params.get('enable_volume_check', True),
+        'enable_cci_check': params.get('enable_cci_check', True),
+        'enable_ma_alignment': params.get('enable_ma_alignment', True),
+    }
+
+
+def right_side_window(params: Optional[Dict[str, Any]]) -> int:
+    """右侧交易策略需要读取的最近K线/技术指标条数"""
+    p = right_side_params(params)
+    return max(p['days_range'], 60, max(p['ma_periods']) + 10)
+
+
+def right_side_technical_fields(params: Optional[Dict[str, Any]]) -> List[str]:
+    """右侧交易策略读取的技术指标字段（CCI 和持久化的均线）"""
+    p = right_side_params(params)
+    return ['cci', volume_ma_field(10)] + [price_ma_field(period) for period in p['ma_periods']]
+
+
+def _date_key(value) -> str:
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def condition_hit(compiled: CompiledConditions, panel: IndicatorPanel, stock_index: int,
+                  row: int = -1) -> Dict[str, Any]:
+    """通用策略命中结果：各条件对应的日期和指标值，以及用作匹配日期的最新指标日期"""
+    row = row % panel.depth
+    latest = panel.dates[row, stock_index]
+    return {
+        'matched': True,
+        'matching_dates': compiled.describe(panel, row, stock_index),
+        'latest_date': None if np.isnat(latest) else _date_key(latest)
+    }
+
+
+def evaluate_condition_strategy(stock_code: str, strategy: Dict[str, Any],
+                                tech_data: List[Dict[str, Any]]) -> bool | Dict[str, Any]:
+    """通用条件策略：编译条件后在该股票最近的技术指标上评估
+
+    Args:
+        tech_data: 技术指标文档，按日期倒序
+    """
+    # If no conditions specified, return False rather than True
+    if not strategy.get('conditions'):
+        return False
+
+    compiled = compile_conditions(strategy['conditions'])
+    if len(tech_data) < compiled.depth:
+        return False
+
+    panel = IndicatorPanel.from_latest({stock_code: tech_data}, compiled.fields, compiled.depth)
+    if compiled.evaluate_latest(panel)[0]:
+        return condition_hit(compiled, panel, 0)
+
+    logger.debug(f"Stock {stock_code} does not meet {strategy.get('name')} strategy conditions")
+    return False
+
+
+# 右侧交易策略用到的K线字段
+RIGHT_SIDE_BAR_FIELDS = ('date', 'close', 'high', 'volume')
+
+
+def _previous_max(values: np.ndarray, window: int) -> np.ndarray:
+    """每个位置之前 window 个值（不含当前）的最大值，不足时取已有部分，NaN 忽略"""
+    padded = np.where(np.isnan(values), -np.inf, values)
+    result = np.full(values.shape, -np.inf)
+    for lag in range(1, window + 1):
+        result[:, lag:] = np.maximum(result[:, lag:], padded[:, :-lag])
+    return np.where(np.isneginf(result), np.nan, result)
+
+
+def _stored_or_rolling(stored: np.ndarray, values: np.ndarray, period: int, needed: np.ndarray) -> np.ndarray:
+    """优先使用技术指标中持久化的均线，只有需要的位置缺失时才现算滚动均值"""
+    missing = np.isnan(stored)
+    if not (missing & needed).any():
+        return stored
+    return np.where(missing, rolling_mean(values, period), stored)
+
+
+def evaluate_right_side_batch(params: Optional[Dict[str, Any]],
+                              rows_by_code: Dict[str, List[Dict[str, Any]]]) -> Dict[str, bool | Dict[str, Any]]:
+    """批量评估右侧交易策略
+
+    每只股票最近的K线（按日期倒序，每条带同日技术指标 technical）按位置右对齐成
+    股票 × 窗口的矩阵，突破、放量、CCI上穿、均线多头排列四个条件在整个矩阵上
+    一次算出布尔掩码，只有最近 days_range 个交易日参与匹配。技术指标中已持久化的
+    均线（ma{period}、vol_ma10）直接使用，缺失时才由窗口内的K线现算。
+
+    Returns:
+        股票代码 -> False 或 {'matched', 'matching_dates', 'latest_match'}
+    """
+    p = right_side_params(params)
+    ma_periods = p['ma_periods']
+    days_range = p['days_range']
+    min_bars = max(ma_periods) + 2
+
+    codes = []
+    for code, rows in rows_by_code.items():
+        if not rows or len(rows) < min_bars:
+            logger.warning(f"股票 {code} 数据不足，无法进行策略评估")
+            continue
+        codes.append(code)
+    outcomes: Dict[str, bool | Dict[str, Any]] = {code: False for code in rows_by_code}
+    if not codes:
+        return outcomes
+
+    width = max(len(rows_by_code[code]) for code in codes)
+    shape = (len(codes), width)
+    close, high, volume, cci, stored_volume_ma = (np.full(shape, np.nan) for _ in range(5))
+    stored_ma = {period: np.full(shape, np.nan) for period in ma_periods}
+    dates = np.full(shape, np.datetime64('NaT'), dtype='datetime64[ns]')
+    for n, code in enumerate(codes):
+        # 倒序转为升序并靠右对齐，最后一列是各自的最新交易日
+        for k, row in enumerate(rows_by_code[code]):
+            col = width - 1 - k
+            close[n, col] = row.get('close', np.nan)
+            high[n, col] = row.get('high', np.nan)
+            volume[n, col] = row.get('volume', np.nan)
+            dates[n, col] = pd.Timestamp(row['date']).to_datetime64()
+            tech = row.get('technical') or {}
+            value = tech.get('cci')
+            cci[n, col] = np.nan if value is None else value
+            value = tech.get(volume_ma_field(10))
+            stored_volume_ma[n, col] = np.nan if value is None else value
+            for period in ma_periods:
+                value = tech.get(price_ma_field(period))
+                stored_ma[period][n, col] = np.nan if value is None else value
+
+    lengths = np.array([len(rows_by_code[code]) for code in codes])
+    columns = np.arange(width)
+    first = (width - lengths)[:, None]
+    # 参与匹配的位置：每只股票除第一条以外、最近 days_range + 1 个交易日
+    candidate = (columns >= first + 1) & (columns >= width - days_range - 1)
+
+    previous_cci = np.full(shape, np.nan)
+    previous_cci[:, 1:] = cci[:, :-1]
+    mask = candidate & ~np.isnan(cci) & ~np.isnan(previous_cci)
+
+    with np.errstate(invalid='ignore'):
+        # 条件1: 价格突破（收盘价突破前5日最高价或指定阈值）
+        if p['enable_price_breakout']:
+            if p['breakout_threshold'] == 0:
+                mask &= close > _previous_max(high, 5)
+            else:
+                mask &= close > p['breakout_threshold']
+
+        # 条件2: 成交量放大（10日均量缺失时使用最近一个有效均量）
+        if p['enable_volume_check']:
+            avg_volume = _stored_or_rolling(stored_volume_ma, volume, 10, candidate)
+            last_valid = np.array([row[~np.isnan(row)][-1] if (~np.isnan(row)).any() else np.nan
+                                   for row in avg_volume])
+            avg_volume = np.where(np.isnan(avg_volume), last_valid[:, None], avg_volume)
+            mask &= volume > avg_volume * p['volume_threshold']
+
+        # 条件3: CCI从阈值以下向上突破
+        if p['enable_cci_check']:
+            mask &= (previous_cci <= p['cci_threshold']) & (cci > p['cci_threshold'])
+
+        # 条件4: 均线多头排列（有效均线按周期顺序依次不减）
+        if p['enable_ma_alignment'] and len(ma_periods) >= 2:
+            aligned = np.ones(shape, dtype=bool)
+            previous_ma = np.full(shape, np.nan)
+            for period in ma_periods:
+                ma = _stored_or_rolling(stored_ma[period], close, period, candidate)
+                valid = ~np.isnan(ma)
+                aligned &= ~(valid & ~np.isnan(previous_ma)) | (previous_ma >= ma)
+                previous_ma = np.where(valid, ma, previous_ma)
+            mask &= aligned
+
+    for n in np.flatnonzero(mask.any(axis=1)):
+        code = codes[n]
+        hits = np.flatnonzero(mask[n])[::-1]
+        matching_dates = [{
+            'date': _date_key(dates[n, col]),
+            'price': float(close[n, col]),
+            'cci': float(cci[n, col])
+        } for col in hits]
+        logger.info(f"Right side strategy for {code}: found {len(matching_dates)} matching dates: "
+                    f"{[md['date'] for md in matching_dates]}")
+        outcomes[code] = {
+            'matched': True,
+            'matching_dates': matching_dates,
+            'latest_match': matching_dates[0]
+        }
+    return outcomes
+
+
+class StrategyScreener:
+    """多策略单次扫描选股
+
+    每只股票只读取一次最近的K线和技术指标窗口（长度取所有激活策略所需的最大值，
+    K线与同日指标由一次聚合读出），在同一份数据上评估全部激活策略：右侧交易策略
+    按批在股票 × 窗口矩阵上向量化评估，通用条件策略编译为 NumPy 谓词，扫描结束后
+    在全部股票的最新指标面板上一次算出。命中记录先缓存，攒够 flush_size 条后按
+    (code, strategy_id, meet_date) 批量 upsert 到股票集合，重复评估不会产生重复记录。
+    读取次数与股票数量成正比，与策略数量无关；只用到最新一条快照中已有指标的通用条件
+    策略直接读取 latest_snapshot 的内存副本，不再逐只查询技术指标集合。
+    """
+
+    def __init__(self, mongo_service: MongoDBService = None, concurrency: int = 20,
+                 flush_size: Optional[int] = None, batch_size: int = 500):
+        self.mongo_service = mongo_service or MongoDBService()
+        self.concurrency = concurrency
+        self.flush_size = flush_size or settings.collection_flush_size
+        self.batch_size = batch_size
+        self.snapshot_service = SnapshotService(self.mongo_service)
+
+    @staticmethod
+    def evaluable(strategy: Dict[str, Any]) -> bool:
+        # 强K策略使用手动执行方式，暂不支持在评估接口中执行
+        return strategy.get('type') != 'strong_k'
+
+    @staticmethod
+    def compile(strategies: List[Dict[str, Any]]) -> Dict[int, CompiledConditions]:
+        """编译通用条件策略，返回 策略下标 -> 编译结果；条件无效的策略记录错误后跳过"""
+        compiled = {}
+        for k, strategy in enumerate(strategies):
+            if strategy.get('type') == 'right_side' or not strategy.get('conditions'):
+                continue
+            try:
+                compiled[k] = compile_conditions(strategy['conditions'])
+            except ValueError as e:
+                logger.error(f"Invalid conditions in strategy {strategy.get('name')}: {str(e)}")
+        return compiled
+
+    def windows(self, strategies: List[Dict[str, Any]],
+                compiled: Dict[int, CompiledConditions]) -> Tuple[int, int]:
+        """所有策略需要的K线条数和技术指标条数"""
+        history_limit = 0
+        tech_limit = max((c.depth for c in compiled.values()), default=0)
+        for strategy in strategies:
+            if strategy.get('type') == 'right_side':
+                window = right_side_window(strategy.get('parameters', {}))
+                history_limit = max(history_limit, window)
+                tech_limit = max(tech_limit, window)
+        return history_limit, tech_limit
+
+    async def load_window(self, stock_code: str, history_limit: int, tech_limit: int,
+                          technical_fields: List[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """读取单只股票最近的K线（带同日技术指标）和最近的技术指标，均按日期倒序
+
+        有右侧策略时K线和技术指标由一次聚合读出，技术指标列表直接取自其中；
+        只有通用条件策略时只读取技术指标；只需要最新一条、且字段都在快照中时取自快照副本。
+        """
+        if not history_limit and tech_limit == 1 and set(technical_fields) <= set(INDICATOR_FIELDS):
+            snapshot = await self.snapshot_service.get(stock_code)
+            if snapshot and snapshot.get('indicator_date') is not None:
+                return [], [{'date': snapshot['indicator_date'],
+                             **{field: snapshot.get(field) for field in technical_fields}}]
+        if history_limit:
+            rows = await self.mongo_service.get_stock_history_with_technical(
+                stock_code, limit=history_limit, fields=list(RIGHT_SIDE_BAR_FIELDS),
+                technical_fields=technical_fields
+            )
+            tech = [row['technical'] for row in rows if row.get('technical')]
+            if tech_limit <= history_limit:
+                return rows, tech[:tech_limit]
+        else:
+            rows = []
+        tech = await self.mongo_service.find(
+            self.mongo_service.get_technical_collection_name(stock_code),
+            {'code': stock_code},
+            projection={'_id': 0, 'date': 1, **{field: 1 for field in technical_fields}},
+            sort=[('date', -1)],
+            limit=tech_limit
+        ) if tech_limit else []
+        return rows, tech
+
+    @staticmethod
+    def build_hits(strategy: Dict[str, Any], stock_code: str, stock_name: str,
+                   outcome: bool | Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """把一次命中转换为接口结果和待写入 stock_collections 的记录"""
+        base_item = {
+            'code': stock_code,
+            'name': stock_name,
+            'strategy_id': str(strategy['_id']),
+            'strategy_name': strategy['name'],
+            'operation': strategy['operation'],
+            'share_amount': 0
+        }
+        result = {
+            'stock_code': stock_code,
+            'stock_name': stock_name,
+            'strategy_name': strategy['name'],
+            'operation': strategy['operation']
+        }
+
+        if strategy.get('type') == 'right_side' and isinstance(outcome, dict):
+            # 右侧交易策略：每个匹配日期一条记录
+            matching_dates = outcome.get('matching_dates', [])
+            items = [{**base_item, 'price': match.get('price'), 'meet_date': match.get('date')}
+                     for match in matching_dates]
+            result['matching_dates'] = matching_dates
+        else:
+            # 通用策略使用最新技术指标的日期作为匹配日期，不需要特定价格
+            meet_date = outcome.get('latest_date') if isinstance(outcome, dict) else None
+            items = [{**base_item, 'price': 0,
+                      'meet_date': meet_date or datetime.utcnow().strftime('%Y-%m-%d')}]
+        return result, items
+
+    @staticmethod
+    def upsert_operation(item: Dict[str, Any], now: datetime) -> UpdateOne:
+        """命中记录按 (code, strategy_id, meet_date) upsert，已有记录保留加入时间和用户填写的股数"""
+        key = {'code': item['code'], 'strategy_id': item['strategy_id'], 'meet_date': item['meet_date']}
+        fields = {k: v for k, v in item.items() if k not in key and k != 'share_amount'}
+        return UpdateOne(
+            key,
+            {
+                '$set': {**fields, 'updated_at': now},
+                '$setOnInsert': {'share_amount': item.get('share_amount', 0),
+                                 'added_date': now, 'created_at': now}
+            },
+            upsert=True
+        )
+
+    async def save_hits(self, items: List[Dict[str, Any]]) -> int:
+        """批量 upsert 命中记录，返回写入的记录数"""
+        now = datetime.utcnow()
+        written = 0
+        for start in range(0, len(items), self.flush_size):
+            operations = [self.upsert_operation(item, now) for item in items[start:start + self.flush_size]]
+            if await self.mongo_service.bulk_write('stock_collections', operations, ordered=False):
+                written += len(operations)
+        return written
+
+    async def run(self, strategies: List[Dict[str, Any]], stocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """扫描全部股票，返回命中结果并写入 stock_collections"""
+        strategies = [s for s in strategies if self.evaluable(s)]
+        results_by_strategy: List[List[Dict[str, Any]]] = [[] for _ in strategies]
+        items_by_strategy: List[List[Dict[str, Any]]] = [[] for _ in strategies]
+        if not strategies:
+            return {'results': [], 'collection_items': []}
+
+        compiled = self.compile(strategies)
+        right_side = [k for k, strategy in enumerate(strategies) if strategy.get('type') == 'right_side']
+        generic_depth = max((c.depth for c in compiled.values()), default=0)
+        history_limit, tech_limit = self.windows(strategies, compiled)
+        technical_fields = list(dict.fromkeys(
+            [field for k in right_side for field in right_side_technical_fields(strategies[k].get('parameters'))]
+            + [f for c in compiled.values() for f in c.fields]
+        ))
+        # 通用条件策略用到的最新指标，按股票保存，扫描结束后组成截面面板
+        latest_tech: Dict[str, List[Dict[str, Any]]] = {}
+        stock_name_map = {stock['code']: stock.get('code_name', stock['code']) for stock in stocks}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        buffer: List[Dict[str, Any]] = []
+        written = 0
+
+        async def flush():
+            nonlocal written
+            items = buffer[:]
+            buffer.clear()
+            written += await self.save_hits(items)
+
+        def add_hit(k: int, stock_code: str, outcome: Dict[str, Any]):
+            result, items = self.build_hits(strategies[k], stock_code,
+                                            stock_name_map.get(stock_code, stock_code), outcome)
+            results_by_strategy[k].append(result)
+            items_by_strategy[k].extend(items)
+            buffer.extend(items)
+
+        async def load(stock_code: str):
+            async with semaphore:
+                try:
+                    return await self.load_window(stock_code, history_limit, tech_limit, technical_fields)
+                except Exception as e:
+                    logger.error(f"Error loading data for {stock_code}: {str(e)}")
+                    return None
+
+        stock_codes = [stock['code'] for stock in stocks]
+        # 按批读取，右侧交易策略在每批股票的矩阵上一次评估，内存占用与批大小成正比
+        for start in range(0, len(stock_codes), self.batch_size):
+            chunk = stock_codes[start:start + self.batch_size]
+            windows = await asyncio.gather(*(load(code) for code in chunk))
+            loaded = {code: window for code, window in zip(chunk, windows) if window is not None}
+
+            for k in right_side:
+                params = strategies[k].get('parameters', {})
+                window = right_side_window(params)
+                try:
+                    outcomes = evaluate_right_side_batch(
+                        params, {code: rows[:window] for code, (rows, _) in loaded.items()}
+                    )
+                except Exception as e:
+                    logger.error(f"Error evaluating strategy {strategies[k].get('name')}: {str(e)}")
+                    continue
+                for code in chunk:
+                    if outcomes.get(code):
+                        add_hit(k, code, outcomes[code])
+
+            if generic_depth:
+                for code, (_, tech) in loaded.items():
+                    latest_tech[code] = tech[:generic_depth]
+            if len(buffer) >= self.flush_size:
+                await flush()
+
+        if compiled:
+            # 通用条件策略：在全部股票的最新指标截面上一次评估
+            panel = IndicatorPanel.from_latest(latest_tech, technical_fields, generic_depth)
+            for k, conditions in compiled.items():
+                for n in np.flatnonzero(conditions.evaluate_latest(panel)):
+                    add_hit(k, panel.codes[n], condition_hit(conditions, panel, n))
+
+        if buffer:
+            await flush()
+
+        collection_items = [item for items in items_by_strategy for item in items]
+        logger.info(f"Screened {len(stocks)} stocks against {len(strategies)} strategies, "
+                    f"{written}/{len(collection_items)} collection items upserted")
+
+        return {
+            'results': [result for results in results_by_strategy for result in results],
+            'collection_items': collection_items
+        }
+
+    async def screen_history(self, strategy: Dict[str, Any], stock_codes: List[str],
+                             start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """在历史区间内逐日评估通用条件策略（不写入股票集合）
+
+        Returns:
+            按日期升序的 [{'date', 'stock_codes'}]，只包含有股票命中的日期
+        """
+        compiled = compile_conditions(strategy.get('conditions'))
+        if not compiled.conditions:
+            return []
+
+        # 区间开始前多读取 depth 条，保证区间第一天的上穿/days_ago 条件有前值
+        start = pd.Timestamp(start_date).to_pydatetime()
+        end = pd.Timestamp(end_date).to_pydatetime()
+        projection = {'_id': 0, 'date': 1, **{name: 1 for name in compiled.fields}}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def load(stock_code: str) -> List[Dict[str, Any]]:
+            collection_name = self.mongo_service.get_technical_collection_name(stock_code)
+            async with semaphore:
+                before = await self.mongo_service.find(
+                    collection_name, {'code': stock_code, 'date': {'$lt': start}},
+                    projection=projection, sort=[('date', -1)], limit=compiled.depth
+                )
+                within = await self.mongo_service.find(
+                    collection_name, {'code': stock_code, 'date': {'$gte': start, '$lte': end}},
+                    projection=projection, sort=[('date', 1)]
+                )
+            return before[::-1] + within
+
+        docs = await asyncio.gather(*(load(code) for code in stock_codes))
+        panel = IndicatorPanel.from_history(dict(zip(stock_codes, docs)), compiled.fields)
+        if panel.depth == 0:
+            return []
+
+        mask = compiled.evaluate(panel)
+        calendar = panel.calendar
+        in_range = calendar >= np.datetime64(start)
+        matches = []
+        for row in np.flatnonzero(in_range & mask.any(axis=1)):
+            matches.append({
+                'date': _date_key(calendar[row]),
+                'stock_codes': [panel.codes[n] for n in np.flatnonzero(mask[row])]
+            })
+        return matches
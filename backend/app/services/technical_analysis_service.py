@@ -6,7 +6,13 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from pymongo import UpdateOne
 
+from app.config.settings import settings
 from app.services.mongodb_service import MongoDBService
+from app.services.condition_compiler import compile_conditions
+from app.services.strategy_screener import (
+    evaluate_condition_strategy, evaluate_right_side_batch, right_side_technical_fields, right_side_window
+)
+from app.utils.moving_average import parse_periods, price_ma_field, rolling_mean, volume_ma_field
 
 logger = logging.getLogger(__name__)
 
@@ -486,13 +492,118 @@ class TechnicalAnalysisService:
             if operations:
                 await self.mongo_service.bulk_write(collection_name, operations)
                 logger.info(f"Calculated technical indicators for {stock_code}, updated {len(operations)} new records")
-                return len(operations)
-            return 0
+
+            # 增量维护持久化的价格/成交量均线（只计算本次数据覆盖的日期）
+            if not df_sorted.empty:
+                await self.update_moving_averages(stock_code, pd.Timestamp(df_sorted['date'].min()).to_pydatetime())
+
+            return len(operations)
             
         except Exception as e:
             logger.error(f"Error calculating technical indicators for {stock_code}: {str(e)}")
             raise  # 重新抛出异常以便调用者能够捕获并处理
-    
+
+    async def get_moving_average_periods(self) -> tuple:
+        """持久化的价格均线和成交量均线周期（configuration 中可修改，留空则不计算）"""
+        price_periods = await self.mongo_service.get_config_value(
+            "technical", "moving_average", "price_periods", settings.price_ma_periods
+        )
+        volume_periods = await self.mongo_service.get_config_value(
+            "technical", "moving_average", "volume_periods", settings.volume_ma_periods
+        )
+        return parse_periods(price_periods), parse_periods(volume_periods)
+
+    async def update_moving_averages(self, stock_code: str, start_date: Optional[datetime] = None) -> int:
+        """计算并保存 start_date 及之后各交易日的均线（ma{n} / vol_ma{n}）
+
+        只读取 start_date 之前最长周期减一条K线作为滚动窗口的前置数据，
+        每晚增量更新时计算量与新增K线数量成正比，不需要重算全部历史。
+        """
+        try:
+            price_periods, volume_periods = await self.get_moving_average_periods()
+            if not price_periods and not volume_periods:
+                return 0
+
+            lookback = max(price_periods + volume_periods) - 1
+            daily_collection = self.mongo_service.get_collection_name(stock_code)
+            projection = {'_id': 0, 'date': 1, 'close': 1, 'volume': 1, 'adjustflag': 1}
+            query = {'code': stock_code}
+            previous = []
+            if start_date:
+                query['date'] = {'$gte': start_date}
+                if lookback > 0:
+                    previous = await self.mongo_service.find(
+                        daily_collection, {'code': stock_code, 'date': {'$lt': start_date}},
+                        projection=projection, sort=[('date', -1)], limit=lookback
+                    )
+            bars = previous[::-1] + await self.mongo_service.find(
+                daily_collection, query, projection=projection, sort=[('date', 1)]
+            )
+            if len(bars) == len(previous):
+                return 0
+            await self.mongo_service.adjust_bars(stock_code, bars)
+
+            close = np.array([bar.get('close') if bar.get('close') is not None else np.nan for bar in bars], dtype=float)
+            volume = np.array([bar.get('volume') if bar.get('volume') is not None else np.nan for bar in bars], dtype=float)
+            columns = {price_ma_field(period): rolling_mean(close, period) for period in price_periods}
+            columns.update({volume_ma_field(period): rolling_mean(volume, period) for period in volume_periods})
+
+            operations = []
+            for i in range(len(previous), len(bars)):
+                values = {name: (None if np.isnan(column[i]) else float(column[i])) for name, column in columns.items()}
+                operations.append(UpdateOne(
+                    {'code': stock_code, 'date': bars[i]['date']},
+                    {'$set': values},
+                    upsert=True
+                ))
+
+            await self.mongo_service.bulk_write(
+                self.mongo_service.get_technical_collection_name(stock_code), operations, ordered=False
+            )
+            logger.info(f"Updated moving averages for {stock_code}: {len(operations)} records, "
+                        f"price periods {price_periods}, volume periods {volume_periods}")
+            return len(operations)
+
+        except Exception as e:
+            logger.error(f"Error updating moving averages for {stock_code}: {str(e)}")
+            return 0
+
+    async def rebase_price_indicators(self, stock_code: str) -> int:
+        """复权因子变化后，按新的前复权价格重算全部历史的价格类指标（MACD、布林带、ma{n}）
+
+        增量计算只写入新K线，除权日之前已保存的这些指标仍是旧的价格基准。CCI、RSI、KDJ
+        不随价格整体缩放变化，保持不变。返回更新的记录数。
+        """
+        bars = await self.mongo_service.get_stock_history(
+            stock_code=stock_code, limit=0, sort="asc", fields=['date', 'close']
+        )
+        if not bars:
+            return 0
+        df = pd.DataFrame(bars)
+        df['date'] = pd.to_datetime(df['date'])
+        macd_values = await self.calculate_macd(df)
+        bb_values = await self.calculate_bollinger_bands(df)
+        columns = {
+            'macd_line': macd_values['macd_line'],
+            'macd_signal': macd_values['signal_line'],
+            'macd_histogram': macd_values['macd_histogram'],
+            'bb_upper': bb_values['bb_upper'],
+            'bb_middle': bb_values['bb_middle'],
+            'bb_lower': bb_values['bb_lower'],
+        }
+
+        # 只更新已有的指标记录，不为缺少 CCI 的前几根K线创建不完整的记录
+        operations = []
+        for i, date in enumerate(df['date']):
+            values = {name: (None if pd.isna(column.iloc[i]) else float(column.iloc[i])) for name, column in columns.items()}
+            operations.append(UpdateOne({'code': stock_code, 'date': date.to_pydatetime()}, {'$set': values}))
+        await self.mongo_service.bulk_write(
+            self.mongo_service.get_technical_collection_name(stock_code), operations, ordered=False
+        )
+        await self.update_moving_averages(stock_code)
+        logger.info(f"Rebased price-level indicators for {stock_code}: {len(operations)} records")
+        return len(operations)
+
     async def count_documents(self, collection_name: str, query: Dict[str, Any]) -> int:
         """统计集合中的文档数量"""
         try:
@@ -936,74 +1047,16 @@ class TechnicalAnalysisService:
     async def evaluate_trading_strategy(self, stock_code: str, strategy: Dict[str, Any]) -> bool:
         """Evaluate if a stock meets trading strategy conditions"""
         try:
-            # Get latest technical data
+            # Get latest technical data (enough rows for days_ago / cross conditions)
+            depth = max(compile_conditions(strategy.get('conditions')).depth, 2)
             collection_name = self.mongo_service.get_technical_collection_name(stock_code)
             tech_data = await self.mongo_service.find(
                 collection_name,
                 {'code': stock_code},
                 sort=[('date', -1)],
-                limit=2
+                limit=depth
             )
-            
-            if len(tech_data) < 2:
-                return False
-            
-            current_data = tech_data[0]
-            previous_data = tech_data[1]
-            
-            # Check strategy conditions
-            conditions_met = True
-            matching_dates = []
-            
-            # Check if any conditions are specified
-            if not strategy.get('conditions'):
-                # If no conditions specified, return False rather than True
-                return False
-            
-            for condition in strategy.get('conditions', []):
-                indicator = condition.get('indicator')
-                operator = condition.get('operator')
-                value = condition.get('value')
-                days_ago = condition.get('days_ago', 0)
-                
-                if days_ago == 0:
-                    data_point = current_data
-                else:
-                    data_point = previous_data
-                
-                condition_met = False
-                if indicator == 'CCI':
-                    cci_value = data_point.get('cci', 0)
-                    if operator == '>' and cci_value > value:
-                        condition_met = True
-                    elif operator == '>=' and cci_value >= value:
-                        condition_met = True
-                    elif operator == '<' and cci_value < value:
-                        condition_met = True
-                    elif operator == '<=' and cci_value <= value:
-                        condition_met = True
-                    elif operator == '==' and cci_value == value:
-                        condition_met = True
-                    elif operator == '!=' and cci_value != value:
-                        condition_met = True
-                
-                if condition_met:
-                    matching_dates.append({
-                        'date': data_point.get('date'),
-                        'value': data_point.get(indicator.lower()) if indicator.lower() in data_point else None
-                    })
-                else:
-                    conditions_met = False
-            
-            # If all conditions are met, return detailed information
-            if conditions_met and matching_dates:
-                return {
-                    'matched': True,
-                    'matching_dates': matching_dates
-                }
-            else:
-                logger.info(f"Stock {stock_code} does not meet {trading_strategy} strategy conditions")
-                return False
+            return evaluate_condition_strategy(stock_code, strategy, tech_data)
             
         except Exception as e:
             logger.error(f"Error evaluating trading strategy for {stock_code}: {str(e)}")
@@ -1038,145 +1091,12 @@ class TechnicalAnalysisService:
             Dict: 如果满足条件，返回包含匹配日期的详细信息
         """
         try:
-            if params is None:
-                params = {}
-            
-            # 获取参数，默认值
-            breakout_threshold = params.get('breakout_threshold', 0)  # 突破阈值
-            volume_threshold = params.get('volume_threshold', 1.5)    # 成交量放大倍数
-            cci_threshold = params.get('cci_threshold', -100)         # CCI阈值
-            ma_periods = params.get('ma_periods', [5, 10, 20])        # 均线周期
-            days_range = params.get('days_range', 30)                 # 执行范围（天数）
-            
-            # 获取开关参数
-            enable_price_breakout = params.get('enable_price_breakout', True)
-            enable_volume_check = params.get('enable_volume_check', True)
-            enable_cci_check = params.get('enable_cci_check', True)
-            enable_ma_alignment = params.get('enable_ma_alignment', True)
-            
-            # 获取股票历史数据（包括价格、成交量等）
             # 增加数据量以确保有足够的数据进行准确计算
-            historical_data = await self.mongo_service.get_stock_history(
-                stock_code=stock_code,
-                limit=max(days_range, 60, max(ma_periods) + 10),  # 使用days_range参数
-                sort="desc"
+            # K线和同日技术指标一次聚合读出
+            rows = await self.mongo_service.get_stock_history_with_technical(
+                stock_code, limit=right_side_window(params), technical_fields=right_side_technical_fields(params)
             )
-            
-            if not historical_data or len(historical_data) < max(ma_periods) + 2:
-                logger.warning(f"股票 {stock_code} 数据不足，无法进行策略评估")
-                return False
-            
-            # 转换为DataFrame并按日期排序
-            df = pd.DataFrame(historical_data)
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.sort_values('date').reset_index(drop=True)
-            
-            # 计算均线
-            for period in ma_periods:
-                df[f'ma{period}'] = df['close'].rolling(window=period).mean()
-            
-            # 计算平均成交量（用于比较最近的成交量）
-            avg_volume = df['volume'].rolling(window=10).mean()
-            
-            # 获取技术指标数据
-            tech_collection = f"technical_{stock_code}"
-            tech_data_list = await self.mongo_service.find(
-                tech_collection,
-                {'code': stock_code},
-                sort=[('date', -1)],
-                limit=max(days_range, 60, max(ma_periods) + 10)  # 使用days_range参数
-            )
-            
-            # 创建技术指标字典，以日期为键
-            tech_data_dict = {item['date']: item for item in tech_data_list}
-            
-            # 检查最近N天内的每一天是否满足条件（N为days_range）
-            matching_dates = []
-            
-            # 获取股票名称
-            stock_name = ""
-            if historical_data and len(historical_data) > 0:
-                stock_name = historical_data[0].get('code_name', stock_code)
-            
-            # 从倒数第1天开始向前检查（确保包含最新的数据）
-            for i in range(len(df) - 1, max(-1, len(df) - days_range - 2), -1):
-                current = df.iloc[i]
-                previous = df.iloc[i-1] if i > 0 else None
-                
-                if previous is None:
-                    continue
-                
-                # 确保当前和前一个日期都有技术指标数据
-                current_date_str = current['date'].strftime('%Y-%m-%d')
-                previous_date_str = previous['date'].strftime('%Y-%m-%d')
-                
-                if current_date_str not in tech_data_dict or previous_date_str not in tech_data_dict:
-                    logger.debug(f"股票 {stock_code} 缺少 {current_date_str} 或 {previous_date_str} 的技术指标数据")
-                    continue  # 跳过没有完整技术指标数据的日期
-                
-                # 检查CCI值是否有效
-                current_cci = tech_data_dict[current_date_str].get('cci')
-                previous_cci = tech_data_dict[previous_date_str].get('cci')
-                
-                if current_cci is None or previous_cci is None or pd.isna(current_cci) or pd.isna(previous_cci):
-                    logger.debug(f"股票 {stock_code} 在 {current_date_str} 或 {previous_date_str} 的CCI数据无效")
-                    continue  # 跳过CCI数据无效的日期
-                
-                # 条件1: 价格突破（收盘价突破前高或均线）
-                price_breakout = True  # 默认为True，如果禁用检查则视为通过
-                if enable_price_breakout:
-                    if breakout_threshold == 0:
-                        # 突破前高（检查最近5天内的最高价）
-                        price_breakout = current['close'] > df['high'].iloc[max(0, i-5):i].max() if i >= 1 else False
-                    else:
-                        # 突破指定价格
-                        price_breakout = current['close'] > breakout_threshold
-                
-                # 条件2: 成交量放大
-                volume_amplified = True  # 默认为True，如果禁用检查则视为通过
-                if enable_volume_check:
-                    avg_vol = avg_volume.iloc[i] if not pd.isna(avg_volume.iloc[i]) else avg_volume.dropna().iloc[-1]
-                    volume_amplified = current['volume'] > (avg_vol * volume_threshold)
-                
-                # 条件3: CCI指标确认（从阈值以下向上突破）
-                cci_condition = True  # 默认为True，如果禁用检查则视为通过
-                if enable_cci_check:
-                    # CCI从阈值以下向上突破
-                    cci_condition = (previous_cci <= cci_threshold) and (current_cci > cci_threshold)
-                
-                # 条件4: 均线多头排列（可选）
-                ma_alignment = True  # 默认为True，如果禁用检查则视为通过
-                if enable_ma_alignment:
-                    if len(ma_periods) >= 2:
-                        # 短期均线 > 长期均线
-                        ma_values = [current[f'ma{period}'] for period in ma_periods if f'ma{period}' in current and not pd.isna(current[f'ma{period}'])]
-                        if len(ma_values) >= 2:
-                            # 检查是否为递减序列（从短期到长期）
-                            ma_alignment = all(ma_values[i] >= ma_values[i+1] for i in range(len(ma_values)-1))
-                    else:
-                        ma_alignment = True  # 如果均线周期少于2个，则视为通过检查
-                
-                # 综合判断
-                right_side_condition = price_breakout and volume_amplified and cci_condition and ma_alignment
-                
-                if right_side_condition:
-                    matching_dates.append({
-                        'date': current['date'].strftime('%Y-%m-%d'),
-                        'price': float(current['close']),
-                        'cci': current_cci
-                    })
-            if matching_dates:
-                logger.info(f"Right side strategy for {stock_name} ({stock_code}): found {len(matching_dates)} matching dates: {[md['date'] for md in matching_dates]}")
-            
-            # 如果有匹配的日期，返回详细信息；否则返回False
-            if matching_dates:
-                return {
-                    'matched': True,
-                    'matching_dates': matching_dates,
-                    'latest_match': matching_dates[0] if matching_dates else None
-                }
-            else:
-                return False
+            return evaluate_right_side_batch(params, {stock_code: rows})[stock_code]
             
         except Exception as e:
             logger.error(f"Error evaluating right side trading strategy for {stock_code}: {str(e)}")
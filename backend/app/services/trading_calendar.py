@@ -0,0 +1,106 @@
+import bisect
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from app.services.mongodb_service import MongoDBService
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_COLLECTION = "trading_calendar"
+
+# query(start_date, end_date) -> (error_code, error_msg, fields, rows)
+TradeDatesQuery = Callable[[str, str], Awaitable[tuple]]
+
+
+class TradingCalendar:
+    """交易所交易日历
+
+    按自然年从上游（BaoStock query_trade_dates）读取，持久化到 trading_calendar 集合
+    （每个自然日一条，含 is_trading_day），之后优先从数据库读取，同一年在内存中只加载一次。
+    调度任务和日线导入据此跳过非交易日，并计算每只股票需要补齐的准确日期区间。
+    """
+
+    def __init__(self, query: TradeDatesQuery, mongo_service: MongoDBService = None):
+        self.query = query
+        self.mongo_service = mongo_service or MongoDBService()
+        self._years: Dict[int, List[str]] = {}
+
+    async def _load_year(self, year: int) -> List[str]:
+        """某一年的全部交易日（升序）"""
+        if year in self._years:
+            return self._years[year]
+
+        stored = await self.mongo_service.find(
+            CALENDAR_COLLECTION,
+            {"date": {"$gte": f"{year}-01-01", "$lte": f"{year}-12-31"}},
+            {"_id": 0, "date": 1, "is_trading_day": 1}
+        )
+        if stored:
+            days = sorted(doc["date"] for doc in stored if doc.get("is_trading_day"))
+            self._years[year] = days
+            return days
+        return await self.refresh(year)
+
+    async def refresh(self, year: int) -> List[str]:
+        """从上游重新读取一年的日历并写入数据库，返回该年的交易日"""
+        error_code, error_msg, fields, rows = await self.query(f"{year}-01-01", f"{year}-12-31")
+        if error_code != "0":
+            raise RuntimeError(f"Failed to query trade dates for {year}: {error_msg}")
+        date_index = fields.index("calendar_date")
+        flag_index = fields.index("is_trading_day")
+        days = sorted(row[date_index] for row in rows if row[flag_index] == "1")
+        if not days:
+            # 下一年的日历可能尚未发布，不保存，下次再查
+            logger.warning(f"No trading days published for {year} yet")
+            return []
+
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"date": row[date_index]},
+                {"$set": {"date": row[date_index], "is_trading_day": row[flag_index] == "1", "updated_at": now}},
+                upsert=True
+            )
+            for row in rows
+        ]
+        await self.mongo_service.bulk_write(CALENDAR_COLLECTION, operations, ordered=False)
+        self._years[year] = days
+        logger.info(f"Trading calendar for {year} refreshed: {len(days)} trading days")
+        return days
+
+    async def is_trading_day(self, date: Optional[str] = None) -> bool:
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        days = await self._load_year(int(date[:4]))
+        position = bisect.bisect_left(days, date)
+        return position < len(days) and days[position] == date
+
+    async def trading_days(self, start_date: str, end_date: str) -> List[str]:
+        """[start_date, end_date] 内的交易日（YYYY-MM-DD，升序）"""
+        days: List[str] = []
+        for year in range(int(start_date[:4]), int(end_date[:4]) + 1):
+            days.extend(day for day in await self._load_year(year) if start_date <= day <= end_date)
+        return days
+
+    async def last_trading_day(self, date: Optional[str] = None) -> Optional[str]:
+        """不晚于 date 的最近一个交易日（默认今天），向前最多查找一年"""
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        year = int(date[:4])
+        for current in (year, year - 1):
+            days = await self._load_year(current)
+            position = bisect.bisect_right(days, date)
+            if position:
+                return days[position - 1]
+        return None
+
+    async def next_trading_day(self, date: str) -> Optional[str]:
+        """晚于 date 的第一个交易日，向后最多查找一年"""
+        year = int(date[:4])
+        for current in (year, year + 1):
+            days = await self._load_year(current)
+            position = bisect.bisect_right(days, date)
+            if position < len(days):
+                return days[position]
+        return None
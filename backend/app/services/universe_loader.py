@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from app.config.settings import settings
+from app.services.mongodb_service import MongoDBService
+from app.utils.price_adjust import adjust_bars
+
+logger = logging.getLogger(__name__)
+
+# 转为 float64 的K线数值字段
+NUMERIC_FIELDS = ("open", "high", "low", "close", "preclose", "volume", "amount",
+                  "turn", "pctChg", "peTTM", "pbMRQ", "psTTM", "pcfNcfTTM")
+
+# 连接池中留给其它请求的比例，读取并发不超过连接池大小的一半
+POOL_SHARE = 0.5
+DEFAULT_POOL_SIZE = 100
+
+# 读取结果：成功时为 DataFrame（无数据时为 None），失败时为异常
+LoadedFrame = Union[pd.DataFrame, None, Exception]
+
+
+def bars_to_frame(bars: List[Dict[str, Any]]) -> Optional[pd.DataFrame]:
+    """K线文档列表转换为按日期升序的 DataFrame，数值字段统一为 float64"""
+    if not bars:
+        return None
+    df = pd.DataFrame(bars)
+    df['date'] = pd.to_datetime(df['date'])
+    for name in NUMERIC_FIELDS:
+        if name in df.columns:
+            df[name] = pd.to_numeric(df[name], errors='coerce').astype('float64')
+    return df.sort_values('date')
+
+
+def pool_size(mongo_service: MongoDBService) -> int:
+    """MongoDB 客户端的连接池大小"""
+    try:
+        return int(mongo_service.client.options.pool_options.max_pool_size)
+    except (AttributeError, TypeError, ValueError):
+        return DEFAULT_POOL_SIZE
+
+
+class UniverseLoader:
+    """股票池K线加载器
+
+    按股票池和回看长度分批并发读取各股票最近的K线，转换为可以直接交给策略的
+    DataFrame。并发数受连接池大小限制，避免全市场读取占满连接池；同一批数据可以
+    交给多个策略共用。
+    """
+
+    def __init__(self, mongo_service: MongoDBService = None, lookback: int = 30,
+                 batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.mongo_service = mongo_service or MongoDBService()
+        self.lookback = lookback
+        self.batch_size = batch_size or settings.strategy_load_batch_size
+        limit = max(1, int(pool_size(self.mongo_service) * POOL_SHARE))
+        self.concurrency = max(1, min(concurrency or settings.strategy_fetch_concurrency, limit))
+
+    async def load_bars(self, stock_code: str,
+                        factors: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """读取单只股票最近 lookback 条K线（按日期倒序，前复权价格）
+
+        factors 为预先批量读取的复权因子，未提供时单独读取
+        """
+        bars = await self.mongo_service.find(
+            self.mongo_service.get_collection_name(stock_code),
+            {'code': stock_code},
+            projection={'_id': 0},
+            sort=[('date', -1)],
+            limit=self.lookback
+        )
+        if factors is None:
+            return await self.mongo_service.adjust_bars(stock_code, bars)
+        return adjust_bars(bars, factors)
+
+    async def load_frame(self, stock_code: str,
+                         factors: Optional[List[Dict[str, Any]]] = None) -> Optional[pd.DataFrame]:
+        return bars_to_frame(await self.load_bars(stock_code, factors))
+
+    async def load_batch(self, stock_codes: List[str]) -> List[LoadedFrame]:
+        """并发读取一批股票，返回与输入顺序一致的结果，单只股票失败时返回异常对象"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # 整批股票的复权因子一次读取
+        factors = await self.mongo_service.get_adjust_factors(stock_codes)
+
+        async def load(stock_code: str) -> LoadedFrame:
+            async with semaphore:
+                try:
+                    return await self.load_frame(stock_code, factors[stock_code])
+                except Exception as e:
+                    logger.error(f"读取股票 {stock_code} 历史数据失败: {str(e)}")
+                    return e
+
+        return list(await asyncio.gather(*(load(code) for code in stock_codes)))
+
+    async def iter_batches(self, stock_codes: List[str],
+                           is_cancelled: Callable[[], bool] = lambda: False
+                           ) -> AsyncIterator[List[Tuple[int, str, LoadedFrame]]]:
+        """按批读取股票池，逐批产出 (下标, 股票代码, 结果)；取消标志在每批读取前检查"""
+        for start in range(0, len(stock_codes), self.batch_size):
+            if is_cancelled():
+                return
+            codes = stock_codes[start:start + self.batch_size]
+            frames = await self.load_batch(codes)
+            yield [(start + offset, code, frame) for offset, (code, frame) in enumerate(zip(codes, frames))]
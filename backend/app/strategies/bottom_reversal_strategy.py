@@ -5,6 +5,8 @@ from typing import List, Dict, Tuple
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+from app.utils.strategy_trace import TraceMixin
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -27,13 +29,14 @@ class Position:
     stop_loss: float
     take_profit: float
 
-class BottomReversalStrategy:
+class BottomReversalStrategy(TraceMixin):
     """底部反转策略 - 仅基于量价关系发现触底后缓慢反弹并在特定日期放量的股票"""
     
     def __init__(self, 
                  initial_capital: float = 100000,
                  max_position_pct: float = 0.03,
-                 max_positions: int = 5):
+                 max_positions: int = 5,
+                 tracer=None):
         """
         底部反转策略初始化
         
@@ -41,12 +44,14 @@ class BottomReversalStrategy:
             initial_capital: 初始资金
             max_position_pct: 单笔交易最大风险比例
             max_positions: 最大持仓数量
+            tracer: 决策追踪器（app.utils.strategy_trace），默认关闭
         """
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
         self.max_position_pct = max_position_pct
         self.max_positions = max_positions
         self.positions: Dict[str, Position] = {}
+        self._init_tracer(tracer)
         
     def identify_bottom_zone(self, df: pd.DataFrame, current_idx: int) -> bool:
         """识别底部区域 - 仅基于量价关系"""
@@ -70,12 +75,11 @@ class BottomReversalStrategy:
         # 当前成交量开始放大
         volume_recovery = current['volume'] > recent_30['volume'].mean() * 1.5     # 当前成交量超过平均1.5倍
         
-        # 记录详细日志
-        logger.debug(f"底部区域识别:")
-        logger.debug(f"  - 价格位置: {current['close']:.2f} (近期低位: {low_price_position})")
-        logger.debug(f"  - 60天最大跌幅: {recent_60['close'].max() / current['close']:.2%} (>15%: {price_decline_60d})")
-        logger.debug(f"  - 成交量萎缩: {recent_30['volume'].mean():.0f} < {recent_60['volume'].mean() * 0.7:.0f} ({volume_low})")
-        logger.debug(f"  - 成交量恢复: {current['volume']:.0f} > {recent_30['volume'].mean() * 1.5:.0f} ({volume_recovery})")
+        if self._tracing:
+            self._trace('bottom_zone', close=current['close'], low_price_position=low_price_position,
+                        decline_60d=recent_60['close'].max() / current['close'], price_decline_60d=price_decline_60d,
+                        volume_30d=recent_30['volume'].mean(), volume_60d=recent_60['volume'].mean(),
+                        volume_low=volume_low, volume=current['volume'], volume_recovery=volume_recovery)
         
         return (low_price_position and 
                 price_decline_60d and 
@@ -108,30 +112,32 @@ class BottomReversalStrategy:
         price_change_5d = (current['close'] / prev_5['close'].iloc[0]) - 1  # 5天累计涨幅
         significant_gain = price_change_5d > 0.05  # 5天累计上涨超过5%
         
-        # 记录详细日志
-        logger.debug(f"反转信号识别:")
-        logger.debug(f"  - 连续上涨天数: {consecutive_up_days} (>=3: {rising_trend})")
-        logger.debug(f"  - 成交量放大: {current['volume']:.0f} > {volume_ma_10 * 2.0:.0f} ({high_volume})")
-        logger.debug(f"  - 5天累计涨幅: {price_change_5d:.2%} (>5%: {significant_gain})")
+        if self._tracing:
+            self._trace('reversal', consecutive_up_days=consecutive_up_days, rising_trend=rising_trend,
+                        volume=current['volume'], volume_ma_10=volume_ma_10, high_volume=high_volume,
+                        price_change_5d=price_change_5d, significant_gain=significant_gain)
         
         return rising_trend and high_volume and significant_gain
     
     def check_entry_conditions(self, df: pd.DataFrame, current_idx: int) -> bool:
         """检查入场条件 - 仅基于量价关系"""
         if current_idx < 60:
-            logger.debug("检查入场条件 - 数据不足，索引小于60")
+            if self._tracing:
+                self._trace('entry', result=False, reason='insufficient_data')
             return False
             
         # 检查是否处于底部区域
         in_bottom_zone = self.identify_bottom_zone(df, current_idx)
         if not in_bottom_zone:
-            logger.debug("检查入场条件 - 不在底部区域")
+            if self._tracing:
+                self._trace('entry', result=False, reason='not_in_bottom_zone')
             return False
             
         # 检查是否有反转信号
         reversal_signal = self.identify_reversal_signal(df, current_idx)
         if not reversal_signal:
-            logger.debug("检查入场条件 - 无反转信号")
+            if self._tracing:
+                self._trace('entry', result=False, reason='no_reversal_signal')
             return False
             
         current = df.iloc[current_idx]
@@ -142,10 +148,10 @@ class BottomReversalStrategy:
         # 3. 成交量确认（放量）
         volume_confirm = current['volume'] > df.iloc[max(0, current_idx-20):current_idx]['volume'].mean() * 1.8
         
-        logger.debug(f"入场条件检查:")
-        logger.debug(f"  - 底部区域: {in_bottom_zone}")
-        logger.debug(f"  - 反转信号: {reversal_signal}")
-        logger.debug(f"  - 成交量确认: {volume_confirm}")
+        if self._tracing:
+            self._trace('entry', result=in_bottom_zone and reversal_signal and volume_confirm,
+                        in_bottom_zone=in_bottom_zone, reversal_signal=reversal_signal,
+                        volume_confirm=volume_confirm)
         
         return in_bottom_zone and reversal_signal and volume_confirm
     
@@ -157,14 +163,18 @@ class BottomReversalStrategy:
         # 1. 止损检查（8%止损）
         stop_loss_triggered = current['close'] <= position.stop_loss
         if stop_loss_triggered:
-            logger.debug(f"止损条件触发 - 当前价格: {current['close']:.2f}, 止损价: {position.stop_loss:.2f}")
+            if self._tracing:
+                self._trace('exit', result=True, reason='stop_loss', close=current['close'],
+                            stop_loss=position.stop_loss)
             return True, "止损"
         
         # 2. 回撤止损（从最高价回撤10%）
         highest_price_since_entry = df.iloc[position.entry_date:current_idx+1]['high'].max()
         drawdown_stop_triggered = current['close'] <= highest_price_since_entry * 0.9
         if drawdown_stop_triggered:
-            logger.debug(f"回撤止损条件触发 - 当前价格: {current['close']:.2f}, 回撤止损价: {highest_price_since_entry * 0.9:.2f}")
+            if self._tracing:
+                self._trace('exit', result=True, reason='drawdown_stop', close=current['close'],
+                            drawdown_stop=highest_price_since_entry * 0.9)
             return True, "回撤止损"
         
         # 3. 放量下跌出场
@@ -172,10 +182,13 @@ class BottomReversalStrategy:
         heavy_volume_down = (current['close'] < current['open'] and 
                            current['volume'] > volume_ma_10 * 2.0)
         if heavy_volume_down:
-            logger.debug(f"放量下跌出场 - 当前价格: {current['close']:.2f}, 开盘价: {current['open']:.2f}, 成交量: {current['volume']:.0f}")
+            if self._tracing:
+                self._trace('exit', result=True, reason='heavy_volume_down', close=current['close'],
+                            open=current['open'], volume=current['volume'], volume_ma_10=volume_ma_10)
             return True, "放量下跌"
         
-        logger.debug(f"出场条件检查 - 无条件满足，继续持仓")
+        if self._tracing:
+            self._trace('exit', result=False, close=current['close'])
         return False, ""
     
     def calculate_position_size(self, price: float, stop_loss: float, symbol: str = None) -> int:
@@ -184,16 +197,15 @@ class BottomReversalStrategy:
         max_risk_amount = self.current_capital * self.max_position_pct
         
         if risk_per_share == 0:
-            logger.debug("风险金额为0，无法计算仓位")
             return 0
         
         # 基础仓位计算
         position_size = int(max_risk_amount / risk_per_share)
-        logger.debug(f"基础仓位计算 - 最大风险金额: {max_risk_amount:.2f}, 每股风险: {risk_per_share:.2f}, 基础仓位: {position_size}")
+        base_size = position_size
         
         # 确保不超过可用资金
         max_affordable = int(self.current_capital * 0.95 / price)
-        logger.debug(f"最大可负担仓位: {max_affordable}")
+        risk_based_size = None
         
         # 考虑已有持仓的影响
         if symbol and len(self.positions) > 0:
@@ -210,31 +222,33 @@ class BottomReversalStrategy:
             # 计算基于可用风险的仓位
             risk_based_size = int(available_risk / risk_per_share)
             position_size = min(position_size, risk_based_size)
-            logger.debug(f"已有持仓影响 - 总风险: {total_risk:.2f}, 可用风险: {available_risk:.2f}, 风险调整后仓位: {risk_based_size}")
         
         # 确保最小交易单位
         min_size = max(1, int(100 / price))  # 至少交易100元
         position_size = max(min_size, position_size)
         
         final_position_size = min(position_size, max_affordable)
-        logger.debug(f"最终仓位大小: {final_position_size}")
+        if self._tracing:
+            self._trace('position_size', price=price, stop_loss=stop_loss, max_risk_amount=max_risk_amount,
+                        risk_per_share=risk_per_share, base_size=base_size, max_affordable=max_affordable,
+                        risk_based_size=risk_based_size, quantity=final_position_size)
         return final_position_size
     
     def generate_signals(self, data: pd.DataFrame, symbol: str) -> List[Signal]:
         """生成交易信号 - 仅基于量价关系"""
         logger.info(f"开始为股票 {symbol} 生成底部反转信号（仅基于量价关系）")
         signals = []
+        self._trace_begin(symbol)
         
         logger.debug(f"数据总长度: {len(data)}")
         for i in range(60, len(data)):
             current_time = data.index[i]
             current_price = data.iloc[i]['close']
-            logger.debug(f"\n检查数据点 {i} - 时间: {current_time}, 价格: {current_price:.2f}")
+            self._trace_bar(data, i)
             
             # 检查是否有持仓
             if symbol in self.positions:
                 position = self.positions[symbol]
-                logger.debug(f"持有仓位 - 数量: {position.quantity}, 入场价: {position.entry_price:.2f}")
                 should_exit, reason = self.check_exit_conditions(data, i, position)
                 
                 if should_exit:
@@ -251,15 +265,12 @@ class BottomReversalStrategy:
             else:
                 # 检查入场条件
                 if len(self.positions) < self.max_positions:
-                    logger.debug(f"检查入场条件 - 当前持仓数: {len(self.positions)}, 最大持仓数: {self.max_positions}")
                     if self.check_entry_conditions(data, i):
                         # 计算止损位（底部价格的8%止损）
                         stop_loss = current_price * 0.92
-                        logger.debug(f"满足入场条件 - 止损价设置为: {stop_loss:.2f}")
                         
                         # 计算仓位大小
                         quantity = self.calculate_position_size(current_price, stop_loss, symbol)
-                        logger.debug(f"计算仓位大小结果: {quantity}")
                         
                         if quantity > 0:
                             logger.info(f"生成买入信号 - 股票: {symbol}, 价格: {current_price:.2f}, 数量: {quantity}")
@@ -6,6 +6,8 @@ from typing import List, Dict, Tuple
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+from app.utils.strategy_trace import TraceMixin
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -26,11 +28,12 @@ class Position:
     stop_loss: float
     take_profit: float
 
-class RightSideTradingStrategy:
+class RightSideTradingStrategy(TraceMixin):
     def __init__(self, 
                  initial_capital: float = 100000,
                  max_position_pct: float = 0.02,
-                 max_positions: int = 5):
+                 max_positions: int = 5,
+                 tracer=None):
         """
         右侧交易策略实现
         
@@ -38,12 +41,14 @@ class RightSideTradingStrategy:
             initial_capital: 初始资金
             max_position_pct: 单笔交易最大风险比例
             max_positions: 最大持仓数量
+            tracer: 决策追踪器（app.utils.strategy_trace），默认关闭
         """
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
         self.max_position_pct = max_position_pct
         self.max_positions = max_positions
         self.positions: Dict[str, Position] = {}
+        self._init_tracer(tracer)
         
     def calculate_technical_indicators(self, data: pd.DataFrame) -> pd.DataFrame:
         """计算技术指标"""
@@ -73,14 +78,16 @@ class RightSideTradingStrategy:
     def check_entry_conditions(self, df: pd.DataFrame, current_idx: int) -> bool:
         """检查入场条件"""
         if current_idx < 200:  # 确保有足够的历史数据
-            logger.debug("检查入场条件 - 数据不足，索引小于200")
+            if self._tracing:
+                self._trace('entry', result=False, reason='insufficient_data')
             return False
             
         current = df.iloc[current_idx]
         
         # 1. 数据有效性检查
         if any(pd.isna(current[col]) for col in ['MA20', 'MA50', 'MA200', 'MACD_DIF', 'MACD_SIGNAL', 'ADX', 'RSI']):
-            logger.debug("检查入场条件 - 技术指标数据不完整")
+            if self._tracing:
+                self._trace('entry', result=False, reason='incomplete_indicators')
             return False
         
         # 2. 趋势确认：MA多头排列（更严格的检查）
@@ -124,15 +131,15 @@ class RightSideTradingStrategy:
         conditions = [ma_bullish, price_breakout, macd_bullish, strong_trend, volume_confirm, rsi_range, recent_volatility_check]
         satisfied_conditions = sum(conditions)
         
-        logger.debug(f"入场条件检查:")
-        logger.debug(f"  - MA多头排列: {ma_bullish} (MA20={current['MA20']:.2f}, MA50={current['MA50']:.2f}, MA200={current['MA200']:.2f})")
-        logger.debug(f"  - 价格突破MA20: {price_breakout} (价格={current['close']:.2f}, MA20={current['MA20']:.2f})")
-        logger.debug(f"  - MACD看涨: {macd_bullish} (DIF={current['MACD_DIF']:.4f}, SIGNAL={current['MACD_SIGNAL']:.4f})")
-        logger.debug(f"  - 趋势强度: {strong_trend} (ADX={current['ADX']:.2f})")
-        logger.debug(f"  - 成交量确认: {volume_confirm} (当前倍数={current['volume_ratio']:.2f}, 前一日={df.iloc[current_idx-1]['volume_ratio']:.2f})")
-        logger.debug(f"  - RSI区间: {rsi_range} (RSI={current['RSI']:.2f})")
-        logger.debug(f"  - 波动率检查: {recent_volatility_check}")
-        logger.debug(f"  - 满足条件数: {satisfied_conditions}/7 (要求≥5)")
+        if self._tracing:
+            self._trace('entry', result=satisfied_conditions >= 5, satisfied_conditions=satisfied_conditions,
+                        ma_bullish=ma_bullish, ma20=current['MA20'], ma50=current['MA50'], ma200=current['MA200'],
+                        price_breakout=price_breakout, close=current['close'],
+                        macd_bullish=macd_bullish, macd_dif=current['MACD_DIF'], macd_signal=current['MACD_SIGNAL'],
+                        strong_trend=strong_trend, adx=current['ADX'],
+                        volume_confirm=volume_confirm, volume_ratio=current['volume_ratio'],
+                        prev_volume_ratio=df.iloc[current_idx-1]['volume_ratio'],
+                        rsi_range=rsi_range, rsi=current['RSI'], volatility_check=recent_volatility_check)
         
         return satisfied_conditions >= 5
     
@@ -144,29 +151,37 @@ class RightSideTradingStrategy:
         # 1. 止损检查
         stop_loss_triggered = current['close'] <= position.stop_loss
         if stop_loss_triggered:
-            logger.debug(f"止损条件触发 - 当前价格: {current['close']:.2f}, 止损价: {position.stop_loss:.2f}")
+            if self._tracing:
+                self._trace('exit', result=True, reason='stop_loss', close=current['close'],
+                            stop_loss=position.stop_loss)
             return True, "止损"
         
         # 2. 移动止损
         move_stop_loss_triggered = current['close'] < position.entry_price * 0.9  # 回撤10%
         if move_stop_loss_triggered:
-            logger.debug(f"移动止损条件触发 - 当前价格: {current['close']:.2f}, 移动止损价: {position.entry_price * 0.9:.2f}")
+            if self._tracing:
+                self._trace('exit', result=True, reason='trailing_stop', close=current['close'],
+                            trailing_stop=position.entry_price * 0.9)
             return True, "移动止损"
         
         # 3. 技术指标出场
         # 跌破MA20
         ma_exit = current['close'] < current['MA20']
         if ma_exit:
-            logger.debug(f"跌破MA20出场 - 当前价格: {current['close']:.2f}, MA20: {current['MA20']:.2f}")
+            if self._tracing:
+                self._trace('exit', result=True, reason='below_ma20', close=current['close'], ma20=current['MA20'])
             return True, "跌破MA20"
         
         # MACD死叉
         macd_exit = current['MACD_DIF'] < current['MACD_SIGNAL']
         if macd_exit:
-            logger.debug(f"MACD死叉出场 - DIF: {current['MACD_DIF']:.4f}, SIGNAL: {current['MACD_SIGNAL']:.4f}")
+            if self._tracing:
+                self._trace('exit', result=True, reason='macd_dead_cross', macd_dif=current['MACD_DIF'],
+                            macd_signal=current['MACD_SIGNAL'])
             return True, "MACD死叉"
         
-        logger.debug(f"出场条件检查 - 无条件满足，继续持仓")
+        if self._tracing:
+            self._trace('exit', result=False, close=current['close'])
         return False, ""
     
     def calculate_position_size(self, price: float, stop_loss: float, symbol: str = None) -> int:
@@ -175,16 +190,15 @@ class RightSideTradingStrategy:
         max_risk_amount = self.current_capital * self.max_position_pct
         
         if risk_per_share == 0:
-            logger.debug("风险金额为0，无法计算仓位")
             return 0
         
         # 基础仓位计算
         position_size = int(max_risk_amount / risk_per_share)
-        logger.debug(f"基础仓位计算 - 最大风险金额: {max_risk_amount:.2f}, 每股风险: {risk_per_share:.2f}, 基础仓位: {position_size}")
+        base_size = position_size
         
         # 确保不超过可用资金
         max_affordable = int(self.current_capital * 0.95 / price)
-        logger.debug(f"最大可负担仓位: {max_affordable}")
+        risk_based_size = None
         
         # 考虑已有持仓的影响
         if symbol and len(self.positions) > 0:
@@ -201,14 +215,16 @@ class RightSideTradingStrategy:
             # 计算基于可用风险的仓位
             risk_based_size = int(available_risk / risk_per_share)
             position_size = min(position_size, risk_based_size)
-            logger.debug(f"已有持仓影响 - 总风险: {total_risk:.2f}, 可用风险: {available_risk:.2f}, 风险调整后仓位: {risk_based_size}")
         
         # 确保最小交易单位
         min_size = max(1, int(100 / price))  # 至少交易100元
         position_size = max(min_size, position_size)
         
         final_position_size = min(position_size, max_affordable)
-        logger.debug(f"最终仓位大小: {final_position_size}")
+        if self._tracing:
+            self._trace('position_size', price=price, stop_loss=stop_loss, max_risk_amount=max_risk_amount,
+                        risk_per_share=risk_per_share, base_size=base_size, max_affordable=max_affordable,
+                        risk_based_size=risk_based_size, quantity=final_position_size)
         return final_position_size
     
     def generate_signals(self, data: pd.DataFrame, symbol: str) -> List[Signal]:
@@ -216,17 +232,17 @@ class RightSideTradingStrategy:
         logger.info(f"开始为股票 {symbol} 生成右侧交易信号")
         df = self.calculate_technical_indicators(data)
         signals = []
+        self._trace_begin(symbol)
         
         logger.debug(f"数据总长度: {len(df)}")
         for i in range(200, len(df)):
             current_time = df.index[i]
             current_price = df.iloc[i]['close']
-            logger.debug(f"\n检查数据点 {i} - 时间: {current_time}, 价格: {current_price:.2f}")
+            self._trace_bar(df, i)
             
             # 检查是否有持仓
             if symbol in self.positions:
                 position = self.positions[symbol]
-                logger.debug(f"持有仓位 - 数量: {position.quantity}, 入场价: {position.entry_price:.2f}")
                 should_exit, reason = self.check_exit_conditions(df, i, position)
                 
                 if should_exit:
@@ -243,15 +259,12 @@ class RightSideTradingStrategy:
             else:
                 # 检查入场条件
                 if len(self.positions) < self.max_positions:
-                    logger.debug(f"检查入场条件 - 当前持仓数: {len(self.positions)}, 最大持仓数: {self.max_positions}")
                     if self.check_entry_conditions(df, i):
                         # 计算止损位
                         stop_loss = current_price * 0.92  # 8%止损
-                        logger.debug(f"满足入场条件 - 止损价设置为: {stop_loss:.2f}")
                         
                         # 计算仓位大小
                         quantity = self.calculate_position_size(current_price, stop_loss, symbol)
-                        logger.debug(f"计算仓位大小结果: {quantity}")
                         
                         if quantity > 0:
                             logger.info(f"生成买入信号 - 股票: {symbol}, 价格: {current_price:.2f}, 数量: {quantity}")
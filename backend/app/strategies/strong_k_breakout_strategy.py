@@ -6,6 +6,8 @@ from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+from app.utils.strategy_trace import TraceMixin
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,13 +34,14 @@ class StrongKSignal:
     stage: str  # 当前所处阶段
     reason: str
 
-class StrongKBreakoutStrategy:
+class StrongKBreakoutStrategy(TraceMixin):
     """强K突围模式策略实现"""
     
     def __init__(self, 
                  initial_capital: float = 100000,
                  max_position_pct: float = 0.03,
-                 max_positions: int = 3):
+                 max_positions: int = 3,
+                 tracer=None):
         """
         强K突围策略初始化
         
@@ -46,6 +49,7 @@ class StrongKBreakoutStrategy:
             initial_capital: 初始资金
             max_position_pct: 单笔交易最大风险比例
             max_positions: 最大持仓数量
+            tracer: 决策追踪器（app.utils.strategy_trace），默认关闭
         """
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
@@ -57,6 +61,7 @@ class StrongKBreakoutStrategy:
         self.market_stages: Dict[str, str] = {}  # 'bottom', 'accumulation', 'left_peak', 'volume_first', 'strong_k', 'rally'
         self.left_peaks: Dict[str, Dict] = {}  # 记录左峰信息
         self.volume_first_signals: Dict[str, Dict] = {}  # 记录量在价先信号
+        self._init_tracer(tracer)
         
     def calculate_technical_indicators(self, data: pd.DataFrame) -> pd.DataFrame:
         """计算技术指标"""
@@ -97,7 +102,7 @@ class StrongKBreakoutStrategy:
             # 避免除零错误
             df['shadow_ratio'] = np.where(df['body_size'] != 0, (df['upper_shadow'] + df['lower_shadow']) / df['body_size'], 0)
         except Exception as e:
-            print(f"Error calculating technical indicators: {str(e)}")
+            logger.error(f"Error calculating technical indicators: {str(e)}")
             raise e
         
         return df
@@ -105,7 +110,8 @@ class StrongKBreakoutStrategy:
     def identify_bottom_support(self, df: pd.DataFrame, current_idx: int) -> Optional[MarketSignal]:
         """识别底部资金承接信号"""
         if current_idx < 30:
-            print("底部资金承接信号检查 - 数据不足，索引小于30")
+            if self._tracing:
+                self._trace('bottom_support', result=False, reason='insufficient_data')
             return None
             
         current = df.iloc[current_idx]
@@ -118,21 +124,22 @@ class StrongKBreakoutStrategy:
         
         # 2. 恐慌性长阴识别（最近5日内）
         panic_long_shadow = False
-        panic_candle_details = []
+        panic_candle_details = [] if self._tracing else None
         for i in range(len(prev_5)):
             candle = prev_5.iloc[i]
             body_size_check = candle['body_size'] > 0.03  # 实体较大
             bearish_check = candle['close'] < candle['open']  # 阴线
             lower_shadow_check = candle['lower_shadow'] > candle['body_size'] * 0.3  # 稍微宽松的长下影要求
             
-            panic_candle_details.append({
-                'index': current_idx-5+i,
-                'body_size': candle['body_size'],
-                'body_size_check': body_size_check,
-                'bearish_check': bearish_check,
-                'lower_shadow_ratio': candle['lower_shadow'] / candle['body_size'] if candle['body_size'] > 0 else 0,
-                'lower_shadow_check': lower_shadow_check
-            })
+            if panic_candle_details is not None:
+                panic_candle_details.append({
+                    'index': current_idx-5+i,
+                    'body_size': candle['body_size'],
+                    'body_size_check': body_size_check,
+                    'bearish_check': bearish_check,
+                    'lower_shadow_ratio': candle['lower_shadow'] / candle['body_size'] if candle['body_size'] > 0 else 0,
+                    'lower_shadow_check': lower_shadow_check
+                })
             
             if body_size_check and bearish_check and lower_shadow_check:
                 panic_long_shadow = True
@@ -145,17 +152,14 @@ class StrongKBreakoutStrategy:
         oversold = current['RSI'] < 35  # 稍微宽松的超卖区域
         support_signal = bullish_candle and long_lower_shadow and high_volume and oversold
         
-        # 记录详细日志
-        print(f"底部资金承接信号检查:")
-        print(f"  - 价格下跌幅度: {price_decline:.2%} (要求≥15%: {price_decline_condition})")
-        print(f"  - 恐慌长阴详情:")
-        for detail in panic_candle_details:
-            print(f"    [{detail['index']}] 实体:{detail['body_size']:.4f}(>{0.03}:{detail['body_size_check']}) "
-                  f"阴线:{detail['bearish_check']} 下影比:{detail['lower_shadow_ratio']:.2f}(>0.3:{detail['lower_shadow_check']})")
-        print(f"  - 资金承接信号详情:")
-        print(f"    阳线: {bullish_candle}, 长下影: {long_lower_shadow}, 放量: {high_volume}({current['volume_ratio']:.2f}>1.0), "
-              f"超卖: {oversold}({current['RSI']:.1f}<35)")
-        print(f"  - 最终结果: {'符合' if (price_decline_condition and panic_long_shadow and support_signal) else '不符合'}")
+        if self._tracing:
+            self._trace('bottom_support',
+                        result=price_decline_condition and panic_long_shadow and support_signal,
+                        price_decline=price_decline, price_decline_condition=price_decline_condition,
+                        panic_candles=panic_candle_details, panic_long_shadow=panic_long_shadow,
+                        bullish_candle=bullish_candle, long_lower_shadow=long_lower_shadow,
+                        volume_ratio=current['volume_ratio'], high_volume=high_volume,
+                        rsi=current['RSI'], oversold=oversold)
         
         if price_decline_condition and panic_long_shadow and support_signal:
             return MarketSignal(
@@ -172,7 +176,8 @@ class StrongKBreakoutStrategy:
     def identify_accumulation_stage(self, df: pd.DataFrame, current_idx: int) -> bool:
         """识别主力吸筹阶段"""
         if current_idx < 20:
-            print("主力吸筹阶段检查 - 数据不足，索引小于20")
+            if self._tracing:
+                self._trace('accumulation', result=False, reason='insufficient_data')
             return False
             
         current = df.iloc[current_idx]
@@ -180,7 +185,7 @@ class StrongKBreakoutStrategy:
         
         # 小连阳拉升特征
         consecutive_rising_days = 0
-        rising_details = []
+        rising_details = [] if self._tracing else None
         for i in range(len(recent_10)):
             candle = recent_10.iloc[i]
             is_rising = candle['close'] > candle['open']
@@ -189,34 +194,32 @@ class StrongKBreakoutStrategy:
             else:
                 consecutive_rising_days = 0
                 
-            rising_details.append({
-                'index': current_idx-10+i,
-                'close': candle['close'],
-                'open': candle['open'],
-                'is_rising': is_rising,
-                'consecutive_count': consecutive_rising_days
-            })
+            if rising_details is not None:
+                rising_details.append({
+                    'index': current_idx-10+i,
+                    'close': candle['close'],
+                    'open': candle['open'],
+                    'is_rising': is_rising,
+                    'consecutive_count': consecutive_rising_days
+                })
         
         # 量能无大幅异动
         max_volume_ratio = recent_10['volume_ratio'].max()
         volume_stable = max_volume_ratio < 2.5  # 稍微宽松的量能要求
         
-        # 记录详细日志
-        print(f"主力吸筹阶段检查:")
-        print(f"  - 连续阳线详情:")
-        for detail in rising_details:
-            print(f"    [{detail['index']}] 收盘:{detail['close']:.2f} 开盘:{detail['open']:.2f} "
-                  f"上涨:{detail['is_rising']} 连续计数:{detail['consecutive_count']}")
-        print(f"  - 量能情况: 最大成交量倍数={max_volume_ratio:.2f} (要求<2.5: {volume_stable})")
-        print(f"  - 最终结果: {'符合' if (consecutive_rising_days >= 3 and volume_stable) else '不符合'} "  # 降低连续阳线要求
-              f"(连续阳线天数: {consecutive_rising_days}≥3)")
+        if self._tracing:
+            self._trace('accumulation',
+                        result=consecutive_rising_days >= 3 and volume_stable,
+                        rising=rising_details, consecutive_rising_days=consecutive_rising_days,
+                        max_volume_ratio=max_volume_ratio, volume_stable=volume_stable)
         
         return consecutive_rising_days >= 3 and volume_stable  # 降低连续阳线要求
     
     def identify_left_peak(self, df: pd.DataFrame, current_idx: int, symbol: str) -> Optional[MarketSignal]:
         """识别左峰形成"""
         if current_idx < 30:
-            print("左峰形成检查 - 数据不足，索引小于30")
+            if self._tracing:
+                self._trace('left_peak', result=False, reason='insufficient_data')
             return None
             
         current = df.iloc[current_idx]
@@ -232,17 +235,17 @@ class StrongKBreakoutStrategy:
         # 左峰后出现回调
         after_peak = df.iloc[peak_position+1:current_idx+1]
         if len(after_peak) < 3:  # 降低数据要求
-            print(f"左峰形成检查 - 峰后数据不足: {len(after_peak)} < 3")
+            if self._tracing:
+                self._trace('left_peak', result=False, reason='insufficient_after_peak', after_peak=len(after_peak))
             return None
             
         max_decline = (peak_data['high'] - after_peak['low'].min()) / peak_data['high']
         decline_condition = max_decline > 0.08  # 降低回调要求到8%
         
-        # 记录详细日志
-        print(f"左峰形成检查:")
-        print(f"  - 左峰信息: 价格={peak_data['high']:.2f}, 位置={peak_idx}")
-        print(f"  - 回调信息: 最低价格={after_peak['low'].min():.2f}, 回调幅度={max_decline:.2%} (要求>8%: {decline_condition})")
-        print(f"  - 最终结果: {'符合' if decline_condition else '不符合'}")
+        if self._tracing:
+            self._trace('left_peak', result=decline_condition,
+                        peak_price=peak_data['high'], peak_index=peak_idx,
+                        low_after_peak=after_peak['low'].min(), max_decline=max_decline)
         
         if decline_condition:
             left_peak_info = {
@@ -268,7 +271,9 @@ class StrongKBreakoutStrategy:
     def identify_volume_first_signal(self, df: pd.DataFrame, current_idx: int, symbol: str) -> Optional[MarketSignal]:
         """识别量在价先前置条件"""
         if symbol not in self.left_peaks or current_idx < 10:
-            print(f"量在价先检查 - 缺少左峰信息: {symbol in self.left_peaks}, 数据索引: {current_idx}")
+            if self._tracing:
+                self._trace('volume_first', result=False, reason='missing_left_peak',
+                            has_left_peak=symbol in self.left_peaks)
             return None
             
         current = df.iloc[current_idx]
@@ -284,14 +289,15 @@ class StrongKBreakoutStrategy:
         price_below_peak = current['close'] < left_peak['price']
         volume_above_peak = current['volume'] > left_peak['volume']
         
-        # 记录详细日志
-        print(f"量在价先检查:")
-        print(f"  - 成交量倍数: {current['volume_ratio']:.2f} (要求>1.5: {high_volume_condition})")
-        print(f"  - 阳线条件: 收盘={current['close']:.2f} > 开盘={current['open']:.2f} ({bullish_candle_condition})")
-        print(f"  - 实体大小: {current['body_size']:.2%} (要求>1.5%: {large_body_condition})")
-        print(f"  - 价格条件: 当前价格={current['close']:.2f} < 左峰价格={left_peak['price']:.2f} ({price_below_peak})")
-        print(f"  - 量能条件: 当前成交量={current['volume']:.0f} > 左峰成交量={left_peak['volume']:.0f} ({volume_above_peak})")
-        print(f"  - 最终结果: {'符合' if (volume_breakout and price_below_peak and volume_above_peak) else '不符合'}")
+        if self._tracing:
+            self._trace('volume_first',
+                        result=volume_breakout and price_below_peak and volume_above_peak,
+                        volume_ratio=current['volume_ratio'], high_volume=high_volume_condition,
+                        bullish_candle=bullish_candle_condition,
+                        body_size=current['body_size'], large_body=large_body_condition,
+                        close=current['close'], left_peak_price=left_peak['price'], price_below_peak=price_below_peak,
+                        volume=current['volume'], left_peak_volume=left_peak['volume'],
+                        volume_above_peak=volume_above_peak)
         
         if volume_breakout and price_below_peak and volume_above_peak:
             volume_first_info = {
@@ -319,7 +325,10 @@ class StrongKBreakoutStrategy:
         if (symbol not in self.left_peaks or 
             symbol not in self.volume_first_signals or 
             current_idx < 5):
-            print(f"强K信号检查 - 缺少必要条件: 左峰={symbol in self.left_peaks}, 量在价先={symbol in self.volume_first_signals}, 索引={current_idx}")
+            if self._tracing:
+                self._trace('strong_k', result=False, reason='missing_preconditions',
+                            has_left_peak=symbol in self.left_peaks,
+                            has_volume_first=symbol in self.volume_first_signals)
             return None
             
         current = df.iloc[current_idx]
@@ -341,14 +350,14 @@ class StrongKBreakoutStrategy:
         ma_support = current['close'] > current['MA20']
         macd_confirm = current['MACD_DIF'] > current['MACD_SIGNAL']
         
-        # 记录详细日志
-        print(f"强K信号检查:")
-        print(f"  - 成交量倍数: {volume_multiplier:.2f} (要求≥1.5: {strong_volume})")
-        print(f"  - 价格突破左峰: {price_breakout} (当前价格: {current['close']:.2f}, 左峰: {left_peak['price']:.2f})")
-        print(f"  - 突破试盘高点: {price_strong_breakout} (试盘高点: {test_high:.2f})")
-        print(f"  - 均线支撑: {ma_support} (收盘价: {current['close']:.2f} > MA20: {current['MA20']:.2f})")
-        print(f"  - MACD确认: {macd_confirm} (DIF: {current['MACD_DIF']:.4f} > SIGNAL: {current['MACD_SIGNAL']:.4f})")
-        print(f"  - 最终结果: {'符合' if (strong_volume and price_breakout and price_strong_breakout and ma_support) else '不符合'}")
+        if self._tracing:
+            self._trace('strong_k',
+                        result=strong_volume and price_breakout and price_strong_breakout and ma_support,
+                        volume_multiplier=volume_multiplier, strong_volume=strong_volume,
+                        close=current['close'], left_peak_price=left_peak['price'], price_breakout=price_breakout,
+                        test_high=test_high, price_strong_breakout=price_strong_breakout,
+                        ma20=current['MA20'], ma_support=ma_support,
+                        macd_dif=current['MACD_DIF'], macd_signal=current['MACD_SIGNAL'], macd_confirm=macd_confirm)
         
         # 不再要求MACD确认，降低要求
         if (strong_volume and price_breakout and price_strong_breakout and ma_support):
@@ -360,7 +369,9 @@ class StrongKBreakoutStrategy:
             k_amplitude = (current['close'] - current['open']) / current['open']
             target_price = current['close'] * (1 + k_amplitude * 3)  # 3倍强K幅度
             
-            print(f"生成强K信号 - 止损: {stop_loss:.2f}, 目标价: {target_price:.2f}, K线幅度: {k_amplitude:.2%}")
+            if self._tracing:
+                self._trace('strong_k_signal', stop_loss=stop_loss, target_price=target_price,
+                            k_amplitude=k_amplitude)
             
             return StrongKSignal(
                 symbol=symbol,
@@ -443,28 +454,24 @@ class StrongKBreakoutStrategy:
     def generate_signals(self, data: pd.DataFrame, symbol: str) -> List[StrongKSignal]:
         """生成交易信号"""
         try:
-            print(f"开始为股票 {symbol} 生成强K信号")
+            logger.debug(f"开始为股票 {symbol} 生成强K信号，数据长度: {len(data)}")
             
             # 限制数据长度以提高性能
             if len(data) > 100:
                 df = self.calculate_technical_indicators(data.tail(100))
-                print(f"使用最近100条数据进行分析")
             else:
                 df = self.calculate_technical_indicators(data)
-                print(f"使用全部 {len(data)} 条数据进行分析")
                 
             signals = []
+            self._trace_begin(symbol)
             
             # 初始化股票状态
             if symbol not in self.market_stages:
                 self.market_stages[symbol] = 'watching'
-                print(f"初始化股票 {symbol} 状态为 watching")
             
             # 检查所有数据点而不是只检查最近的
             # 从索引30开始（确保有足够的历史数据）
             start_idx = 30
-            end_idx = len(df) - 1
-            print(f"开始检查索引 {start_idx} 到 {end_idx} 的数据点")
             
             # 为每个股票重新初始化状态，以便检查多个信号点
             self.market_stages[symbol] = 'watching'
@@ -478,7 +485,7 @@ class StrongKBreakoutStrategy:
             for i in range(start_idx, len(df)):
                 current_time = df.index[i]
                 current_price = df.iloc[i]['close']
-                print(f"\n检查数据点 {i} - 时间: {current_time}, 价格: {current_price:.2f}")
+                self._trace_bar(df, i)
                 
                 # 更新市场阶段
                 self.update_market_stage(df, i, symbol)
@@ -486,16 +493,18 @@ class StrongKBreakoutStrategy:
                 # 检查是否有持仓
                 if symbol in self.positions:
                     position = self.positions[symbol]
-                    print(f"持有仓位 - 数量: {position['quantity']}, 入场价: {position['entry_price']:.2f}")
                     
                     # 更新最高价
                     if current_price > position.get('highest_price', position['entry_price']):
                         position['highest_price'] = current_price
-                        print(f"更新最高价至: {current_price:.2f}")
                     
                     # 检查出场条件
                     should_exit, reason = self.check_exit_conditions(df, i, position)
-                    print(f"出场条件检查 - 需要出场: {should_exit}, 原因: {reason}")
+                    if self._tracing:
+                        self._trace('exit', result=should_exit, reason=reason, close=current_price,
+                                    entry_price=position['entry_price'], stop_loss=position['stop_loss'],
+                                    target_price=position['target_price'],
+                                    highest_price=position.get('highest_price'))
                     
                     if should_exit:
                         signals.append(StrongKSignal(
@@ -509,7 +518,6 @@ class StrongKBreakoutStrategy:
                             stage=self.market_stages[symbol],
                             reason=reason
                         ))
-                        print(f"生成卖出信号 - 原因: {reason}")
                         
                         del self.positions[symbol]
                         self.market_stages[symbol] = 'watching'
@@ -521,7 +529,6 @@ class StrongKBreakoutStrategy:
                 else:
                     # 检查强K买入信号
                     if len(self.positions) < self.max_positions:
-                        print(f"检查强K买入信号 - 当前持仓数: {len(self.positions)}, 最大持仓数: {self.max_positions}")
                         strong_k_signal = self.identify_strong_k_signal(df, i, symbol)
                         
                         if strong_k_signal:
@@ -531,11 +538,12 @@ class StrongKBreakoutStrategy:
                                 strong_k_signal.stop_loss, 
                                 symbol
                             )
-                            print(f"计算仓位大小 - 数量: {quantity}")
+                            if self._tracing:
+                                self._trace('position_size', price=strong_k_signal.price,
+                                            stop_loss=strong_k_signal.stop_loss, quantity=quantity)
                             
                             if quantity > 0:
                                 signals.append(strong_k_signal)
-                                print(f"生成买入信号 - 价格: {strong_k_signal.price:.2f}, 止损: {strong_k_signal.stop_loss:.2f}")
                                 
                                 self.positions[symbol] = {
                                     'quantity': quantity,
@@ -547,28 +555,24 @@ class StrongKBreakoutStrategy:
                                 }
                                 
                                 self.market_stages[symbol] = 'rally'
-                                print(f"建立仓位并进入rally阶段")
                                 
                                 # 在生成买入信号后重置状态以寻找下一个机会
                                 # 注意：这里我们不重置状态，因为可能还有上涨空间
             
-            print(f"信号生成完成 - 股票: {symbol}, 生成信号数: {len(signals)}")
+            logger.debug(f"信号生成完成 - 股票: {symbol}, 生成信号数: {len(signals)}")
             return signals
         except Exception as e:
-            print(f"Error generating signals for {symbol}: {str(e)}")
+            logger.error(f"Error generating signals for {symbol}: {str(e)}")
             raise e
     
     def update_market_stage(self, df: pd.DataFrame, current_idx: int, symbol: str):
         """更新市场阶段"""
         current_stage = self.market_stages.get(symbol, 'watching')
-        print(f"更新市场阶段 - 股票: {symbol}, 当前阶段: {current_stage}")
         
         # 底部承接信号
-        print(f"检查底部承接信号 - 当前阶段: {current_stage}")
         bottom_signal = self.identify_bottom_support(df, current_idx)
         if bottom_signal and current_stage == 'watching':
-            self.market_stages[symbol] = 'bottom'
-            print(f"进入底部阶段 - 股票: {symbol}")
+            self._set_stage(symbol, current_stage, 'bottom')
             # 重置其他状态
             if symbol in self.left_peaks:
                 del self.left_peaks[symbol]
@@ -578,45 +582,42 @@ class StrongKBreakoutStrategy:
         
         # 吸筹阶段
         if current_stage == 'bottom':
-            print(f"检查吸筹阶段 - 当前阶段: {current_stage}")
             accumulation_condition = self.identify_accumulation_stage(df, current_idx)
             if accumulation_condition:
-                self.market_stages[symbol] = 'accumulation'
-                print(f"进入吸筹阶段 - 股票: {symbol}")
+                self._set_stage(symbol, current_stage, 'accumulation')
         
         # 左峰形成
-        print(f"检查左峰形成 - 当前阶段: {current_stage}")
         left_peak_signal = self.identify_left_peak(df, current_idx, symbol)
         if left_peak_signal and current_stage in ['accumulation', 'bottom']:
-            self.market_stages[symbol] = 'left_peak'
-            print(f"进入左峰阶段 - 股票: {symbol}")
+            self._set_stage(symbol, current_stage, 'left_peak')
         
         # 量在价先
-        print(f"检查量在价先 - 当前阶段: {current_stage}")
         volume_first_signal = self.identify_volume_first_signal(df, current_idx, symbol)
         if volume_first_signal and current_stage == 'left_peak':
-            self.market_stages[symbol] = 'volume_first'
-            print(f"进入量在价先阶段 - 股票: {symbol}")
+            self._set_stage(symbol, current_stage, 'volume_first')
         
         # 强K突破后进入拉升阶段
         if current_stage == 'volume_first':
-            print(f"检查强K信号 - 当前阶段: {current_stage}")
             strong_k = self.identify_strong_k_signal(df, current_idx, symbol)
             if strong_k:
-                self.market_stages[symbol] = 'strong_k'
-                print(f"进入强K阶段 - 股票: {symbol}")
+                self._set_stage(symbol, current_stage, 'strong_k')
         
         # 如果当前没有任何信号且不是在观察阶段，重置状态
         # 这样可以重新开始寻找机会
         if (not bottom_signal and not left_peak_signal and not volume_first_signal and 
             current_stage != 'watching' and current_stage != 'rally'):
-            print(f"重置状态为观察阶段 - 股票: {symbol}")
-            self.market_stages[symbol] = 'watching'
+            self._set_stage(symbol, current_stage, 'watching')
             if symbol in self.left_peaks:
                 del self.left_peaks[symbol]
             if symbol in self.volume_first_signals:
                 del self.volume_first_signals[symbol]
     
+    def _set_stage(self, symbol: str, previous: str, stage: str):
+        """切换市场阶段，追踪开启时记录阶段变化"""
+        self.market_stages[symbol] = stage
+        if self._tracing:
+            self._trace('stage', previous=previous, stage=stage)
+    
     def get_market_analysis(self, data: pd.DataFrame, symbol: str) -> Dict:
         """获取市场分析结果"""
         df = self.calculate_technical_indicators(data)
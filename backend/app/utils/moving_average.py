@@ -0,0 +1,36 @@
+"""均线工具：字段命名与滚动均值
+
+技术指标集合中持久化的均线字段统一命名为 ma{period}（收盘价均线）和
+vol_ma{period}（成交量均线），计算指标和选股两侧共用这里的命名。
+"""
+
+from typing import Iterable, List
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def price_ma_field(period: int) -> str:
+    return f"ma{period}"
+
+
+def volume_ma_field(period: int) -> str:
+    return f"vol_ma{period}"
+
+
+def parse_periods(value) -> List[int]:
+    """配置值（"5,10,20" 或整数列表）解析为去重后的升序周期列表"""
+    if value is None:
+        return []
+    items: Iterable = value.split(",") if isinstance(value, str) else value
+    periods = {int(str(item).strip()) for item in items if str(item).strip()}
+    return sorted(period for period in periods if period > 0)
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """沿最后一维计算滚动均值，窗口内有 NaN 或数据不足时为 NaN（与 pandas rolling 一致）"""
+    values = np.asarray(values, dtype=float)
+    result = np.full(values.shape, np.nan)
+    if window <= values.shape[-1]:
+        result[..., window - 1:] = sliding_window_view(values, window, axis=-1).mean(axis=-1)
+    return result
@@ -0,0 +1,106 @@
+"""复权计算
+
+日线以不复权价格（adjustflag "3"）保存，另存每只股票的复权因子（除权除息日及该日起
+生效的后复权因子）。读取时按K线日期查到生效的因子，价格字段乘以
+
+    前复权系数 = 当日后复权因子 / 最新后复权因子
+
+得到以最新价格为基准的前复权价格。发生除权除息时只需要更新因子，不需要重新抓取历史
+K线。旧数据（adjustflag "2"，抓取时已经前复权）保持原值，不会重新抓取，之后的K线从最后
+一个日期起以不复权价格续接。
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+RAW_FLAG = "3"
+PRICE_FIELDS = ("open", "high", "low", "close", "preclose")
+# 判断除权除息：昨收与上一根K线收盘价的相对差超过该值
+EX_RIGHTS_TOLERANCE = 0.005
+
+
+def forward_factors(bar_dates: np.ndarray, factor_dates: np.ndarray, back_factors: np.ndarray) -> np.ndarray:
+    """每根K线的前复权系数
+
+    Args:
+        bar_dates: K线日期（datetime64）
+        factor_dates: 除权除息日（datetime64，升序）
+        back_factors: 对应日期起生效的后复权因子
+    """
+    if len(factor_dates) == 0:
+        return np.ones(len(bar_dates))
+    index = np.searchsorted(factor_dates, bar_dates, side="right") - 1
+    # 第一次除权之前的后复权因子为 1
+    back = np.where(index >= 0, back_factors[np.clip(index, 0, None)], 1.0)
+    return back / back_factors[-1]
+
+
+def _factor_arrays(factors: Optional[Sequence[Dict[str, Any]]]):
+    if not factors:
+        return np.array([], dtype="datetime64[ns]"), np.array([], dtype=float)
+    ordered = sorted(factors, key=lambda doc: doc["date"])
+    dates = np.array([pd.Timestamp(doc["date"]).to_datetime64() for doc in ordered], dtype="datetime64[ns]")
+    back = np.array([float(doc["back_factor"]) for doc in ordered], dtype=float)
+    return dates, back
+
+
+def latest_back_factor(factors: Optional[Sequence[Dict[str, Any]]]) -> float:
+    """最新的后复权因子，即前复权价格的基准；没有除权记录时为 1"""
+    _, back = _factor_arrays(factors)
+    return float(back[-1]) if len(back) else 1.0
+
+
+def date_multipliers(dates: Sequence[Any], factors: Optional[Sequence[Dict[str, Any]]]) -> np.ndarray:
+    """各日期的前复权系数，用于同一天共用一个系数的数据（如分钟K线）"""
+    factor_dates, back = _factor_arrays(factors)
+    bar_dates = np.array([pd.Timestamp(date).to_datetime64() for date in dates], dtype="datetime64[ns]")
+    return forward_factors(bar_dates, factor_dates, back)
+
+
+def adjust_bars(bars: List[Dict[str, Any]], factors: Optional[Sequence[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """把不复权K线的价格字段原地换算为前复权价格，返回 bars"""
+    raw = [i for i, bar in enumerate(bars) if bar.get("adjustflag") == RAW_FLAG and bar.get("date") is not None]
+    if not raw or not factors:
+        return bars
+    factor_dates, back = _factor_arrays(factors)
+    bar_dates = np.array([pd.Timestamp(bars[i]["date"]).to_datetime64() for i in raw], dtype="datetime64[ns]")
+    multipliers = forward_factors(bar_dates, factor_dates, back)
+    for i, multiplier in zip(raw, multipliers):
+        if multiplier == 1.0:
+            continue
+        bar = bars[i]
+        for name in PRICE_FIELDS:
+            value = bar.get(name)
+            if isinstance(value, (int, float)):
+                bar[name] = value * multiplier
+    return bars
+
+
+def adjust_frame(df: pd.DataFrame, factors: Optional[Sequence[Dict[str, Any]]]) -> pd.DataFrame:
+    """DataFrame 版本：返回价格列为前复权数值的副本（原始字符串列会转换为数值）"""
+    if df is None or df.empty or not factors or "adjustflag" not in df.columns:
+        return df
+    raw = (df["adjustflag"] == RAW_FLAG).to_numpy()
+    if not raw.any():
+        return df
+    factor_dates, back = _factor_arrays(factors)
+    bar_dates = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]")
+    multipliers = np.where(raw, forward_factors(bar_dates, factor_dates, back), 1.0)
+    df = df.copy()
+    for name in PRICE_FIELDS:
+        if name in df.columns:
+            df[name] = pd.to_numeric(df[name], errors="coerce").to_numpy() * multipliers
+    return df
+
+
+def ex_rights_detected(df: pd.DataFrame, previous_close: Optional[float] = None) -> bool:
+    """新抓取的不复权K线中是否有除权除息日：昨收与上一根K线的收盘价不一致"""
+    if df is None or df.empty or "preclose" not in df.columns:
+        return False
+    preclose = pd.to_numeric(df["preclose"], errors="coerce").to_numpy(dtype=float)
+    close = pd.to_numeric(df["close"], errors="coerce").to_numpy(dtype=float)
+    before = np.concatenate(([np.nan if previous_close is None else previous_close], close[:-1]))
+    valid = np.isfinite(preclose) & np.isfinite(before) & (before > 0)
+    return bool((np.abs(preclose[valid] - before[valid]) > EX_RIGHTS_TOLERANCE * before[valid]).any())
@@ -0,0 +1,169 @@
+"""上游接口限流与熔断
+
+BaoStock、TuShare 等数据源各使用一个 UpstreamGuard：令牌桶把请求速率限制在配置的
+QPS 以内，熔断器在连续失败达到阈值后打开，一段时间内不再请求上游；冷却结束后进入
+半开状态，只放行一个探测请求，成功则恢复，失败则重新打开。
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 半开状态下等待探测结果的轮询间隔（秒）
+PROBE_POLL_SECONDS = 0.5
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求未发送到上游"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个；rate <= 0 表示不限速"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """取得令牌，不足时等待；等待者按先后顺序获得令牌"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后打开，reset_timeout 秒后半开探测"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> float:
+        """是否可以发送请求：返回 0 表示可以，否则为建议等待的秒数"""
+        if self.state == CLOSED:
+            return 0.0
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = HALF_OPEN
+            logger.info(f"{self.name} circuit half-open, probing upstream")
+        if self._probing:
+            return PROBE_POLL_SECONDS
+        self._probing = True
+        return 0.0
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"{self.name} circuit closed")
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        if self.state == HALF_OPEN:
+            self._open()
+            return
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def release(self):
+        """请求未完成（如被取消）时释放探测名额"""
+        self._probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures, "
+                       f"pausing requests for {self.reset_timeout}s")
+
+
+class UpstreamGuard:
+    """单个数据源的限流 + 熔断
+
+    Args:
+        name: 数据源名称，用于日志
+        qps: 每秒请求数上限，<= 0 不限速
+        burst: 允许的突发请求数，默认等于 qps
+        failure_threshold: 连续失败多少次后熔断
+        reset_timeout: 熔断后多少秒开始半开探测
+    """
+
+    def __init__(self, name: str, qps: float, burst: Optional[float] = None,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.bucket = TokenBucket(qps, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+
+    async def call(self, func: Callable[..., Any], *args, executor=None,
+                   is_failure: Optional[Callable[[Any], bool]] = None, wait: bool = True, **kwargs) -> Any:
+        """在线程池中调用阻塞的上游接口
+
+        func 抛出异常或 is_failure(结果) 为真时记为失败。熔断器打开时，wait 为真则等待
+        到可以探测为止，否则立即抛出 CircuitOpenError。
+        """
+        while True:
+            delay = self.breaker.allow()
+            if delay <= 0:
+                break
+            if not wait:
+                raise CircuitOpenError(self.name, delay)
+            await asyncio.sleep(delay)
+
+        try:
+            await self.bucket.acquire()
+            result = await asyncio.get_running_loop().run_in_executor(
+                executor, functools.partial(func, *args, **kwargs))
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        if is_failure is not None and is_failure(result):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return result
+
+    def status(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "qps": self.bucket.rate,
+        }
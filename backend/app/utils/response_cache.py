@@ -0,0 +1,81 @@
+"""上游响应的本地磁盘缓存
+
+按 (接口名, 参数, 日期) 缓存上游返回，文件超过 TTL 后视为过期。用于股票列表、公司信息、
+交易日历这类一天内不会变化、但每次请求代价较高或占用配额的接口。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """磁盘缓存，每个响应一个 JSON 文件：<root>/<api>/<date>-<hash>.json
+
+    Args:
+        root: 缓存目录，不存在时自动创建
+        ttl_seconds: 默认有效期，<= 0 表示不使用缓存
+    """
+
+    def __init__(self, root: str, ttl_seconds: float):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+
+    def path(self, api: str, params: Optional[Dict[str, Any]] = None, date: Optional[str] = None) -> str:
+        digest = hashlib.sha1(
+            json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+        return os.path.join(self.root, api, f"{date or 'any'}-{digest}.json")
+
+    def get(self, api: str, params: Optional[Dict[str, Any]] = None, date: Optional[str] = None,
+            ttl_seconds: Optional[float] = None) -> Optional[Any]:
+        """读取未过期的缓存，没有或已过期时返回 None"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return None
+        path = self.path(api, params, date)
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {str(e)}")
+            return None
+
+    def set(self, api: str, params: Optional[Dict[str, Any]], date: Optional[str], value: Any):
+        """写入缓存；先写临时文件再替换，避免并发读到半个文件"""
+        if self.ttl_seconds <= 0:
+            return
+        path = self.path(api, params, date)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp = f"{path}.{os.getpid()}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, default=str)
+            os.replace(temp, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {path}: {str(e)}")
+
+    def get_frame(self, api: str, params: Optional[Dict[str, Any]] = None, date: Optional[str] = None,
+                  ttl_seconds: Optional[float] = None) -> Optional[pd.DataFrame]:
+        value = self.get(api, params, date, ttl_seconds)
+        if value is None:
+            return None
+        return pd.DataFrame(value["data"], columns=value["columns"])
+
+    def set_frame(self, api: str, params: Optional[Dict[str, Any]], date: Optional[str], df: pd.DataFrame):
+        if df is None:
+            return
+        # NaN 按 JSON 扩展写入，读回后与原数据一致（不会变成 None）
+        data = df.astype(object).values.tolist()
+        self.set(api, params, date, {"columns": list(df.columns), "data": data})
@@ -0,0 +1,178 @@
+"""策略决策追踪
+
+策略逐根K线评估时的中间判断（各条件是否满足及对应数值）默认不记录，也不构造任何
+明细对象。执行策略时可以按股票和日期区间开启追踪，命中的K线把决策明细写入一个
+固定容量的环形缓冲区，执行结束后随结果返回，通过执行接口查看。
+
+策略类继承 TraceMixin 后的用法::
+
+    self._trace_begin(symbol)          # 每只股票一次
+    for i in range(...):
+        self._trace_bar(df, i)         # 每根K线一次
+        ...
+        if self._tracing:
+            self._trace('bottom_support', price_decline=price_decline, ...)
+
+关闭时每根K线只有布尔判断，明细参数不会被求值，也不会分配任何对象。
+"""
+
+from collections import deque
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CAPACITY = 2000
+MAX_CAPACITY = 50000
+
+
+def _to_timestamp(value) -> Optional[pd.Timestamp]:
+    if value is None or value == '':
+        return None
+    return pd.Timestamp(value)
+
+
+def _plain(value: Any) -> Any:
+    """转换为可以写入 MongoDB / JSON 的普通类型"""
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def bar_date(df: pd.DataFrame, index: int):
+    """第 index 根K线的日期：优先取 date 列，否则取索引"""
+    if 'date' in df.columns:
+        return df['date'].iat[index]
+    return df.index[index]
+
+
+class StrategyTracer:
+    """按股票 / 日期开启的决策追踪器
+
+    Args:
+        symbols: 需要追踪的股票代码，为空时追踪全部股票
+        start_date: 追踪的起始日期（含），为空不限
+        end_date: 追踪的结束日期（含），为空不限
+        capacity: 缓冲区容量，超出后丢弃最早的记录
+    """
+
+    def __init__(self, symbols: Optional[Iterable[str]] = None, start_date=None, end_date=None,
+                 capacity: int = DEFAULT_CAPACITY):
+        self.symbols = frozenset(symbols) if symbols else None
+        self.start_date = _to_timestamp(start_date)
+        self.end_date = _to_timestamp(end_date)
+        self.capacity = max(1, min(int(capacity), MAX_CAPACITY))
+        self.dropped = 0
+        self._buffer: deque = deque(maxlen=self.capacity)
+
+    def enabled(self, symbol: str, when=None) -> bool:
+        """该股票（及日期）是否需要追踪"""
+        if self.symbols is not None and symbol not in self.symbols:
+            return False
+        if when is None or (self.start_date is None and self.end_date is None):
+            return True
+        try:
+            when = pd.Timestamp(when)
+        except (TypeError, ValueError):
+            return True
+        if self.start_date is not None and when < self.start_date:
+            return False
+        if self.end_date is not None and when > self.end_date:
+            return False
+        return True
+
+    def record(self, symbol: str, when, check: str, **details):
+        """记录一条决策明细 (股票, 日期, 检查项, 明细)"""
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+        self._buffer.append((symbol, when, check, details))
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def export(self) -> List[Dict[str, Any]]:
+        """按记录顺序导出为字典列表"""
+        return [
+            {'symbol': symbol, 'date': _plain(when), 'check': check, 'details': _plain(details)}
+            for symbol, when, check, details in self._buffer
+        ]
+
+
+class _DisabledTracer:
+    """默认的关闭状态：不记录任何内容"""
+
+    symbols = None
+    dropped = 0
+
+    def enabled(self, symbol: str, when=None) -> bool:
+        return False
+
+    def record(self, symbol: str, when, check: str, **details):
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+    def export(self) -> List[Dict[str, Any]]:
+        return []
+
+
+NULL_TRACER = _DisabledTracer()
+
+
+def build_tracer(options: Any):
+    """由执行参数中的 trace 选项创建追踪器
+
+    options 为 True 时追踪全部股票；为字典时支持 symbols、start_date、end_date、capacity；
+    为空或 False 时返回关闭状态的追踪器。
+    """
+    if not options:
+        return NULL_TRACER
+    if options is True:
+        return StrategyTracer()
+    if isinstance(options, dict):
+        symbols = options.get('symbols')
+        if isinstance(symbols, str):
+            symbols = [code.strip() for code in symbols.split(',') if code.strip()]
+        return StrategyTracer(
+            symbols=symbols,
+            start_date=options.get('start_date'),
+            end_date=options.get('end_date'),
+            capacity=options.get('capacity') or DEFAULT_CAPACITY
+        )
+    raise ValueError(f"Invalid trace options: {options!r}")
+
+
+class TraceMixin:
+    """策略类使用的追踪辅助方法，需在 __init__ 中调用 _init_tracer"""
+
+    def _init_tracer(self, tracer=None):
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self._trace_stock = False
+        self._tracing = False
+        self._trace_symbol = None
+        self._trace_date = None
+
+    def _trace_begin(self, symbol: str):
+        """开始处理一只股票"""
+        self._trace_symbol = symbol
+        self._trace_stock = self.tracer.enabled(symbol)
+        self._tracing = False
+
+    def _trace_bar(self, df: pd.DataFrame, index: int):
+        """切换到第 index 根K线；股票未开启追踪时不做任何事"""
+        if self._trace_stock:
+            self._trace_date = bar_date(df, index)
+            self._tracing = self.tracer.enabled(self._trace_symbol, self._trace_date)
+
+    def _trace(self, check: str, **details):
+        self.tracer.record(self._trace_symbol, self._trace_date, check, **details)
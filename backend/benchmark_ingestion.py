@@ -0,0 +1,115 @@
+"""日线导入离线压测
+
+生成（或复用）合成股票的日线录制文件，用 ReplayProvider 按设定延迟回放，跑一遍完整的
+导入流水线（抓取 → 转换 → 批量写入 → 指标计算），输出各阶段的行数吞吐。
+数据写入单独的数据库（默认 grape_finance_bench），运行前会清空该库。
+
+    python benchmark_ingestion.py --stocks 5000 --years 3 --latency 0.005
+    python benchmark_ingestion.py --record-dir ./recordings   # 回放真实录制的数据
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+# 压测只受回放延迟限制，不做上游限流
+os.environ.setdefault("BAOSTOCK_QPS", "0")
+
+import numpy as np
+
+from app.services.data_service import DataService
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.services.market_data_provider import DAILY_FIELDS, ReplayProvider, daily_recording_path, write_daily_recording
+
+SYNTHETIC_DIR = "./bench_recordings"
+
+
+def synthetic_codes(count: int):
+    return [f"sh.{600000 + i}" if i % 2 == 0 else f"sz.{i:06d}" for i in range(count)]
+
+
+def trading_days(years: int, end: datetime):
+    start = end - timedelta(days=365 * years)
+    days = []
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            days.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return days
+
+
+def write_synthetic_recordings(root: str, codes, days, seed: int = 7):
+    """随机游走生成日线录制文件，已存在的文件不重写"""
+    rng = np.random.default_rng(seed)
+    fields = DAILY_FIELDS.split(",")
+    for code in codes:
+        if os.path.exists(daily_recording_path(root, code)):
+            continue
+        returns = rng.normal(0, 0.02, len(days))
+        close = 10 * np.exp(np.cumsum(returns))
+        preclose = np.concatenate(([close[0]], close[:-1]))
+        high = np.maximum(close, preclose) * (1 + rng.uniform(0, 0.02, len(days)))
+        low = np.minimum(close, preclose) * (1 - rng.uniform(0, 0.02, len(days)))
+        volume = rng.integers(100_000, 10_000_000, len(days))
+        rows = [
+            [day, code, f"{preclose[i]:.2f}", f"{high[i]:.2f}", f"{low[i]:.2f}", f"{close[i]:.2f}",
+             f"{preclose[i]:.2f}", str(volume[i]), f"{volume[i] * close[i]:.2f}", "3", "1.5", "1",
+             f"{(close[i] / preclose[i] - 1) * 100:.4f}", "15.0", "1.2", "2.0", "8.0", "0"]
+            for i, day in enumerate(days)
+        ]
+        write_daily_recording(root, code, fields, rows)
+
+
+def use_database(data_service: DataService, name: str):
+    """把数据服务及其依赖的服务指向压测数据库"""
+    db = data_service.mongo_service.client[name]
+    data_service.mongo_service.db = db
+    data_service.technical_service.mongo_service.db = db
+    data_service.snapshot_service.db = db
+    return db
+
+
+async def main(args):
+    if args.record_dir is None:
+        root = SYNTHETIC_DIR
+        codes = synthetic_codes(args.stocks)
+        print(f"Preparing {len(codes)} synthetic stocks x {args.years} years in {root} ...")
+        write_synthetic_recordings(root, codes, trading_days(args.years, datetime(2025, 12, 31)))
+    else:
+        root = args.record_dir
+        codes = sorted(name[:-len(".json")] for name in os.listdir(os.path.join(root, "daily")))
+        codes = codes[:args.stocks] if args.stocks else codes
+
+    data_service = DataService(provider=ReplayProvider(root, latency=args.latency))
+    db = use_database(data_service, args.database)
+    await data_service.mongo_service.client.drop_database(args.database)
+
+    pipeline = IngestionPipeline(data_service)
+    started = time.perf_counter()
+    summary = await pipeline.run(codes)
+    elapsed = time.perf_counter() - started
+
+    rows = summary["stages"]["write"]["rows"]
+    print(json.dumps(summary["stages"], indent=2))
+    print(f"{summary['completed']}/{summary['total']} stocks, {rows} rows written in {elapsed:.1f}s "
+          f"({rows / elapsed:.0f} rows/s end to end)")
+    if not args.keep:
+        await data_service.mongo_service.client.drop_database(db.name)
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--stocks", type=int, default=5000, help="股票数量")
+parser.add_argument("--years", type=int, default=3, help="每只股票的历史年数（合成数据）")
+parser.add_argument("--latency", type=float, default=0.0, help="每次上游调用的模拟延迟（秒）")
+parser.add_argument("--record-dir", help=f"回放的录制目录，不指定时在 {SYNTHETIC_DIR} 生成合成数据")
+parser.add_argument("--database", default="grape_finance_bench", help="压测使用的数据库")
+parser.add_argument("--keep", action="store_true", help="保留压测写入的数据")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""把逐根K线的日线集合迁移为月度分桶
+
+对每只股票读取 stock_daily_<code> 的全部K线，重建 stock_monthly_<code>，可重复执行。
+每只股票重建完成后在 monthly_bar_status 中标记为完整，get_stock_history 只对已标记的
+股票读取分桶。迁移完成后把 daily_bar_layout 设为 "monthly"，之后的日线写入会同时更新分桶。
+逐根K线的集合保持不变，快照、选股等仍直接读取它们，分桶是额外的副本；--compare
+输出的是两种布局各自的大小和读取耗时，不代表迁移后可以节省的空间。
+
+    python migrate_monthly_bars.py                      # 全部股票
+    python migrate_monthly_bars.py --codes sh.600000 --compare
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from app.services.mongodb_service import MongoDBService
+
+
+async def collection_size(db, name: str) -> int:
+    """集合的 BSON 数据大小（不含索引）"""
+    stats = await db.command("collStats", name)
+    return int(stats.get("size", 0))
+
+
+async def compare(mongo_service: MongoDBService, stock_code: str, years: int = 10):
+    """对比两种布局的存储大小和读取最近 years 年K线的耗时"""
+    db = mongo_service.db
+    daily_name = mongo_service.get_collection_name(stock_code)
+    monthly_name = mongo_service.monthly_bars.collection_name(stock_code)
+    limit = years * 250
+
+    started = time.perf_counter()
+    documents = await db[daily_name].find({"code": stock_code}, {"_id": 0}).sort("date", -1).limit(limit).to_list(length=None)
+    document_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    bars = await mongo_service.monthly_bars.read(stock_code, descending=True, max_bars=limit)
+    monthly_seconds = time.perf_counter() - started
+
+    return {
+        "code": stock_code,
+        "document_bytes": await collection_size(db, daily_name),
+        "monthly_bytes": await collection_size(db, monthly_name),
+        "bars_read": [len(documents), len(bars or [])],
+        "document_read_ms": round(document_seconds * 1000, 1),
+        "monthly_read_ms": round(monthly_seconds * 1000, 1),
+    }
+
+
+async def main(args):
+    mongo_service = MongoDBService()
+    if args.codes:
+        codes = [code.strip() for code in args.codes.split(",") if code.strip()]
+    else:
+        stocks = await mongo_service.find("stock_info", {}, {"code": 1})
+        codes = [stock["code"] for stock in stocks]
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    migrated = 0
+
+    async def migrate(stock_code: str) -> int:
+        nonlocal migrated
+        async with semaphore:
+            buckets = await mongo_service.monthly_bars.migrate(stock_code, mongo_service.get_collection_name(stock_code))
+            migrated += 1
+            if migrated % 100 == 0:
+                print(f"{migrated}/{len(codes)} stocks migrated")
+            return buckets
+
+    started = time.perf_counter()
+    buckets = sum(await asyncio.gather(*(migrate(code) for code in codes)))
+    print(f"Migrated {len(codes)} stocks into {buckets} monthly buckets in {time.perf_counter() - started:.1f}s")
+
+    if args.compare:
+        for code in codes[:args.compare_stocks]:
+            print(json.dumps(await compare(mongo_service, code)))
+
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--codes", help="股票代码，逗号分隔，默认全部")
+parser.add_argument("--concurrency", type=int, default=8, help="同时迁移的股票数")
+parser.add_argument("--compare", action="store_true", help="迁移后对比存储大小和读取耗时")
+parser.add_argument("--compare-stocks", type=int, default=5, help="参与对比的股票数量")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
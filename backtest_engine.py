@@ -1,10 +1,12 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import matplotlib.pyplot as plt
 from right_side_trading_strategy import RightSideTradingStrategy, Signal, Position
+from backtest_metrics import compute_metrics, stack_curves
+from trade_ledger import TradeLedger, OpenPosition
 
 @dataclass
 class BacktestResult:
@@ -18,7 +20,12 @@ class BacktestResult:
     total_trades: int
     avg_trade_return: float
     equity_curve: pd.Series
-    trade_history: List[Dict]
+    trade_history: TradeLedger
+    sortino_ratio: float = 0.0
+    calmar_ratio: float = 0.0
+    max_drawdown_duration: int = 0
+    exposure: float = 0.0
+    turnover: float = 0.0
 
 class BacktestEngine:
     """回测引擎"""
@@ -30,24 +37,16 @@ class BacktestEngine:
     def reset(self):
         """重置回测状态"""
         self.capital = self.strategy.initial_capital
-        self.positions = {}
-        self.equity_curve = []
-        self.trade_history = []
+        self.positions: Dict[str, OpenPosition] = {}
+        # 资金曲线按信号数预分配为数组，指标计算直接在数组上进行
+        self.equity_dates = np.empty(0, dtype='datetime64[ns]')
+        self.equity_values = np.empty(0)
+        self.invested_values = np.empty(0)
+        self.trade_history = TradeLedger()
         self.current_date = None
     
-    def execute_trade(self, signal: Signal) -> Dict:
-        """执行交易"""
-        trade_result = {
-            'date': signal.timestamp,
-            'symbol': signal.symbol,
-            'action': signal.action,
-            'price': signal.price,
-            'quantity': 0,
-            'pnl': 0,
-            'commission': 0,
-            'reason': signal.reason
-        }
-        
+    def execute_trade(self, signal: Signal) -> int:
+        """执行交易并写入成交记录，返回成交数量（0表示未成交）"""
         if signal.action == 'BUY':
             # 计算可买数量
             available_capital = self.capital * 0.95  # 留5%作为缓冲
@@ -58,37 +57,34 @@ class BacktestEngine:
                 total_cost = quantity * signal.price + commission
                 
                 if total_cost <= self.capital:
-                    self.positions[signal.symbol] = {
-                        'quantity': quantity,
-                        'entry_price': signal.price,
-                        'entry_date': signal.timestamp
-                    }
+                    self.positions[signal.symbol] = OpenPosition(
+                        signal.symbol, quantity, signal.price, signal.timestamp
+                    )
                     self.capital -= total_cost
                     
-                    trade_result.update({
-                        'quantity': quantity,
-                        'commission': commission
-                    })
+                    self.trade_history.append(
+                        signal.timestamp, signal.symbol, 'BUY', signal.price, quantity,
+                        commission=commission, reason=signal.reason
+                    )
+                    return quantity
         
         elif signal.action == 'SELL' and signal.symbol in self.positions:
-            position = self.positions[signal.symbol]
-            quantity = position['quantity']
+            position = self.positions.pop(signal.symbol)
+            quantity = position.quantity
             
             commission = quantity * signal.price * 0.001
             proceeds = quantity * signal.price - commission
             
-            pnl = (signal.price - position['entry_price']) * quantity - commission
+            pnl = (signal.price - position.entry_price) * quantity - commission
             self.capital += proceeds
             
-            trade_result.update({
-                'quantity': quantity,
-                'pnl': pnl,
-                'commission': commission
-            })
-            
-            del self.positions[signal.symbol]
+            self.trade_history.append(
+                signal.timestamp, signal.symbol, 'SELL', signal.price, quantity,
+                pnl=pnl, commission=commission, reason=signal.reason
+            )
+            return quantity
         
-        return trade_result
+        return 0
     
     def calculate_portfolio_value(self, current_prices: Dict[str, float]) -> float:
         """计算当前组合价值"""
@@ -96,16 +92,12 @@ class BacktestEngine:
         
         for symbol, position in self.positions.items():
             if symbol in current_prices:
-                total_value += position['quantity'] * current_prices[symbol]
+                total_value += position.market_value(current_prices[symbol])
         
         return total_value
     
-    def run_backtest(self, data_dict: Dict[str, pd.DataFrame], 
-                    start_date: str, end_date: str) -> BacktestResult:
-        """运行回测"""
-        self.reset()
-        
-        # 生成所有交易信号
+    def generate_all_signals(self, data_dict: Dict[str, pd.DataFrame]) -> List[Signal]:
+        """为所有股票生成交易信号并按时间排序"""
         all_signals = []
         for symbol, data in data_dict.items():
             signals = self.strategy.generate_signals(data, symbol)
@@ -113,6 +105,32 @@ class BacktestEngine:
         
         # 按时间排序信号
         all_signals.sort(key=lambda x: x.timestamp)
+        return all_signals
+    
+    def run_backtest(self, data_dict: Dict[str, pd.DataFrame], 
+                    start_date: str, end_date: str,
+                    signals: Optional[List[Signal]] = None) -> BacktestResult:
+        """运行回测
+        
+        Args:
+            data_dict: 股票代码到行情数据的映射
+            start_date: 回测开始日期
+            end_date: 回测结束日期
+            signals: 预先生成的已排序信号，传入时不再重新计算指标和信号
+        """
+        self.simulate(data_dict, start_date, end_date, signals)
+        
+        # 计算回测结果
+        return self.calculate_results()
+    
+    def simulate(self, data_dict: Dict[str, pd.DataFrame],
+                 start_date: str, end_date: str,
+                 signals: Optional[List[Signal]] = None):
+        """逐信号撮合交易并记录资金曲线，不计算指标"""
+        self.reset()
+        
+        # 生成所有交易信号
+        all_signals = signals if signals is not None else self.generate_all_signals(data_dict)
         
         # 过滤时间范围
         start_dt = pd.to_datetime(start_date)
@@ -120,14 +138,17 @@ class BacktestEngine:
         filtered_signals = [s for s in all_signals 
                           if start_dt <= s.timestamp <= end_dt]
         
+        n = len(filtered_signals)
+        self.equity_dates = np.empty(n, dtype='datetime64[ns]')
+        self.equity_values = np.empty(n)
+        self.invested_values = np.empty(n)
+        
         # 执行回测
-        for signal in filtered_signals:
+        for i, signal in enumerate(filtered_signals):
             self.current_date = signal.timestamp
             
             # 执行交易
-            trade_result = self.execute_trade(signal)
-            if trade_result['quantity'] > 0:
-                self.trade_history.append(trade_result)
+            self.execute_trade(signal)
             
             # 记录组合价值
             current_prices = {symbol: data.loc[data.index <= signal.timestamp]['close'].iloc[-1] 
@@ -135,65 +156,43 @@ class BacktestEngine:
                             if len(data.loc[data.index <= signal.timestamp]) > 0}
             
             portfolio_value = self.calculate_portfolio_value(current_prices)
-            self.equity_curve.append({
-                'date': signal.timestamp,
-                'value': portfolio_value
-            })
-        
-        # 计算回测结果
-        return self.calculate_results()
+            self.equity_dates[i] = np.datetime64(pd.Timestamp(signal.timestamp))
+            self.equity_values[i] = portfolio_value
+            self.invested_values[i] = portfolio_value - self.capital
+    
+    def trade_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """成交记录的盈亏和成交金额数组"""
+        return self.trade_history.column('pnl'), self.trade_history.notional
+    
+    def backtest_years(self) -> float:
+        """资金曲线覆盖的自然年数"""
+        if len(self.equity_dates) == 0:
+            return 0.0
+        days = (self.equity_dates[-1] - self.equity_dates[0]) // np.timedelta64(1, 'D')
+        return int(days) / 365
     
     def calculate_results(self) -> BacktestResult:
         """计算回测结果"""
-        if not self.equity_curve:
-            return BacktestResult(0, 0, 0, 0, 0, 0, 0, 0, pd.Series(), [])
-        
-        equity_df = pd.DataFrame(self.equity_curve)
-        equity_df.set_index('date', inplace=True)
-        equity_series = equity_df['value']
-        
-        # 基本收益指标
-        total_return = (equity_series.iloc[-1] - self.strategy.initial_capital) / self.strategy.initial_capital
-        
-        # 年化收益率
-        days = (equity_series.index[-1] - equity_series.index[0]).days
-        annualized_return = (equity_series.iloc[-1] / self.strategy.initial_capital) ** (365 / days) - 1
-        
-        # 最大回撤
-        rolling_max = equity_series.expanding().max()
-        drawdown = (equity_series - rolling_max) / rolling_max
-        max_drawdown = drawdown.min()
+        if len(self.equity_values) == 0:
+            return BacktestResult(0, 0, 0, 0, 0, 0, 0, 0, pd.Series(dtype=float), TradeLedger())
         
-        # 夏普比率
-        returns = equity_series.pct_change().dropna()
-        if len(returns) > 1 and returns.std() > 0:
-            sharpe_ratio = returns.mean() / returns.std() * np.sqrt(252)
-        else:
-            sharpe_ratio = 0
-        
-        # 交易统计
-        winning_trades = [t for t in self.trade_history if t['pnl'] > 0]
-        losing_trades = [t for t in self.trade_history if t['pnl'] < 0]
-        
-        win_rate = len(winning_trades) / len(self.trade_history) if self.trade_history else 0
-        
-        total_wins = sum(t['pnl'] for t in winning_trades)
-        total_losses = abs(sum(t['pnl'] for t in losing_trades))
-        profit_factor = total_wins / total_losses if total_losses > 0 else float('inf')
-        
-        avg_trade_return = np.mean([t['pnl'] for t in self.trade_history]) if self.trade_history else 0
+        pnl, notional = self.trade_arrays()
+        stats = compute_metrics(
+            self.equity_values,
+            self.strategy.initial_capital,
+            self.backtest_years(),
+            invested=self.invested_values,
+            trade_pnl=pnl,
+            trade_notional=notional
+        )
+        equity_series = pd.Series(self.equity_values,
+                                  index=pd.DatetimeIndex(self.equity_dates, name='date'),
+                                  name='value')
         
         return BacktestResult(
-            total_return=total_return,
-            annualized_return=annualized_return,
-            max_drawdown=max_drawdown,
-            sharpe_ratio=sharpe_ratio,
-            win_rate=win_rate,
-            profit_factor=profit_factor,
-            total_trades=len(self.trade_history),
-            avg_trade_return=avg_trade_return,
             equity_curve=equity_series,
-            trade_history=self.trade_history
+            trade_history=self.trade_history,
+            **stats
         )
     
     def plot_results(self, result: BacktestResult, save_path: str = None):
@@ -227,6 +226,8 @@ class BacktestEngine:
         Annualized Return: {result.annualized_return:.2%}
         Max Drawdown: {result.max_drawdown:.2%}
         Sharpe Ratio: {result.sharpe_ratio:.2f}
+        Sortino Ratio: {result.sortino_ratio:.2f}
+        Calmar Ratio: {result.calmar_ratio:.2f}
         Win Rate: {result.win_rate:.2%}
         Profit Factor: {result.profit_factor:.2f}
         Total Trades: {result.total_trades}
@@ -249,6 +250,82 @@ class StrategyOptimizer:
     def __init__(self, strategy_class, data_dict: Dict[str, pd.DataFrame]):
         self.strategy_class = strategy_class
         self.data_dict = data_dict
+        # 参数组合 -> 全历史信号，避免同一组参数在不同区间重复计算指标
+        self._signal_cache: Dict[Tuple, List[Signal]] = {}
+    
+    @staticmethod
+    def param_combinations(param_grid: Dict[str, List]) -> List[Dict]:
+        """生成所有参数组合"""
+        from itertools import product
+        param_names = list(param_grid.keys())
+        param_values = list(param_grid.values())
+        return [dict(zip(param_names, combination)) for combination in product(*param_values)]
+    
+    @staticmethod
+    def params_key(params: Dict) -> Tuple:
+        """参数字典的可哈希键"""
+        return tuple(sorted((name, repr(value)) for name, value in params.items()))
+    
+    def get_signals(self, params: Dict) -> List[Signal]:
+        """获取指定参数在全部历史数据上的信号（带缓存）"""
+        key = self.params_key(params)
+        if key not in self._signal_cache:
+            engine = BacktestEngine(self.strategy_class(**params))
+            self._signal_cache[key] = engine.generate_all_signals(self.data_dict)
+        return self._signal_cache[key]
+    
+    def set_signals(self, params: Dict, signals: List[Signal]):
+        """写入外部（如并行进程）计算好的信号"""
+        self._signal_cache[self.params_key(params)] = signals
+    
+    def evaluate(self, params: Dict, start_date: str, end_date: str) -> BacktestResult:
+        """在指定区间上评估一组参数，复用已缓存的信号"""
+        engine = BacktestEngine(self.strategy_class(**params))
+        return engine.run_backtest(self.data_dict, start_date, end_date,
+                                   signals=self.get_signals(params))
+    
+    def evaluate_many(self, param_list: List[Dict], start_date: str, end_date: str) -> pd.DataFrame:
+        """批量评估多组参数，所有指标在堆叠后的资金曲线上一次性向量化计算
+
+        只有绩效指标是跨参数组合向量化的：持仓与资金曲线的模拟依赖每一步的现金、持仓
+        和止损状态，仍按参数组合逐个调用 simulate（信号按参数缓存，不重复计算）。
+
+        Returns:
+            每组参数一行的 DataFrame，列为参数和 BacktestResult 中的各项指标
+        """
+        if not param_list:
+            return pd.DataFrame()
+        
+        curves, invested, years, capitals = [], [], [], []
+        pnl_parts, notional_parts, id_parts = [], [], []
+        
+        for run_id, params in enumerate(param_list):
+            engine = BacktestEngine(self.strategy_class(**params))
+            engine.simulate(self.data_dict, start_date, end_date,
+                            signals=self.get_signals(params))
+            capitals.append(engine.strategy.initial_capital)
+            curves.append(engine.equity_values)
+            invested.append(engine.invested_values)
+            years.append(engine.backtest_years())
+            pnl, notional = engine.trade_arrays()
+            pnl_parts.append(pnl)
+            notional_parts.append(notional)
+            id_parts.append(np.full(len(pnl), run_id, dtype=np.int64))
+        
+        stats = compute_metrics(
+            stack_curves(curves),
+            np.array(capitals, dtype=float),
+            np.array(years),
+            invested=stack_curves(invested),
+            trade_pnl=np.concatenate(pnl_parts),
+            trade_notional=np.concatenate(notional_parts),
+            trade_run_ids=np.concatenate(id_parts)
+        )
+        
+        table = pd.DataFrame(param_list)
+        for name, values in stats.items():
+            table[name] = values
+        return table
     
     def optimize_parameters(self, param_grid: Dict[str, List], 
                           start_date: str, end_date: str,
@@ -258,20 +335,9 @@ class StrategyOptimizer:
         best_score = -float('inf')
         results = []
         
-        # 生成所有参数组合
-        from itertools import product
-        param_names = list(param_grid.keys())
-        param_values = list(param_grid.values())
-        
-        for combination in product(*param_values):
-            params = dict(zip(param_names, combination))
-            
-            # 创建策略实例
-            strategy = self.strategy_class(**params)
-            
+        for params in self.param_combinations(param_grid):
             # 运行回测
-            engine = BacktestEngine(strategy)
-            result = engine.run_backtest(self.data_dict, start_date, end_date)
+            result = self.evaluate(params, start_date, end_date)
             
             # 记录结果
             score = getattr(result, metric)
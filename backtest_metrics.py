@@ -0,0 +1,301 @@
+"""回测绩效指标（NumPy 向量化实现）
+
+所有函数同时支持一维数组（单次回测）和二维数组（runs × T，多次回测按行堆叠）。
+长度不同的资金曲线通过 stack_curves 在尾部用 NaN 补齐，计算时自动忽略 NaN，
+因此上千组参数优化结果可以一次性计算，不需要逐个回测循环。
+一维输入返回标量，二维输入返回长度为 runs 的数组。
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Sequence, Union
+
+TRADING_DAYS_PER_YEAR = 252
+
+ArrayLike = Union[np.ndarray, Sequence[float], pd.Series]
+
+def _as_2d(values: ArrayLike):
+    arr = np.asarray(values, dtype=float)
+    if arr.ndim == 1:
+        return arr[np.newaxis, :], True
+    if arr.ndim != 2:
+        raise ValueError("expected a 1D or 2D array")
+    return arr, False
+
+def _finish(values: np.ndarray, squeeze: bool):
+    return values[0].item() if squeeze else values
+
+def stack_curves(curves: Sequence[ArrayLike]) -> np.ndarray:
+    """将多条长度不同的曲线堆叠为 runs × T 数组，尾部以 NaN 补齐"""
+    arrays = [np.asarray(c, dtype=float) for c in curves]
+    width = max((len(a) for a in arrays), default=0)
+    stacked = np.full((len(arrays), width), np.nan)
+    for i, a in enumerate(arrays):
+        stacked[i, :len(a)] = a
+    return stacked
+
+def last_valid(values: ArrayLike):
+    """每行最后一个有效值（要求 NaN 只出现在尾部）"""
+    arr, squeeze = _as_2d(values)
+    counts = np.isfinite(arr).sum(axis=1)
+    result = np.full(arr.shape[0], np.nan)
+    has_data = counts > 0
+    result[has_data] = arr[has_data, counts[has_data] - 1]
+    return _finish(result, squeeze)
+
+def simple_returns(equity: ArrayLike) -> np.ndarray:
+    """资金曲线的逐期收益率，输出比输入少一列"""
+    arr, squeeze = _as_2d(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = arr[:, 1:] / arr[:, :-1] - 1
+    returns[~np.isfinite(returns)] = np.nan
+    return returns[0] if squeeze else returns
+
+def _mean_std(returns: np.ndarray):
+    """忽略 NaN 的均值和样本标准差（ddof=1），有效样本不足时为 NaN"""
+    valid = np.isfinite(returns)
+    counts = valid.sum(axis=1)
+    filled = np.where(valid, returns, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = filled.sum(axis=1) / counts
+        sq = np.where(valid, (returns - mean[:, np.newaxis]) ** 2, 0.0)
+        std = np.sqrt(sq.sum(axis=1) / (counts - 1))
+    return mean, std, counts
+
+def total_return(equity: ArrayLike, initial_capital: ArrayLike):
+    """总收益率，initial_capital 可为标量或每次回测一个值"""
+    return (np.asarray(last_valid(equity)) - initial_capital) / initial_capital
+
+def annualized_return(equity: ArrayLike, initial_capital: ArrayLike, years: ArrayLike):
+    """年化收益率，years 为每次回测覆盖的年数（可为标量）"""
+    final = np.asarray(last_valid(equity), dtype=float)
+    years = np.broadcast_to(np.asarray(years, dtype=float), final.shape)
+    initial = np.broadcast_to(np.asarray(initial_capital, dtype=float), final.shape)
+    result = np.zeros(final.shape)
+    ok = (years > 0) & np.isfinite(final)
+    with np.errstate(invalid='ignore'):
+        result[ok] = (final[ok] / initial[ok]) ** (1.0 / years[ok]) - 1
+    return result.item() if result.ndim == 0 else result
+
+def sharpe_ratio(equity: ArrayLike, periods_per_year: int = TRADING_DAYS_PER_YEAR):
+    """夏普比率（无风险利率取0），收益率不足两期或波动为0时返回0"""
+    arr, squeeze = _as_2d(equity)
+    mean, std, counts = _mean_std(simple_returns(arr))
+    ok = (counts > 1) & (std > 0)
+    result = np.zeros(arr.shape[0])
+    result[ok] = mean[ok] / std[ok] * np.sqrt(periods_per_year)
+    return _finish(result, squeeze)
+
+def sortino_ratio(equity: ArrayLike, periods_per_year: int = TRADING_DAYS_PER_YEAR):
+    """索提诺比率，只用下行波动作为分母"""
+    arr, squeeze = _as_2d(equity)
+    returns = simple_returns(arr)
+    mean, _, counts = _mean_std(returns)
+    downside = np.where(np.isfinite(returns), np.minimum(returns, 0.0), 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        downside_dev = np.sqrt((downside ** 2).sum(axis=1) / counts)
+    ok = (counts > 1) & (downside_dev > 0)
+    result = np.zeros(arr.shape[0])
+    result[ok] = mean[ok] / downside_dev[ok] * np.sqrt(periods_per_year)
+    return _finish(result, squeeze)
+
+def drawdown(equity: ArrayLike) -> np.ndarray:
+    """回撤序列（相对历史最高点，值<=0）"""
+    arr, squeeze = _as_2d(equity)
+    peak = np.fmax.accumulate(arr, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dd = arr / peak - 1
+    return dd[0] if squeeze else dd
+
+def max_drawdown(equity: ArrayLike):
+    """最大回撤（负数）"""
+    arr, squeeze = _as_2d(equity)
+    dd = drawdown(arr)
+    dd = np.where(np.isfinite(dd), dd, 0.0)
+    result = dd.min(axis=1) if dd.shape[1] else np.zeros(arr.shape[0])
+    return _finish(result, squeeze)
+
+def max_drawdown_duration(equity: ArrayLike):
+    """最长回撤持续期数（从创新高到重新创新高之间的期数）"""
+    arr, squeeze = _as_2d(equity)
+    if arr.shape[1] == 0:
+        return _finish(np.zeros(arr.shape[0], dtype=np.int64), squeeze)
+    peak = np.fmax.accumulate(arr, axis=1)
+    underwater = arr < peak
+    idx = np.arange(arr.shape[1])
+    # 每个位置最近一次处于高点的下标
+    last_peak = np.maximum.accumulate(np.where(underwater, 0, idx), axis=1)
+    duration = np.where(underwater, idx - last_peak, 0)
+    return _finish(duration.max(axis=1), squeeze)
+
+def calmar_ratio(annual_return: ArrayLike, max_dd: ArrayLike):
+    """卡玛比率 = 年化收益 / |最大回撤|，无回撤时返回0"""
+    ar = np.asarray(annual_return, dtype=float)
+    dd = np.abs(np.asarray(max_dd, dtype=float))
+    ar, dd = np.broadcast_arrays(ar, dd)
+    result = np.zeros(ar.shape)
+    ok = dd > 0
+    result[ok] = ar[ok] / dd[ok]
+    return result.item() if result.ndim == 0 else result
+
+def exposure(invested: ArrayLike, equity: ArrayLike):
+    """平均持仓比例（持仓市值 / 组合总值）"""
+    inv, squeeze = _as_2d(invested)
+    eq, _ = _as_2d(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = inv / eq
+    valid = np.isfinite(ratio)
+    counts = valid.sum(axis=1)
+    result = np.zeros(inv.shape[0])
+    ok = counts > 0
+    result[ok] = np.where(valid, ratio, 0.0).sum(axis=1)[ok] / counts[ok]
+    return _finish(result, squeeze)
+
+def turnover(trade_notional: ArrayLike, equity: ArrayLike,
+             run_ids: Optional[ArrayLike] = None):
+    """换手率 = 累计成交金额 / 平均组合总值
+
+    Args:
+        trade_notional: 每笔成交金额（所有回测拼接在一起）
+        equity: 资金曲线（一维或 runs × T）
+        run_ids: 每笔成交所属的回测行号，单次回测时可省略
+    """
+    eq, squeeze = _as_2d(equity)
+    notional = np.abs(np.asarray(trade_notional, dtype=float))
+    ids = np.zeros(len(notional), dtype=np.int64) if run_ids is None else np.asarray(run_ids, dtype=np.int64)
+    traded = np.bincount(ids, weights=notional, minlength=eq.shape[0])
+    valid = np.isfinite(eq)
+    counts = valid.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_equity = np.where(valid, eq, 0.0).sum(axis=1) / counts
+    result = np.zeros(eq.shape[0])
+    ok = (counts > 0) & (avg_equity > 0)
+    result[ok] = traded[ok] / avg_equity[ok]
+    return _finish(result, squeeze)
+
+def trade_statistics(pnl: ArrayLike, run_ids: Optional[ArrayLike] = None,
+                     n_runs: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """按回测分组的交易统计：胜率、盈亏比、平均每笔盈亏、交易次数"""
+    pnl = np.asarray(pnl, dtype=float)
+    squeeze = run_ids is None
+    ids = np.zeros(len(pnl), dtype=np.int64) if squeeze else np.asarray(run_ids, dtype=np.int64)
+    size = 1 if squeeze else (n_runs if n_runs is not None else int(ids.max(initial=-1)) + 1)
+
+    total_trades = np.bincount(ids, minlength=size)
+    wins = np.bincount(ids, weights=(pnl > 0), minlength=size)
+    total_wins = np.bincount(ids, weights=np.where(pnl > 0, pnl, 0.0), minlength=size)
+    total_losses = -np.bincount(ids, weights=np.where(pnl < 0, pnl, 0.0), minlength=size)
+    pnl_sum = np.bincount(ids, weights=pnl, minlength=size)
+
+    has_trades = total_trades > 0
+    win_rate = np.zeros(size)
+    avg_trade = np.zeros(size)
+    win_rate[has_trades] = wins[has_trades] / total_trades[has_trades]
+    avg_trade[has_trades] = pnl_sum[has_trades] / total_trades[has_trades]
+    profit_factor = np.full(size, np.inf)
+    has_losses = total_losses > 0
+    profit_factor[has_losses] = total_wins[has_losses] / total_losses[has_losses]
+
+    stats = {
+        'win_rate': win_rate,
+        'profit_factor': profit_factor,
+        'total_trades': total_trades,
+        'avg_trade_return': avg_trade
+    }
+    if squeeze:
+        return {k: v[0].item() for k, v in stats.items()}
+    return stats
+
+def _rolling_moments(returns: np.ndarray, window: int):
+    """基于累加和的滑动均值/标准差，窗口内有效样本不足时为 NaN"""
+    valid = np.isfinite(returns)
+    filled = np.where(valid, returns, 0.0)
+    pad = np.zeros((returns.shape[0], 1))
+    csum = np.concatenate([pad, np.cumsum(filled, axis=1)], axis=1)
+    csq = np.concatenate([pad, np.cumsum(filled ** 2, axis=1)], axis=1)
+    ccount = np.concatenate([pad, np.cumsum(valid, axis=1)], axis=1)
+
+    n = ccount[:, window:] - ccount[:, :-window]
+    s = csum[:, window:] - csum[:, :-window]
+    sq = csq[:, window:] - csq[:, :-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = s / n
+        var = (sq - n * mean ** 2) / (n - 1)
+    std = np.sqrt(np.maximum(var, 0.0))
+    full = n == window
+    mean[~full] = np.nan
+    std[~full] = np.nan
+
+    # 前 window-1 期没有完整窗口
+    head = np.full((returns.shape[0], window - 1), np.nan)
+    return np.concatenate([head, mean], axis=1), np.concatenate([head, std], axis=1)
+
+def rolling_volatility(equity: ArrayLike, window: int = 20,
+                       periods_per_year: int = TRADING_DAYS_PER_YEAR) -> np.ndarray:
+    """滚动年化波动率，与 simple_returns 对齐"""
+    arr, squeeze = _as_2d(equity)
+    returns = simple_returns(arr)
+    if window < 2 or returns.shape[1] < window:
+        result = np.full(returns.shape, np.nan)
+    else:
+        _, std = _rolling_moments(returns, window)
+        result = std * np.sqrt(periods_per_year)
+    return result[0] if squeeze else result
+
+def rolling_sharpe(equity: ArrayLike, window: int = 60,
+                   periods_per_year: int = TRADING_DAYS_PER_YEAR) -> np.ndarray:
+    """滚动夏普比率，与 simple_returns 对齐"""
+    arr, squeeze = _as_2d(equity)
+    returns = simple_returns(arr)
+    if window < 2 or returns.shape[1] < window:
+        result = np.full(returns.shape, np.nan)
+    else:
+        mean, std = _rolling_moments(returns, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = np.where(std > 0, mean / std * np.sqrt(periods_per_year), np.nan)
+    return result[0] if squeeze else result
+
+def compute_metrics(equity: ArrayLike, initial_capital: ArrayLike, years: ArrayLike,
+                    invested: Optional[ArrayLike] = None,
+                    trade_pnl: Optional[ArrayLike] = None,
+                    trade_notional: Optional[ArrayLike] = None,
+                    trade_run_ids: Optional[ArrayLike] = None,
+                    periods_per_year: int = TRADING_DAYS_PER_YEAR) -> Dict:
+    """一次计算全部指标，键名与 BacktestResult 字段一致
+
+    Args:
+        equity: 资金曲线，一维或 runs × T（尾部 NaN 补齐）
+        initial_capital: 初始资金（标量或每次回测一个值）
+        years: 每次回测覆盖的年数
+        invested: 与 equity 同形的持仓市值
+        trade_pnl / trade_notional: 所有回测拼接后的每笔交易盈亏和成交金额
+        trade_run_ids: 每笔交易所属的回测行号（二维输入时必需）
+    """
+    eq, squeeze = _as_2d(equity)
+    n_runs = eq.shape[0]
+    ids = None if squeeze else trade_run_ids
+    if not squeeze and trade_pnl is not None and trade_run_ids is None:
+        raise ValueError("trade_run_ids is required for 2D equity")
+
+    annual = annualized_return(eq, initial_capital, years)
+    mdd = max_drawdown(eq)
+    metrics = {
+        'total_return': total_return(eq, initial_capital),
+        'annualized_return': annual,
+        'max_drawdown': mdd,
+        'sharpe_ratio': sharpe_ratio(eq, periods_per_year),
+        'sortino_ratio': sortino_ratio(eq, periods_per_year),
+        'calmar_ratio': calmar_ratio(annual, mdd),
+        'max_drawdown_duration': max_drawdown_duration(eq),
+        'exposure': exposure(invested, eq) if invested is not None else np.zeros(n_runs),
+        'turnover': (turnover(trade_notional, eq, ids)
+                     if trade_notional is not None else np.zeros(n_runs))
+    }
+    pnl = trade_pnl if trade_pnl is not None else np.empty(0)
+    if squeeze:
+        metrics = {k: np.asarray(v).reshape(-1)[0].item() for k, v in metrics.items()}
+        metrics.update(trade_statistics(pnl))
+    else:
+        run_ids = trade_run_ids if trade_pnl is not None else np.empty(0, dtype=np.int64)
+        metrics.update(trade_statistics(pnl, run_ids, n_runs))
+    return metrics
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 回测模块在仓库根目录，后端服务以 app 包的形式在 backend 目录下导入
+for path in (ROOT, os.path.join(ROOT, "backend")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# 以下是需要联网或本地服务、导入时就会执行的脚本，不作为 pytest 用例收集
+collect_ignore = [
+    "test_baostock_query_history_k_data_plus.py",
+    "test_cci_calculation.py",
+    "test_server.py",
+]
+collect_ignore_glob = ["strategies/*", "trae_test/*", "tushare_pro/*"]
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """MongoDBService 改用 mongomock_motor 的内存数据库，返回该数据库"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    from app.services import mongodb_service
+
+    client = AsyncMongoMockClient()
+
+    def init(self):
+        self.client = client
+        self.db = client.grape_finance
+
+    monkeypatch.setattr(mongodb_service.MongoDBService, "__init__", init)
+    return client.grape_finance
@@ -5,6 +5,11 @@ from dataclasses import dataclass
 from datetime import datetime
 import matplotlib.pyplot as plt
 from strong_k_breakout_strategy import StrongKBreakoutStrategy, StrongKSignal
+from backtest_metrics import compute_metrics
+from trade_ledger import TradeLedger, OpenPosition
+
+# 强K策略的阶段，顺序即成交记录中的阶段编码
+STAGES = ('bottom', 'accumulation', 'left_peak', 'volume_first', 'strong_k', 'rally')
 
 @dataclass
 class StrongKBacktestResult:
@@ -21,7 +26,7 @@ class StrongKBacktestResult:
     strong_k_success_rate: float
     stage_distribution: Dict[str, int]
     equity_curve: pd.Series
-    trade_history: List[Dict]
+    trade_history: TradeLedger
 
 class StrongKBacktestEngine:
     """强K突围策略专用回测引擎"""
@@ -33,30 +38,35 @@ class StrongKBacktestEngine:
     def reset(self):
         """重置回测状态"""
         self.capital = self.strategy.initial_capital
-        self.positions = {}
-        self.equity_curve = []
-        self.trade_history = []
-        self.stage_signals = []  # 记录各阶段信号
+        self.positions: Dict[str, OpenPosition] = {}
+        self.equity_dates = np.empty(0, dtype='datetime64[ns]')
+        self.equity_values = np.empty(0)
+        self.invested_values = np.empty(0)
+        # 成交记录按列存储，entry_stage 即原 stage_signals 中记录的持仓阶段
+        self.trade_history = TradeLedger(stages=STAGES)
         self.current_date = None
     
-    def execute_trade(self, signal: StrongKSignal) -> Dict:
-        """执行交易"""
-        trade_result = {
-            'date': signal.timestamp,
-            'symbol': signal.symbol,
-            'action': signal.action,
-            'price': signal.price,
-            'quantity': 0,
-            'pnl': 0,
-            'commission': 0,
-            'stage': signal.stage,
-            'reason': signal.reason,
-            'confidence': signal.confidence,
-            'stop_loss': signal.stop_loss,
-            'target_price': signal.target_price,
-            'holding_days': 0
-        }
-        
+    @property
+    def stage_signals(self) -> List[Dict]:
+        """各阶段信号记录（由成交记录生成，阶段取持仓建立时的阶段）"""
+        records = []
+        for trade in self.trade_history:
+            record = {
+                'date': trade['date'],
+                'symbol': trade['symbol'],
+                'stage': trade['entry_stage'],
+                'action': trade['action'],
+                'price': trade['price'],
+                'reason': trade['reason']
+            }
+            if trade['action'] == 'SELL':
+                record['pnl'] = trade['pnl']
+                record['holding_days'] = trade['holding_days']
+            records.append(record)
+        return records
+    
+    def execute_trade(self, signal: StrongKSignal) -> int:
+        """执行交易并写入成交记录，返回成交数量（0表示未成交）"""
         if signal.action == 'BUY':
             # 计算可买数量
             available_capital = self.capital * 0.95
@@ -67,66 +77,44 @@ class StrongKBacktestEngine:
                 total_cost = quantity * signal.price + commission
                 
                 if total_cost <= self.capital:
-                    self.positions[signal.symbol] = {
-                        'quantity': quantity,
-                        'entry_price': signal.price,
-                        'entry_date': signal.timestamp,
-                        'stop_loss': signal.stop_loss,
-                        'target_price': signal.target_price,
-                        'stage': signal.stage,
-                        'highest_price': signal.price
-                    }
+                    self.positions[signal.symbol] = OpenPosition(
+                        signal.symbol, quantity, signal.price, signal.timestamp,
+                        stop_loss=signal.stop_loss,
+                        target_price=signal.target_price,
+                        stage=signal.stage
+                    )
                     self.capital -= total_cost
                     
-                    trade_result.update({
-                        'quantity': quantity,
-                        'commission': commission
-                    })
-                    
-                    # 记录阶段信号
-                    self.stage_signals.append({
-                        'date': signal.timestamp,
-                        'symbol': signal.symbol,
-                        'stage': signal.stage,
-                        'action': 'BUY',
-                        'price': signal.price,
-                        'reason': signal.reason
-                    })
+                    self.trade_history.append(
+                        signal.timestamp, signal.symbol, 'BUY', signal.price, quantity,
+                        commission=commission, stage=signal.stage, reason=signal.reason,
+                        confidence=signal.confidence, stop_loss=signal.stop_loss,
+                        target_price=signal.target_price
+                    )
+                    return quantity
         
         elif signal.action == 'SELL' and signal.symbol in self.positions:
-            position = self.positions[signal.symbol]
-            quantity = position['quantity']
+            position = self.positions.pop(signal.symbol)
+            quantity = position.quantity
             
             commission = quantity * signal.price * 0.001
             proceeds = quantity * signal.price - commission
             
-            pnl = (signal.price - position['entry_price']) * quantity - commission
-            holding_days = (signal.timestamp - position['entry_date']).days
+            pnl = (signal.price - position.entry_price) * quantity - commission
+            holding_days = (signal.timestamp - position.entry_date).days
             
             self.capital += proceeds
             
-            trade_result.update({
-                'quantity': quantity,
-                'pnl': pnl,
-                'commission': commission,
-                'holding_days': holding_days
-            })
-            
-            # 记录阶段信号
-            self.stage_signals.append({
-                'date': signal.timestamp,
-                'symbol': signal.symbol,
-                'stage': position['stage'],
-                'action': 'SELL',
-                'price': signal.price,
-                'reason': signal.reason,
-                'pnl': pnl,
-                'holding_days': holding_days
-            })
-            
-            del self.positions[signal.symbol]
-        
-        return trade_result
+            self.trade_history.append(
+                signal.timestamp, signal.symbol, 'SELL', signal.price, quantity,
+                pnl=pnl, commission=commission, holding_days=holding_days,
+                stage=signal.stage, entry_stage=position.stage, reason=signal.reason,
+                confidence=signal.confidence, stop_loss=signal.stop_loss,
+                target_price=signal.target_price
+            )
+            return quantity
+        
+        return 0
     
     def calculate_portfolio_value(self, current_prices: Dict[str, float]) -> float:
         """计算当前组合价值"""
@@ -134,7 +122,7 @@ class StrongKBacktestEngine:
         
         for symbol, position in self.positions.items():
             if symbol in current_prices:
-                total_value += position['quantity'] * current_prices[symbol]
+                total_value += position.market_value(current_prices[symbol])
         
         return total_value
     
@@ -158,14 +146,17 @@ class StrongKBacktestEngine:
         filtered_signals = [s for s in all_signals 
                           if start_dt <= s.timestamp <= end_dt]
         
+        n = len(filtered_signals)
+        self.equity_dates = np.empty(n, dtype='datetime64[ns]')
+        self.equity_values = np.empty(n)
+        self.invested_values = np.empty(n)
+        
         # 执行回测
-        for signal in filtered_signals:
+        for i, signal in enumerate(filtered_signals):
             self.current_date = signal.timestamp
             
             # 执行交易
-            trade_result = self.execute_trade(signal)
-            if trade_result['quantity'] > 0:
-                self.trade_history.append(trade_result)
+            self.execute_trade(signal)
             
             # 记录组合价值
             current_prices = {symbol: data.loc[data.index <= signal.timestamp]['close'].iloc[-1] 
@@ -173,85 +164,63 @@ class StrongKBacktestEngine:
                             if len(data.loc[data.index <= signal.timestamp]) > 0}
             
             portfolio_value = self.calculate_portfolio_value(current_prices)
-            self.equity_curve.append({
-                'date': signal.timestamp,
-                'value': portfolio_value
-            })
+            self.equity_dates[i] = np.datetime64(pd.Timestamp(signal.timestamp))
+            self.equity_values[i] = portfolio_value
+            self.invested_values[i] = portfolio_value - self.capital
         
         # 计算回测结果
         return self.calculate_results()
     
     def calculate_results(self) -> StrongKBacktestResult:
         """计算强K策略回测结果"""
-        if not self.equity_curve:
-            return StrongKBacktestResult(0, 0, 0, 0, 0, 0, 0, 0, 0, {}, pd.Series(), [])
-        
-        equity_df = pd.DataFrame(self.equity_curve)
-        equity_df.set_index('date', inplace=True)
-        equity_series = equity_df['value']
-        
-        # 基本收益指标
-        total_return = (equity_series.iloc[-1] - self.strategy.initial_capital) / self.strategy.initial_capital
-        
-        # 年化收益率
-        days = (equity_series.index[-1] - equity_series.index[0]).days
-        if days > 0:
-            annualized_return = (equity_series.iloc[-1] / self.strategy.initial_capital) ** (365 / days) - 1
-        else:
-            annualized_return = 0
-        
-        # 最大回撤
-        rolling_max = equity_series.expanding().max()
-        drawdown = (equity_series - rolling_max) / rolling_max
-        max_drawdown = drawdown.min()
-        
-        # 夏普比率
-        returns = equity_series.pct_change().dropna()
-        if len(returns) > 1 and returns.std() > 0:
-            sharpe_ratio = returns.mean() / returns.std() * np.sqrt(252)
-        else:
-            sharpe_ratio = 0
-        
-        # 交易统计
-        winning_trades = [t for t in self.trade_history if t['pnl'] > 0]
-        losing_trades = [t for t in self.trade_history if t['pnl'] < 0]
+        if len(self.equity_values) == 0:
+            return StrongKBacktestResult(0, 0, 0, 0, 0, 0, 0, 0, 0, {}, pd.Series(dtype=float),
+                                         TradeLedger(stages=STAGES))
+        
+        ledger = self.trade_history
+        days = (self.equity_dates[-1] - self.equity_dates[0]) // np.timedelta64(1, 'D')
+        stats = compute_metrics(
+            self.equity_values,
+            self.strategy.initial_capital,
+            int(days) / 365,
+            invested=self.invested_values,
+            trade_pnl=ledger.column('pnl'),
+            trade_notional=ledger.notional
+        )
         
-        win_rate = len(winning_trades) / len(self.trade_history) if self.trade_history else 0
+        holding_days = ledger.column('holding_days')
+        held = holding_days[holding_days > 0]
+        avg_holding_days = float(held.mean()) if len(held) else 0.0
         
-        total_wins = sum(t['pnl'] for t in winning_trades)
-        total_losses = abs(sum(t['pnl'] for t in losing_trades))
-        profit_factor = total_wins / total_losses if total_losses > 0 else float('inf')
+        # 强K成功率
+        strong_k = ledger.mask(stage='strong_k')
+        strong_k_count = int(strong_k.sum())
+        strong_k_wins = int((ledger.column('pnl')[strong_k] > 0).sum())
+        strong_k_success_rate = strong_k_wins / strong_k_count if strong_k_count else 0
         
-        avg_trade_return = np.mean([t['pnl'] for t in self.trade_history]) if self.trade_history else 0
-        avg_holding_days = np.mean([t['holding_days'] for t in self.trade_history if t['holding_days'] > 0]) if self.trade_history else 0
+        # 阶段分布统计（按持仓阶段）
+        counts = ledger.group_stats('entry_stage')['trade_count']
+        stage_distribution = {ledger.stages.values[code]: int(count)
+                              for code, count in enumerate(counts) if count > 0}
         
-        # 强K成功率
-        strong_k_trades = [t for t in self.trade_history if t['stage'] == 'strong_k']
-        strong_k_wins = [t for t in strong_k_trades if t['pnl'] > 0]
-        strong_k_success_rate = len(strong_k_wins) / len(strong_k_trades) if strong_k_trades else 0
-        
-        # 阶段分布统计
-        stage_distribution = {}
-        for signal in self.stage_signals:
-            stage = signal['stage']
-            if stage not in stage_distribution:
-                stage_distribution[stage] = 0
-            stage_distribution[stage] += 1
+        equity_series = pd.Series(self.equity_values,
+                                  index=pd.DatetimeIndex(self.equity_dates, name='date'),
+                                  name='value')
         
         return StrongKBacktestResult(
-            total_return=total_return,
-            annualized_return=annualized_return,
-            max_drawdown=max_drawdown,
-            sharpe_ratio=sharpe_ratio,
-            win_rate=win_rate,
-            profit_factor=profit_factor,
-            total_trades=len(self.trade_history),
-            avg_trade_return=avg_trade_return,
+            total_return=stats['total_return'],
+            annualized_return=stats['annualized_return'],
+            max_drawdown=stats['max_drawdown'],
+            sharpe_ratio=stats['sharpe_ratio'],
+            win_rate=stats['win_rate'],
+            profit_factor=stats['profit_factor'],
+            total_trades=stats['total_trades'],
+            avg_trade_return=stats['avg_trade_return'],
             avg_holding_days=avg_holding_days,
             strong_k_success_rate=strong_k_success_rate,
             stage_distribution=stage_distribution,
             equity_curve=equity_series,
-            trade_history=self.trade_history
+            trade_history=ledger
         )
     
     def plot_results(self, result: StrongKBacktestResult, save_path: str = None):
@@ -281,7 +250,7 @@ class StrongKBacktestEngine:
         
         # 交易收益分布
         if result.trade_history:
-            returns = [t['pnl'] for t in result.trade_history]
+            returns = result.trade_history.column('pnl')
             axes[1, 1].hist(returns, bins=20, alpha=0.7, color='blue', edgecolor='black')
             axes[1, 1].set_title('单笔交易收益分布', fontsize=14, fontweight='bold')
             axes[1, 1].set_xlabel('收益金额')
@@ -290,7 +259,8 @@ class StrongKBacktestEngine:
         
         # 持仓天数分布
         if result.trade_history:
-            holding_days = [t['holding_days'] for t in result.trade_history if t['holding_days'] > 0]
+            holding_days = result.trade_history.column('holding_days')
+            holding_days = holding_days[holding_days > 0]
             axes[2, 0].hist(holding_days, bins=15, alpha=0.7, color='green', edgecolor='black')
             axes[2, 0].set_title('持仓天数分布', fontsize=14, fontweight='bold')
             axes[2, 0].set_xlabel('持仓天数')
@@ -332,27 +302,27 @@ class StrongKBacktestEngine:
             plt.show()
     
     def analyze_stage_performance(self) -> Dict:
-        """分析各阶段表现"""
-        stage_analysis = {}
+        """分析各阶段表现（按阶段编码一次性分组统计）"""
+        stats = self.trade_history.group_stats('stage')
+        count = stats['trade_count']
+        has_trades = count > 0
+        has_holding = stats['holding_count'] > 0
+        
+        win_rate = np.zeros(len(count))
+        avg_return = np.zeros(len(count))
+        avg_holding_days = np.zeros(len(count))
+        win_rate[has_trades] = stats['wins'][has_trades] / count[has_trades]
+        avg_return[has_trades] = stats['pnl_sum'][has_trades] / count[has_trades]
+        avg_holding_days[has_holding] = stats['holding_days_sum'][has_holding] / stats['holding_count'][has_holding]
         
-        for stage in ['bottom', 'accumulation', 'left_peak', 'volume_first', 'strong_k', 'rally']:
-            stage_trades = [t for t in self.trade_history if t['stage'] == stage]
-            
-            if stage_trades:
-                winning_trades = [t for t in stage_trades if t['pnl'] > 0]
-                stage_analysis[stage] = {
-                    'trade_count': len(stage_trades),
-                    'win_rate': len(winning_trades) / len(stage_trades),
-                    'avg_return': np.mean([t['pnl'] for t in stage_trades]),
-                    'avg_holding_days': np.mean([t['holding_days'] for t in stage_trades if t['holding_days'] > 0])
-                }
-            else:
-                stage_analysis[stage] = {
-                    'trade_count': 0,
-                    'win_rate': 0,
-                    'avg_return': 0,
-                    'avg_holding_days': 0
-                }
+        stage_analysis = {}
+        for code, stage in enumerate(STAGES):
+            stage_analysis[stage] = {
+                'trade_count': int(count[code]),
+                'win_rate': float(win_rate[code]),
+                'avg_return': float(avg_return[code]),
+                'avg_holding_days': float(avg_holding_days[code])
+            }
         
         return stage_analysis
 
@@ -0,0 +1,103 @@
+import asyncio
+import datetime as dt
+
+import pytest
+
+from app.services.data_service import DataService
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.services.market_data_provider import ADJUST_FACTOR_FIELDS, DAILY_FIELDS, MarketDataProvider
+
+CODE = "sh.600000"
+
+
+def bar(day, close, preclose):
+    values = dict(date=day, code=CODE, open=close, high=close, low=close, close=close, preclose=preclose,
+                  volume="1000", amount="10000", adjustflag="3", turn="1", tradestatus="1", pctChg="0",
+                  peTTM="1", pbMRQ="1", psTTM="1", pcfNcfTTM="1", isST="0")
+    return [str(values[name]) for name in DAILY_FIELDS.split(",")]
+
+
+class FakeProvider(MarketDataProvider):
+    """内存中的日线和复权因子，记录每次日线查询的区间"""
+
+    name = "fake"
+
+    def __init__(self):
+        self.bars = []
+        self.factors = []
+        self.daily_queries = []
+
+    def query_daily_k(self, stock_code, start_date, end_date):
+        self.daily_queries.append((start_date, end_date))
+        return "0", "", DAILY_FIELDS.split(","), [row for row in self.bars if start_date <= row[0] <= end_date]
+
+    def query_adjust_factor(self, stock_code, start_date, end_date):
+        return "0", "", ADJUST_FACTOR_FIELDS.split(","), self.factors
+
+    def query_trade_dates(self, start_date, end_date):
+        day, last, rows = dt.date.fromisoformat(start_date), dt.date.fromisoformat(end_date), []
+        while day <= last:
+            rows.append([day.isoformat(), "1" if day.weekday() < 5 else "0"])
+            day += dt.timedelta(days=1)
+        return "0", "", ["calendar_date", "is_trading_day"], rows
+
+
+def weekdays(start, count):
+    days = [start + dt.timedelta(days=i) for i in range(count * 2)]
+    return [day.isoformat() for day in days if day.weekday() < 5][:count]
+
+
+def test_legacy_bars_are_kept_and_continued(mongo):
+    provider = FakeProvider()
+    data_service = DataService(provider=provider)
+    legacy_days = weekdays(dt.date(2024, 1, 1), 30)
+    raw_days = weekdays(dt.date(2024, 2, 12), 5)
+    provider.bars = [bar(day, 10, 10) for day in raw_days]
+    provider.factors = [[CODE, "2023-06-01", "0.8", "1.25", "1.25"]]
+
+    async def run():
+        await mongo[f"stock_daily_{CODE}"].insert_many([
+            {"code": CODE, "date": dt.datetime.fromisoformat(day), "close": 10.0, "adjustflag": "2"}
+            for day in legacy_days
+        ])
+        return await IngestionPipeline(data_service).run([CODE])
+
+    summary = asyncio.run(run())
+    assert summary["completed"] == 1 and summary["failed"] == 0
+    # 只抓取旧数据之后的K线，不重新抓取全部历史
+    assert provider.daily_queries[0][0] == raw_days[0]
+
+    async def stored():
+        bars = await mongo[f"stock_daily_{CODE}"].find({}, {"_id": 0, "adjustflag": 1}).to_list(None)
+        factors = await mongo["adjust_factors"].count_documents({"code": CODE})
+        return [doc["adjustflag"] for doc in bars], factors
+
+    flags, factors = asyncio.run(stored())
+    assert flags == ["2"] * len(legacy_days) + ["3"] * len(raw_days)
+    assert factors == 1
+
+
+def test_ex_rights_rebases_stored_moving_averages(mongo):
+    provider = FakeProvider()
+    data_service = DataService(provider=provider)
+    days = weekdays(dt.date(2024, 1, 1), 30)
+    provider.bars = [bar(day, 20, 20) for day in days[:25]]
+
+    async def run(codes):
+        return await IngestionPipeline(data_service).run(codes)
+
+    asyncio.run(run([CODE]))
+
+    # 2024-02-05 每股送一股：不复权价格减半，后复权因子 1 -> 2
+    provider.bars += [bar(days[25], 10, 10)] + [bar(day, 10, 10) for day in days[26:]]
+    provider.factors = [[CODE, days[25], "0.5", "2.0", "2.0"]]
+    asyncio.run(run([CODE]))
+
+    async def ma5():
+        rows = await mongo[f"technical_{CODE}"].find({}, {"_id": 0, "date": 1, "ma5": 1}).sort("date", 1).to_list(None)
+        return {row["date"].strftime("%Y-%m-%d"): row.get("ma5") for row in rows}
+
+    values = asyncio.run(ma5())
+    # 除权前的均线按新的前复权基准（价格减半）重算
+    assert values[days[10]] == pytest.approx(10.0)
+    assert values[days[-1]] == pytest.approx(10.0)
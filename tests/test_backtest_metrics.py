@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import backtest_metrics as bm
+
+
+EQUITY = [100.0, 110.0, 99.0, 105.0, 120.0]
+
+
+def test_drawdown_and_duration():
+    assert bm.max_drawdown(EQUITY) == pytest.approx(99 / 110 - 1)
+    # 110 之后两期低于高点，120 创新高
+    assert bm.max_drawdown_duration(EQUITY) == 2
+    assert bm.max_drawdown([100.0, 101.0, 102.0]) == 0.0
+
+
+def test_ratios_match_pandas_definition():
+    returns = np.diff(EQUITY) / np.array(EQUITY[:-1])
+    expected = returns.mean() / returns.std(ddof=1) * np.sqrt(252)
+    assert bm.sharpe_ratio(EQUITY) == pytest.approx(expected)
+
+    downside = np.minimum(returns, 0.0)
+    expected = returns.mean() / np.sqrt((downside ** 2).mean()) * np.sqrt(252)
+    assert bm.sortino_ratio(EQUITY) == pytest.approx(expected)
+
+    assert bm.sharpe_ratio([100.0, 100.0, 100.0]) == 0.0
+
+
+def test_two_dimensional_input_matches_each_run():
+    curves = [EQUITY, [100.0, 95.0, 97.0], [100.0, 100.5, 101.0, 101.5]]
+    stacked = bm.stack_curves(curves)
+    assert stacked.shape == (3, 5)
+    assert np.isnan(stacked[1, 3:]).all()
+
+    for name in ("sharpe_ratio", "sortino_ratio", "max_drawdown", "max_drawdown_duration"):
+        batch = getattr(bm, name)(stacked)
+        single = [getattr(bm, name)(curve) for curve in curves]
+        np.testing.assert_allclose(batch, single, err_msg=name)
+
+    np.testing.assert_allclose(bm.last_valid(stacked), [120.0, 97.0, 101.5])
+    np.testing.assert_allclose(bm.total_return(stacked, 100.0), [0.2, -0.03, 0.015])
+
+
+def test_trade_statistics_grouped_by_run():
+    pnl = [10.0, -5.0, 3.0, -2.0, -1.0]
+    run_ids = [0, 0, 0, 1, 1]
+    stats = bm.trade_statistics(pnl, run_ids, n_runs=3)
+    np.testing.assert_allclose(stats["win_rate"], [2 / 3, 0.0, 0.0])
+    np.testing.assert_allclose(stats["profit_factor"], [13 / 5, 0.0, np.inf])
+    np.testing.assert_array_equal(stats["total_trades"], [3, 2, 0])
+
+    single = bm.trade_statistics(pnl[:3])
+    assert single["win_rate"] == pytest.approx(2 / 3)
+    assert single["avg_trade_return"] == pytest.approx(8 / 3)
+
+
+def test_rolling_sharpe_matches_window_recomputation():
+    rng = np.random.default_rng(7)
+    equity = 100 * np.cumprod(1 + rng.normal(0.001, 0.01, 80))
+    window = 20
+    rolling = bm.rolling_sharpe(equity, window=window)
+    returns = bm.simple_returns(equity)
+    assert rolling.shape == returns.shape
+    assert np.isnan(rolling[:window - 1]).all()
+    for end in (window, 50, len(returns)):
+        sample = returns[end - window:end]
+        expected = sample.mean() / sample.std(ddof=1) * np.sqrt(252)
+        assert rolling[end - 1] == pytest.approx(expected)
+
+
+def test_compute_metrics_single_run():
+    metrics = bm.compute_metrics(EQUITY, 100.0, 1.0, trade_pnl=[5.0, -1.0],
+                                 trade_notional=[1000.0, 1000.0])
+    assert metrics["total_return"] == pytest.approx(0.2)
+    assert metrics["annualized_return"] == pytest.approx(0.2)
+    assert metrics["calmar_ratio"] == pytest.approx(0.2 / abs(99 / 110 - 1))
+    assert metrics["turnover"] == pytest.approx(2000.0 / np.mean(EQUITY))
+    assert metrics["total_trades"] == 2
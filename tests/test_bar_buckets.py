@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime
+
+import pandas as pd
+
+from app.services import bar_buckets
+from app.services.bar_buckets import NUMERIC_FIELDS, MonthlyBarStore, bucket_bars, month_document, month_start
+from app.services.ingestion_pipeline import INT_FIELDS, daily_bar_documents
+
+
+def sample_bars():
+    frame = pd.DataFrame({
+        "date": ["2024-02-01", "2024-02-02", "2024-02-05", "2024-02-29"],
+        "code": "sh.600000",
+        "open": ["10.1", "10.3", "", "11.0"],
+        "high": ["10.5", "10.6", "10.9", "11.2"],
+        "low": ["9.9", "10.1", "10.2", "10.8"],
+        "close": ["10.2", "10.4", "10.8", "11.1"],
+        "preclose": ["10.0", "10.2", "10.4", "10.8"],
+        "volume": ["123456", "234567", "345678", "456789"],
+        "amount": ["1.2e6", "2.4e6", "3.7e6", "5.1e6"],
+        "adjustflag": ["3", "3", "3", "2"],
+        "turn": ["0.5", "0.6", "0.7", "0.8"],
+        "tradestatus": ["1", "1", "0", "1"],
+        "pctChg": ["2.0", "1.96", "3.85", "2.78"],
+        "peTTM": ["5.1", "5.2", "5.3", "5.4"],
+        "pbMRQ": ["0.6", "0.6", "0.6", "0.6"],
+        "psTTM": ["1.1", "1.1", "1.1", "1.1"],
+        "pcfNcfTTM": ["3.3", "3.3", "3.3", "3.3"],
+        "isST": ["0", "0", "0", "1"],
+    })
+    return daily_bar_documents("sh.600000", frame)
+
+
+def test_month_document_round_trip():
+    bars = sample_bars()
+    bucket = month_document("sh.600000", month_start(bars[0]["date"]), bars)
+    assert bucket["month"] == datetime(2024, 2, 1)
+    assert bucket["count"] == 4
+    assert set(bucket["columns"]) == set(NUMERIC_FIELDS)
+    assert len(bucket["days"]) == 4
+
+    restored = bucket_bars(bucket)
+    assert [bar["date"] for bar in restored] == [bar["date"] for bar in bars]
+    for original, bar in zip(bars, restored):
+        assert bar["code"] == "sh.600000"
+        assert bar["adjustflag"] == original["adjustflag"]
+        for name in NUMERIC_FIELDS:
+            # float64 按位保存，数值完全一致
+            assert bar[name] == original[name], name
+            assert isinstance(bar[name], int if name in INT_FIELDS else float)
+
+
+def test_missing_values_are_not_stored_as_zero():
+    bars = sample_bars()
+    # 文档中缺少的字段按 NaN 保存，展开后仍然缺少，而不是变成 0
+    del bars[1]["turn"]
+    bars[2]["open"] = None
+    restored = bucket_bars(month_document("sh.600000", datetime(2024, 2, 1), bars))
+    assert "turn" not in restored[1]
+    assert "open" not in restored[2]
+    assert restored[0]["turn"] == bars[0]["turn"]
+
+
+def test_unmark_from_another_process_expires_cached_completeness(mongo, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bar_buckets.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(MonthlyBarStore, "_complete", {})
+    store, other = MonthlyBarStore(mongo), MonthlyBarStore(mongo)
+
+    async def run():
+        await store.mark_complete("sh.600000", datetime(2024, 2, 1))
+        # 另一个进程的 unmark 只删除 Mongo 中的标记
+        await other.db[bar_buckets.STATUS_COLLECTION].delete_one({"code": "sh.600000"})
+        cached = await store.is_complete("sh.600000")
+        now[0] += bar_buckets.COMPLETE_CACHE_SECONDS
+        return cached, await store.is_complete("sh.600000")
+
+    assert asyncio.run(run()) == (True, False)
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.services.condition_compiler import IndicatorPanel, compile_conditions
+
+
+def docs(values, start=datetime(2024, 1, 1), **series):
+    """按日期升序生成技术指标文档，values 为 cci 序列，series 为其他字段"""
+    result = []
+    for i, value in enumerate(values):
+        doc = {"date": start + timedelta(days=i), "cci": value}
+        doc.update({name: column[i] for name, column in series.items()})
+        result.append(doc)
+    return result
+
+
+def latest_panel(history, fields):
+    """from_latest 需要按日期倒序的文档"""
+    depth = max(len(rows) for rows in history.values())
+    return IndicatorPanel.from_latest({code: rows[::-1] for code, rows in history.items()}, fields, depth)
+
+
+def test_comparison_on_latest_row():
+    history = {
+        "a": docs([50, 120]),
+        "b": docs([150, 90]),
+        "c": docs([130, None]),
+    }
+    compiled = compile_conditions([{"indicator": "CCI", "operator": ">", "value": 100}])
+    assert compiled.fields == ["cci"]
+    panel = latest_panel(history, compiled.fields)
+    # 缺失值不满足条件
+    np.testing.assert_array_equal(compiled.evaluate_latest(panel), [True, False, False])
+
+
+def test_days_ago_and_field_operand():
+    history = {
+        "a": docs([1, 2, 3], macd_signal=[0, 0, 5]),
+        "b": docs([1, 2, 3], macd_signal=[0, 5, 0]),
+    }
+    compiled = compile_conditions([
+        {"indicator": "macd", "operator": ">", "value": "macd_signal", "days_ago": 1},
+    ])
+    assert compiled.fields == ["macd_line", "macd_signal"]
+    assert compiled.depth == 2
+    for rows in history.values():
+        for row in rows:
+            row["macd_line"] = row["cci"]
+    panel = latest_panel(history, compiled.fields)
+    # 一天前：a 的 2 > 0，b 的 2 < 5
+    np.testing.assert_array_equal(compiled.evaluate_latest(panel), [True, False])
+
+
+def test_cross_operators():
+    history = {
+        "up": docs([90, 110]),
+        "down": docs([110, 90]),
+        "flat": docs([110, 120]),
+    }
+    above = compile_conditions([{"indicator": "cci", "operator": "cross_above", "value": 100}])
+    below = compile_conditions([{"indicator": "cci", "operator": "cross_below", "value": 100}])
+    assert above.depth == 2
+    panel = latest_panel(history, above.fields)
+    np.testing.assert_array_equal(above.evaluate_latest(panel), [True, False, False])
+    np.testing.assert_array_equal(below.evaluate_latest(panel), [False, True, False])
+
+
+def test_conditions_are_combined_with_and():
+    history = {
+        "a": docs([120], rsi=[25]),
+        "b": docs([120], rsi=[60]),
+    }
+    compiled = compile_conditions([
+        {"indicator": "cci", "operator": ">=", "value": 100},
+        {"indicator": "rsi", "operator": "<", "value": "30"},
+    ])
+    panel = latest_panel(history, compiled.fields)
+    np.testing.assert_array_equal(compiled.evaluate_latest(panel), [True, False])
+    assert compiled.describe(panel, 0, 0) == [
+        {"date": datetime(2024, 1, 1), "value": 120.0},
+        {"date": datetime(2024, 1, 1), "value": 25.0},
+    ]
+
+
+def test_history_panel_aligns_by_date():
+    history = {
+        "a": docs([90, 110, 130]),
+        "b": docs([120, 80], start=datetime(2024, 1, 2)),
+    }
+    compiled = compile_conditions([{"indicator": "cci", "operator": ">", "value": 100}])
+    panel = IndicatorPanel.from_history(history, compiled.fields)
+    assert list(panel.calendar) == [np.datetime64(datetime(2024, 1, d)) for d in (1, 2, 3)]
+    np.testing.assert_array_equal(compiled.evaluate(panel), [
+        [False, False],
+        [True, True],
+        [True, False],
+    ])
+    assert np.isnat(panel.dates[0, 1])
+
+
+def test_empty_and_invalid_conditions():
+    panel = latest_panel({"a": docs([120])}, ["cci"])
+    assert not compile_conditions([]).evaluate_latest(panel).any()
+    with pytest.raises(ValueError):
+        compile_conditions([{"indicator": "cci", "operator": "between", "value": 1}])
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+
+from app.services.gap_scanner import missing_ranges
+
+
+def weekdays(start, count):
+    days = [start + timedelta(days=i) for i in range(count)]
+    return [day for day in days if day.weekday() < 5]
+
+
+def test_missing_ranges_between_first_and_last_bar():
+    calendar = weekdays(datetime(2024, 1, 1), 31)
+    stored = [day for day in calendar if day.day not in (3, 4, 5, 8, 17)]
+    assert missing_ranges(stored, calendar) == [
+        ("2024-01-03", "2024-01-08"),  # 跨周末的连续缺口合并为一个区间
+        ("2024-01-17", "2024-01-17"),
+    ]
+
+
+def test_missing_ranges_ignores_edges_and_skipped():
+    calendar = weekdays(datetime(2024, 1, 1), 31)
+    stored = [day for day in calendar if datetime(2024, 1, 3) <= day <= datetime(2024, 1, 24)
+              and day.day not in (10, 11, 22)]
+    skipped = [(datetime(2024, 1, 9), datetime(2024, 1, 12))]
+    # 首尾之外的交易日不算缺口，已确认没有数据的区间不再报告
+    assert missing_ranges(stored, calendar, skipped) == [("2024-01-22", "2024-01-22")]
+    assert missing_ranges(stored[:1], calendar) == []
+    assert missing_ranges(calendar, calendar) == []
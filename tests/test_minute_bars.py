@@ -0,0 +1,43 @@
+import math
+
+import pandas as pd
+import pytest
+
+from app.services.minute_bars import daily_rollup, minute_bucket_documents
+
+
+def minute_frame(rows):
+    frame = pd.DataFrame(rows, columns=["date", "time", "open", "high", "low", "close", "volume", "amount"])
+    frame["code"] = "sh.600000"
+    frame["adjustflag"] = "3"
+    return frame
+
+
+def test_incomplete_rows_are_dropped_not_zeroed():
+    frame = minute_frame([
+        ["2024-03-01", "20240301093500000", "10.0", "10.2", "9.9", "10.1", "1000", "10100"],
+        ["2024-03-01", "20240301094000000", "10.1", "10.3", "", "10.2", "800", "8160"],
+        ["2024-03-01", "20240301094500000", "10.2", "10.4", "10.0", "10.3", "900", "9270"],
+        ["2024-03-01", "", "10.3", "10.5", "10.1", "10.4", "700", "7280"],
+    ])
+    [bucket] = minute_bucket_documents("sh.600000", 5, frame)
+    assert bucket["time"] == [935, 945]
+    assert bucket["count"] == 2
+    assert 0.0 not in bucket["low"]
+    assert bucket["day"] == {"open": 10.0, "high": 10.4, "low": 9.9, "close": 10.3,
+                             "volume": 1900.0, "amount": 19370.0}
+
+
+def test_rollup_ignores_missing_values():
+    nan = math.nan
+    bucket = {"open": [nan, 10.1], "high": [10.2, nan], "low": [nan, 9.8], "close": [10.0, nan],
+              "volume": [100.0, nan], "amount": [nan, 200.0]}
+    assert daily_rollup(bucket) == {"open": 10.1, "high": 10.2, "low": 9.8, "close": 10.0,
+                                    "volume": 100.0, "amount": 200.0}
+
+
+def test_rollup_without_prices():
+    bucket = {name: [math.nan] for name in ("open", "high", "low", "close", "volume", "amount")}
+    day = daily_rollup(bucket)
+    assert day["low"] is None and day["high"] is None
+    assert day["volume"] == pytest.approx(0.0)
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.price_adjust import (RAW_FLAG, adjust_bars, adjust_frame, date_multipliers, ex_rights_detected,
+                                    latest_back_factor)
+
+# 2024-01-03 每股送一股（后复权因子 1 -> 2），2024-01-05 再次除权（2 -> 2.5）
+FACTORS = [
+    {"date": datetime(2024, 1, 3), "back_factor": 2.0},
+    {"date": datetime(2024, 1, 5), "back_factor": 2.5},
+]
+
+
+def raw_bar(day, close, flag=RAW_FLAG):
+    return {"date": datetime(2024, 1, day), "open": close, "high": close, "low": close,
+            "close": close, "preclose": close, "volume": 100.0, "adjustflag": flag}
+
+
+def test_multipliers_use_the_latest_factor_as_basis():
+    dates = [datetime(2024, 1, day) for day in (2, 3, 4, 5, 8)]
+    np.testing.assert_allclose(date_multipliers(dates, FACTORS), [0.4, 0.8, 0.8, 1.0, 1.0])
+    np.testing.assert_allclose(date_multipliers(dates, []), np.ones(5))
+    assert latest_back_factor(FACTORS) == 2.5
+    assert latest_back_factor([]) == 1.0
+
+
+def test_adjust_bars_only_touches_raw_price_fields():
+    bars = [raw_bar(2, 20.0), raw_bar(3, 10.0), raw_bar(5, 8.0), raw_bar(2, 7.0, flag="2")]
+    adjust_bars(bars, FACTORS)
+    assert [bar["close"] for bar in bars] == pytest.approx([8.0, 8.0, 8.0, 7.0])
+    assert bars[0]["high"] == pytest.approx(8.0)
+    # 成交量不复权，已前复权的旧数据保持原值
+    assert bars[0]["volume"] == 100.0
+    assert bars[3]["open"] == 7.0
+
+
+def test_adjust_frame_matches_adjust_bars():
+    bars = [raw_bar(day, close) for day, close in ((2, 20.0), (3, 10.0), (4, 10.5), (5, 8.4))]
+    frame = pd.DataFrame([{**bar, "date": bar["date"].strftime("%Y-%m-%d"), "close": str(bar["close"])}
+                          for bar in bars])
+    adjusted = adjust_frame(frame, FACTORS)
+    expected = [bar["close"] for bar in adjust_bars([dict(bar) for bar in bars], FACTORS)]
+    np.testing.assert_allclose(adjusted["close"], expected)
+    # 原 DataFrame 不被修改
+    assert frame["close"].iloc[0] == "20.0"
+    assert adjust_frame(frame, []) is frame
+
+
+def test_ex_rights_detection():
+    frame = pd.DataFrame({"close": ["10", "10.2", "5.2"], "preclose": ["9.9", "10", "5.1"]})
+    assert ex_rights_detected(frame, previous_close=9.9)
+    continuous = pd.DataFrame({"close": ["10", "10.2"], "preclose": ["9.9", "10"]})
+    assert not ex_rights_detected(continuous, previous_close=9.9)
+    # 第一根K线的昨收与库中最后一个收盘价不一致
+    assert ex_rights_detected(continuous, previous_close=19.8)
+    assert not ex_rights_detected(pd.DataFrame(), previous_close=1.0)
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.utils import rate_limit
+from app.utils.rate_limit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, TokenBucket, UpstreamGuard
+
+
+class FakeClock:
+    """替换 time.monotonic 和 asyncio.sleep，sleep 只推进时间不真正等待"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limit.asyncio, "sleep", fake.sleep)
+    return fake
+
+
+def test_token_bucket_allows_burst_then_paces(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    asyncio.run(take(3))
+    assert clock.sleeps == []
+
+    asyncio.run(take(2))
+    # 令牌用完后每个令牌等待 1 / rate 秒
+    assert clock.sleeps == pytest.approx([0.5, 0.5])
+
+    clock.now += 10
+    clock.sleeps.clear()
+    asyncio.run(take(3))
+    # 空闲期间最多积累 capacity 个令牌
+    assert clock.sleeps == []
+
+
+def test_token_bucket_unlimited(clock):
+    bucket = TokenBucket(rate=0)
+    asyncio.run(bucket.acquire(100))
+    assert clock.sleeps == []
+
+
+def test_circuit_breaker_opens_and_probes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow() == 0
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.allow() == pytest.approx(30)
+
+    clock.now += 30
+    # 冷却结束后只放行一个探测请求
+    assert breaker.allow() == 0
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() == rate_limit.PROBE_POLL_SECONDS
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now += 30
+    assert breaker.allow() == 0
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_guard_counts_failed_results_and_fails_fast(clock):
+    guard = UpstreamGuard("test", qps=0, failure_threshold=1, reset_timeout=60)
+
+    async def run():
+        result = await guard.call(lambda: ("1", "error"), is_failure=lambda r: r[0] != "0")
+        assert result == ("1", "error")
+        assert guard.breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            await guard.call(lambda: ("0", ""), wait=False)
+
+        # wait=True 时等到半开后发送探测请求，成功则恢复
+        assert await guard.call(lambda: ("0", "")) == ("0", "")
+        assert guard.breaker.state == CLOSED
+
+    asyncio.run(run())
+    assert clock.sleeps == pytest.approx([60])
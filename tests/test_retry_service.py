@@ -0,0 +1,33 @@
+from app.services.retry_service import coalesce_ranges, group_daily_requests
+
+
+def test_coalesce_overlapping_and_adjacent_ranges():
+    ranges = [
+        ("2024-03-01", "2024-03-10"),
+        ("2024-01-01", "2024-01-31"),
+        ("2024-02-01", "2024-02-05"),  # 与 1 月相邻
+        ("2024-03-05", "2024-03-08"),  # 被包含
+        ("2024-03-12", "2024-03-15"),
+    ]
+    assert coalesce_ranges(ranges) == [
+        ("2024-01-01", "2024-02-05"),
+        ("2024-03-01", "2024-03-10"),
+        ("2024-03-12", "2024-03-15"),
+    ]
+    assert coalesce_ranges([]) == []
+
+
+def test_group_daily_requests_merges_per_stock():
+    requests = [
+        {"_id": 1, "parameters": {"code": "sh.600000", "start_date": "2024-01-01", "end_date": "2024-01-10"},
+         "retry_count": 1},
+        {"_id": 2, "parameters": {"code": "sh.600000", "start_date": "2024-01-05", "end_date": None},
+         "retry_count": 3},
+        {"_id": 3, "parameters": {"code": "sz.000001", "start_date": "2024-02-01", "end_date": "2024-01-01"}},
+        {"_id": 4, "parameters": {}},
+    ]
+    groups = group_daily_requests(requests, "2024-01-20")
+    assert groups["sh.600000"] == {"ids": [1, 2], "retry_count": 3, "ranges": [("2024-01-01", "2024-01-20")]}
+    # 结束日期早于开始日期时按单日处理
+    assert groups["sz.000001"]["ranges"] == [("2024-02-01", "2024-02-01")]
+    assert set(groups) == {"sh.600000", "sz.000001"}
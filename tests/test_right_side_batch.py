@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.strategy_screener import evaluate_right_side_batch, right_side_params
+
+
+def per_stock_loop(params, historical_data, tech_data_list):
+    """向量化之前逐日检查的实现，作为对照"""
+    p = right_side_params(params)
+    ma_periods = p['ma_periods']
+    days_range = p['days_range']
+    if not historical_data or len(historical_data) < max(ma_periods) + 2:
+        return False
+
+    df = pd.DataFrame(historical_data)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values('date').reset_index(drop=True)
+    for period in ma_periods:
+        df[f'ma{period}'] = df['close'].rolling(window=period).mean()
+    avg_volume = df['volume'].rolling(window=10).mean()
+    tech = {pd.Timestamp(item['date']).strftime('%Y-%m-%d'): item for item in tech_data_list}
+
+    matching_dates = []
+    for i in range(len(df) - 1, max(-1, len(df) - days_range - 2), -1):
+        if i == 0:
+            continue
+        current, previous = df.iloc[i], df.iloc[i - 1]
+        current_key = current['date'].strftime('%Y-%m-%d')
+        previous_key = previous['date'].strftime('%Y-%m-%d')
+        if current_key not in tech or previous_key not in tech:
+            continue
+        current_cci, previous_cci = tech[current_key].get('cci'), tech[previous_key].get('cci')
+        if current_cci is None or previous_cci is None:
+            continue
+
+        ok = True
+        if p['enable_price_breakout']:
+            if p['breakout_threshold'] == 0:
+                ok &= current['close'] > df['high'].iloc[max(0, i - 5):i].max()
+            else:
+                ok &= current['close'] > p['breakout_threshold']
+        if p['enable_volume_check']:
+            avg_vol = avg_volume.iloc[i] if not pd.isna(avg_volume.iloc[i]) else avg_volume.dropna().iloc[-1]
+            ok &= current['volume'] > avg_vol * p['volume_threshold']
+        if p['enable_cci_check']:
+            ok &= previous_cci <= p['cci_threshold'] < current_cci
+        if p['enable_ma_alignment'] and len(ma_periods) >= 2:
+            values = [current[f'ma{period}'] for period in ma_periods if not pd.isna(current[f'ma{period}'])]
+            if len(values) >= 2:
+                ok &= all(values[k] >= values[k + 1] for k in range(len(values) - 1))
+        if ok:
+            matching_dates.append({'date': current_key, 'price': float(current['close']), 'cci': current_cci})
+
+    if not matching_dates:
+        return False
+    return {'matched': True, 'matching_dates': matching_dates, 'latest_match': matching_dates[0]}
+
+
+def random_stock(rng, length):
+    """按日期倒序的K线，部分日期缺少技术指标"""
+    start = datetime(2024, 1, 1)
+    close = 10 * np.cumprod(1 + rng.normal(0, 0.03, length))
+    bars, tech = [], []
+    for i in range(length):
+        date = start + timedelta(days=i)
+        bar = {
+            'date': date,
+            'close': float(close[i]),
+            'high': float(close[i] * (1 + rng.uniform(0, 0.02))),
+            'volume': float(rng.uniform(1e5, 4e5)),
+        }
+        bars.append(bar)
+        if rng.random() > 0.1:
+            tech.append({'date': date, 'cci': float(rng.uniform(-200, 50))})
+    return bars[::-1], tech[::-1]
+
+
+@pytest.mark.parametrize('params', [
+    None,
+    {'volume_threshold': 1.0, 'cci_threshold': -80, 'days_range': 40},
+    {'enable_volume_check': False, 'enable_ma_alignment': False, 'ma_periods': [5, 10]},
+    {'breakout_threshold': 10.5, 'enable_cci_check': False},
+])
+def test_batch_matches_per_stock_loop(params):
+    rng = np.random.default_rng(2024)
+    stocks = {f'sh.6{n:05d}': random_stock(rng, int(rng.integers(15, 90))) for n in range(40)}
+
+    rows_by_code = {}
+    for code, (bars, tech) in stocks.items():
+        by_date = {doc['date']: doc for doc in tech}
+        rows_by_code[code] = [dict(bar, technical=by_date.get(bar['date'])) for bar in bars]
+    batch = evaluate_right_side_batch(params, rows_by_code)
+
+    matched = 0
+    for code, (bars, tech) in stocks.items():
+        expected = per_stock_loop(params, bars, tech)
+        assert batch[code] == expected, code
+        matched += expected is not False
+    assert matched > 0
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.services import snapshot_service
+from app.services.mongodb_service import MongoDBService
+from app.services.snapshot_service import SNAPSHOT_COLLECTION, SnapshotService
+from app.services.strategy_screener import StrategyScreener
+
+SNAPSHOTS = [
+    {"code": "sh.600000", "market": "sh", "industry": "银行", "close": 10.2, "cci": 120.0,
+     "indicator_date": datetime(2024, 3, 1)},
+    {"code": "sh.600004", "market": "sh", "industry": "机场", "close": 15.0, "cci": None,
+     "indicator_date": datetime(2024, 3, 1)},
+    {"code": "sz.000001", "market": "sz", "industry": "银行", "close": 11.8, "cci": 80.0,
+     "indicator_date": datetime(2024, 3, 1)},
+]
+
+
+@pytest.fixture
+def snapshots(mongo, monkeypatch):
+    monkeypatch.setattr(SnapshotService, "_cache", {})
+    monkeypatch.setattr(SnapshotService, "_cache_loaded_at", None)
+    asyncio.run(mongo[SNAPSHOT_COLLECTION].insert_many([dict(doc) for doc in SNAPSHOTS]))
+    return mongo
+
+
+@pytest.mark.parametrize("query", [
+    {},
+    {"market": "sh"},
+    {"close": {"$gte": 10.5, "$lte": 15.0}},
+    {"cci": {"$gte": 100}},
+    {"industry": {"$regex": "银", "$options": "i"}, "close": {"$lte": 11}},
+])
+def test_filter_in_memory_matches_database(snapshots, query):
+    async def run():
+        in_memory = await SnapshotService().filter(query)
+        stored = await snapshots[SNAPSHOT_COLLECTION].find(query, {"_id": 0}).sort("code", 1).to_list(None)
+        return in_memory, stored
+
+    in_memory, stored = asyncio.run(run())
+    assert [doc["code"] for doc in in_memory] == [doc["code"] for doc in stored]
+
+
+def test_lookups_use_the_cache_after_loading(snapshots, monkeypatch):
+    service = SnapshotService()
+
+    async def run():
+        await service.load_cache()
+        # 加载后不再访问数据库；save 同步更新副本
+        monkeypatch.setattr(service.mongo_service, "find", None)
+        await service.save([{**SNAPSHOTS[0], "close": 10.5}])
+        return await service.get("sh.600000"), await service.filter({"close": {"$gte": 10.5}}, limit=1)
+
+    snapshot, filtered = asyncio.run(run())
+    assert snapshot["close"] == 10.5
+    assert [doc["code"] for doc in filtered] == ["sh.600000"]
+
+
+def test_cache_reloads_after_it_expires(snapshots, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(snapshot_service.time, "monotonic", lambda: now[0])
+
+    async def run():
+        service = SnapshotService()
+        await service.load_cache()
+        # 其他进程写入的快照
+        await snapshots[SNAPSHOT_COLLECTION].update_one({"code": "sz.000001"}, {"$set": {"close": 12.0}})
+        cached = (await service.get("sz.000001"))["close"]
+        now[0] += snapshot_service.CACHE_SECONDS
+        return cached, (await service.get("sz.000001"))["close"]
+
+    assert asyncio.run(run()) == (11.8, 12.0)
+
+
+def test_screener_reads_latest_indicators_from_snapshots(snapshots):
+    strategy = {"_id": "s1", "name": "CCI", "operation": "buy",
+                "conditions": [{"indicator": "CCI", "operator": ">", "value": 100}]}
+    stocks = [{"code": doc["code"], "code_name": doc["code"]} for doc in SNAPSHOTS]
+
+    # 没有任何技术指标集合，命中只能来自快照
+    result = asyncio.run(StrategyScreener(MongoDBService()).run([strategy], stocks))
+    assert [item["stock_code"] for item in result["results"]] == ["sh.600000"]
+    assert result["collection_items"][0]["meet_date"] == "2024-03-01"
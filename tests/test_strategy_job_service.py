@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from app.services import strategy_job_service
+from app.services.strategy_job_service import (COMPLETED, ERROR, JOBS_COLLECTION, RESULTS_COLLECTION,
+                                               StrategyJobService)
+
+CODES = ["sh.600000", "sh.600004", "sz.000001"]
+
+
+class FlakyCollection:
+    """第 failing 次（从 1 开始）调用 method 时抛出 PyMongoError，其余调用交给真实集合"""
+
+    def __init__(self, collection, method, failing):
+        self.collection = collection
+        self.method = method
+        self.failing = failing
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if name != self.method:
+            return attribute
+
+        async def call(*args, **kwargs):
+            self.calls += 1
+            if self.calls in self.failing:
+                raise PyMongoError("write failed")
+            return await attribute(*args, **kwargs)
+        return call
+
+
+class FlakyDb:
+    def __init__(self, db, flaky):
+        self.db = db
+        self.flaky = flaky
+
+    def __getitem__(self, name):
+        return self.flaky.get(name) or self.db[name]
+
+
+class FakeExecutor:
+    """每只股票立即产生一条结果，结果之间让出事件循环给心跳"""
+
+    def __init__(self, mongo_service):
+        pass
+
+    async def run(self, job_id, strategies, stock_codes, days_range, is_cancelled, on_result, trace_options):
+        for position, code in enumerate(stock_codes):
+            await asyncio.sleep(0.02)
+            await on_result(position, {"stock_code": code, "signals": [], "status": "success"})
+
+
+def run_job(mongo, monkeypatch, flaky, flush_size=1):
+    monkeypatch.setattr(strategy_job_service, "StrategyExecutor", FakeExecutor)
+    service = StrategyJobService()
+    service.db = FlakyDb(mongo, flaky)
+    service.flush_size = flush_size
+    service.heartbeat_seconds = 0.01
+
+    async def run():
+        job_id = await service.create_job("right_side", CODES, 30, {})
+        await StrategyJobService._running[job_id]
+        job = await mongo[JOBS_COLLECTION].find_one({"job_id": job_id})
+        stored = await mongo[RESULTS_COLLECTION].distinct("stock_code", {"job_id": job_id})
+        return job, stored
+
+    return asyncio.run(run())
+
+
+def test_failed_checkpoint_write_is_retried(mongo, monkeypatch):
+    results = FlakyCollection(mongo[RESULTS_COLLECTION], "bulk_write", failing={1})
+    job, stored = run_job(mongo, monkeypatch, {RESULTS_COLLECTION: results})
+    assert job["status"] == COMPLETED
+    assert sorted(stored) == CODES
+    assert job["processed"] == len(CODES)
+
+
+def test_job_fails_when_checkpoints_cannot_be_written(mongo, monkeypatch):
+    results = FlakyCollection(mongo[RESULTS_COLLECTION], "bulk_write", failing=range(1, 100))
+    job, stored = run_job(mongo, monkeypatch, {RESULTS_COLLECTION: results}, flush_size=100)
+    assert job["status"] == ERROR
+    assert stored == []
+
+
+def test_heartbeat_survives_lease_renewal_errors(mongo, monkeypatch):
+    # 第一次调用是获取租约，之后两次心跳续租失败
+    jobs = FlakyCollection(mongo[JOBS_COLLECTION], "find_one_and_update", failing={2, 3})
+    job, stored = run_job(mongo, monkeypatch, {JOBS_COLLECTION: jobs}, flush_size=100)
+    assert job["status"] == COMPLETED
+    assert sorted(stored) == CODES
+    # 续租失败后心跳仍在继续
+    assert jobs.calls > 3
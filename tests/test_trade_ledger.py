@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from trade_ledger import TradeLedger
+
+
+def make_ledger() -> TradeLedger:
+    ledger = TradeLedger(capacity=2, stages=("breakout", "pullback"))
+    ledger.append("2024-01-02", "sh.600000", "BUY", 10.0, 100, stage="breakout", reason="signal")
+    ledger.append("2024-01-05", "sh.600000", "SELL", 11.0, 100, pnl=100.0, holding_days=3,
+                  stage="pullback", entry_stage="breakout", reason="target")
+    ledger.append("2024-01-08", "sz.000001", "BUY", 20.0, 50)
+    ledger.append("2024-01-10", "sz.000001", "SELL", 19.0, 50, pnl=-50.0, holding_days=2)
+    return ledger
+
+
+def test_grows_and_returns_dict_rows():
+    ledger = make_ledger()
+    assert len(ledger) == 4
+    row = ledger[1]
+    assert row["date"] == pd.Timestamp("2024-01-05")
+    assert row["symbol"] == "sh.600000"
+    assert row["action"] == "SELL"
+    assert row["stage"] == "pullback"
+    assert row["entry_stage"] == "breakout"
+    assert row["reason"] == "target"
+    assert ledger[-1]["stage"] is None
+    assert [r["symbol"] for r in ledger[2:]] == ["sz.000001", "sz.000001"]
+
+
+def test_to_frame_decodes_categories():
+    frame = make_ledger().to_frame()
+    assert list(frame["stage"]) == ["breakout", "pullback", None, None]
+    assert list(frame["action"]) == ["BUY", "SELL", "BUY", "SELL"]
+    np.testing.assert_allclose(make_ledger().notional, [1000.0, 1100.0, 1000.0, 950.0])
+
+
+def test_mask_by_action_and_stage():
+    ledger = make_ledger()
+    np.testing.assert_array_equal(ledger.mask(action="SELL"), [False, True, False, True])
+    np.testing.assert_array_equal(ledger.mask(stage="breakout"), [True, False, False, False])
+    np.testing.assert_array_equal(ledger.mask(action="SELL", entry_stage="breakout"),
+                                  [False, True, False, False])
+
+
+def test_mask_for_unknown_stage_is_empty():
+    # 未登记的阶段不能匹配到“无阶段”的成交
+    ledger = make_ledger()
+    assert not ledger.mask(stage="unknown").any()
+    assert not ledger.mask(entry_stage="unknown").any()
+
+
+def test_group_stats_by_stage():
+    stats = make_ledger().group_stats("entry_stage")
+    np.testing.assert_array_equal(stats["trade_count"], [2, 0])
+    np.testing.assert_allclose(stats["pnl_sum"], [100.0, 0.0])
+    np.testing.assert_allclose(stats["holding_count"], [1, 0])
@@ -0,0 +1,246 @@
+"""紧凑的成交记录与持仓结构
+
+回测引擎原先用字典列表保存成交记录、用字典保存持仓，参数优化时上百万笔交易会占用
+大量内存，按阶段统计也需要反复遍历列表。TradeLedger 用 NumPy 结构化数组按列保存
+成交记录（股票代码、阶段、原因等字符串编码为整数），容量按倍数增长；同时实现序列
+接口，按下标或迭代访问时仍返回与原来相同键名的字典，原有调用方式不受影响。
+"""
+
+import numpy as np
+import pandas as pd
+from collections.abc import Sequence
+from typing import Dict, List, Optional
+
+ACTIONS = ('BUY', 'SELL')
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+TRADE_DTYPE = np.dtype([
+    ('symbol_id', np.int32),
+    ('date', np.int64),          # 纳秒时间戳
+    ('action', np.int8),         # ACTIONS 下标
+    ('price', np.float64),
+    ('quantity', np.int64),
+    ('pnl', np.float64),
+    ('commission', np.float64),
+    ('holding_days', np.int32),
+    ('stage', np.int16),         # 信号阶段编码，-1 表示无
+    ('entry_stage', np.int16),   # 持仓建立时的阶段编码，-1 表示无
+    ('reason_id', np.int32),     # -1 表示无
+    ('confidence', np.float64),
+    ('stop_loss', np.float64),
+    ('target_price', np.float64)
+])
+
+class Categories:
+    """字符串与整数编码的双向映射，重复出现的字符串只保存一份"""
+
+    __slots__ = ('values', '_codes')
+
+    def __init__(self, values=()):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: Optional[str]) -> int:
+        """返回字符串的编码，首次出现时分配新编码；None 编码为 -1"""
+        if value is None:
+            return -1
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> int:
+        """查询已有编码，不存在时返回 -1（不分配新编码）"""
+        return self._codes.get(value, -1)
+
+    def decode(self, code: int) -> Optional[str]:
+        return self.values[code] if code >= 0 else None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+class OpenPosition:
+    """单个持仓，使用 __slots__ 代替字典"""
+
+    __slots__ = ('symbol', 'quantity', 'entry_price', 'entry_date',
+                 'stop_loss', 'target_price', 'stage', 'highest_price')
+
+    def __init__(self, symbol: str, quantity: int, entry_price: float, entry_date,
+                 stop_loss: float = np.nan, target_price: float = np.nan,
+                 stage: Optional[str] = None, highest_price: Optional[float] = None):
+        self.symbol = symbol
+        self.quantity = quantity
+        self.entry_price = entry_price
+        self.entry_date = entry_date
+        self.stop_loss = stop_loss
+        self.target_price = target_price
+        self.stage = stage
+        self.highest_price = entry_price if highest_price is None else highest_price
+
+    def market_value(self, price: float) -> float:
+        return self.quantity * price
+
+class TradeLedger(Sequence):
+    """按列存储的成交记录
+
+    Args:
+        capacity: 初始容量，写满后按两倍扩容
+        stages: 预先登记的阶段名称，保证编码顺序稳定
+    """
+
+    def __init__(self, capacity: int = 64, stages=()):
+        self._data = np.zeros(max(capacity, 1), dtype=TRADE_DTYPE)
+        self._size = 0
+        self.symbols = Categories()
+        self.stages = Categories(stages)
+        self.reasons = Categories()
+
+    def _grow(self):
+        data = np.zeros(len(self._data) * 2, dtype=TRADE_DTYPE)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def append(self, date, symbol: str, action: str, price: float, quantity: int,
+               pnl: float = 0.0, commission: float = 0.0, holding_days: int = 0,
+               stage: Optional[str] = None, entry_stage: Optional[str] = None,
+               reason: Optional[str] = None, confidence: float = np.nan,
+               stop_loss: Optional[float] = None, target_price: Optional[float] = None):
+        """追加一笔成交"""
+        if self._size == len(self._data):
+            self._grow()
+        self._data[self._size] = (
+            self.symbols.code(symbol),
+            pd.Timestamp(date).value,
+            ACTION_CODES[action],
+            price,
+            quantity,
+            pnl,
+            commission,
+            holding_days,
+            self.stages.code(stage),
+            self.stages.code(entry_stage if entry_stage is not None else stage),
+            self.reasons.code(reason),
+            confidence,
+            np.nan if stop_loss is None else stop_loss,
+            np.nan if target_price is None else target_price
+        )
+        self._size += 1
+
+    @property
+    def records(self) -> np.ndarray:
+        """已写入部分的结构化数组视图（不复制）"""
+        return self._data[:self._size]
+
+    def column(self, name: str) -> np.ndarray:
+        return self._data[name][:self._size]
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.column('date'))
+
+    @property
+    def notional(self) -> np.ndarray:
+        """每笔成交金额"""
+        return self.column('price') * self.column('quantity')
+
+    def mask(self, action: Optional[str] = None, stage: Optional[str] = None,
+             entry_stage: Optional[str] = None) -> np.ndarray:
+        """按动作/阶段筛选的布尔掩码"""
+        result = np.ones(self._size, dtype=bool)
+        if action is not None:
+            result &= self.column('action') == ACTION_CODES[action]
+        # 未出现过的阶段查到 -1，与“无阶段”的编码相同，直接返回全 False
+        for name, value in (('stage', stage), ('entry_stage', entry_stage)):
+            if value is None:
+                continue
+            code = self.stages.lookup(value)
+            if code < 0:
+                return np.zeros(self._size, dtype=bool)
+            result &= self.column(name) == code
+        return result
+
+    def group_stats(self, key: str = 'stage') -> Dict[str, np.ndarray]:
+        """按编码列（stage / entry_stage / symbol_id）分组汇总，结果下标即编码
+
+        Returns:
+            trade_count, wins, pnl_sum, holding_days_sum, holding_count 各为一维数组
+        """
+        codes = self.column(key).astype(np.int64)
+        valid = codes >= 0
+        codes = codes[valid]
+        categories = self.symbols if key == 'symbol_id' else self.stages
+        size = len(categories)
+        pnl = self.column('pnl')[valid]
+        holding = self.column('holding_days')[valid]
+        held = holding > 0
+        return {
+            'trade_count': np.bincount(codes, minlength=size),
+            'wins': np.bincount(codes, weights=pnl > 0, minlength=size),
+            'pnl_sum': np.bincount(codes, weights=pnl, minlength=size),
+            'holding_days_sum': np.bincount(codes, weights=np.where(held, holding, 0), minlength=size),
+            'holding_count': np.bincount(codes, weights=held, minlength=size)
+        }
+
+    def row(self, index: int) -> Dict:
+        """单笔成交转换为字典（与原 trade_history 元素键名一致）"""
+        rec = self._data[index]
+        return {
+            'date': pd.Timestamp(int(rec['date'])),
+            'symbol': self.symbols.decode(int(rec['symbol_id'])),
+            'action': ACTIONS[rec['action']],
+            'price': float(rec['price']),
+            'quantity': int(rec['quantity']),
+            'pnl': float(rec['pnl']),
+            'commission': float(rec['commission']),
+            'stage': self.stages.decode(int(rec['stage'])),
+            'entry_stage': self.stages.decode(int(rec['entry_stage'])),
+            'reason': self.reasons.decode(int(rec['reason_id'])),
+            'confidence': float(rec['confidence']),
+            'stop_loss': float(rec['stop_loss']),
+            'target_price': float(rec['target_price']),
+            'holding_days': int(rec['holding_days'])
+        }
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return f"TradeLedger({self._size} trades)"
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("trade index out of range")
+        return self.row(index)
+
+    def to_frame(self) -> pd.DataFrame:
+        """转换为 DataFrame，编码列还原为字符串"""
+        rec = self.records
+
+        def decode(categories: Categories, codes: np.ndarray) -> np.ndarray:
+            lookup = np.array(categories.values + [None], dtype=object)
+            return lookup[codes]  # -1 对应末尾的 None
+
+        return pd.DataFrame({
+            'date': self.dates,
+            'symbol': decode(self.symbols, rec['symbol_id']),
+            'action': np.array(ACTIONS, dtype=object)[rec['action']],
+            'price': rec['price'],
+            'quantity': rec['quantity'],
+            'pnl': rec['pnl'],
+            'commission': rec['commission'],
+            'stage': decode(self.stages, rec['stage']),
+            'entry_stage': decode(self.stages, rec['entry_stage']),
+            'reason': decode(self.reasons, rec['reason_id']),
+            'confidence': rec['confidence'],
+            'stop_loss': rec['stop_loss'],
+            'target_price': rec['target_price'],
+            'holding_days': rec['holding_days']
+        })
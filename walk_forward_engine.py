@@ -0,0 +1,228 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Optional
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from backtest_engine import BacktestResult, StrategyOptimizer
+
+@dataclass
+class WalkForwardWindow:
+    """单个滚动窗口（训练区间 + 样本外测试区间）"""
+    fold: int
+    train_start: pd.Timestamp
+    train_end: pd.Timestamp
+    test_start: pd.Timestamp
+    test_end: pd.Timestamp
+
+@dataclass
+class WalkForwardFold:
+    """单个窗口的优化与样本外检验结果"""
+    window: WalkForwardWindow
+    best_params: Dict
+    in_sample_score: float
+    out_of_sample_score: float
+    in_sample_result: BacktestResult
+    out_of_sample_result: BacktestResult
+
+@dataclass
+class WalkForwardResult:
+    """滚动前进分析结果"""
+    metric: str
+    folds: List[WalkForwardFold]
+
+    @property
+    def out_of_sample_scores(self) -> np.ndarray:
+        return np.array([f.out_of_sample_score for f in self.folds], dtype=float)
+
+    @property
+    def mean_out_of_sample_score(self) -> float:
+        scores = self.out_of_sample_scores
+        scores = scores[np.isfinite(scores)]
+        return float(scores.mean()) if len(scores) else 0.0
+
+    def summary(self) -> pd.DataFrame:
+        """每个窗口一行的汇总表"""
+        rows = []
+        for f in self.folds:
+            oos = f.out_of_sample_result
+            rows.append({
+                'fold': f.window.fold,
+                'train_start': f.window.train_start,
+                'train_end': f.window.train_end,
+                'test_start': f.window.test_start,
+                'test_end': f.window.test_end,
+                'best_params': f.best_params,
+                'in_sample_score': f.in_sample_score,
+                'out_of_sample_score': f.out_of_sample_score,
+                'oos_total_return': oos.total_return,
+                'oos_sharpe_ratio': oos.sharpe_ratio,
+                'oos_max_drawdown': oos.max_drawdown,
+                'oos_win_rate': oos.win_rate,
+                'oos_total_trades': oos.total_trades
+            })
+        return pd.DataFrame(rows)
+
+# 进程池中每个工作进程持有一份优化器（数据和信号缓存只在初始化时传输一次）
+_worker_optimizer: Optional[StrategyOptimizer] = None
+
+def _init_worker(strategy_class, data_dict: Dict[str, pd.DataFrame], signal_cache: Dict):
+    global _worker_optimizer
+    _worker_optimizer = StrategyOptimizer(strategy_class, data_dict)
+    _worker_optimizer._signal_cache.update(signal_cache)
+
+def _generate_signals_task(params: Dict):
+    return params, _worker_optimizer.get_signals(params)
+
+def _run_fold_task(window: WalkForwardWindow, param_list: List[Dict], metric: str) -> WalkForwardFold:
+    return _run_fold(_worker_optimizer, window, param_list, metric)
+
+def _run_fold(optimizer: StrategyOptimizer, window: WalkForwardWindow,
+              param_list: List[Dict], metric: str) -> WalkForwardFold:
+    """在训练区间选出最优参数，并在紧随其后的测试区间做样本外检验"""
+    best_params = None
+    best_score = -float('inf')
+    best_result = None
+
+    for params in param_list:
+        result = optimizer.evaluate(params, window.train_start, window.train_end)
+        score = getattr(result, metric)
+        if score is None or np.isnan(score):
+            continue
+        if best_params is None or score > best_score:
+            best_score = score
+            best_params = params
+            best_result = result
+
+    if best_params is None:
+        # 所有参数在训练区间都没有有效得分时，退回第一组参数
+        best_params = param_list[0]
+        best_result = optimizer.evaluate(best_params, window.train_start, window.train_end)
+        best_score = getattr(best_result, metric)
+
+    oos_result = optimizer.evaluate(best_params, window.test_start, window.test_end)
+    return WalkForwardFold(
+        window=window,
+        best_params=best_params,
+        in_sample_score=best_score,
+        out_of_sample_score=getattr(oos_result, metric),
+        in_sample_result=best_result,
+        out_of_sample_result=oos_result
+    )
+
+class WalkForwardEngine:
+    """滚动前进（Walk-Forward）回测引擎
+
+    将历史数据切分为连续的训练/测试窗口，在每个训练窗口上用 StrategyOptimizer
+    选参，再在随后的测试窗口上记录样本外表现。每组参数的指标和信号只在全历史上
+    计算一次（指标均为滚动计算，不引入未来数据），各窗口只对缓存的信号做区间回放，
+    窗口之间并行执行。
+    """
+
+    def __init__(self, strategy_class, data_dict: Dict[str, pd.DataFrame],
+                 train_days: int = 252, test_days: int = 63,
+                 step_days: Optional[int] = None, anchored: bool = False,
+                 max_workers: Optional[int] = None):
+        """
+        Args:
+            strategy_class: 策略类
+            data_dict: 股票代码到行情数据（DatetimeIndex）的映射
+            train_days: 训练窗口长度（交易日）
+            test_days: 测试窗口长度（交易日）
+            step_days: 窗口滚动步长，默认等于测试窗口长度
+            anchored: True时训练窗口起点固定（扩展窗口），False时为固定长度滚动窗口
+            max_workers: 并行进程数，1表示在当前进程串行执行
+        """
+        if train_days < 1 or test_days < 1:
+            raise ValueError("train_days and test_days must be positive")
+        self.strategy_class = strategy_class
+        self.data_dict = data_dict
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days or test_days
+        self.anchored = anchored
+        self.max_workers = max_workers
+        self.optimizer = StrategyOptimizer(strategy_class, data_dict)
+
+    def trading_dates(self, start_date: str, end_date: str) -> pd.DatetimeIndex:
+        """所有股票交易日期的并集"""
+        index = pd.DatetimeIndex([])
+        for data in self.data_dict.values():
+            index = index.union(pd.DatetimeIndex(data.index))
+        start_dt = pd.to_datetime(start_date)
+        end_dt = pd.to_datetime(end_date)
+        return index[(index >= start_dt) & (index <= end_dt)]
+
+    def split_windows(self, start_date: str, end_date: str) -> List[WalkForwardWindow]:
+        """按交易日切分训练/测试窗口"""
+        dates = self.trading_dates(start_date, end_date)
+        windows = []
+        fold = 0
+
+        while True:
+            train_begin = 0 if self.anchored else fold * self.step_days
+            train_stop = self.train_days + fold * self.step_days
+            test_stop = train_stop + self.test_days
+            if test_stop > len(dates):
+                break
+
+            windows.append(WalkForwardWindow(
+                fold=fold,
+                train_start=dates[train_begin],
+                train_end=dates[train_stop - 1],
+                test_start=dates[train_stop],
+                test_end=dates[test_stop - 1]
+            ))
+            fold += 1
+
+        return windows
+
+    def run(self, param_grid: Dict[str, List], start_date: str, end_date: str,
+            metric: str = 'sharpe_ratio') -> WalkForwardResult:
+        """执行滚动前进分析"""
+        windows = self.split_windows(start_date, end_date)
+        if not windows:
+            raise ValueError("Not enough history for a single train/test window")
+
+        param_list = StrategyOptimizer.param_combinations(param_grid)
+
+        if self.max_workers == 1:
+            folds = [_run_fold(self.optimizer, w, param_list, metric) for w in windows]
+            return WalkForwardResult(metric=metric, folds=folds)
+
+        # 第一阶段：每组参数在全历史上生成一次信号
+        missing = [p for p in param_list
+                   if StrategyOptimizer.params_key(p) not in self.optimizer._signal_cache]
+        if missing:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(self.strategy_class, self.data_dict, {})) as pool:
+                for params, signals in pool.map(_generate_signals_task, missing):
+                    self.optimizer.set_signals(params, signals)
+
+        # 第二阶段：各窗口并行选参并做样本外检验
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                 initargs=(self.strategy_class, self.data_dict,
+                                           self.optimizer._signal_cache)) as pool:
+            folds = list(pool.map(_run_fold_task, windows,
+                                  [param_list] * len(windows), [metric] * len(windows)))
+
+        return WalkForwardResult(metric=metric, folds=folds)
+
+# 使用示例
+if __name__ == "__main__":
+    from right_side_trading_strategy import RightSideTradingStrategy
+
+    # 示例：需要提供实际数据
+    # data_dict = {
+    #     'AAPL': pd.DataFrame(...),
+    #     'MSFT': pd.DataFrame(...)
+    # }
+
+    # engine = WalkForwardEngine(RightSideTradingStrategy, data_dict,
+    #                            train_days=504, test_days=126)
+    # param_grid = {
+    #     'max_position_pct': [0.01, 0.02, 0.03],
+    #     'max_positions': [3, 5, 7]
+    # }
+    # wf_result = engine.run(param_grid, '2018-01-01', '2023-12-31')
+    # print(wf_result.summary())
+    # print(f"样本外平均得分: {wf_result.mean_out_of_sample_score:.2f}")